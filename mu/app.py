@@ -30,12 +30,13 @@ from PyQt5.QtCore import QTimer, Qt
 from PyQt5.QtWidgets import QApplication, QSplashScreen
 
 from mu import __version__, language_code
-from mu.logic import Editor, LOG_FILE, LOG_DIR, DEBUGGER_PORT, ENCODING
+from mu.logic import Editor, LOG_FILE, LOG_DIR, ENCODING
 from mu.interface import Window
 from mu.resources import load_pixmap, load_icon
 from mu.modes import (PythonMode, AdafruitMode, MicrobitMode, DebugMode,
                       PyGameZeroMode, ESPMode)
 from mu.debugger.runner import run as run_debugger
+from mu.debugger.runner import serve as serve_debugger
 from mu.interface.themes import NIGHT_STYLE, DAY_STYLE, CONTRAST_STYLE
 
 
@@ -174,12 +175,17 @@ def debug():
     Create a debug runner in a new process.
 
     This is what the Mu debugger will drive. Uses the filename and associated
-    args found in sys.argv.
+    args found in sys.argv. If started with the "--warm" flag instead, the
+    runner waits for Mu to send it the script to debug (see the ProcessPool
+    class in mu.interface.panes).
     """
-    if len(sys.argv) > 1:
+    if sys.argv[1:] == ['--warm']:
+        serve_debugger('localhost')
+    elif len(sys.argv) > 1:
         filename = os.path.normcase(os.path.abspath(sys.argv[1]))
         args = sys.argv[2:]
-        run_debugger('localhost', DEBUGGER_PORT, filename, args)
+        # Listen on a free port, reported to Mu in the runner's ready line.
+        run_debugger('localhost', 0, filename, args)
     else:
         # See https://github.com/mu-editor/mu/issues/743
         print("Debugger requires a Python script filename to run.")
@@ -13,9 +13,11 @@ You may:
 from __future__ import print_function
 import ast
 import argparse
+import hashlib
 import sys
 import os
 import time
+import zlib
 import os.path
 from serial.tools.list_ports import comports as list_serial_ports
 from serial import Serial
@@ -101,12 +103,14 @@ def raw_off(serial):
     serial.write(b'\x02')  # Send CTRL-B to get out of raw mode.
 
 
-def get_serial():
+def get_serial(port=None):
     """
     Detect if a micro:bit is connected and return a serial object to talk to
-    it.
+    it. If a port is given, return a serial object to talk to the micro:bit
+    connected to that port instead.
     """
-    port, serial_number = find_microbit()
+    if port is None:
+        port, serial_number = find_microbit()
     if port is None:
         raise IOError('Could not find micro:bit.')
     return Serial(port, 115200, timeout=1, parity='N')
@@ -128,9 +132,29 @@ def execute(commands, serial=None):
         serial = get_serial()
         close_serial = True
         time.sleep(0.1)
-    result = b''
     raw_on(serial)
     time.sleep(0.1)
+    result, err = send_commands(commands, serial)
+    if err:
+        return b'', err
+    time.sleep(0.1)
+    raw_off(serial)
+    if close_serial:
+        serial.close()
+        time.sleep(0.1)
+    return result, err
+
+
+def send_commands(commands, serial):
+    """
+    Sends the commands to a device that is already in raw mode (see raw_on)
+    and returns the stdout and stderr output. Stops at the first command that
+    writes to stderr.
+
+    Use this to run several batches of commands in a single raw mode session.
+    """
+    result = b''
+    err = b''
     # Write the actual command and send CTRL-D to evaluate.
     for command in commands:
         command_bytes = command.encode('utf-8')
@@ -143,11 +167,6 @@ def execute(commands, serial=None):
         result += out
         if err:
             return b'', err
-    time.sleep(0.1)
-    raw_off(serial)
-    if close_serial:
-        serial.close()
-        time.sleep(0.1)
     return result, err
 
 
@@ -220,6 +239,17 @@ def put(filename, target=None, serial=None):
     filename = os.path.basename(filename)
     if target is None:
         target = filename
+    out, err = execute(put_commands(content, target), serial)
+    if err:
+        raise IOError(clean_error(err))
+    return True
+
+
+def put_commands(content, target):
+    """
+    Returns the list of commands that write the bytes in content to the
+    target file on the device.
+    """
     commands = [
         "fd = open('{}', 'wb')".format(target),
         "f = fd.write",
@@ -232,10 +262,7 @@ def put(filename, target=None, serial=None):
             commands.append('f(' + repr(line) + ')')
         content = content[64:]
     commands.append('fd.close()')
-    out, err = execute(commands, serial)
-    if err:
-        raise IOError(clean_error(err))
-    return True
+    return commands
 
 
 def get(filename, target=None, serial=None):
@@ -250,7 +277,21 @@ def get(filename, target=None, serial=None):
     """
     if target is None:
         target = filename
-    commands = [
+    out, err = execute(get_commands(filename), serial)
+    if err:
+        raise IOError(clean_error(err))
+    # Recombine the bytes while removing "b'" from start and "'" from end.
+    with open(target, 'wb') as f:
+        f.write(out)
+    return True
+
+
+def get_commands(filename):
+    """
+    Returns the list of commands that write the content of the referenced
+    file on the device to stdout.
+    """
+    return [
         "from microbit import uart",
         "f = open('{}', 'rb')".format(filename),
         "r = f.read",
@@ -258,13 +299,100 @@ def get(filename, target=None, serial=None):
         "while result:\n result = r(32)\n if result:\n  uart.write(result)\n",
         "f.close()",
     ]
-    out, err = execute(commands, serial)
-    if err:
-        raise IOError(clean_error(err))
-    # Recombine the bytes while removing "b'" from start and "'" from end.
-    with open(target, 'wb') as f:
-        f.write(out)
-    return True
+
+
+#: Commands that print True if the device's file system has directories. The
+#: micro:bit's is flat, so its os module has no mkdir.
+DIRS_COMMANDS = ["import os\nprint(hasattr(os, 'mkdir'))"]
+
+
+#: Commands that define _d(path, block_size) on the device. It returns a list
+#: with the digest of each block_size chunk of the file (or a single digest
+#: of the whole file if block_size is 0). SHA-256 is used if the device has
+#: it, otherwise a pure Python Adler-32. See digest for the local equivalent.
+_DIGEST_DEFINITIONS = [
+    "import os\n"
+    "try:\n from uhashlib import sha256\nexcept ImportError:\n"
+    " try:\n  from hashlib import sha256\n except ImportError:\n"
+    "  sha256 = None\n",
+    "def _a(c, s):\n a = s & 0xffff\n b = s >> 16\n for x in c:\n"
+    "  a = (a + x) % 65521\n  b = (b + a) % 65521\n return (b << 16) | a\n",
+    "def _d(p, n):\n f = open(p, 'rb')\n r = []\n while True:\n"
+    "  h = sha256() if sha256 else 1\n  m = 0\n  while not n or m < n:\n"
+    "   c = f.read(min(256, n - m) if n else 256)\n   if not c:\n    break\n"
+    "   m += len(c)\n   if sha256:\n    h.update(c)\n   else:\n"
+    "    h = _a(c, h)\n  if not m and r:\n   break\n"
+    "  r.append(h.digest() if sha256 else h)\n  if not n or m < n:\n"
+    "   break\n f.close()\n return r\n",
+]
+
+
+def digest_commands(filename=None, block_size=0):
+    """
+    Returns the list of commands that print digests of files on the device.
+
+    If no filename is given, every file on the device is listed (recursing
+    into directories where the device supports them) and the output is the
+    repr of a tuple of the name of the digest algorithm and a list of
+    (path, size, digest) tuples.
+
+    If a filename is given the output is the repr of a list of the digests
+    of each block_size chunk of that file.
+    """
+    commands = list(_DIGEST_DEFINITIONS)
+    if filename:
+        command = "print(repr(_d('{}', {})))".format(filename, block_size)
+        commands.append(command)
+    else:
+        commands.append(
+            "def _w(d, r):\n"
+            " for e in (os.listdir(d) if d else os.listdir()):\n"
+            "  p = d + '/' + e if d else e\n"
+            "  try:\n   s = os.stat(p)\n   if s[0] & 0x4000:\n"
+            "    _w(p, r)\n    continue\n   z = s[6]\n"
+            "  except AttributeError:\n   z = os.size(p)\n"
+            "  r.append((p, z, _d(p, 0)[0]))\n return r\n")
+        commands.append("print(repr(('sha256' if sha256 else 'adler32', "
+                        "_w('', []))))")
+    return commands
+
+
+def digest(content, algorithm, block_size=0):
+    """
+    Returns a list of digests of each block_size chunk of the content (or a
+    single digest of all the content if block_size is 0) computed the same
+    way as the commands from digest_commands compute them on the device.
+    """
+    if block_size:
+        blocks = [content[i:i + block_size]
+                  for i in range(0, len(content), block_size)] or [b'']
+    else:
+        blocks = [content]
+    if algorithm == 'sha256':
+        return [hashlib.sha256(block).digest() for block in blocks]
+    return [zlib.adler32(block) for block in blocks]
+
+
+def patch_commands(blocks, target):
+    """
+    Returns the list of commands that overwrite the (offset, content) blocks
+    of the existing target file on the device in place.
+    """
+    commands = [
+        "fd = open('{}', 'r+b')".format(target),
+        "f = fd.write",
+    ]
+    for offset, content in blocks:
+        commands.append('fd.seek({})'.format(offset))
+        while content:
+            line = content[:64]
+            if PY2:
+                commands.append('f(b' + repr(line) + ')')
+            else:
+                commands.append('f(' + repr(line) + ')')
+            content = content[64:]
+    commands.append('fd.close()')
+    return commands
 
 
 def version(serial=None):
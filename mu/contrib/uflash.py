@@ -16,6 +16,7 @@ import argparse
 import binascii
 import ctypes
 import os
+import re
 import struct
 import sys
 from subprocess import check_output
@@ -142,6 +143,42 @@ def unhexlify(blob):
         return ''
 
 
+#: Extracts the mount point from a line of output from the "mount" command.
+#: Linux looks like "dev on /path type fs (opts)", OSX "dev on /path (opts)".
+#: Mu uses it too, so the pattern is only defined here.
+MOUNT_POINT = re.compile(br'^.+? on (.+?) (?:type \S+ )?\(')
+#: Matches the name of the volume a BBC micro:bit is mounted as.
+_MICROBIT_VOLUME = re.compile(r'^MICROBIT(?: ?\d+)?$')
+#: Cache of runtime hex strings split at the point a script is embedded.
+_SPLIT_RUNTIMES = {}
+#: Cache of custom runtimes read from disk, keyed by path.
+_RUNTIME_FILES = {}
+
+
+def split_runtime(runtime_hex):
+    """
+    Given a string representing the MicroPython runtime hex, returns a tuple
+    of the (normalised) hex before and after the point where a Python script
+    is embedded.
+
+    Splitting the runtime is expensive, so the result is cached. Building a
+    hex file is then simply a matter of concatenating these with the script.
+    """
+    try:
+        return _SPLIT_RUNTIMES[runtime_hex]
+    except KeyError:
+        pass
+    runtime_list = runtime_hex.split()
+    # The Python based hex is embedded two lines from the end.
+    head = '\n'.join(runtime_list[:-5])
+    tail = '\n'.join(runtime_list[-5:])
+    result = (head + '\n' if head else '', tail + '\n' if tail else '')
+    if len(_SPLIT_RUNTIMES) > 4:
+        _SPLIT_RUNTIMES.clear()
+    _SPLIT_RUNTIMES[runtime_hex] = result
+    return result
+
+
 def embed_hex(runtime_hex, python_hex=None):
     """
     Given a string representing the MicroPython runtime hex, will embed a
@@ -157,15 +194,28 @@ def embed_hex(runtime_hex, python_hex=None):
         raise ValueError('MicroPython runtime hex required.')
     if not python_hex:
         return runtime_hex
-    py_list = python_hex.split()
-    runtime_list = runtime_hex.split()
-    embedded_list = []
-    # The embedded list should be the original runtime with the Python based
-    # hex embedded two lines from the end.
-    embedded_list.extend(runtime_list[:-5])
-    embedded_list.extend(py_list)
-    embedded_list.extend(runtime_list[-5:])
-    return '\n'.join(embedded_list) + '\n'
+    head, tail = split_runtime(runtime_hex)
+    py_hex = '\n'.join(python_hex.split())
+    if py_hex:
+        return head + py_hex + '\n' + tail
+    return head + tail
+
+
+def read_runtime(path_to_runtime):
+    """
+    Returns the content of the custom MicroPython runtime hex file at the
+    referenced path, re-reading it only if the file has changed since it was
+    last read.
+    """
+    stat = os.stat(path_to_runtime)
+    key = (stat.st_mtime, stat.st_size)
+    cached = _RUNTIME_FILES.get(path_to_runtime)
+    if cached and cached[0] == key:
+        return cached[1]
+    with open(path_to_runtime) as runtime_file:
+        runtime = runtime_file.read()
+    _RUNTIME_FILES[path_to_runtime] = (key, runtime)
+    return runtime
 
 
 def extract_script(embedded_hex):
@@ -202,7 +252,7 @@ def extract_script(embedded_hex):
     return ''
 
 
-def find_microbit():
+def find_microbit(mounted_volumes=None):
     """
     Returns a path on the filesystem that represents the plugged in BBC
     micro:bit that is to be flashed. If no micro:bit is found, it returns
@@ -211,15 +261,41 @@ def find_microbit():
     Works on Linux, OSX and Windows. Will raise a NotImplementedError
     exception if run on any other operating system.
     """
+    microbits = find_microbits(mounted_volumes)
+    if microbits:
+        return microbits[0]
+    return None
+
+
+def find_microbits(mounted_volumes=None):
+    """
+    Returns a list of paths on the filesystem that represent all the plugged
+    in BBC micro:bits. If no micro:bit is found, it returns an empty list.
+
+    On Linux and OSX, the caller may pass in a list of the paths of the
+    mounted volumes if it already knows them (for example, from a cache).
+
+    Works on Linux, OSX and Windows. Will raise a NotImplementedError
+    exception if run on any other operating system.
+    """
+    microbits = []
     # Check what sort of operating system we're on.
     if os.name == 'posix':
         # 'posix' means we're on Linux or OSX (Mac).
-        # Call the unix "mount" command to list the mounted volumes.
-        mount_output = check_output('mount').splitlines()
-        mounted_volumes = [x.split()[2] for x in mount_output]
+        if mounted_volumes is None:
+            # Call the unix "mount" command to list the mounted volumes.
+            mounted_volumes = []
+            mount_output = check_output('mount').splitlines()
+            for line in mount_output:
+                match = MOUNT_POINT.match(line)
+                if match:
+                    # Use strings not bytes.
+                    mounted_volumes.append(match.group(1).decode('utf-8'))
         for volume in mounted_volumes:
-            if volume.endswith(b'MICROBIT'):
-                return volume.decode('utf-8')  # Return a string not bytes.
+            # Second and subsequent devices are mounted with a numeric
+            # suffix (e.g. "MICROBIT1" on Linux or "MICROBIT 1" on OSX).
+            if _MICROBIT_VOLUME.match(os.path.basename(volume)):
+                microbits.append(volume)
     elif os.name == 'nt':
         # 'nt' means we're on Windows.
 
@@ -254,12 +330,13 @@ def find_microbit():
                     continue
                 if os.path.exists(path) and \
                         get_volume_name(path) == 'MICROBIT':
-                    return path
+                    microbits.append(path)
         finally:
             ctypes.windll.kernel32.SetErrorMode(old_mode)
     else:
         # No support for unknown operating systems.
         raise NotImplementedError('OS "{}" not supported.'.format(os.name))
+    return microbits
 
 
 def save_hex(hex_file, path):
@@ -322,8 +399,7 @@ def flash(path_to_python=None, paths_to_microbits=None,
     runtime = _RUNTIME
     # Load the hex for the runtime.
     if path_to_runtime:
-        with open(path_to_runtime) as runtime_file:
-            runtime = runtime_file.read()
+        runtime = read_runtime(path_to_runtime)
     # Generate the resulting hex file.
     micropython_hex = embed_hex(runtime, python_hex)
     # Find the micro:bit.
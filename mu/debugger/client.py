@@ -16,12 +16,12 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-import json
 import socket
-import time
 import logging
 import os.path
 from PyQt5.QtCore import QObject, QThread, pyqtSignal
+from mu.debugger.utils import (encode_message, decode_messages, apply_delta,
+                               RECV_SIZE)
 
 
 logger = logging.getLogger(__name__)
@@ -70,7 +70,8 @@ class CommandBufferHandler(QObject):
     fails at appropriate moments during the lifetime of a debug session.
     """
 
-    on_command = pyqtSignal(str)  #: Signal emitted when a command is received.
+    #: Signal emitted with the decoded (event, data) of a received command.
+    on_command = pyqtSignal(object)
     on_fail = pyqtSignal(str)  #: Emitted when there was a connection failure.
 
     def __init__(self, debugger):
@@ -86,65 +87,42 @@ class CommandBufferHandler(QObject):
         """
         Buffer input from a socket, emit complete debugger commands as signals.
         """
-        connected = False
-        tries = 0
-        connection_attempts = 50  # Translates to 10 seconds.
-        pause_between_attempts = 0.2
-        while not connected:
-            try:
-                self.debugger.socket = socket.socket(socket.AF_INET,
-                                                     socket.SOCK_STREAM)
-                self.debugger.socket.connect((self.debugger.host,
-                                              self.debugger.port))
-                connected = True
-            except ConnectionRefusedError:
-                # Allow up to connection_attempts attempts to connect.
-                # The Raspberry Pi is quite slow, so Mu needs to give the
-                # debug runner enough time to start up and start listening.
-                tries += 1
-                if tries >= connection_attempts:
-                    self.on_fail.emit(_('Connection timed out. Is your '
-                                        'machine slow or busy? Free up some '
-                                        "of the machine's resources and try "
-                                        "again."))
-                    return
-                time.sleep(pause_between_attempts)
-            except OSError:
-                # This will catch address related errors. Especially on OSX
-                # this is usually solved by adding "127.0.0.1 localhost" to
-                # /etc/hosts.
-                self.on_fail.emit(_('Could not find localhost.\n'
-                                    "Ensure you have '127.0.0.1 localhost' in "
-                                    "your /etc/hosts file."))
-                return
+        try:
+            self.debugger.socket = socket.socket(socket.AF_INET,
+                                                 socket.SOCK_STREAM)
+            self.debugger.socket.connect((self.debugger.host,
+                                          self.debugger.port))
+        except ConnectionRefusedError:
+            # The runner only reports its port once it's listening, so it
+            # must have stopped since.
+            self.on_fail.emit(_('The debug runner is no longer running.'))
+            return
+        except OSError:
+            # This will catch address related errors. Especially on OSX
+            # this is usually solved by adding "127.0.0.1 localhost" to
+            # /etc/hosts.
+            self.on_fail.emit(_('Could not find localhost.\n'
+                                "Ensure you have '127.0.0.1 localhost' in "
+                                "your /etc/hosts file."))
+            return
         # Getting here means the connection has been established, so handle all
         # incoming data from the debug runner process.
-        remainder = b''
+        self.debugger.socket.setsockopt(socket.IPPROTO_TCP,
+                                        socket.TCP_NODELAY, 1)
+        buffer = bytearray()
         while not self.stopped:
             new_buffer = None
             try:
-                new_buffer = self.debugger.socket.recv(1024)
+                new_buffer = self.debugger.socket.recv(RECV_SIZE)
             except Exception:
                 # Stop if there's any failure in receiving data from the
                 # runner.
                 self.stopped = True
             if new_buffer:
-                if new_buffer.endswith(self.debugger.ETX):
-                    terminator = self.debugger.ETX
-                    pos = new_buffer.rfind(self.debugger.ETX)
-                    full_buffer = remainder + new_buffer[:pos]
-                else:
-                    terminator = None
-                    full_buffer = remainder + new_buffer
-
-                commands = full_buffer.split(self.debugger.ETX)
-                if terminator is None:
-                    remainder = commands.pop()
-                else:
-                    remainder = b''
-                for command in commands:
-                    command = command.decode('utf-8')
-                    logger.debug(command)
+                buffer += new_buffer
+                for command in decode_messages(buffer):
+                    # Only log the event: stack payloads can be very large.
+                    logger.debug('Debug runner event: {}'.format(command[0]))
                     self.on_command.emit(command)
             else:
                 # If recv() returns None, the socket is closed.
@@ -157,8 +135,6 @@ class Debugger(QObject):
     Represents the networked debugger client.
     """
 
-    ETX = b'\x03'  # End transmission token.
-
     def __init__(self, host, port, proc=None):
         """
         Instantiate given a host, port and process for the debug runner.
@@ -167,6 +143,7 @@ class Debugger(QObject):
         self.port = port
         self.proc = proc
         self.view = None  # Set after instantiation.
+        self.reset_stack()
         super().__init__()
 
     def start(self):
@@ -185,7 +162,7 @@ class Debugger(QObject):
         """
         Handle a command emitted by the client thread.
         """
-        event, data = json.loads(command)
+        event, data = command
         if hasattr(self, 'on_{}'.format(event)):
             getattr(self, 'on_{}'.format(event))(**data)
 
@@ -215,8 +192,7 @@ class Debugger(QObject):
         Send a command to the debug runner.
         """
         try:
-            dumped = json.dumps((event, data)).encode('utf-8')
-            self.socket.sendall(dumped + Debugger.ETX)
+            self.socket.sendall(encode_message(event, data))
         except OSError as e:
             logger.debug('Debugger client error.')
             logger.debug(e)
@@ -281,6 +257,28 @@ class Debugger(QObject):
         """
         self.output('clear', bpnum=breakpoint.bpnum)
 
+    def fetch_children(self, request, path, start):
+        """
+        Ask for a page of the children, from position "start", of the list or
+        dict found at the referenced path in the stack. The response is tagged
+        with the request number.
+        """
+        self.output('children', request=request, path=path, start=start)
+
+    def fetch_value(self, request, path):
+        """
+        Ask for the full repr of the value at the referenced path in the
+        stack. The response is tagged with the request number.
+        """
+        self.output('value', request=request, path=path)
+
+    def set_repr_limits(self, limits):
+        """
+        Set the limits (a dict of reprlib.Repr attributes, such as maxlist or
+        maxstring, and maxlength) on the size of the reprs the runner sends.
+        """
+        self.output('limits', **limits)
+
     def do_run(self):
         """
         Run the debugger until the next breakpoint.
@@ -310,10 +308,20 @@ class Debugger(QObject):
     # the debug runner, then calling a method in the UI layer to update the
     # GUI to reflect the changed state.
 
+    def reset_stack(self):
+        """
+        Forget the current state of the stack. The runner sends it in full to
+        each newly connected client.
+        """
+        self.stack = []
+        self.namespaces = {}
+        self.builtins = {}
+
     def on_bootstrap(self, breakpoints):
         """
         The runner has finished setting up.
         """
+        self.reset_stack()
         self.bp_index = {}
         self.bp_list = list([True, ])  # Breakpoints count from 1
         for bp_data in breakpoints:
@@ -364,12 +372,46 @@ class Debugger(QObject):
         bp = self.bp_list[bpnum]
         self.view.debug_on_breakpoint_clear(bp)
 
-    def on_stack(self, stack):
+    def on_stack(self, stack, namespaces, builtins=None):
+        """
+        The runner has sent the changes to the stack since its last update.
+
+        Rebuild the full stack from these changes, so each frame has its
+        filename, locals, globals, builtins and so on, then pass it on to the
+        view.
+        """
+        if builtins is not None:
+            self.builtins = builtins
+        for key, delta in namespaces.items():
+            apply_delta(self.namespaces.setdefault(key, {}), delta)
+        snapshot = []
+        for index, (line_no, frame_data) in enumerate(stack):
+            if frame_data.pop('new', False):
+                frame = {'locals': {}, 'builtins': self.builtins}
+            else:
+                frame = self.stack[index][1]
+            locals_delta = frame_data.pop('locals', None)
+            if locals_delta:
+                apply_delta(frame['locals'], locals_delta)
+            if 'globals' in frame_data:
+                key = frame_data.pop('globals')
+                frame['globals'] = self.namespaces.setdefault(key, {})
+            frame.update(frame_data)
+            snapshot.append((line_no, frame))
+        self.stack = snapshot
+        self.view.debug_on_stack(snapshot)
+
+    def on_children(self, request, start, total, children):
+        """
+        The runner has sent a page of the children of a list or dict.
+        """
+        self.view.debug_on_children(request, start, total, children)
+
+    def on_value(self, request, value):
         """
-        The runner has sent an update to the stack.
+        The runner has sent the full repr of a value.
         """
-        self.stack = stack
-        self.view.debug_on_stack(stack)
+        self.view.debug_on_value(request, value)
 
     def on_restart(self):
         """
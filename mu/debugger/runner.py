@@ -19,20 +19,27 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import sys
 import os
 import socket
-import json
 import bdb
+import dis
+import json
 import linecache
 import logging
+import reprlib
 import traceback
 from enum import Enum
+from itertools import islice
 from queue import Queue
 from threading import Thread
-from mu.debugger.utils import is_breakpoint_line
+from mu.debugger.utils import (is_breakpoint_line, encode_message,
+                               decode_messages, diff_namespace, RECV_SIZE)
 
 
 logger = logging.getLogger(__name__)
 
 
+PAGE_SIZE = 100  #: Number of a container's children sent at once.
+
+
 class Restart(Exception):
     """
     Cause the debugger to restart for the target Python program.
@@ -56,30 +63,99 @@ class DebugState(Enum):
     STARTED = 2
 
 
+class BoundedRepr(reprlib.Repr):
+    """
+    Creates reprs of limited size, however big the value, so the cost of
+    stepping through a program doesn't depend on the size of its data.
+
+    In addition to the limits of reprlib.Repr (maxlevel, maxlist, maxstring
+    and so on) the whole repr is cut short at maxlength characters.
+
+    Since reprlib.Repr makes the full repr of other objects before cutting it
+    short, objects with more than maxlist items (such as OrderedDicts or
+    arrays) are summarised by their type and length instead, and bytes are
+    cut short before their repr is made, like strings.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.maxlength = 200
+        self.maxstring = 80
+        self.maxother = 80
+
+    def configure(self, **limits):
+        """
+        Set the named limits, ignoring any that aren't known.
+        """
+        for name, value in limits.items():
+            if name.startswith('max') and hasattr(self, name):
+                setattr(self, name, int(value))
+            else:
+                logger.debug('Unknown repr limit: {}'.format(name))
+
+    repr_bytes = repr_bytearray = reprlib.Repr.repr_str
+
+    def repr_instance(self, x, level):
+        try:
+            size = len(x) if hasattr(type(x), '__len__') else None
+        except Exception:
+            size = None
+        if size is not None and size > self.maxlist:
+            return '<{} of {} items>'.format(type(x).__name__, size)
+        return super().repr_instance(x, level)
+
+    def repr(self, value):
+        try:
+            result = super().repr(value)
+        except Exception:
+            # For example, ints too big to convert to a string.
+            result = '<{} object>'.format(type(value).__name__)
+        if len(result) > self.maxlength:
+            result = result[:self.maxlength - 3] + '...'
+        return result
+
+
+#: The bounded repr used for all values sent to the debug client.
+short_repr = BoundedRepr()
+
+
+def inspect_value(value):
+    """
+    Summarise a value for the debug inspector as a [kind, value] pair.
+
+    Lists and dicts, whose children are fetched when they're expanded in the
+    inspector, become ['list', length] or ['dict', length]. Everything else
+    becomes [None, bounded repr].
+    """
+    if isinstance(value, dict):
+        return ['dict', len(value)]
+    if isinstance(value, list):
+        return ['list', len(value)]
+    return [None, short_repr.repr(value)]
+
+
+def child_items(value, start, count):
+    """
+    Return a list of (label, child) pairs for a page of the children of the
+    referenced list or dict.
+    """
+    if isinstance(value, dict):
+        return [(short_repr.repr(k), v)
+                for k, v in islice(value.items(), start, start + count)]
+    return [(str(i), v)
+            for i, v in enumerate(value[start:start + count], start)]
+
+
 def command_buffer(debugger):
     """
     Buffer input from a socket, yield complete debugger commands.
     """
-    remainder = b''
+    buffer = bytearray()
     while True:
-        new_buffer = debugger.client.recv(1024)
+        new_buffer = debugger.client.recv(RECV_SIZE)
         if new_buffer:
-            if new_buffer.endswith(debugger.ETX):
-                terminator = debugger.ETX
-                pos = new_buffer.rfind(debugger.ETX)
-                full_buffer = remainder + new_buffer[:pos]
-            else:
-                terminator = None
-                full_buffer = remainder + new_buffer
-
-            commands = full_buffer.split(debugger.ETX)
-            if terminator is None:
-                remainder = commands.pop()
-            else:
-                remainder = b''
-            for command in commands:
-                command = command.decode('utf-8')
-                command_data = json.loads(command)
+            buffer += new_buffer
+            for command_data in decode_messages(buffer):
                 logging.debug(command_data)
                 debugger.commands.put(command_data)
         else:
@@ -93,8 +169,6 @@ class Debugger(bdb.Bdb):
     Instances of this class represent and drive the debugging process.
     """
 
-    ETX = b'\x03'  # End transmission token.
-
     def __init__(self, socket, host, port, skip=None):
         super().__init__(skip=skip)
         self._run_state = DebugState.NOT_STARTED
@@ -112,15 +186,21 @@ class Debugger(bdb.Bdb):
         # set_continue, in the absence of breakpoints at script start. The
         # flag indicates that continue means set_continue from now on.
         self.continue_flag = False
+        # Set while continuing with only the code containing breakpoints being
+        # traced (see set_continue).
+        self.fast_continuing = False
+        self.break_lines = {}
+        self.break_code = {}
+        self.reset_snapshot()
 
     def output(self, event, **data):
         """
         Dumps data related to a referenced event to the socket.
         """
         try:
-            dumped = json.dumps((event, data)).encode('utf-8')
+            dumped = encode_message(event, data)
             logging.debug(dumped)
-            self.client.sendall(dumped + Debugger.ETX)
+            self.client.sendall(dumped)
         except OSError as e:
             logger.debug('Debugger client error.')
             logger.debug(e)
@@ -130,7 +210,11 @@ class Debugger(bdb.Bdb):
 
     def output_stack(self):
         """
-        Dump the current stack.
+        Dump the changes to the current stack since it was last sent.
+
+        Only the frames, variables and global namespaces that have changed
+        are sent, and builtins are only sent once per client session. The
+        client rebuilds the full stack from these deltas.
 
         If this is a normal situation, the top two frames are BDB and the
         runner executing the program. If there is an exception, there are two
@@ -143,29 +227,81 @@ class Debugger(bdb.Bdb):
         elif sl > 3 and self.stack[3][0].f_code.co_filename == '<string>':
             str_index = 4
         stack_data = []
+        snapshot = []
+        namespaces = {}
         if str_index > 0:
-            for frame, line_no in self.stack[str_index:]:
-                frame_data = (
-                    line_no,
-                    {
-                        'filename': frame.f_code.co_filename,
-                        'locals': {k: repr(v) for k, v in
-                                   frame.f_locals.items()},
-                        'globals': {k: repr(v) for k, v in
-                                    frame.f_globals.items()},
-                        'builtins': {k: repr(v) for k, v in
-                                     frame.f_builtins.items()},
-                        'restricted': getattr(frame, 'f_restricted', ''),
-                        'lasti': repr(frame.f_lasti),
-                        'exc_type': repr(getattr(frame, 'f_exc_type', '')),
-                        'exc_value': repr(getattr(frame, 'f_exc_value', '')),
-                        'exc_traceback': repr(getattr(frame,
-                                                      'f_exc_traceback', '')),
-                        'current': frame is self.curframe,
-                    }
-                )
-                stack_data.append(frame_data)
-        self.output('stack', stack=stack_data)
+            for index, (frame, line_no) in enumerate(self.stack[str_index:]):
+                state = {
+                    'filename': frame.f_code.co_filename,
+                    'locals': {k: inspect_value(v)
+                               for k, v in frame.f_locals.items()},
+                    'globals': self.namespace_key(frame.f_globals,
+                                                  namespaces),
+                    'restricted': getattr(frame, 'f_restricted', ''),
+                    'lasti': repr(frame.f_lasti),
+                    'exc_type': short_repr.repr(getattr(frame, 'f_exc_type',
+                                                        '')),
+                    'exc_value': short_repr.repr(getattr(frame,
+                                                         'f_exc_value', '')),
+                    'exc_traceback': short_repr.repr(
+                        getattr(frame, 'f_exc_traceback', '')),
+                    'current': frame is self.curframe,
+                }
+                if (index < len(self.snapshot) and
+                        self.snapshot[index][0] is frame):
+                    # Same frame as last time, so only send what changed.
+                    old_state = self.snapshot[index][1]
+                    frame_data = {k: v for k, v in state.items()
+                                  if k != 'locals' and old_state[k] != v}
+                    locals_delta = diff_namespace(old_state['locals'],
+                                                  state['locals'])
+                    if locals_delta:
+                        frame_data['locals'] = locals_delta
+                else:
+                    frame_data = dict(state, new=True,
+                                      locals=diff_namespace({},
+                                                            state['locals']))
+                snapshot.append((frame, state))
+                stack_data.append((line_no, frame_data))
+        # Keeping a reference to each frame means a new frame can never have
+        # the same identity as one in the previous snapshot.
+        self.snapshot = snapshot
+        data = {
+            'stack': stack_data,
+            'namespaces': {k: v for k, v in namespaces.items() if v},
+        }
+        if stack_data and not self.builtins_sent:
+            builtins = self.stack[str_index][0].f_builtins
+            data['builtins'] = {k: short_repr.repr(v)
+                                for k, v in builtins.items()}
+            self.builtins_sent = True
+        self.output('stack', **data)
+
+    def namespace_key(self, namespace, deltas):
+        """
+        Return the key identifying the referenced global namespace of a frame.
+
+        Namespaces are shared between frames, so each is only checked once
+        per stop: any changes since it was last sent are added to the deltas
+        dict under this key.
+        """
+        key = str(id(namespace))
+        if key not in deltas:
+            reprs = {k: short_repr.repr(v) for k, v in namespace.items()}
+            old_reprs = self.namespaces.get(key, (namespace, {}))[1]
+            deltas[key] = diff_namespace(old_reprs, reprs)
+            self.namespaces[key] = (namespace, reprs)
+        return key
+
+    def reset_snapshot(self):
+        """
+        Forget the state of the stack already sent to the client, so the next
+        stack update is sent in full (for example, to a newly connected
+        client).
+        """
+        self.snapshot = []
+        self.namespaces = {}
+        self.builtins_sent = False
 
     def reset(self):
         """
@@ -188,6 +324,9 @@ class Debugger(bdb.Bdb):
         """
         Contains the loop processing interactions with the debugger.
         """
+        if self.fast_continuing:
+            self.end_fast_continue()
+            self.trace_stack(frame)
         self.setup(frame, traceback)
         self.output_stack()
         while True:
@@ -211,7 +350,11 @@ class Debugger(bdb.Bdb):
             except (OSError, AttributeError, ClientClose):
                 # Connection problem; try listening for new connection.
                 client, addr = self.socket.accept()
+                # Step replies are small, so don't let Nagle's algorithm
+                # hold them back waiting for an ACK.
+                client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
                 self.client = client
+                self.reset_snapshot()
                 self.commands = Queue()
                 self.command_thread = Thread(target=command_buffer,
                                              args=(self, ))
@@ -273,7 +416,7 @@ class Debugger(bdb.Bdb):
         if self._run_state == DebugState.STARTING:
             return
         frame.f_locals['__return__'] = return_value
-        self.output('return', retval=repr(return_value))
+        self.output('return', retval=short_repr.repr(return_value))
         self.interact(frame, None)
 
     def user_exception(self, frame, exc_info):
@@ -292,9 +435,130 @@ class Debugger(bdb.Bdb):
             exc_type_name = exc_type
         else:
             exc_type_name = exc_type.__name__
-        self.output('exception', name=exc_type_name, value=repr(exc_value))
+        self.output('exception', name=exc_type_name,
+                    value=short_repr.repr(exc_value))
         self.interact(frame, exc_traceback)
 
+    def set_continue(self):
+        """
+        Stop only at breakpoints or when finished.
+
+        Rather than tracing every line of every function (including the
+        standard library) until a breakpoint is reached, only the code objects
+        containing breakpoints are traced. On Python 3.12 and later this uses
+        sys.monitoring, otherwise a minimal global trace function that only
+        hands frames containing breakpoints to bdb.
+        """
+        super().set_continue()
+        if not self.breaks:
+            return  # bdb has already turned off tracing.
+        self.break_lines = {filename: set(lines)
+                            for filename, lines in self.breaks.items()}
+        self.break_code = {}
+        self.fast_continuing = True
+        frame = sys._getframe().f_back
+        if hasattr(sys, 'monitoring'):
+            monitoring = sys.monitoring
+            tool = monitoring.DEBUGGER_ID
+            if monitoring.get_tool(tool) is None:
+                monitoring.use_tool_id(tool, 'mu-debugger')
+            monitoring.register_callback(tool, monitoring.events.PY_START,
+                                         self.monitor_start)
+            monitoring.register_callback(tool, monitoring.events.LINE,
+                                         self.monitor_line)
+            sys.settrace(None)
+            monitoring.restart_events()
+            monitoring.set_events(tool, monitoring.events.PY_START)
+            # Frames already running won't start again, so check them now.
+            while frame and frame is not self.botframe:
+                frame.f_trace = None
+                self.monitor_start(frame.f_code, 0)
+                frame = frame.f_back
+        else:
+            sys.settrace(self.trace_continue)
+            while frame and frame is not self.botframe:
+                if not self.has_breakpoint(frame.f_code):
+                    frame.f_trace = None
+                frame = frame.f_back
+
+    def end_fast_continue(self):
+        """
+        Stop only tracing the code containing breakpoints.
+        """
+        self.fast_continuing = False
+        if hasattr(sys, 'monitoring'):
+            monitoring = sys.monitoring
+            tool = monitoring.DEBUGGER_ID
+            if monitoring.get_tool(tool) is not None:
+                monitoring.set_events(tool, 0)
+                for (filename, code), traced in self.break_code.items():
+                    if traced:
+                        monitoring.set_local_events(tool, code, 0)
+
+    def trace_stack(self, frame):
+        """
+        Trace every frame in the stack, from the referenced frame to the
+        bottom frame, and every call from now on, ready for stepping.
+        """
+        sys.settrace(self.trace_dispatch)
+        while frame and frame is not self.botframe:
+            frame.f_trace = self.trace_dispatch
+            frame = frame.f_back
+
+    def has_breakpoint(self, code):
+        """
+        Return a boolean indication if the code object contains a line with a
+        breakpoint (or, like bdb, starts on such a line).
+        """
+        # Code objects in different files can compare equal.
+        key = (code.co_filename, code)
+        result = self.break_code.get(key)
+        if result is None:
+            filename = self.canonic(code.co_filename)
+            lines = self.break_lines.get(filename)
+            result = bool(lines) and (
+                code.co_firstlineno in lines or
+                any(line in lines for _, line in dis.findlinestarts(code)))
+            self.break_code[key] = result
+        return result
+
+    def trace_continue(self, frame, event, arg):
+        """
+        The global trace function while continuing, without sys.monitoring.
+
+        Only calls to code containing breakpoints are traced by bdb, the rest
+        run without any further tracing.
+        """
+        if self.has_breakpoint(frame.f_code):
+            return self.trace_dispatch(frame, event, arg)
+        return None
+
+    def monitor_start(self, code, instruction_offset):
+        """
+        The sys.monitoring callback for when a code object starts running
+        while continuing: turn on line events for it only if it contains a
+        breakpoint. Either way, this is only called once per code object.
+        """
+        if self.has_breakpoint(code):
+            sys.monitoring.set_local_events(sys.monitoring.DEBUGGER_ID, code,
+                                            sys.monitoring.events.LINE)
+        return sys.monitoring.DISABLE
+
+    def monitor_line(self, code, line_number):
+        """
+        The sys.monitoring callback for a line in code containing a
+        breakpoint, while continuing. Stop if bdb agrees there's an effective
+        breakpoint here, otherwise stop monitoring this line.
+        """
+        lines = self.break_lines.get(self.canonic(code.co_filename), ())
+        if line_number not in lines:
+            return sys.monitoring.DISABLE
+        frame = sys._getframe(1)
+        if self.break_here(frame):
+            self.user_line(frame)
+            if self.quitting:
+                raise bdb.BdbQuit
+
     # Debug command handlers.
 
     def do_break(self, filename, line, temporary=False):
@@ -381,6 +645,43 @@ class Debugger(bdb.Bdb):
             else:
                 self.output('breakpoint_clear', bpnum=bpnum)
 
+    def resolve(self, path):
+        """
+        Return the value found by following the path from a local variable in
+        the stack: the index of the frame, the name of the local variable,
+        then the position of each child of a list or dict.
+        """
+        frame_index, name = path[:2]
+        value = self.snapshot[frame_index][0].f_locals[name]
+        for position in path[2:]:
+            value = child_items(value, position, 1)[0][1]
+        return value
+
+    def do_children(self, request, path, start):
+        """
+        Send a page of the children of a list or dict shown in the debug
+        inspector.
+        """
+        value = self.resolve(path)
+        children = [[label] + inspect_value(child)
+                    for label, child in child_items(value, start, PAGE_SIZE)]
+        self.output('children', request=request, start=start,
+                    total=len(value), children=children)
+
+    def do_value(self, request, path):
+        """
+        Send the full, unbounded, repr of a value shown in the debug
+        inspector.
+        """
+        self.output('value', request=request, value=repr(self.resolve(path)))
+
+    def do_limits(self, **limits):
+        """
+        Set the limits on the size of the reprs sent to the client (see
+        BoundedRepr).
+        """
+        short_repr.configure(**limits)
+
     def do_step(self):
         """
         Stop after one line of code.
@@ -466,13 +767,57 @@ class Debugger(bdb.Bdb):
              ' r"{filename}", "exec");'
              'exec(__debug_code__);'
              '__debug_script__.close();'.format(filename=filename))
-        self.run(e)
+        try:
+            self.run(e)
+        finally:
+            self.end_fast_continue()
 
 
-def run(hostname, port, filename, *args):
+def listen(hostname, port):
+    """
+    Return a socket listening for the client debugger at hostname/port.
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    s.bind((hostname, port))
+    s.listen(1)
+    return s
+
+
+def serve(hostname):
+    """
+    Start a debug runner in advance, before the script to debug is known.
+
+    The runner listens on a free port, which it reports on stdout in a line
+    starting "MU-READY". It then waits for a line of JSON on stdin containing
+    the filename, arguments and working directory of the script to debug.
+    The script's stderr is redirected to stdout, where Mu reads its output.
+    """
+    s = listen(hostname, 0)
+    port = s.getsockname()[1]
+    print('MU-READY', port, flush=True)
+    line = sys.stdin.readline()
+    if not line:
+        # Mu has gone away without needing this runner.
+        s.close()
+        return
+    script = json.loads(line)
+    os.chdir(script['cwd'])
+    sys.stderr.flush()
+    os.dup2(sys.stdout.fileno(), sys.stderr.fileno())
+    run(hostname, port, script['filename'], *script['args'], listener=s)
+
+
+def run(hostname, port, filename, *args, listener=None):
     """
     Run a Python script identified by "filename" with the specified arguments
     in a debugger session that's listening at hostname/port.
+
+    If a listener socket is given, the client debugger connects to that rather
+    than a new socket bound to hostname/port. A new socket's port is reported
+    on stdout in a line starting "MU-READY" (as by serve), so port 0 can be
+    used to listen on a free port.
     """
     # Create the correct context for the target Python script.
     sys.argv[0] = filename
@@ -480,11 +825,11 @@ def run(hostname, port, filename, *args):
     sys.path[0] = os.path.dirname(filename)
 
     # Socket to which the client debugger connects.
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-    s.bind((hostname, port))
-    s.listen(1)
+    s = listener
+    if s is None:
+        s = listen(hostname, port)
+        port = s.getsockname()[1]
+        print('MU-READY', port, flush=True)
 
     debugger = Debugger(s, hostname, port)
     debugger.reset()
@@ -16,6 +16,48 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+import json
+import struct
+
+
+#: Each message is prefixed by its length as an unsigned 32-bit integer.
+HEADER = struct.Struct('!I')
+#: Number of bytes to ask for from the socket in each recv() call.
+RECV_SIZE = 65536
+
+
+def encode_message(event, data):
+    """
+    Return the bytes to send over the socket for the named event and its
+    associated data: a length prefix followed by compact JSON.
+    """
+    payload = json.dumps((event, data), separators=(',', ':'))
+    payload = payload.encode('utf-8')
+    return HEADER.pack(len(payload)) + payload
+
+
+def decode_messages(buffer):
+    """
+    Remove all the complete messages from the start of the referenced
+    bytearray and return them as a list of decoded (event, data) pairs.
+
+    Any incomplete message is left in the buffer, to be completed by the
+    next recv() from the socket.
+    """
+    messages = []
+    start = 0
+    size = len(buffer)
+    while size - start >= HEADER.size:
+        length, = HEADER.unpack_from(buffer, start)
+        end = start + HEADER.size + length
+        if end > size:
+            break
+        # Python 3.5's json.loads only takes a str.
+        payload = buffer[start + HEADER.size:end].decode('utf-8')
+        messages.append(json.loads(payload))
+        start = end
+    del buffer[:start]
+    return messages
 
 
 def is_breakpoint_line(code):
@@ -39,3 +81,26 @@ def is_breakpoint_line(code):
     if len(code) == 1 and code in (')', '}', ']'):
         return False
     return True
+
+
+def diff_namespace(old, new):
+    """
+    Given two dicts of names and reprs, return a dict of the values that
+    changed (or were added) and the names that were removed to turn "old" into
+    "new", or None if they are the same.
+    """
+    changed = {k: v for k, v in new.items() if old.get(k) != v}
+    removed = [k for k in old if k not in new]
+    if changed or removed:
+        return {'changed': changed, 'removed': removed}
+    return None
+
+
+def apply_delta(namespace, delta):
+    """
+    Update the namespace dict of names and reprs in place with the changes
+    produced by diff_namespace.
+    """
+    for name in delta['removed']:
+        namespace.pop(name, None)
+    namespace.update(delta['changed'])
@@ -19,7 +19,6 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
 import sys
 import logging
-import csv
 import shutil
 from PyQt5.QtCore import QSize, QProcess, QTimer
 from PyQt5.QtWidgets import (QVBoxLayout, QListWidget, QLabel, QListWidgetItem,
@@ -27,6 +26,7 @@ from PyQt5.QtWidgets import (QVBoxLayout, QListWidget, QLabel, QListWidgetItem,
                              QTabWidget, QWidget, QCheckBox, QLineEdit)
 from PyQt5.QtGui import QTextCursor
 from mu.resources import load_icon
+from mu.logic import package_files
 
 
 logger = logging.getLogger(__name__)
@@ -307,14 +307,22 @@ class PackageDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
 
-    def setup(self, to_remove, to_add, module_dir):
+    def setup(self, to_remove, to_add, module_dir, wheel_dir=None,
+              index=None):
         """
         Create the UI for the dialog.
         """
         self.to_remove = to_remove
         self.to_add = to_add
         self.module_dir = module_dir
+        self.wheel_dir = wheel_dir  # Local packages to install from first.
+        self.index = index  # Installed packages, by normalised name.
         self.pkg_dirs = {}  # To hold locations of to-be-removed packages.
+        self.pkg_files = {}  # Known files of to-be-removed packages.
+        self.emptied_dirs = set()  # Directories files were removed from.
+        self.pip_packages = []  # Packages being installed by pip.
+        self.pip_queue = []  # Packages left to install one at a time.
+        self.pip_results = []  # (package, installed) for each package.
         self.process = None
         # Basic layout.
         self.setMinimumSize(600, 400)
@@ -341,21 +349,45 @@ class PackageDialog(QDialog):
         """
         Work out which packages need to be removed and then kick off their
         removal.
+
+        Packages are looked up in the index of installed packages. Without
+        one, the metadata directories in the module directory are indexed by
+        package name in a single pass.
         """
-        dirs = [os.path.join(self.module_dir, d)
-                for d in os.listdir(self.module_dir)
-                if d.endswith("dist-info") or d.endswith("egg-info")]
+        if self.index is None:
+            self.index = {}
+            for d in os.listdir(self.module_dir):
+                if d.endswith("dist-info") or d.endswith("egg-info"):
+                    # Assets on the filesystem use a normalised package name,
+                    # followed by a "-" and the version.
+                    name = d.split('-', 1)[0].lower()
+                    self.index[name] = {'info': d, 'files': None}
         self.pkg_dirs = {}
+        self.pkg_files = {}
+        self.emptied_dirs = set()
         for pkg in self.to_remove:
-            for d in dirs:
-                # Assets on the filesystem use a normalised package name.
-                pkg_name = pkg.replace('-', '_').lower()
-                if os.path.basename(d).lower().startswith(pkg_name + '-'):
-                    self.pkg_dirs[pkg] = d
+            entry = self.index.get(pkg.replace('-', '_').lower())
+            if entry:
+                self.pkg_dirs[pkg] = os.path.join(self.module_dir,
+                                                  entry['info'])
+                if entry.get('files') is not None:
+                    self.pkg_files[pkg] = entry['files']
         if self.pkg_dirs:
             # If there are packages to remove, schedule removal.
             QTimer.singleShot(2, self.remove_package)
 
+    def remove_file(self, to_delete):
+        """
+        Delete a file belonging to a package, remembering the directory it was
+        in so the directory can be removed if it's left empty.
+        """
+        try:
+            os.remove(to_delete)
+        except Exception as ex:
+            logger.error('Unable to remove: ' + to_delete)
+            logger.error(ex)
+        self.emptied_dirs.add(os.path.dirname(os.path.normpath(to_delete)))
+
     def remove_package(self):
         """
         Take a package from the pending packages to be removed, delete all its
@@ -364,18 +396,14 @@ class PackageDialog(QDialog):
         """
         if self.pkg_dirs:
             package, info = self.pkg_dirs.popitem()
-            if info.endswith("dist-info"):
-                # Modern
-                record = os.path.join(info, 'RECORD')
-                with open(record) as f:
-                    files = csv.reader(f)
-                    for row in files:
-                        to_delete = os.path.join(self.module_dir, row[0])
-                        try:
-                            os.remove(to_delete)
-                        except Exception as ex:
-                            logger.error('Unable to remove: ' + to_delete)
-                            logger.error(ex)
+            files = self.pkg_files.pop(package, None)
+            try:
+                if files is None:
+                    # Not indexed, so read them from the package's record.
+                    files = package_files(self.module_dir,
+                                          os.path.basename(info))
+                for filename in files:
+                    self.remove_file(os.path.join(self.module_dir, filename))
                 shutil.rmtree(info, ignore_errors=True)
                 # Some modules don't use the module name for the module
                 # directory (they use a lower case variant thereof). E.g.
@@ -385,47 +413,15 @@ class PackageDialog(QDialog):
                 shutil.rmtree(normal_module, ignore_errors=True)
                 shutil.rmtree(lower_module, ignore_errors=True)
                 self.append_data('Removed {}\n'.format(package))
-            else:
-                # Egg
-                try:
-                    record = os.path.join(info, 'installed-files.txt')
-                    with open(record) as f:
-                        files = f.readlines()
-                        for row in files:
-                            to_delete = os.path.join(info, row.strip())
-                            try:
-                                os.remove(to_delete)
-                            except Exception as ex:
-                                logger.error("Unable to remove: " + to_delete)
-                                logger.error(ex)
-                    shutil.rmtree(info, ignore_errors=True)
-                    # Some modules don't use the module name for the module
-                    # directory (they use a lower case variant thereof). E.g.
-                    # "Fom" vs. "fom".
-                    normal_module = os.path.join(self.module_dir, package)
-                    lower_module = os.path.join(self.module_dir,
-                                                package.lower())
-                    shutil.rmtree(normal_module, ignore_errors=True)
-                    shutil.rmtree(lower_module, ignore_errors=True)
-                    self.append_data('Removed {}\n'.format(package))
-                except Exception as ex:
-                    msg = ("UNABLE TO REMOVE PACKAGE: {} (check the logs for"
-                           " more information.)").format(package)
-                    self.append_data(msg)
-                    logger.error("Unable to remove package: " + package)
-                    logger.error(ex)
+            except Exception as ex:
+                msg = ("UNABLE TO REMOVE PACKAGE: {} (check the logs for"
+                       " more information.)").format(package)
+                self.append_data(msg)
+                logger.error("Unable to remove package: " + package)
+                logger.error(ex)
             QTimer.singleShot(2, self.remove_package)
         else:
-            # Clean any directories not containing files.
-            dirs = [os.path.join(self.module_dir, d)
-                    for d in os.listdir(self.module_dir)]
-            for d in dirs:
-                keep = False
-                for entry in os.walk(d):
-                    if entry[2]:
-                        keep = True
-                if not keep:
-                    shutil.rmtree(d, ignore_errors=True)
+            self.remove_empty_dirs()
             # Remove the bin directory (and anything in it) since we don't
             # use these assets.
             shutil.rmtree(os.path.join(self.module_dir, "bin"),
@@ -434,6 +430,25 @@ class PackageDialog(QDialog):
             if not (self.to_add or self.process):
                 self.end_state()
 
+    def remove_empty_dirs(self):
+        """
+        Remove the directories (within the module directory) that files were
+        deleted from, and their parents, if they no longer contain anything.
+        Only the directories the removed packages used are looked at, rather
+        than everything that's installed.
+        """
+        module_dir = os.path.normpath(self.module_dir)
+        # Deepest first, so a parent is only checked after its children.
+        for d in sorted(self.emptied_dirs, key=len, reverse=True):
+            while d.startswith(module_dir + os.sep):
+                try:
+                    os.rmdir(d)
+                except OSError:
+                    # Not empty (or already gone).
+                    break
+                d = os.path.dirname(d)
+        self.emptied_dirs = set()
+
     def end_state(self):
         """
         Set the UI to a valid end state.
@@ -441,14 +456,29 @@ class PackageDialog(QDialog):
         self.append_data('\nFINISHED')
         self.button_box.button(QDialogButtonBox.Ok).setEnabled(True)
 
-    def run_pip(self):
+    def run_pip(self, packages=None):
         """
-        Run a pip command in a subprocess and pipe the output to the dialog's
-        text area.
+        Run pip in a subprocess to install the referenced packages (by
+        default, all the packages to be added at once), and pipe the output
+        to the dialog's text area.
+
+        A single pip command resolves the dependencies of all the packages
+        together and downloads each only once. However, if any package can't
+        be installed (e.g. its name is misspelled) pip installs none of them,
+        so they're then retried one at a time (see finished).
+
+        If there's a wheel directory (for example, filled in advance with
+        "pip download -d" for a classroom without internet access), pip only
+        looks for the packages there, rather than also trying to reach PyPI.
         """
-        package = self.to_add.pop()
-        args = ['-m', 'pip', 'install', package, '--target',
-                self.module_dir]
+        if packages is None:
+            packages = sorted(self.to_add)
+            self.to_add = set()
+        self.pip_packages = packages
+        args = ['-m', 'pip', 'install'] + packages + ['--target',
+                                                      self.module_dir]
+        if self.wheel_dir and os.path.isdir(self.wheel_dir):
+            args += ['--no-index', '--find-links', self.wheel_dir]
         self.process = QProcess(self)
         self.process.setProcessChannelMode(QProcess.MergedChannels)
         self.process.readyRead.connect(self.read_process)
@@ -456,23 +486,54 @@ class PackageDialog(QDialog):
         logger.info('{} {}'.format(sys.executable, ' '.join(args)))
         self.process.start(sys.executable, args)
 
-    def finished(self):
+    def finished(self, exit_code=0, exit_status=QProcess.NormalExit):
         """
-        Called when the subprocess that uses pip to install a package is
+        Called when the subprocess that uses pip to install the packages is
         finished.
+
+        If pip failed to install several packages together, none of them were
+        installed, so each is retried on its own to install all those that
+        can be. Once pip has finished with every package, the result for each
+        one is reported.
         """
-        if self.to_add:
-            self.process = None
-            self.run_pip()
+        data = self.process.readAll()
+        if data:
+            self.append_data(data.data().decode('utf-8'))
+        self.process = None
+        failed = exit_code or exit_status != QProcess.NormalExit
+        if failed and len(self.pip_packages) > 1:
+            logger.warning('Unable to install packages together: {}'.format(
+                self.pip_packages))
+            self.append_data('\nUnable to install the packages together, so '
+                             'trying each one on its own.\n')
+            self.pip_queue = list(self.pip_packages)
         else:
-            if not self.pkg_dirs:
-                self.end_state()
+            for package in self.pip_packages:
+                self.pip_results.append((package, not failed))
+        if self.pip_queue:
+            self.run_pip([self.pip_queue.pop(0)])
+            return
+        self.append_data('\n')
+        for package, installed in self.pip_results:
+            if installed:
+                self.append_data('Installed {}\n'.format(package))
+            else:
+                msg = ("UNABLE TO INSTALL PACKAGE: {} (check the output "
+                       "above for why.)\n").format(package)
+                self.append_data(msg)
+                logger.error('Unable to install package: ' + package)
+        self.pip_results = []
+        if not self.pkg_dirs:
+            self.end_state()
 
     def read_process(self):
         """
         Read data from the child process and append it to the text area. Try
         to keep reading until there's no more data from the process.
         """
+        if self.process is None:
+            # Finished, and everything it wrote has been read.
+            return
         data = self.process.readAll()
         if data:
             self.append_data(data.data().decode('utf-8'))
@@ -487,3 +548,63 @@ class PackageDialog(QDialog):
         cursor.insertText(msg)
         cursor.movePosition(QTextCursor.End)
         self.text_area.setTextCursor(cursor)
+
+
+class FlashDevicesDialog(QDialog):
+    """
+    Display a dialog to indicate the status of each of the devices being
+    flashed at the same time.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+    def setup(self, devices):
+        """
+        Create the UI for the dialog. The devices should be a list of the
+        names of the devices to be flashed.
+        """
+        self.items = {}
+        self.failed = set()
+        # Basic layout.
+        self.setMinimumSize(600, 400)
+        self.setWindowTitle(_('Flashing Devices'))
+        widget_layout = QVBoxLayout()
+        self.setLayout(widget_layout)
+        self.summary = QLabel(_('Flashing {} devices.').format(len(devices)))
+        widget_layout.addWidget(self.summary)
+        # A line for each device.
+        self.device_list = QListWidget()
+        for device in devices:
+            item = QListWidgetItem(self.device_list)
+            self.items[device] = item
+            self.on_progress(device, _('Waiting'))
+        widget_layout.addWidget(self.device_list)
+        # Buttons.
+        self.button_box = QDialogButtonBox(QDialogButtonBox.Ok)
+        self.button_box.button(QDialogButtonBox.Ok).setEnabled(False)
+        self.button_box.accepted.connect(self.accept)
+        widget_layout.addWidget(self.button_box)
+
+    def on_progress(self, device, status):
+        """
+        Update the status shown for the referenced device.
+        """
+        self.items[device].setText('{}: {}'.format(device, status))
+
+    def on_fail(self, device, error):
+        """
+        Show that flashing the referenced device failed and why.
+        """
+        self.failed.add(device)
+        self.on_progress(device, _('Failed ({})').format(error))
+
+    def on_finished(self):
+        """
+        Set the UI to a valid end state, summarising the outcome.
+        """
+        total = len(self.items)
+        flashed = total - len(self.failed)
+        summary = _('Flashed {} of {} devices.').format(flashed, total)
+        self.summary.setText(summary)
+        self.button_box.button(QDialogButtonBox.Ok).setEnabled(True)
@@ -89,6 +89,10 @@ class EditorPane(QsciScintilla):
         self.has_annotations = False
         self.setModified(False)
         self.breakpoint_handles = set()
+        self.journal_id = None  # Identifies the journal of an unsaved tab.
+        self.unjournaled = 0  # Characters changed since last journaled.
+        self.journaled_at = 0.0  # When last journaled (time.monotonic).
+        self.SCN_MODIFIED.connect(self.count_changes)
         self.configure()
 
     def dropEvent(self, event):
@@ -127,6 +131,17 @@ class EditorPane(QsciScintilla):
         if not event.isAccepted():
             super().dropEvent(event)
 
+    def count_changes(self, position, modification_type, text, length,
+                      *args):
+        """
+        Called by Scintilla whenever the document is modified, to keep a
+        running count of the characters inserted or deleted since the tab was
+        last journaled. This happens on every keystroke, so does no more.
+        """
+        if modification_type & (self.SC_MOD_INSERTTEXT |
+                                self.SC_MOD_DELETETEXT):
+            self.unjournaled += length
+
     def configure(self):
         """
         Set up the editor component.
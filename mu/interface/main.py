@@ -20,19 +20,20 @@ import sys
 import logging
 import serial
 import os.path
-from PyQt5.QtCore import QSize, Qt, pyqtSignal, QTimer, QIODevice
+from PyQt5.QtCore import (QSize, Qt, pyqtSignal, QTimer, QIODevice,
+                          QFileSystemWatcher)
 from PyQt5.QtWidgets import (QToolBar, QAction, QDesktopWidget, QWidget,
                              QVBoxLayout, QTabWidget, QFileDialog, QMessageBox,
                              QLabel, QMainWindow, QStatusBar, QDockWidget,
                              QShortcut)
-from PyQt5.QtGui import QKeySequence, QStandardItemModel
+from PyQt5.QtGui import QKeySequence
 from PyQt5.QtSerialPort import QSerialPort
 from mu import __version__
 from mu.interface.dialogs import (ModeSelector, AdminDialog, FindReplaceDialog,
-                                  PackageDialog)
+                                  PackageDialog, FlashDevicesDialog)
 from mu.interface.themes import (DayTheme, NightTheme, ContrastTheme,
                                  DEFAULT_FONT_SIZE)
-from mu.interface.panes import (DebugInspector, DebugInspectorItem,
+from mu.interface.panes import (DebugInspector, DebugInspectorModel,
                                 PythonProcessPane, JupyterREPLPane,
                                 MicroPythonREPLPane, FileSystemPane,
                                 PlotterPane)
@@ -43,6 +44,10 @@ from mu.resources import load_icon, load_pixmap
 logger = logging.getLogger(__name__)
 
 
+#: Milliseconds to wait after a change to /dev before checking USB devices.
+USB_SETTLE_TIME = 250
+
+
 class ButtonBar(QToolBar):
     """
     Represents the bar of buttons across the top of the editor and defines
@@ -154,12 +159,13 @@ class FileTabs(QTabWidget):
         Ask the user before closing the file.
         """
         window = self.nativeParentWidget()
-        modified = self.widget(tab_id).isModified()
-        if modified:
+        tab = self.widget(tab_id)
+        if tab.isModified():
             msg = ('There is un-saved work, closing the tab will cause you '
                    'to lose it.')
             if window.show_confirmation(msg) == QMessageBox.Cancel:
                 return
+        window.dirty_tabs.discard(tab)
         super(FileTabs, self).removeTab(tab_id)
 
     def change_tab(self, tab_id):
@@ -183,7 +189,9 @@ class Window(QMainWindow):
     title = _("Mu {}").format(__version__)
     icon = "icon"
     timer = None
+    journal_timer = None
     usb_checker = None
+    usb_watcher = None
     serial = None
     repl = None
     plotter = None
@@ -199,6 +207,10 @@ class Window(QMainWindow):
     load_theme = pyqtSignal(str)
     previous_folder = None
 
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.dirty_tabs = set()  # Tabs with unsaved changes.
+
     def set_zoom(self):
         """
         Sets the zoom to current zoom_position level.
@@ -292,7 +304,11 @@ class Window(QMainWindow):
         new_tab.set_api(api)
 
         @new_tab.modificationChanged.connect
-        def on_modified():
+        def on_modified(modified):
+            if modified:
+                self.dirty_tabs.add(new_tab)
+            else:
+                self.dirty_tabs.discard(new_tab)
             modified_tab_index = self.tabs.currentIndex()
             self.tabs.setTabText(modified_tab_index, new_tab.label)
             self.update_title(new_tab.label)
@@ -336,10 +352,7 @@ class Window(QMainWindow):
         Returns a boolean indication if there are any modified tabs in the
         editor.
         """
-        for widget in self.widgets:
-            if widget.isModified():
-                return True
-        return False
+        return bool(self.dirty_tabs)
 
     def on_serial_read(self):
         """
@@ -408,18 +421,34 @@ class Window(QMainWindow):
         self.fs_pane.setFocus()
         file_manager.on_list_files.connect(self.fs_pane.on_ls)
         self.fs_pane.list_files.connect(file_manager.ls)
+        self.fs_pane.sync_files.connect(file_manager.sync)
         self.fs_pane.microbit_fs.put.connect(file_manager.put)
+        self.fs_pane.microbit_fs.put_files.connect(file_manager.put_files)
         self.fs_pane.microbit_fs.delete.connect(file_manager.delete)
         self.fs_pane.microbit_fs.list_files.connect(file_manager.ls)
         self.fs_pane.local_fs.get.connect(file_manager.get)
+        self.fs_pane.local_fs.get_files.connect(file_manager.get_files)
+        # The file manager's thread is busy during a transfer, so cancelling
+        # must happen directly rather than being queued behind it.
+        self.fs_pane.cancel_transfer.connect(file_manager.cancel,
+                                             Qt.DirectConnection)
         self.fs_pane.local_fs.list_files.connect(file_manager.ls)
         file_manager.on_put_file.connect(self.fs_pane.microbit_fs.on_put)
         file_manager.on_delete_file.connect(self.fs_pane.microbit_fs.on_delete)
         file_manager.on_get_file.connect(self.fs_pane.local_fs.on_get)
+        file_manager.on_put_files.connect(
+            self.fs_pane.microbit_fs.on_put_files)
+        file_manager.on_get_files.connect(self.fs_pane.local_fs.on_get_files)
+        file_manager.on_sync_files.connect(
+            self.fs_pane.microbit_fs.on_sync_files)
+        file_manager.on_transfer_progress.connect(
+            self.fs_pane.on_transfer_progress)
         file_manager.on_list_fail.connect(self.fs_pane.on_ls_fail)
         file_manager.on_put_fail.connect(self.fs_pane.on_put_fail)
         file_manager.on_delete_fail.connect(self.fs_pane.on_delete_fail)
         file_manager.on_get_fail.connect(self.fs_pane.on_get_fail)
+        file_manager.on_put_files_fail.connect(self.fs_pane.on_put_files_fail)
+        file_manager.on_get_files_fail.connect(self.fs_pane.on_get_files_fail)
         self.connect_zoom(self.fs_pane)
         return self.fs_pane
 
@@ -466,7 +495,10 @@ class Window(QMainWindow):
         Adds a Jupyter based REPL pane to the application.
         """
         kernel_manager.kernel.gui = 'qt4'
-        kernel_client.start_channels()
+        if not kernel_client.channels_running:
+            # A kernel kept running while the REPL was hidden is already
+            # connected.
+            kernel_client.start_channels()
         ipython_widget = JupyterREPLPane()
         ipython_widget.kernel_manager = kernel_manager
         ipython_widget.kernel_client = kernel_client
@@ -507,7 +539,7 @@ class Window(QMainWindow):
     def add_python3_runner(self, script_name, working_directory,
                            interactive=False, debugger=False,
                            command_args=None, runner=None, envars=None,
-                           python_args=None):
+                           python_args=None, process=None):
         """
         Display console output for the referenced Python script.
 
@@ -533,6 +565,9 @@ class Window(QMainWindow):
 
         If python_args is given, these will be passed as arguments to the
         Python runtime used to launch the child process.
+
+        If process is given, it is a Python process that's already running,
+        which is sent the script to run instead of starting a new process.
         """
         self.process_runner = PythonProcessPane(self)
         self.runner = QDockWidget(_("Running: {}").format(
@@ -545,7 +580,8 @@ class Window(QMainWindow):
         self.addDockWidget(Qt.BottomDockWidgetArea, self.runner)
         self.process_runner.start_process(script_name, working_directory,
                                           interactive, debugger, command_args,
-                                          envars, runner, python_args)
+                                          envars, runner, python_args,
+                                          process)
         self.process_runner.setFocus()
         self.process_runner.on_append_text.connect(self.on_stdout_write)
         self.connect_zoom(self.process_runner)
@@ -556,8 +592,11 @@ class Window(QMainWindow):
         Display a debug inspector to view the call stack.
         """
         self.debug_inspector = DebugInspector()
-        self.debug_model = QStandardItemModel()
+        self.debug_model = DebugInspectorModel()
         self.debug_inspector.setModel(self.debug_model)
+        self.debug_inspector.clicked.connect(self.debug_model.load_more)
+        self.debug_inspector.doubleClicked.connect(
+            self.debug_model.fetch_value)
         self.inspector = QDockWidget(_('Debug Inspector'))
         self.inspector.setWidget(self.debug_inspector)
         self.inspector.setFeatures(QDockWidget.DockWidgetMovable)
@@ -569,51 +608,38 @@ class Window(QMainWindow):
 
     def update_debug_inspector(self, locals_dict):
         """
-        Given the contents of a dict representation of the locals in the
-        current stack frame, update the debug inspector with the new values.
+        Given a dict of the locals in the current stack, update the debug
+        inspector with the new values.
+
+        Each local maps to a (path, (kind, value)) pair: the path to find its
+        children in the debug runner, and the summary of the value sent by the
+        runner (see DebugInspectorModel.append_variable).
         """
         excluded_names = ['__builtins__', '__debug_code__',
                           '__debug_script__', ]
         names = sorted([x for x in locals_dict if x not in excluded_names])
         self.debug_model.clear()
         self.debug_model.setHorizontalHeaderLabels([_('Name'), _('Value'), ])
+        root = self.debug_model.invisibleRootItem()
         for name in names:
-            try:
-                # DANGER!
-                val = eval(locals_dict[name])
-            except Exception:
-                val = None
-            if isinstance(val, list):
-                # Show a list consisting of rows of position/value
-                list_item = DebugInspectorItem(name)
-                for i, i_val in enumerate(val):
-                    list_item.appendRow([
-                        DebugInspectorItem(str(i)),
-                        DebugInspectorItem(repr(i_val))
-                    ])
-                self.debug_model.appendRow([
-                    list_item,
-                    DebugInspectorItem(_('(A list of {} items.)')
-                                       .format(len(val)))
-                ])
-            elif isinstance(val, dict):
-                # Show a dict consisting of rows of key/value pairs.
-                dict_item = DebugInspectorItem(name)
-                for k, k_val in val.items():
-                    dict_item.appendRow([
-                        DebugInspectorItem(repr(k)),
-                        DebugInspectorItem(repr(k_val))
-                    ])
-                self.debug_model.appendRow([
-                    dict_item,
-                    DebugInspectorItem(_('(A dict of {} items.)')
-                                       .format(len(val)))
-                ])
-            else:
-                self.debug_model.appendRow([
-                    DebugInspectorItem(name),
-                    DebugInspectorItem(locals_dict[name]),
-                ])
+            path, (kind, value) = locals_dict[name]
+            self.debug_model.append_variable(root, name, path, kind, value)
+
+    def update_debug_children(self, request, start, total, children):
+        """
+        Add a page of children, fetched from the debug runner, to the list or
+        dict they belong to in the debug inspector.
+        """
+        if self.debug_model:
+            self.debug_model.add_children(request, start, total, children)
+
+    def update_debug_value(self, request, value):
+        """
+        Show the full repr of a value, fetched from the debug runner, in the
+        debug inspector.
+        """
+        if self.debug_model:
+            self.debug_model.set_value(request, value)
 
     def remove_filesystem(self):
         """
@@ -707,15 +733,27 @@ class Window(QMainWindow):
         else:
             return {}
 
-    def sync_packages(self, to_remove, to_add, module_dir):
+    def sync_packages(self, to_remove, to_add, module_dir, wheel_dir=None,
+                      index=None):
         """
         Display a modal dialog that indicates the status of the add/remove
         package management operation.
         """
         package_box = PackageDialog(self)
-        package_box.setup(to_remove, to_add, module_dir)
+        package_box.setup(to_remove, to_add, module_dir, wheel_dir, index)
         package_box.exec()
 
+    def show_flash_progress(self, devices):
+        """
+        Display a (non-modal) dialog that indicates the status of each of the
+        referenced devices being flashed. Returns the dialog so it can be
+        updated as flashing progresses.
+        """
+        flash_box = FlashDevicesDialog(self)
+        flash_box.setup(devices)
+        flash_box.show()
+        return flash_box
+
     def show_message(self, message, information=None, icon=None):
         """
         Displays a modal message to the user.
@@ -872,15 +910,46 @@ class Window(QMainWindow):
         for widget in self.widgets:
             widget.set_api(api)
 
+    def set_journal_timer(self, duration, callback):
+        """
+        Set a repeating timer to call "callback", which journals unsaved tabs,
+        every "duration" seconds.
+        """
+        self.journal_timer = QTimer()
+        self.journal_timer.timeout.connect(callback)
+        self.journal_timer.start(duration * 1000)  # Measured in milliseconds.
+
     def set_usb_checker(self, duration, callback):
         """
         Sets up a timer that polls for USB changes via the "callback" every
         "duration" seconds.
+
+        On Linux, device nodes appear in (and disappear from) /dev as devices
+        are attached (and removed). In this case /dev is watched instead of
+        polling and the "callback" is called as soon as it changes.
         """
         self.usb_checker = QTimer()
         self.usb_checker.timeout.connect(callback)
+        if sys.platform.startswith('linux'):
+            self.usb_watcher = QFileSystemWatcher(['/dev'])
+            if self.usb_watcher.directories():
+                # Several changes happen as a device is attached, so wait for
+                # them to settle before calling back just once.
+                self.usb_checker.setSingleShot(True)
+                self.usb_watcher.directoryChanged.connect(
+                    self.usb_changed)
+                self.usb_checker.start(duration * 1000)
+                return
+            self.usb_watcher = None
         self.usb_checker.start(duration * 1000)
 
+    def usb_changed(self, path):
+        """
+        Called when the watched /dev directory changes. Schedules a check for
+        USB changes once things have settled down.
+        """
+        self.usb_checker.start(USB_SETTLE_TIME)
+
     def set_timer(self, duration, callback):
         """
         Set a repeating timer to call "callback" every "duration" seconds.
@@ -19,6 +19,8 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import sys
 import site
 import os
+import json
+import codecs
 import re
 import platform
 import logging
@@ -27,13 +29,14 @@ import string
 import bisect
 import os.path
 from PyQt5.QtCore import (Qt, QProcess, QProcessEnvironment, pyqtSignal,
-                          QTimer, QUrl)
+                          QTimer, QUrl, QObject)
 from collections import deque
+from functools import partial
 from PyQt5.QtWidgets import (QMessageBox, QTextEdit, QFrame, QListWidget,
                              QGridLayout, QLabel, QMenu, QApplication,
-                             QTreeView)
+                             QTreeView, QProgressBar, QPushButton)
 from PyQt5.QtGui import (QKeySequence, QTextCursor, QCursor, QPainter,
-                         QDesktopServices, QStandardItem)
+                         QDesktopServices, QStandardItem, QStandardItemModel)
 from qtconsole.rich_jupyter_widget import RichJupyterWidget
 from mu.interface.themes import Font
 from mu.interface.themes import DEFAULT_FONT_SIZE
@@ -115,6 +118,14 @@ class JupyterREPLPane(RichJupyterWidget):
         """
         self._control.setFocus()
 
+    def request_restart_kernel(self):
+        """
+        When asked to (with CTRL-.), restart the kernel for a clean namespace
+        straight away, rather than waiting for it to shut down cleanly.
+        """
+        self.restart_kernel(_('Are you sure you want to restart the kernel?'),
+                            now=True)
+
 
 class MicroPythonREPLPane(QTextEdit):
     """
@@ -359,27 +370,58 @@ class MicroPythonDeviceFileList(MuFileList):
     """
 
     put = pyqtSignal(str)
+    put_files = pyqtSignal(list)
     delete = pyqtSignal(str)
+    sync = pyqtSignal()
 
     def __init__(self, home):
         super().__init__()
         self.home = home
         self.setDragDropMode(QListWidget.DragDrop)
+        self.setSelectionMode(QListWidget.ExtendedSelection)
+
+    def dragEnterEvent(self, event):
+        """
+        Accept files and directories dragged in from outside Mu too.
+        """
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+        else:
+            super().dragEnterEvent(event)
+
+    def dragMoveEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+        else:
+            super().dragMoveEvent(event)
 
     def dropEvent(self, event):
         source = event.source()
         if isinstance(source, LocalFileList):
-            file_exists = self.findItems(source.currentItem().text(),
-                                         Qt.MatchExactly)
-            if not file_exists or \
-                    file_exists and self.show_confirm_overwrite_dialog():
-                self.disable.emit()
-                local_filename = os.path.join(self.home,
-                                              source.currentItem().text())
-                msg = _("Copying '{}' to micro:bit.").format(local_filename)
-                logger.info(msg)
-                self.set_message.emit(msg)
-                self.put.emit(local_filename)
+            local_filenames = [os.path.join(self.home, item.text())
+                               for item in source.selectedItems()]
+        elif event.mimeData().hasUrls():
+            local_filenames = [url.toLocalFile()
+                               for url in event.mimeData().urls()
+                               if url.isLocalFile()]
+        else:
+            return
+        if not local_filenames:
+            return
+        file_exists = any(self.findItems(os.path.basename(f), Qt.MatchExactly)
+                          for f in local_filenames)
+        if not file_exists or \
+                file_exists and self.show_confirm_overwrite_dialog():
+            self.disable.emit()
+            if len(local_filenames) == 1:
+                msg = _("Copying '{}' to micro:bit.").format(
+                    local_filenames[0])
+            else:
+                msg = _("Copying {} items to micro:bit.").format(
+                    len(local_filenames))
+            logger.info(msg)
+            self.set_message.emit(msg)
+            self.put_files.emit(local_filenames)
 
     def on_put(self, microbit_file):
         """
@@ -389,9 +431,21 @@ class MicroPythonDeviceFileList(MuFileList):
         self.set_message.emit(msg)
         self.list_files.emit()
 
+    def on_put_files(self, microbit_files):
+        """
+        Fired when a queued put is completed for the given filenames.
+        """
+        msg = _("{} file(s) successfully copied to micro:bit.").format(
+            len(microbit_files))
+        self.set_message.emit(msg)
+        self.list_files.emit()
+
     def contextMenuEvent(self, event):
         menu = QMenu(self)
-        delete_action = menu.addAction(_("Delete (cannot be undone)"))
+        delete_action = None
+        if self.currentItem():
+            delete_action = menu.addAction(_("Delete (cannot be undone)"))
+        sync_action = menu.addAction(_("Copy changed files from computer"))
         action = menu.exec_(self.mapToGlobal(event.pos()))
         if action == delete_action:
             self.disable.emit()
@@ -401,6 +455,12 @@ class MicroPythonDeviceFileList(MuFileList):
             logger.info(msg)
             self.set_message.emit(msg)
             self.delete.emit(microbit_filename)
+        elif action == sync_action:
+            self.disable.emit()
+            msg = _("Copying changed files to micro:bit.")
+            logger.info(msg)
+            self.set_message.emit(msg)
+            self.sync.emit()
 
     def on_delete(self, microbit_file):
         """
@@ -411,6 +471,17 @@ class MicroPythonDeviceFileList(MuFileList):
         self.set_message.emit(msg)
         self.list_files.emit()
 
+    def on_sync_files(self, microbit_files, unchanged_files):
+        """
+        Fired when a sync is completed with the filenames that were copied
+        and those that were already up to date.
+        """
+        msg = _("{} changed file(s) copied to micro:bit, "
+                "{} already up to date.").format(len(microbit_files),
+                                                 len(unchanged_files))
+        self.set_message.emit(msg)
+        self.list_files.emit()
+
 
 class LocalFileList(MuFileList):
     """
@@ -418,30 +489,39 @@ class LocalFileList(MuFileList):
     """
 
     get = pyqtSignal(str, str)
+    get_files = pyqtSignal(list)
     open_file = pyqtSignal(str)
 
     def __init__(self, home):
         super().__init__()
         self.home = home
         self.setDragDropMode(QListWidget.DragDrop)
+        self.setSelectionMode(QListWidget.ExtendedSelection)
 
     def dropEvent(self, event):
         source = event.source()
         if isinstance(source, MicroPythonDeviceFileList):
-            file_exists = self.findItems(source.currentItem().text(),
-                                         Qt.MatchExactly)
+            microbit_filenames = [item.text()
+                                  for item in source.selectedItems()]
+            if not microbit_filenames:
+                return
+            file_exists = any(self.findItems(f, Qt.MatchExactly)
+                              for f in microbit_filenames)
             if not file_exists or \
                     file_exists and self.show_confirm_overwrite_dialog():
                 self.disable.emit()
-                microbit_filename = source.currentItem().text()
-                local_filename = os.path.join(self.home,
-                                              microbit_filename)
-                msg = _("Getting '{}' from micro:bit. "
-                        "Copying to '{}'.").format(microbit_filename,
-                                                   local_filename)
+                filenames = [[f, os.path.join(self.home, f)]
+                             for f in microbit_filenames]
+                if len(filenames) == 1:
+                    msg = _("Getting '{}' from micro:bit. "
+                            "Copying to '{}'.").format(*filenames[0])
+                else:
+                    msg = _("Getting {} files from micro:bit. "
+                            "Copying to '{}'.").format(len(filenames),
+                                                       self.home)
                 logger.info(msg)
                 self.set_message.emit(msg)
-                self.get.emit(microbit_filename, local_filename)
+                self.get_files.emit(filenames)
 
     def on_get(self, microbit_file):
         """
@@ -452,6 +532,16 @@ class LocalFileList(MuFileList):
         self.set_message.emit(msg)
         self.list_files.emit()
 
+    def on_get_files(self, microbit_files):
+        """
+        Fired when a queued get is completed for the given filenames.
+        """
+        msg = _("Successfully copied {} file(s) "
+                "from the micro:bit to your computer.").format(
+                    len(microbit_files))
+        self.set_message.emit(msg)
+        self.list_files.emit()
+
     def contextMenuEvent(self, event):
         menu = QMenu(self)
         local_filename = self.currentItem().text()
@@ -492,10 +582,13 @@ class FileSystemPane(QFrame):
     set_warning = pyqtSignal(str)
     list_files = pyqtSignal()
     open_file = pyqtSignal(str)
+    cancel_transfer = pyqtSignal()
+    sync_files = pyqtSignal(list, int)
 
     def __init__(self, home):
         super().__init__()
         self.home = home
+        self.sync_block_size = 0  # If set, sync only patches changed blocks.
         self.font = Font().load()
         microbit_fs = MicroPythonDeviceFileList(home)
         local_fs = LocalFileList(home)
@@ -520,7 +613,16 @@ class FileSystemPane(QFrame):
         layout.addWidget(local_label, 0, 1)
         layout.addWidget(microbit_fs, 1, 0)
         layout.addWidget(local_fs, 1, 1)
+        # Progress of queued transfers, only shown while one is running.
+        self.progress = QProgressBar()
+        self.progress.hide()
+        self.cancel_button = QPushButton(_('Cancel'))
+        self.cancel_button.hide()
+        self.cancel_button.clicked.connect(self.on_cancel)
+        layout.addWidget(self.progress, 2, 0)
+        layout.addWidget(self.cancel_button, 2, 1)
         self.microbit_fs.disable.connect(self.disable)
+        self.microbit_fs.sync.connect(self.on_sync)
         self.microbit_fs.set_message.connect(self.show_message)
         self.local_fs.disable.connect(self.disable)
         self.local_fs.set_message.connect(self.show_message)
@@ -572,8 +674,44 @@ class FileSystemPane(QFrame):
         local_files.sort()
         for f in local_files:
             self.local_fs.addItem(f)
+        self.progress.hide()
+        self.cancel_button.hide()
         self.enable()
 
+    def on_transfer_progress(self, done, total, transferred, rate):
+        """
+        Fired after each file in a queued transfer. Shows the aggregate
+        progress and throughput of the transfer.
+        """
+        self.progress.setMaximum(total)
+        self.progress.setValue(done)
+        self.progress.show()
+        if done < total:
+            self.cancel_button.show()
+        else:
+            self.cancel_button.hide()
+        self.show_message(_("Copied {} of {} files ({:.1f} KB/s).").format(
+            done, total, rate / 1024))
+
+    def on_sync(self):
+        """
+        Fired when the user asks for the files on their computer to be synced
+        to the device. Emits the paths of all the listed local files and the
+        size of the blocks to patch in files that have changed (0 to copy
+        whole files).
+        """
+        local_files = [os.path.join(self.home, self.local_fs.item(i).text())
+                       for i in range(self.local_fs.count())]
+        self.sync_files.emit(local_files, self.sync_block_size)
+
+    def on_cancel(self):
+        """
+        Fired when the user cancels a queued transfer.
+        """
+        self.cancel_button.hide()
+        self.show_message(_("Cancelling after the current file."))
+        self.cancel_transfer.emit()
+
     def on_ls_fail(self):
         """
         Fired when listing files fails.
@@ -593,6 +731,19 @@ class FileSystemPane(QFrame):
                             "the device. Please check Mu's logs for "
                             "more information.").format(filename))
 
+    def on_put_files_fail(self, filenames):
+        """
+        Fired once when the referenced files from a queued transfer cannot be
+        copied onto the device.
+        """
+        if len(filenames) == 1:
+            self.on_put_fail(filenames[0])
+            return
+        self.show_warning(_("There was a problem copying {} files onto the "
+                            "device, starting with '{}'. Please check Mu's "
+                            "logs for more information.").format(
+                                len(filenames), filenames[0]))
+
     def on_delete_fail(self, filename):
         """
         Fired when a deletion on the device for the given file failed.
@@ -609,6 +760,19 @@ class FileSystemPane(QFrame):
                             "device. Please check Mu's logs for "
                             "more information.").format(filename))
 
+    def on_get_files_fail(self, filenames):
+        """
+        Fired once when the referenced files from a queued transfer cannot be
+        got from the device.
+        """
+        if len(filenames) == 1:
+            self.on_get_fail(filenames[0])
+            return
+        self.show_warning(_("There was a problem getting {} files from the "
+                            "device, starting with '{}'. Please check Mu's "
+                            "logs for more information.").format(
+                                len(filenames), filenames[0]))
+
     def set_theme(self, theme):
         pass
 
@@ -629,6 +793,140 @@ class FileSystemPane(QFrame):
         self.set_font_size(PANE_ZOOM_SIZES[size])
 
 
+def process_environment(envars=None):
+    """
+    Return the environment for a child Python process, with the list of
+    (name, value) environment variables added to the system environment.
+    """
+    env = QProcessEnvironment.systemEnvironment()
+    # Force buffers to flush immediately.
+    env.insert('PYTHONUNBUFFERED', '1')
+    env.insert('PYTHONIOENCODING', 'utf-8')
+    for name, value in envars or []:
+        env.insert(name, value)
+    env.insert('PYTHONPATH', os.pathsep.join(sys.path))
+    return env
+
+
+class ProcessPool(QObject):
+    """
+    Keeps child Python processes started in advance, each waiting to be told
+    what to do, so one can be claimed without waiting for Python to start up.
+
+    Each process must write a line starting with "MU-READY" to stdout once it
+    is ready. The rest of that line is handed over with the process when it's
+    claimed, and a replacement started in the background. Anything else the
+    process writes while starting up (on stdout or stderr, such as a warning
+    from an imported module) is logged. Once claimed, the process should
+    redirect its stderr to stdout, since only stdout is read from then on.
+    """
+
+    ready_tag = 'MU-READY'  # Starts the line a process writes once ready.
+
+    process_ready = pyqtSignal()  # A process is ready to be claimed.
+    process_failed = pyqtSignal()  # A process ended before it was ready.
+
+    def __init__(self, args, envars=None, size=1, parent=None):
+        super().__init__(parent)
+        self.args = args  # Arguments to the Python runtime.
+        self.envars = [tuple(envar) for envar in envars or []]
+        self.size = size
+        self.starting = []  # Processes yet to report they're ready.
+        self.ready = []  # (process, line) for each ready process.
+
+    def fill(self):
+        """
+        Start enough new processes to bring the pool up to size.
+        """
+        while len(self.starting) + len(self.ready) < self.size:
+            process = QProcess(self)
+            process.setProcessChannelMode(QProcess.SeparateChannels)
+            process.setProcessEnvironment(process_environment(self.envars))
+            process.readyRead.connect(partial(self.on_ready_read, process))
+            process.readyReadStandardError.connect(
+                partial(self.on_ready_read_stderr, process))
+            process.finished.connect(partial(self.on_finished, process))
+            process.start(sys.executable, self.args)
+            self.starting.append(process)
+            logger.info('Starting pooled process: {}'.format(self.args))
+
+    def on_ready_read(self, process):
+        """
+        Move the process to the ready list once it has written its ready line,
+        logging any other lines it writes first.
+        """
+        while process in self.starting and process.canReadLine():
+            line = bytes(process.readLine()).decode('utf-8', 'replace')
+            tag, space, info = line.strip().partition(' ')
+            if tag == self.ready_tag:
+                self.starting.remove(process)
+                self.ready.append((process, info))
+                self.process_ready.emit()
+            else:
+                logger.info('Pooled process: {}'.format(line.rstrip()))
+
+    def on_ready_read_stderr(self, process):
+        """
+        Log anything a process writes to stderr before it's claimed.
+        """
+        error = bytes(process.readAllStandardError())
+        if error:
+            logger.info('Pooled process stderr: {}'.format(
+                error.decode('utf-8', 'replace').rstrip()))
+
+    def on_finished(self, process, *args):
+        """
+        Forget about a process that has ended before being claimed.
+        """
+        logger.info('Pooled process finished before being claimed.')
+        logger.info(bytes(process.readAll()).decode('utf-8', 'replace'))
+        self.on_ready_read_stderr(process)
+        self.ready = [item for item in self.ready if item[0] is not process]
+        if process in self.starting:
+            self.starting.remove(process)
+            self.process_failed.emit()
+
+    def matches(self, envars=None):
+        """
+        Return a boolean indication if the pool's processes were started with
+        the referenced list of environment variables.
+        """
+        return [tuple(envar) for envar in envars or []] == self.envars
+
+    def claim(self, envars=None):
+        """
+        Return a (process, line) tuple for a ready process, or None if there
+        isn't one or the pool's processes have a different environment.
+
+        This doesn't wait for a process to be ready: the process_ready signal
+        is emitted when one is.
+        """
+        if not self.matches(envars):
+            return None
+        if not self.ready:
+            self.fill()
+            return None
+        process, line = self.ready.pop(0)
+        process.readyRead.disconnect()
+        process.readyReadStandardError.disconnect()
+        process.finished.disconnect()
+        self.on_ready_read_stderr(process)
+        self.fill()
+        return process, line
+
+    def stop(self):
+        """
+        Kill all the processes in the pool.
+        """
+        processes = self.starting + [process for process, _ in self.ready]
+        self.starting = []
+        self.ready = []
+        for process in processes:
+            process.finished.disconnect()
+            process.kill()
+            process.waitForFinished()
+
+
 class PythonProcessPane(QTextEdit):
     """
     Handles / displays a Python process's stdin/out with working command
@@ -636,6 +934,14 @@ class PythonProcessPane(QTextEdit):
     """
 
     on_append_text = pyqtSignal(bytes)
+    # Emitted with the rest of the ready line written by a new debug runner
+    # (the port it's listening on), as for a ProcessPool's processes.
+    process_ready = pyqtSignal(str)
+    stdout_interval = 16  # Milliseconds between reads, about once a frame.
+    # The most bytes of output emitted by on_append_text at once. The plotter
+    # takes any bigger chunk as a flood of data.
+    emit_size = 1024
+    kill_timeout = 2000  # Milliseconds to wait for a stopped process to end.
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -651,12 +957,18 @@ class PythonProcessPane(QTextEdit):
         self.input_history = []  # history of inputs entered in this session.
         self.start_of_current_line = 0  # start position of the input line.
         self.history_position = 0  # current position when navigation history.
-        self.stdout_buffer = b''  # contains non-decoded bytes from stdout.
+        # Decodes stdout, keeping multi-byte characters split between reads.
+        self.stdout_decoder = codecs.getincrementaldecoder('utf-8')('replace')
         self.reading_stdout = False  # flag showing if already reading stdout.
+        self.awaiting_ready = False  # flag showing the ready line is due.
+        # Kills a process that hasn't ended soon enough after being stopped.
+        self.kill_timer = QTimer(self)
+        self.kill_timer.setSingleShot(True)
+        self.kill_timer.timeout.connect(self.kill_process)
 
     def start_process(self, script_name, working_directory, interactive=True,
                       debugger=False, command_args=None, envars=None,
-                      runner=None, python_args=None):
+                      runner=None, python_args=None, process=None):
         """
         Start the child Python process.
 
@@ -668,7 +980,8 @@ class PythonProcessPane(QTextEdit):
         completes).
 
         If debugger is True (the default is False) then the script will run
-        within a debug runner session.
+        within a debug runner session. A new debug runner reports the port
+        it's listening on with the process_ready signal.
 
         If there is a list of command_args (the default is None), then these
         will be passed as further arguments into the script to be run.
@@ -681,6 +994,10 @@ class PythonProcessPane(QTextEdit):
 
         If python_args is given, these are passed as arguments to the Python
         runtime used to launch the child process.
+
+        If process is given, it's a Python process already started by a
+        ProcessPool (running "mu-debug.py --warm" or mu-run.py), which is sent
+        the script to run instead of starting a new process.
         """
         if not envars:  # Envars must be a list if not passed a value.
             envars = []
@@ -691,12 +1008,22 @@ class PythonProcessPane(QTextEdit):
         if command_args is None:
             command_args = []
         logger.info('Command args: {}'.format(command_args))
+        if process is not None:
+            logger.info('Using a process started in advance.')
+            self.process = process
+            self.process.setParent(self)
+            self.process.readyRead.connect(self.try_read_from_stdout)
+            self.process.finished.connect(self.finished)
+            script = {
+                'filename': self.script,
+                'args': command_args,
+                'cwd': working_directory,
+            }
+            self.process.write(json.dumps(script).encode('utf-8') + b'\n')
+            self.running = not debugger
+            return
         self.process = QProcess(self)
         self.process.setProcessChannelMode(QProcess.MergedChannels)
-        # Force buffers to flush immediately.
-        env = QProcessEnvironment.systemEnvironment()
-        env.insert('PYTHONUNBUFFERED', '1')
-        env.insert('PYTHONIOENCODING', 'utf-8')
         if sys.platform == 'win32' and 'pythonw.exe' in sys.executable:
             # On Windows, if installed via NSIS then Python is always run in
             # isolated mode via pythonw.exe so none of the expected directories
@@ -737,16 +1064,12 @@ class PythonProcessPane(QTextEdit):
                 # this to fail.
                 logger.error('Could not set Python paths with mu.pth file.')
                 logger.error(ex)
-        if 'PYTHONPATH' not in envars:
-            envars.append(('PYTHONPATH', os.pathsep.join(sys.path)))
         if envars:
             logger.info('Running with environment variables: '
                         '{}'.format(envars))
-            for name, value in envars:
-                env.insert(name, value)
         logger.info('Working directory: {}'.format(working_directory))
         self.process.setWorkingDirectory(working_directory)
-        self.process.setProcessEnvironment(env)
+        self.process.setProcessEnvironment(process_environment(envars))
         self.process.readyRead.connect(self.try_read_from_stdout)
         self.process.finished.connect(self.finished)
         logger.info('Python path: {}'.format(sys.path))
@@ -757,6 +1080,7 @@ class PythonProcessPane(QTextEdit):
             runner = os.path.join(mu_dir, 'mu-debug.py')
             python_exec = sys.executable
             args = [runner, self.script, ] + command_args
+            self.awaiting_ready = True
             self.process.start(python_exec, args)
         else:
             if runner:
@@ -776,11 +1100,43 @@ class PythonProcessPane(QTextEdit):
             self.process.start(python_exec, args)
             self.running = True
 
+    def stop_process(self):
+        """
+        Ask the child process to end, without waiting for it to do so.
+
+        The process is terminated, giving the script a chance to clean up, and
+        killed if it's still running after kill_timeout milliseconds (on
+        Windows, where most scripts can't be asked to end, it's killed
+        straight away). The process's finished signal is emitted once it has
+        gone.
+
+        Returns False if there's no process still running.
+        """
+        if self.process is None or \
+                self.process.state() == QProcess.NotRunning:
+            return False
+        logger.info('Stopping process.')
+        if sys.platform == 'win32':
+            self.process.kill()
+        else:
+            self.process.terminate()
+            self.kill_timer.start(self.kill_timeout)
+        return True
+
+    def kill_process(self):
+        """
+        Kill a child process that hasn't ended after being stopped.
+        """
+        if self.process and self.process.state() != QProcess.NotRunning:
+            logger.info('Killing process that did not stop.')
+            self.process.kill()
+
     def finished(self, code, status):
         """
         Handle when the child process finishes.
         """
         self.running = False
+        self.kill_timer.stop()
         cursor = self.textCursor()
         cursor.movePosition(cursor.End)
         cursor.insertText('\n\n---------- FINISHED ----------\n')
@@ -866,7 +1222,7 @@ class PythonProcessPane(QTextEdit):
             while True:
                 try:
                     self.append(data)
-                    self.on_append_text.emit(data)
+                    self.emit_output(data)
                     self.set_start_of_current_line()
                     break
                 except UnicodeDecodeError:
@@ -904,7 +1260,7 @@ class PythonProcessPane(QTextEdit):
                 if halt_flag:
                     # Clean up from kill signal.
                     self.process.readAll()  # Discard queued output.
-                    self.stdout_buffer = b''
+                    self.stdout_decoder.reset()
                     # Schedule update of the UI after the process halts (in
                     # next iteration of the event loop).
                     QTimer.singleShot(1, self.on_process_halt)
@@ -1014,28 +1370,60 @@ class PythonProcessPane(QTextEdit):
         Ensure reading from stdout only happens if there is NOT already current
         attempts to read from stdout.
         """
+        if self.awaiting_ready and not self.read_ready_line():
+            return
         if not self.reading_stdout:
             self.reading_stdout = True
             self.read_from_stdout()
 
+    def read_ready_line(self):
+        """
+        Read the output of a new debug runner up to its ready line, emitting
+        the rest of that line with process_ready. Anything written before it
+        (such as a warning as Python starts up) is shown as usual.
+
+        Returns True once the ready line has been read.
+        """
+        while self.process.canReadLine():
+            line = bytes(self.process.readLine())
+            tag, space, info = line.decode('utf-8', 'replace').strip().\
+                partition(' ')
+            if tag == ProcessPool.ready_tag:
+                self.awaiting_ready = False
+                self.process_ready.emit(info)
+                return True
+            self.append_text(self.stdout_decoder.decode(line))
+            self.emit_output(line)
+            self.set_start_of_current_line()
+        return False
+
     def read_from_stdout(self):
         """
-        Process incoming data from the process's stdout.
+        Process all the incoming data available from the process's stdout.
+
+        While data keeps arriving, this is called again after stdout_interval
+        so everything that arrives in the meantime is added to the text area
+        in one go.
         """
-        data = self.process.read(256)
+        data = self.process.readAll().data()
         if data:
-            data = self.stdout_buffer + data
-            try:
-                self.append(data)
-                self.on_append_text.emit(data)
-                self.set_start_of_current_line()
-                self.stdout_buffer = b''
-            except UnicodeDecodeError:
-                self.stdout_buffer = data
-            QTimer.singleShot(2, self.read_from_stdout)
+            text = self.stdout_decoder.decode(data)
+            if text:
+                self.append_text(text)
+            self.emit_output(data)
+            self.set_start_of_current_line()
+            QTimer.singleShot(self.stdout_interval, self.read_from_stdout)
         else:
             self.reading_stdout = False
 
+    def emit_output(self, data):
+        """
+        Emit the bytes read from the process via on_append_text, in slices of
+        no more than emit_size bytes.
+        """
+        for i in range(0, len(data), self.emit_size):
+            self.on_append_text.emit(data[i:i + self.emit_size])
+
     def write_to_stdin(self, data):
         """
         Writes data from the Qt application to the child process's stdin.
@@ -1044,12 +1432,18 @@ class PythonProcessPane(QTextEdit):
             self.process.write(data)
 
     def append(self, msg):
+        """
+        Append UTF-8 encoded bytes to the text area.
+        """
+        self.append_text(msg.decode('utf-8'))
+
+    def append_text(self, text):
         """
         Append text to the text area.
         """
         cursor = self.textCursor()
         cursor.movePosition(QTextCursor.End)
-        cursor.insertText(msg.decode('utf-8'))
+        cursor.insertText(text)
         cursor.movePosition(QTextCursor.End)
         self.setTextCursor(cursor)
 
@@ -1122,6 +1516,142 @@ class DebugInspectorItem(QStandardItem):
     def __init__(self, *args):
         super().__init__(*args)
         self.setEditable(False)
+        self.path = None  # Where to find the value in the debug runner.
+        self.total = None  # The number of children of a list or dict.
+        self.requested = False  # Children have been asked for.
+        self.more = False  # The row to click to fetch more children.
+
+
+class DebugInspectorModel(QStandardItemModel):
+    """
+    Represents the variables shown in the debug inspector.
+
+    The children of lists and dicts are only fetched from the debug runner,
+    a page at a time, when the user expands them. Other values are shown as
+    a bounded repr, and the full repr is fetched if the user double clicks.
+    """
+
+    #: Emitted with the request number, path and start position of a page of
+    #: children to fetch from the debug runner.
+    on_fetch = pyqtSignal(int, object, int)
+    #: Emitted with the request number and path of a value whose full repr
+    #: should be fetched from the debug runner.
+    on_fetch_value = pyqtSignal(int, object)
+
+    def __init__(self):
+        super().__init__()
+        self.pending = {}
+        self.last_request = 0
+
+    def clear(self):
+        """
+        Remove all the variables and forget any outstanding requests, since
+        they refer to the previous state of the stack.
+        """
+        super().clear()
+        self.pending = {}
+
+    def append_variable(self, parent, name, path, kind, value):
+        """
+        Append a row for the named variable, found at the referenced path in
+        the debug runner, to the parent item. Lists and dicts (kind is "list"
+        or "dict") have their length as the value, and can be expanded to
+        fetch their children.
+        """
+        name_item = DebugInspectorItem(name)
+        name_item.path = path
+        if kind == 'list':
+            value_item = DebugInspectorItem(_('(A list of {} items.)')
+                                            .format(value))
+        elif kind == 'dict':
+            value_item = DebugInspectorItem(_('(A dict of {} items.)')
+                                            .format(value))
+        else:
+            value_item = DebugInspectorItem(value)
+        if kind:
+            name_item.total = value
+        parent.appendRow([name_item, value_item])
+
+    def next_request(self, item):
+        """
+        Return the number of a new request on behalf of the referenced item.
+        """
+        self.last_request += 1
+        self.pending[self.last_request] = item
+        return self.last_request
+
+    def request(self, item, start):
+        """
+        Ask for a page of the children of the item.
+        """
+        self.on_fetch.emit(self.next_request(item), item.path, start)
+
+    def add_children(self, request, start, total, children):
+        """
+        Add a page of children, in response to the referenced request. If
+        there are more to come, the last row can be clicked to fetch them.
+        """
+        item = self.pending.pop(request, None)
+        if item is None:
+            return  # The stack has changed since the request was made.
+        last = item.rowCount() - 1
+        if last >= 0 and item.child(last).more:
+            item.removeRow(last)
+        for position, (label, kind, value) in enumerate(children, start):
+            self.append_variable(item, label, item.path + [position], kind,
+                                 value)
+        shown = start + len(children)
+        if shown < total:
+            more = DebugInspectorItem(_('(Click to show {} more items.)')
+                                      .format(total - shown))
+            more.more = True
+            item.appendRow([more, DebugInspectorItem()])
+
+    def load_more(self, index):
+        """
+        Fetch the next page of children if the referenced row asks for them.
+        """
+        item = self.itemFromIndex(index.sibling(index.row(), 0))
+        if item is not None and item.more and not item.requested:
+            item.requested = True
+            item.setText(_('(Loading...)'))
+            parent = item.parent()
+            self.request(parent, parent.rowCount() - 1)
+
+    def fetch_value(self, index):
+        """
+        Fetch the full repr of the value in the referenced row, unless it's a
+        list or dict.
+        """
+        item = self.itemFromIndex(index.sibling(index.row(), 0))
+        if (item is not None and item.path is not None and
+                item.total is None):
+            self.on_fetch_value.emit(self.next_request(item), item.path)
+
+    def set_value(self, request, value):
+        """
+        Show the full repr of a value, in response to the referenced request.
+        """
+        item = self.pending.pop(request, None)
+        if item is not None:
+            value_item = self.itemFromIndex(item.index().sibling(item.row(),
+                                                                 1))
+            value_item.setText(value)
+
+    def hasChildren(self, parent):
+        item = self.itemFromIndex(parent) if parent.isValid() else None
+        if item is not None and item.total:
+            return True
+        return super().hasChildren(parent)
+
+    def canFetchMore(self, parent):
+        item = self.itemFromIndex(parent) if parent.isValid() else None
+        return item is not None and bool(item.total) and not item.requested
+
+    def fetchMore(self, parent):
+        item = self.itemFromIndex(parent)
+        item.requested = True
+        self.request(item, 0)
 
 
 class DebugInspector(QTreeView):
@@ -22,9 +22,14 @@ import sys
 import codecs
 import io
 import re
+import csv
+import gzip
 import json
 import logging
 import tempfile
+import threading
+import time
+import uuid
 import platform
 import webbrowser
 import random
@@ -32,8 +37,11 @@ import locale
 import shutil
 import appdirs
 import site
+from concurrent.futures import ThreadPoolExecutor
+from serial import Serial
 from PyQt5.QtWidgets import QMessageBox
-from PyQt5.QtCore import QLocale
+from PyQt5.QtCore import QLocale, QLockFile, QThread, pyqtSignal
+from PyQt5.QtSerialPort import QSerialPortInfo
 from pyflakes.api import check
 from pycodestyle import StyleGuide, Checker
 from mu.resources import path
@@ -50,6 +58,18 @@ DATA_DIR = appdirs.user_data_dir(appname='mu', appauthor='python')
 # The directory containing user installed third party modules.
 MODULE_DIR = os.path.join(DATA_DIR, 'site-packages')
 sys.path.append(MODULE_DIR)
+# If it exists, the only place (instead of PyPI) to install third party modules
+# from: packages fetched in advance with "pip download -d" for offline use.
+WHEEL_DIR = os.path.join(DATA_DIR, 'wheels')
+# Index of the third party modules installed in MODULE_DIR.
+PACKAGE_INDEX = os.path.join(DATA_DIR, 'packages.json')
+# Snapshots of the text in tabs that haven't been saved to a file, so they can
+# be recovered if Mu stops without quitting (e.g. it crashes).
+JOURNAL_DIR = os.path.join(DATA_DIR, 'journal')
+# A tab is journaled once this many characters have changed or, if fewer have
+# changed, this many seconds after it was last journaled.
+JOURNAL_BYTES = 1024
+JOURNAL_TIMEOUT = 5
 # The default directory for application logs.
 LOG_DIR = appdirs.user_log_dir(appname='mu', appauthor='python')
 # The path to the log file for the application.
@@ -67,8 +87,14 @@ EXPANDED_IMPORT = ("from microbit import pin15, pin2, pin0, pin1, "
                    "sleep, pin20, button_a, button_b, running_time, "
                    "accelerometer, display, uart, spi, panic, pin13, "
                    "pin12, pin11, pin10, compass")
-# Port number for debugger.
-DEBUGGER_PORT = 31415
+# Seconds to wait for a device to reply when identifying its firmware.
+PROBE_TIMEOUT = 1
+# How many more times, and after how many seconds, to probe a device when its
+# REPL doesn't reply (it may be busy running a program, or its port in use).
+PROBE_RETRIES = 2
+PROBE_RETRY_DELAY = 2
+# Printed by the REPL once the banner of the firmware has been printed.
+REPL_PROMPT = '>>> '
 MOTD = [  # Candidate phrases for the message of the day (MOTD).
     _('Hello, World!'),
     _("This editor is free software written in Python. You can modify it, "
@@ -144,34 +170,129 @@ ENCODING = "utf-8"
 ENCODING_COOKIE_RE = re.compile(
     "^[ \t\v]*#.*?coding[:=][ \t]*([-_.a-zA-Z0-9]+)")
 
+# Files are saved this many characters (to the end of a line) at a time, so
+# only a little of a large file is ever copied at once.
+SAVE_CHUNK = 64 * 1024
+
+# The most of a file's text to include when it's logged.
+LOG_TEXT_LIMIT = 1000
+
 logger = logging.getLogger(__name__)
 
 
-def installed_packages():
+def read_package_metadata(pkg_dir):
     """
-    List all the third party modules installed by the user.
+    Return the name and version of the package whose metadata is in the
+    referenced dist-info or egg-info directory.
+
+    Only the headers at the start of the metadata file are read, rather than
+    the (often long) description that follows them.
     """
-    result = []
-    pkg_dirs = [os.path.join(MODULE_DIR, d) for d in os.listdir(MODULE_DIR)
-                if d.endswith("dist-info") or d.endswith("egg-info")]
-    logger.info("Packages found: {}".format(pkg_dirs))
-    for pkg in pkg_dirs:
-        if pkg.endswith("dist-info"):
-            # Modern.
-            metadata_file = os.path.join(pkg, 'METADATA')
-        else:
-            # Legacy (eggs).
-            metadata_file = os.path.join(pkg, 'PKG-INFO')
+    if pkg_dir.endswith("dist-info"):
+        # Modern.
+        metadata_file = os.path.join(pkg_dir, 'METADATA')
+    else:
+        # Legacy (eggs).
+        metadata_file = os.path.join(pkg_dir, 'PKG-INFO')
+    name = version = None
+    with open(metadata_file, 'rb') as f:
+        for line in f:
+            if not line.strip():
+                # End of the headers.
+                break
+            key, sep, value = line.partition(b':')
+            key = key.strip().lower()
+            if key == b'name':
+                name = value.strip().decode('utf-8')
+            elif key == b'version':
+                version = value.strip().decode('utf-8')
+            if name and version:
+                break
+    if not name:
+        raise ValueError('No name in ' + metadata_file)
+    return name, version
+
+
+def package_files(module_dir, info):
+    """
+    Return the files installed for the package whose metadata is in the
+    referenced info directory (within module_dir), relative to module_dir.
+    """
+    pkg_dir = os.path.join(module_dir, info)
+    if info.endswith("dist-info"):
+        # Modern.
+        with open(os.path.join(pkg_dir, 'RECORD'), newline='') as f:
+            return [row[0] for row in csv.reader(f) if row]
+    else:
+        # Legacy (eggs), which lists files relative to the egg-info.
+        with open(os.path.join(pkg_dir, 'installed-files.txt')) as f:
+            return [os.path.relpath(os.path.join(pkg_dir, line.strip()),
+                                    module_dir)
+                    for line in f if line.strip()]
+
+
+def package_index():
+    """
+    Return an index of the third party modules installed by the user, keyed by
+    normalised package name. Each entry has the package's name, version,
+    metadata directory and the files it installed (or None if they're not
+    known).
+
+    The index is kept in PACKAGE_INDEX and only rebuilt from the packages'
+    metadata when the modification time of MODULE_DIR changes (as it does
+    whenever a package is installed or removed).
+    """
+    mtime = os.stat(MODULE_DIR).st_mtime_ns
+    try:
+        with open(PACKAGE_INDEX, encoding='utf-8') as f:
+            index = json.load(f)
+        if index['module_dir'] == MODULE_DIR and index['mtime'] == mtime:
+            return index['packages']
+    except Exception:
+        # Missing, stale or damaged, so rebuild it.
+        pass
+    packages = {}
+    for info in os.listdir(MODULE_DIR):
+        if not (info.endswith("dist-info") or info.endswith("egg-info")):
+            continue
+        pkg_dir = os.path.join(MODULE_DIR, info)
         try:
-            with open(metadata_file, 'rb') as f:
-                lines = f.readlines()
-                name = lines[1].rsplit(b':')[-1].strip()
-                result.append(name.decode('utf-8'))
+            name, version = read_package_metadata(pkg_dir)
         except Exception as ex:
             # Just log any errors.
-            logger.error("Unable to get metadata for package: " + pkg)
+            logger.error("Unable to get metadata for package: " + pkg_dir)
             logger.error(ex)
-    return sorted(result)
+            continue
+        try:
+            files = package_files(MODULE_DIR, info)
+        except Exception as ex:
+            logger.error("Unable to get files for package: " + pkg_dir)
+            logger.error(ex)
+            files = None
+        # Assets on the filesystem use a normalised package name, followed by
+        # a "-" and the version.
+        packages[info.split('-', 1)[0].lower()] = {
+            'name': name,
+            'version': version,
+            'info': info,
+            'files': files,
+        }
+    logger.info("Packages found: {}".format(sorted(packages)))
+    try:
+        with open(PACKAGE_INDEX, 'w', encoding='utf-8') as f:
+            json.dump({'module_dir': MODULE_DIR, 'mtime': mtime,
+                       'packages': packages}, f)
+    except Exception as ex:
+        logger.error('Unable to write package index: ' + PACKAGE_INDEX)
+        logger.error(ex)
+    return packages
+
+
+def installed_packages():
+    """
+    List all the third party modules installed by the user.
+    """
+    return sorted(pkg['name'] for pkg in package_index().values())
 
 
 def write_and_flush(fileobj, content):
@@ -191,11 +312,57 @@ def write_and_flush(fileobj, content):
     os.fsync(fileobj)
 
 
-def save_and_encode(text, filepath, newline=os.linesep):
+def normalised_chunks(text, newline, size=SAVE_CHUNK):
+    """
+    Yield the text in chunks of whole lines (of roughly size characters),
+    with trailing spaces removed from each line and every line, including
+    the last, ended with newline.
+
+    Only a chunk is copied at a time, so the whole text is never rebuilt.
+    """
+    if not text:
+        yield newline
+        return
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start + size)
+        end = len(text) if end == -1 else end + 1
+        yield ''.join([line.rstrip(' ') + newline for line in
+                       text[start:end].splitlines()])
+        start = end
+
+
+def truncate(text, limit=LOG_TEXT_LIMIT):
+    """
+    Return the text, cut short at limit characters (with a note of how many
+    were left out) so logging a large file doesn't swamp the log.
+    """
+    if len(text) <= limit:
+        return text
+    return '{}... ({} more characters)'.format(text[:limit],
+                                               len(text) - limit)
+
+
+def write_chunks(fileobj, chunks):
+    """
+    Write each chunk to the fileobj in turn, flushing and fsyncing (via
+    write_and_flush) with the last of them.
+    """
+    last = ''
+    for chunk in chunks:
+        fileobj.write(last)
+        last = chunk
+    write_and_flush(fileobj, last)
+
+
+def save_and_encode(text, filepath, newline=os.linesep, atomic=False):
     """
     Detect the presence of an encoding cookie and use that encoding; if
     none is present, do not add one and use the Mu default encoding.
     If the codec is invalid, log a warning and fall back to the default.
+
+    If atomic is True, the text is written to a temporary file which then
+    replaces the file at filepath, so the file is never left half written.
     """
     match = ENCODING_COOKIE_RE.match(text)
     if match:
@@ -208,10 +375,61 @@ def save_and_encode(text, filepath, newline=os.linesep):
     else:
         encoding = ENCODING
 
-    with open(filepath, "w", encoding=encoding, newline='') as f:
-        text_to_write = newline.join(l.rstrip(" ") for l in
-                                     text.splitlines()) + newline
-        write_and_flush(f, text_to_write)
+    if not atomic:
+        with open(filepath, "w", encoding=encoding, newline='') as f:
+            write_chunks(f, normalised_chunks(text, newline))
+        return
+    # Replace the file a link points to, rather than the link itself.
+    target = os.path.realpath(filepath)
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(target),
+        prefix='.{}.'.format(os.path.basename(target)), suffix='.tmp')
+    try:
+        with open(fd, "w", encoding=encoding, newline='') as f:
+            write_chunks(f, normalised_chunks(text, newline))
+        if os.path.exists(target):
+            shutil.copymode(target, temp_path)
+        os.replace(temp_path, target)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_journal(text, filepath, newline):
+    """
+    Write a compressed snapshot of the text (and newline convention) of an
+    unsaved tab to the journal file at filepath, via a temporary file so a
+    crash while writing leaves the previous snapshot intact.
+    """
+    data = json.dumps({'text': text, 'newline': newline}).encode('utf-8')
+    temp_path = filepath + '.tmp'
+    with open(temp_path, 'wb') as f:
+        write_and_flush(f, gzip.compress(data, compresslevel=1))
+    os.replace(temp_path, filepath)
+
+
+def read_journal(filepath):
+    """
+    Return the text and newline convention in the referenced journal file.
+    """
+    with open(filepath, 'rb') as f:
+        journal = json.loads(gzip.decompress(f.read()).decode('utf-8'))
+    return journal['text'], journal['newline']
+
+
+def journal_lock(journal_id):
+    """
+    Return the lock file for the journal with the referenced ID. The copy of
+    Mu holding the lock owns the journal. Another copy of Mu can only take
+    the lock over once the owner has stopped.
+    """
+    lock = QLockFile(os.path.join(JOURNAL_DIR, journal_id + '.lock'))
+    # Only a lock whose owner has stopped is stale, however old it is.
+    lock.setStaleLockTime(0)
+    return lock
 
 
 def sniff_encoding(filepath):
@@ -565,6 +783,175 @@ class REPL:
         logger.info('Created new REPL object with port: {}'.format(self.port))
 
 
+def probe_firmware(port):
+    """
+    Return the banner printed by the MicroPython-ish firmware on the device
+    connected to the referenced port, or an empty string if there's no reply.
+
+    DTR and RTS are kept low by Mu, but on Linux and OSX the OS raises DTR
+    as the port is opened, so a board that resets on DTR (e.g. an Arduino or
+    an ESP board with auto-reset) may still be reset. That's why only boards
+    for the mode the user has chosen are probed (see Editor.check_usb).
+    """
+    serial = Serial()
+    serial.port = port
+    serial.baudrate = 115200
+    serial.timeout = PROBE_TIMEOUT
+    # Many ESP boards reset if DTR or RTS change when the port is opened.
+    serial.dtr = False
+    serial.rts = False
+    serial.open()
+    try:
+        serial.reset_input_buffer()
+        # CTRL-B at the REPL prints the banner.
+        serial.write(b'\r\x02')
+        return serial.read_until(REPL_PROMPT.encode('utf-8'),
+                                 1024).decode('utf-8', 'replace')
+    finally:
+        serial.close()
+
+
+class DeviceProber(QThread):
+    """
+    Used to identify the firmware on several devices at the same time in a
+    non-blocking manner.
+    """
+    # Emitted with a port and the banner of the firmware found on its device.
+    on_probed = pyqtSignal(str, str)
+
+    def __init__(self, ports):
+        """
+        The ports should be a list of the ports to which the devices to probe
+        are connected.
+        """
+        QThread.__init__(self)
+        self.ports = ports
+
+    def run(self):
+        """
+        Probe all the devices in parallel.
+        """
+        with ThreadPoolExecutor(max_workers=len(self.ports)) as executor:
+            executor.map(self.probe, self.ports)
+
+    def probe(self, port):
+        """
+        Probe the device connected to the referenced port, trying again a
+        few times if its REPL doesn't reply.
+        """
+        for attempt in range(PROBE_RETRIES + 1):
+            if attempt:
+                time.sleep(PROBE_RETRY_DELAY)
+            try:
+                banner = probe_firmware(port)
+            except Exception as ex:
+                # The port may be in use, gone away or not a serial device.
+                logger.warning('Unable to probe {}: {}'.format(port, ex))
+                banner = ''
+            logger.info('Probed {}: {}'.format(port, repr(banner)))
+            if REPL_PROMPT in banner:
+                break
+        self.on_probed.emit(port, banner)
+
+
+class FileWriter(QThread):
+    """
+    Used to save files in the background, so slow disks (such as network
+    drives and SD cards) don't hold up the editor.
+
+    Each file is written to a temporary file that is then renamed into place.
+    Saving a file again before its previous save is written replaces the
+    previous save, so only the latest text is written.
+    """
+    # Emitted when the results of saves are ready to be taken.
+    written = pyqtSignal()
+
+    def __init__(self, save=None):
+        """
+        The optional save function is called with the text, path and newline
+        of each save to write it, instead of save_and_encode.
+        """
+        QThread.__init__(self)
+        self.save = save
+        self.condition = threading.Condition()
+        self.pending = {}  # Path -> (text, newline) of saves to be written.
+        self.writing = None  # Path of the file being written.
+        self.results = []  # (path, text, exception or None) of saves.
+        self.stopping = False
+
+    def write(self, path, text, newline):
+        """
+        Schedule the text to be saved to the file at the referenced path.
+        """
+        with self.condition:
+            self.pending[path] = (text, newline)
+            self.condition.notify_all()
+
+    def cancel(self, path):
+        """
+        Forget any pending save of the file at the referenced path, waiting
+        for the file to be written if that's already started. The file can
+        then be saved without an older save overwriting it.
+        """
+        with self.condition:
+            self.pending.pop(path, None)
+            while self.writing == path:
+                self.condition.wait()
+
+    def flush(self):
+        """
+        Wait until all the pending saves are written.
+        """
+        with self.condition:
+            while (self.pending or self.writing) and self.isRunning():
+                self.condition.wait()
+
+    def stop(self):
+        """
+        Write any pending saves and stop the thread.
+        """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.wait()
+
+    def take_results(self):
+        """
+        Return, and forget, the results of the saves written so far.
+        """
+        with self.condition:
+            results, self.results = self.results, []
+        return results
+
+    def run(self):
+        """
+        Write the pending saves, one at a time, until stopped.
+        """
+        while True:
+            with self.condition:
+                while not (self.pending or self.stopping):
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                path = next(iter(self.pending))
+                text, newline = self.pending.pop(path)
+                self.writing = path
+            try:
+                if self.save:
+                    self.save(text, path, newline)
+                else:
+                    save_and_encode(text, path, newline, atomic=True)
+                error = None
+            except Exception as ex:
+                logger.error('Unable to save {}: {}'.format(path, ex))
+                error = ex
+            with self.condition:
+                self.writing = None
+                self.results.append((path, text, error))
+                self.condition.notify_all()
+            self.written.emit()
+
+
 class Editor:
     """
     Application logic for the editor itself.
@@ -581,7 +968,19 @@ class Editor:
         self.envars = []  # See restore session and show_admin
         self.minify = False
         self.microbit_runtime = ''
+        self.flashed_runtimes = {}  # micro:bit serial number -> runtime hash.
+        self.debug_repr_limits = {}  # Limits on reprs sent by the debugger.
+        self.warm_run = False  # Start Python in advance for the Run button.
+        self.warm_repl = False  # Start the REPL's kernel in advance.
+        self.sync_block_size = 0  # Patch changed blocks of files on sync.
         self.connected_devices = set()
+        self.usb_ports = None  # Ports found the last time USB was checked.
+        self.probed = {}  # Port -> banner of the firmware found there.
+        self.prober = None  # Identifies firmware on ambiguous devices.
+        self.writer = None  # Autosaves files in the background.
+        self.journaler = None  # Journals unsaved tabs in the background.
+        self.journals = {}  # Journal ID -> tab journaled with that ID.
+        self.journal_locks = {}  # Journal ID -> lock held on that journal.
         self.find = ''
         self.replace = ''
         self.current_path = ''  # Directory of last loaded file.
@@ -641,6 +1040,8 @@ class Editor:
         # Start the timer to poll every second for an attached or removed
         # USB device.
         self._view.set_usb_checker(1, self.check_usb)
+        # Check every second for unsaved tabs that need journaling.
+        self._view.set_journal_timer(1, self.journal_tabs)
 
     def restore_session(self, paths=None):
         """
@@ -699,6 +1100,16 @@ class Editor:
                             logger.warning('The specified micro:bit runtime '
                                            'does not exist. Using default '
                                            'runtime instead.')
+                if 'flashed_runtimes' in old_session:
+                    self.flashed_runtimes = old_session['flashed_runtimes']
+                if 'debug_repr_limits' in old_session:
+                    self.debug_repr_limits = old_session['debug_repr_limits']
+                if 'warm_run' in old_session:
+                    self.warm_run = old_session['warm_run']
+                if 'warm_repl' in old_session:
+                    self.warm_repl = old_session['warm_repl']
+                if 'sync_block_size' in old_session:
+                    self.sync_block_size = old_session['sync_block_size']
                 if 'zoom_level' in old_session:
                     self._view.zoom_position = old_session['zoom_level']
                     self._view.set_zoom()
@@ -706,6 +1117,7 @@ class Editor:
         # so it will not be focused over by another tab
         if paths and len(paths) > 0:
             self.load_cli(paths)
+        self.restore_journals()
         if not self._view.tab_count:
             py = _('# Write your code here :-)') + NEWLINE
             tab = self._view.add_tab(None, py, self.modes[self.mode].api(),
@@ -716,6 +1128,119 @@ class Editor:
         self._view.set_theme(self.theme)
         self.show_status_message(random.choice(MOTD), 10)
 
+    def restore_journals(self):
+        """
+        Recreate the unsaved tabs journaled by copies of Mu that stopped
+        without quitting, oldest first. Each tab carries on using its journal,
+        which this copy of Mu now owns. The journals of copies of Mu that are
+        still running are left alone.
+        """
+        if not os.path.isdir(JOURNAL_DIR):
+            return
+        journal_ids = {filename.split('.', 1)[0]
+                       for filename in os.listdir(JOURNAL_DIR)}
+        journals = []
+        for journal_id in journal_ids:
+            lock = journal_lock(journal_id)
+            if not lock.tryLock(0):
+                # Owned by another copy of Mu.
+                continue
+            journal_path = os.path.join(JOURNAL_DIR, journal_id + '.json.gz')
+            try:
+                # Left over from a snapshot that was never finished.
+                os.remove(journal_path + '.tmp')
+            except OSError:
+                pass
+            if os.path.exists(journal_path):
+                journals.append((os.path.getmtime(journal_path), journal_id,
+                                 lock))
+            else:
+                lock.unlock()
+        for mtime, journal_id, lock in sorted(journals):
+            journal_path = os.path.join(JOURNAL_DIR, journal_id + '.json.gz')
+            try:
+                text, newline = read_journal(journal_path)
+            except Exception as ex:
+                logger.error('Unable to read journal: ' + journal_path)
+                logger.error(ex)
+                lock.unlock()
+                continue
+            logger.info('Restoring unsaved tab from: ' + journal_path)
+            tab = self._view.add_tab(None, '', self.modes[self.mode].api(),
+                                     newline)
+            # Scintilla can't be told a tab is modified, so add the text as
+            # a change (that can't be undone).
+            tab.setText(text)
+            tab.SendScintilla(tab.SCI_EMPTYUNDOBUFFER)
+            tab.unjournaled = 0
+            tab.journal_id = journal_id
+            self.journals[journal_id] = tab
+            self.journal_locks[journal_id] = lock
+
+    def journal_tabs(self):
+        """
+        Journal the text of modified tabs that haven't been saved to a file,
+        so it can be recovered if Mu stops without quitting. A tab is
+        journaled once JOURNAL_BYTES of its text have changed or, if less has
+        changed, JOURNAL_TIMEOUT seconds after it was last journaled.
+
+        The journals of tabs that have since been closed, saved to a file or
+        returned to their unmodified state are removed.
+        """
+        tabs = self._view.widgets
+        for journal_id, tab in list(self.journals.items()):
+            if tab not in tabs or tab.path or not tab.isModified():
+                self.remove_journal(journal_id)
+        now = time.monotonic()
+        for tab in self._view.dirty_tabs:
+            if tab.path or not tab.unjournaled:
+                continue
+            if (tab.unjournaled < JOURNAL_BYTES and
+                    now - tab.journaled_at < JOURNAL_TIMEOUT):
+                continue
+            if self.journaler is None:
+                os.makedirs(JOURNAL_DIR, exist_ok=True)
+                self.journaler = FileWriter(save=write_journal)
+                # Any problems are logged by the writer.
+                self.journaler.written.connect(self.journaler.take_results)
+                self.journaler.start()
+            if tab.journal_id is None:
+                journal_id = uuid.uuid4().hex
+                lock = journal_lock(journal_id)
+                if not lock.tryLock(0):
+                    logger.error('Unable to lock journal: ' + journal_id)
+                    continue
+                tab.journal_id = journal_id
+                self.journals[journal_id] = tab
+                self.journal_locks[journal_id] = lock
+            journal_path = os.path.join(JOURNAL_DIR,
+                                        tab.journal_id + '.json.gz')
+            self.journaler.write(journal_path, tab.text(), tab.newline)
+            tab.unjournaled = 0
+            tab.journaled_at = now
+
+    def remove_journal(self, journal_id):
+        """
+        Delete the journal with the referenced ID, which is no longer needed,
+        and give up the lock on it. Only journals this copy of Mu owns are
+        ever removed.
+        """
+        tab = self.journals.pop(journal_id)
+        tab.journal_id = None
+        journal_path = os.path.join(JOURNAL_DIR, journal_id + '.json.gz')
+        if self.journaler:
+            self.journaler.cancel(journal_path)
+        try:
+            os.remove(journal_path)
+        except FileNotFoundError:
+            pass
+        except OSError as ex:
+            logger.error('Unable to remove journal: ' + journal_path)
+            logger.error(ex)
+        lock = self.journal_locks.pop(journal_id, None)
+        if lock:
+            lock.unlock()
+
     def toggle_theme(self):
         """
         Switches between themes (night, day or high-contrast).
@@ -829,7 +1354,7 @@ class Editor:
                 if self._view.show_confirmation(
                         message, info, icon='Question') == QMessageBox.Ok:
                     self.change_mode(file_mode)
-            logger.debug(text)
+            logger.debug(truncate(text))
             self._view.add_tab(
                 name, text, self.modes[self.mode].api(), newline)
 
@@ -912,28 +1437,37 @@ class Editor:
         reported and the tab status will continue to show as Modified.
         """
         logger.info('Saving script to: {}'.format(tab.path))
-        logger.debug(tab.text())
+        text = tab.text()
+        logger.debug(truncate(text))
+        if self.writer:
+            # Make sure an earlier autosave can't overwrite this save.
+            self.writer.cancel(tab.path)
         try:
-            save_and_encode(tab.text(), tab.path, tab.newline)
-        except OSError as e:
-            logger.error(e)
-            error_message = _('Could not save file (disk problem)')
-            information = _("Error saving file to disk. Ensure you have "
-                            "permission to write the file and "
-                            "sufficient disk space.")
-        except UnicodeEncodeError:
+            save_and_encode(text, tab.path, tab.newline)
+        except (OSError, UnicodeEncodeError) as ex:
+            self.show_save_error(ex)
+        else:
+            tab.setModified(False)
+            self.show_status_message(_("Saved file: {}").format(tab.path))
+
+    def show_save_error(self, ex):
+        """
+        Log and report the referenced exception raised when saving a file.
+        """
+        if isinstance(ex, UnicodeEncodeError):
             error_message = _("Could not save file (encoding problem)")
-            logger.exception(error_message)
+            logger.error(error_message)
+            logger.error(ex)
             information = _("Unable to convert all the characters. If you "
                             "have an encoding line at the top of the file, "
                             "remove it and try again.")
         else:
-            error_message = information = None
-        if error_message:
-            self._view.show_message(error_message, information)
-        else:
-            tab.setModified(False)
-            self.show_status_message(_("Saved file: {}").format(tab.path))
+            logger.error(ex)
+            error_message = _('Could not save file (disk problem)')
+            information = _("Error saving file to disk. Ensure you have "
+                            "permission to write the file and "
+                            "sufficient disk space.")
+        self._view.show_message(error_message, information)
 
     def check_for_shadow_module(self, path):
         """
@@ -1064,6 +1598,11 @@ class Editor:
         """
         Exit the application.
         """
+        if self.writer:
+            # Finish any autosaves, so the tabs they've saved aren't reported
+            # as un-saved.
+            self.writer.flush()
+            self.on_written()
         if self._view.modified:
             # Alert the user to handle unsaved work.
             msg = _('There is un-saved work, exiting the application will'
@@ -1080,8 +1619,19 @@ class Editor:
                 paths.append(os.path.abspath(widget.path))
         if self.modes[self.mode].is_debugger:
             # If quitting while debugging, make sure everything is cleaned
-            # up.
-            self.modes[self.mode].stop()
+            # up. There's no waiting for the debug runner to stop: it's
+            # killed along with its pane.
+            self.modes[self.mode].runner_stopped()
+        for mode_object in self.modes.values():
+            mode_object.stop_process_pool(quitting=True)
+        if self.writer:
+            self.writer.stop()
+        # Unsaved work is being discarded, so its journals are no longer
+        # needed.
+        if self.journaler:
+            self.journaler.stop()
+        for journal_id in list(self.journals):
+            self.remove_journal(journal_id)
         session = {
             'theme': self.theme,
             'mode': self.mode,
@@ -1089,6 +1639,11 @@ class Editor:
             'envars': self.envars,
             'minify': self.minify,
             'microbit_runtime': self.microbit_runtime,
+            'flashed_runtimes': self.flashed_runtimes,
+            'debug_repr_limits': self.debug_repr_limits,
+            'warm_run': self.warm_run,
+            'warm_repl': self.warm_repl,
+            'sync_block_size': self.sync_block_size,
             'zoom_level': self._view.zoom_position,
         }
         session_path = get_session_path()
@@ -1168,7 +1723,12 @@ class Editor:
             logger.info('To add: {}'.format(to_add))
             logger.info('To remove: {}'.format(to_remove))
             logger.info('Site packages: {}'.format(MODULE_DIR))
-            self._view.sync_packages(to_remove, to_add, MODULE_DIR)
+            logger.info('Wheels: {}'.format(WHEEL_DIR))
+            self._view.sync_packages(to_remove, to_add, MODULE_DIR,
+                                     WHEEL_DIR, package_index())
+            # Bring the index up to date with the changes, so it's ready for
+            # next time.
+            package_index()
 
     def select_mode(self, event=None):
         """
@@ -1201,6 +1761,9 @@ class Editor:
                 old_mode.remove_plotter()
         # Re-assign to new mode.
         self.mode = mode
+        # Check the connected devices afresh, since boards for the new mode
+        # may now have their firmware probed (see check_usb).
+        self.usb_ports = None
         # Update buttons.
         self._view.change_mode(self.modes[mode])
         button_bar = self._view.button_bar
@@ -1237,20 +1800,53 @@ class Editor:
             for tab in self._view.widgets:
                 tab.breakpoint_handles = set()
                 tab.reset_annotations()
+        # Only keep processes started in advance for the current mode, and
+        # for the debugger if the mode has one.
+        in_use = {mode}
+        if self.modes[mode].has_debugger:
+            in_use.add('debugger')
+        for name, mode_object in self.modes.items():
+            if name in in_use:
+                mode_object.start_process_pool()
+            else:
+                mode_object.stop_process_pool()
         self.show_status_message(_('Changed to {} mode.').format(
             mode.capitalize()))
 
     def autosave(self):
         """
-        Cycles through each tab and, if changed, saves it to the filesystem.
+        Schedule the changes in each modified tab to be saved to the
+        filesystem in the background.
         """
-        if self._view.modified:
-            # Something has changed, so save it!
+        tabs = [tab for tab in self._view.dirty_tabs if tab.path]
+        if not tabs:
+            return
+        if self.writer is None:
+            self.writer = FileWriter()
+            self.writer.written.connect(self.on_written)
+            self.writer.start()
+        for tab in tabs:
+            self.writer.write(tab.path, tab.text(), tab.newline)
+            logger.info('Autosave detected changes in {}.'.format(tab.path))
+
+    def on_written(self):
+        """
+        Called when files have been saved in the background. Tabs whose text
+        hasn't changed since are no longer modified, and any problems saving
+        are reported.
+        """
+        if self.writer is None:
+            return
+        for filename, text, error in self.writer.take_results():
+            if error:
+                self.show_save_error(error)
+                continue
+            logger.info('Autosaved changes in {}.'.format(filename))
             for tab in self._view.widgets:
-                if tab.path and tab.isModified():
-                    self.save_tab_to_file(tab)
-                    logger.info('Autosave detected and saved '
-                                'changes in {}.'.format(tab.path))
+                if tab.path == filename and tab.text() == text:
+                    tab.setModified(False)
+                    self.show_status_message(_("Saved file: {}").format(
+                        filename))
 
     def check_usb(self):
         """
@@ -1259,16 +1855,45 @@ class Editor:
         If a single device is found and Mu is in a different mode ask the user
         if they'd like to change mode.
         """
+        # Enumerate the ports once and share them with all the modes.
+        ports = QSerialPortInfo.availablePorts()
+        usb_ports = [(p.portName(), p.vendorIdentifier(),
+                      p.productIdentifier(), p.serialNumber()) for p in ports]
+        if usb_ports == self.usb_ports:
+            # Nothing has been attached or removed since the last check.
+            return
+        self.usb_ports = usb_ports
         devices = []
         device_types = set()
-        # Detect connected devices.
-        for name, mode in self.modes.items():
-            if hasattr(mode, 'find_device'):
-                # The mode can detect an attached device.
-                port, serial = mode.find_device(with_logging=False)
-                if port:
-                    devices.append((name, port))
-                    device_types.add(name)
+        to_probe = []
+        # Detect connected devices. Only ports with USB IDs claimed by a mode
+        # are in the index, so nothing else is ever probed.
+        index = self.board_index(ports)
+        for port, names, generic in index:
+            if generic or len(names) > 1:
+                # Only the firmware on the device can tell which mode (if any)
+                # it works with. Probing may reset the board, so it's only
+                # done once the user is in one of those modes. Until then,
+                # the board is taken to work with them all.
+                if port in self.probed:
+                    names = self.identify_firmware(names, generic,
+                                                   self.probed[port])
+                elif self.mode in names:
+                    to_probe.append(port)
+                    continue
+            for name in names:
+                devices.append((name, port))
+                device_types.add(name)
+        # Forget the firmware found on devices that have been removed.
+        connected_ports = {port for port, names, generic in index}
+        for port in list(self.probed):
+            if port not in connected_ports:
+                del self.probed[port]
+        if to_probe and not self.prober:
+            self.prober = DeviceProber(to_probe)
+            self.prober.on_probed.connect(self.on_probed)
+            self.prober.finished.connect(self.probe_finished)
+            self.prober.start()
         # Remove no-longer connected devices.
         to_remove = []
         for connected in self.connected_devices:
@@ -1299,6 +1924,71 @@ class Editor:
                     if change_confirmation == QMessageBox.Ok:
                         self.change_mode(mode_name)
 
+    def board_index(self, ports):
+        """
+        Given the ports connected to the host computer, return a list of
+        (port, mode names, generic) tuples, one for each port connected to a
+        board that works with one or more modes. If generic is True, the board
+        uses a generic USB/serial chip, so may or may not work with the modes.
+        """
+        # Index the modes by the USB IDs of the boards they work with.
+        boards = {}
+        generic_boards = set()
+        for name, mode in self.modes.items():
+            for board in getattr(mode, 'valid_boards', []):
+                boards.setdefault(board, []).append(name)
+            generic_boards.update(getattr(mode, 'generic_boards', []))
+        index = []
+        for port in ports:
+            board = (port.vendorIdentifier(), port.productIdentifier())
+            names = list(boards.get(board, []))
+            for name in boards.get((board[0], None), []):
+                if name not in names:
+                    names.append(name)
+            if names:
+                path = self.modes[names[0]].port_path(port.portName())
+                index.append((path, names, board in generic_boards))
+        return index
+
+    def identify_firmware(self, names, generic, banner):
+        """
+        Given the names of the modes a board may work with, whether it uses a
+        generic USB/serial chip and the banner printed by its firmware, return
+        the names of the modes it actually works with.
+
+        If the board's REPL didn't reply (it may be running a program, or its
+        port may have been in use) there's no telling, so the board is taken
+        to work with all the modes that accept its USB IDs.
+        """
+        identified = []
+        for name in names:
+            firmware = getattr(self.modes[name], 'firmware', None)
+            if firmware and firmware.search(banner):
+                identified.append(name)
+        if identified:
+            return identified
+        if generic and REPL_PROMPT in banner:
+            # The firmware replied and isn't what any of the modes work with.
+            return []
+        # Nothing to tell the modes apart, so the device works with them all.
+        return names
+
+    def on_probed(self, port, banner):
+        """
+        Called when the firmware on the device connected to the referenced
+        port has been probed.
+        """
+        self.probed[port] = banner
+
+    def probe_finished(self):
+        """
+        Called when probing devices has finished. Check USB devices again so
+        the newly identified devices are detected.
+        """
+        self.prober = None
+        self.usb_ports = None
+        self.check_usb()
+
     def show_status_message(self, message, duration=5):
         """
         Displays the referenced message for duration seconds.
@@ -17,9 +17,9 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 import os
+import re
 import ctypes
-from subprocess import check_output
-from mu.modes.base import MicroPythonMode
+from mu.modes.base import MicroPythonMode, mounted_volumes
 from mu.modes.api import ADAFRUIT_APIS, SHARED_APIS
 from mu.interface.panes import CHARTS
 
@@ -65,6 +65,7 @@ class AdafruitMode(MicroPythonMode):
         (0x239A, 0x803E),  # future board
         (0x239A, None),    # Any Adafruit Boards
     ]
+    firmware = re.compile(r'^Adafruit CircuitPython\b', re.MULTILINE)
     # Modules built into CircuitPython which mustn't be used as file names
     # for source code.
     module_names = {'storage', 'os', 'touchio', 'microcontroller', 'bitbangio',
@@ -105,15 +106,9 @@ class AdafruitMode(MicroPythonMode):
         # plugged in CIRCUITPY board.
         if os.name == 'posix':
             # We're on Linux or OSX
-            for mount_command in ['mount', '/sbin/mount']:
-                try:
-                    mount_output = check_output(mount_command).splitlines()
-                    mounted_volumes = [x.split()[2] for x in mount_output]
-                    for volume in mounted_volumes:
-                        if volume.endswith(b'CIRCUITPY'):
-                            device_dir = volume.decode('utf-8')
-                except FileNotFoundError:
-                    next
+            for volume in mounted_volumes():
+                if volume.endswith('CIRCUITPY'):
+                    device_dir = volume
         elif os.name == 'nt':
             # We're on Windows.
 
@@ -16,6 +16,7 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+import ast
 import json
 import os
 import os.path
@@ -23,11 +24,17 @@ import csv
 import time
 import logging
 import pkgutil
+import re
+import select
+import threading
+from subprocess import check_output
 from serial import Serial
 from PyQt5.QtSerialPort import QSerialPortInfo
 from PyQt5.QtCore import QObject, pyqtSignal
 from mu.logic import HOME_DIRECTORY, WORKSPACE_NAME, get_settings_path
+from mu.interface.panes import ProcessPool
 from mu.contrib import microfs
+from mu.contrib.uflash import MOUNT_POINT
 
 
 logger = logging.getLogger(__name__)
@@ -52,6 +59,83 @@ MODULE_NAMES.add('sys')
 MODULE_NAMES.add('builtins')
 
 
+# Directory containing the scripts Mu runs in child processes (mu-debug.py and
+# mu-run.py).
+MU_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+#: The mount table on Linux, which signals when it changes (see proc(5)).
+MOUNTINFO = '/proc/self/mountinfo'
+# The open mount table, a poll object to watch it for changes and the cached
+# list of mounted volumes (see mounted_volumes).
+_MOUNTS = {}
+
+
+def mounted_volumes():
+    """
+    Return a list of the paths of all the volumes mounted on the host
+    computer, or None if the platform has no mount table (i.e. Windows).
+
+    On Linux the mount table is read and cached. It's only read again once
+    the kernel signals it has changed. Elsewhere (e.g. OSX) the "mount"
+    command is run every time.
+    """
+    if os.name != 'posix':
+        return None
+    if 'volumes' not in _MOUNTS:
+        try:
+            mountinfo = open(MOUNTINFO, 'rb')
+        except OSError:
+            # Not Linux (e.g. OSX), so fall back to the "mount" command.
+            return read_mount_command()
+        poller = select.poll()
+        poller.register(mountinfo, select.POLLPRI | select.POLLERR)
+        _MOUNTS.update(mountinfo=mountinfo, poller=poller)
+    elif not _MOUNTS['poller'].poll(0):
+        # Nothing has been mounted or unmounted.
+        return _MOUNTS['volumes']
+    mountinfo = _MOUNTS['mountinfo']
+    mountinfo.seek(0)
+    _MOUNTS['volumes'] = parse_mountinfo(mountinfo.read())
+    return _MOUNTS['volumes']
+
+
+def parse_mountinfo(mountinfo):
+    """
+    Return a list of the mount points found in the referenced content of a
+    Linux mountinfo file.
+    """
+    volumes = []
+    for line in mountinfo.splitlines():
+        fields = line.split()
+        if len(fields) > 4:
+            # Spaces (etc) in mount points are escaped as octal (e.g. \040).
+            volume = re.sub(br'\\([0-7]{3})',
+                            lambda m: bytes([int(m.group(1), 8)]), fields[4])
+            volumes.append(os.fsdecode(volume))
+    return volumes
+
+
+def read_mount_command():
+    """
+    Return a list of the mount points reported by the "mount" command.
+    """
+    volumes = []
+    # When the user doesn't have administrative privileges on OSX, the mount
+    # command isn't on their path, so also try the explicit /sbin/mount.
+    for mount_command in ['mount', '/sbin/mount']:
+        try:
+            mount_output = check_output(mount_command).splitlines()
+        except FileNotFoundError:
+            continue
+        for line in mount_output:
+            match = MOUNT_POINT.match(line)
+            if match:
+                volumes.append(os.fsdecode(match.group(1)))
+        break
+    return volumes
+
+
 def get_default_workspace():
     """
     Return the location on the filesystem for opening and closing files.
@@ -97,6 +181,8 @@ class BaseMode(QObject):
     builtins = None  #: Symbols to assume as builtins when checking code style.
     file_extensions = []
     module_names = MODULE_NAMES
+    process_pool = None  #: Python processes started in advance.
+    process_pool_size = 1  #: Number of processes to start in advance.
 
     def __init__(self, editor, view):
         self.editor = editor
@@ -127,6 +213,53 @@ class BaseMode(QObject):
         """
         return NotImplemented
 
+    def process_pool_args(self):
+        """
+        Return the arguments to the Python runtime for the processes this mode
+        starts in advance (see ProcessPool), or None if it doesn't.
+        """
+        return None
+
+    def start_process_pool(self):
+        """
+        Start Python processes in advance, ready to be claimed without waiting
+        for Python to start up.
+
+        The processes are replaced if the arguments or environment variables
+        they need have changed.
+        """
+        args = self.process_pool_args()
+        envars = self.editor.envars
+        if self.process_pool and not (self.process_pool.args == args and
+                                      self.process_pool.matches(envars)):
+            self.stop_process_pool()
+        if args is None:
+            return
+        if self.process_pool is None:
+            self.process_pool = ProcessPool(args, envars,
+                                            self.process_pool_size)
+        self.process_pool.fill()
+
+    def stop_process_pool(self, quitting=False):
+        """
+        Stop any Python processes started in advance.
+
+        Modes that keep other things running in the background can use the
+        quitting flag to wait for them when Mu quits.
+        """
+        if self.process_pool:
+            self.process_pool.stop()
+            self.process_pool = None
+
+    def claim_process(self):
+        """
+        Return a (process, line) tuple for a process started in advance, and
+        the line it wrote when ready, or None if there isn't one ready.
+        """
+        if self.process_pool:
+            return self.process_pool.claim(self.editor.envars)
+        return None
+
     def set_buttons(self, **kwargs):
         """
         Given the names and boolean settings of buttons associated with actions
@@ -208,6 +341,12 @@ class MicroPythonMode(BaseMode):
     Includes functionality that works with a USB serial based REPL.
     """
     valid_boards = BOARD_IDS
+    #: USB IDs of generic USB/serial chips used by all sorts of devices. The
+    #: firmware on such a device must be identified to know it works with
+    #: this mode.
+    generic_boards = []
+    #: Matches the banner printed by firmware that works with this mode.
+    firmware = None
     force_interrupt = True
 
     def find_device(self, with_logging=True):
@@ -238,6 +377,22 @@ class MicroPythonMode(BaseMode):
                 p.portName()) for p in available_ports])
         return (None, None)
 
+    def find_devices(self):
+        """
+        Returns a list of (port, serial number) tuples for all the
+        MicroPython-ish devices found connected to the host computer.
+        """
+        devices = []
+        for port in QSerialPortInfo.availablePorts():
+            pid = port.productIdentifier()
+            vid = port.vendorIdentifier()
+            if (vid, pid) in self.valid_boards or \
+               (vid, None) in self.valid_boards:
+                devices.append((self.port_path(port.portName()),
+                                port.serialNumber()))
+        logger.info('Found devices: {}'.format(devices))
+        return devices
+
     def port_path(self, port_name):
         if os.name == 'posix':
             # If we're on Linux or OSX reference the port is like this...
@@ -368,8 +523,23 @@ class FileManager(QObject):
     on_get_fail = pyqtSignal(str)
     # Emitted when the referenced file fails to be put onto the device.
     on_put_fail = pyqtSignal(str)
+    # Emitted once with the filenames that failed in a queued put or sync.
+    on_put_files_fail = pyqtSignal(tuple)
+    # Emitted once with the filenames that failed in a queued get.
+    on_get_files_fail = pyqtSignal(tuple)
     # Emitted when the referenced file fails to be deleted from the device.
     on_delete_fail = pyqtSignal(str)
+    # Emitted with the tuple of device filenames when a queued put finishes.
+    on_put_files = pyqtSignal(tuple)
+    # Emitted with the tuple of device filenames when a queued get finishes.
+    on_get_files = pyqtSignal(tuple)
+    # Emitted with the tuples of copied and unchanged device filenames when
+    # a sync finishes.
+    on_sync_files = pyqtSignal(tuple, tuple)
+    # Emitted after each file in a queued transfer with the number of files
+    # done, the total number of files, the bytes transferred so far and the
+    # throughput in bytes per second.
+    on_transfer_progress = pyqtSignal(int, int, int, float)
 
     def __init__(self, port):
         """
@@ -377,6 +547,7 @@ class FileManager(QObject):
         """
         super().__init__()
         self.port = port
+        self._cancel = threading.Event()
 
     def on_start(self):
         """
@@ -440,3 +611,264 @@ class FileManager(QObject):
         except Exception as ex:
             logger.error(ex)
             self.on_delete_fail.emit(device_filename)
+
+    def cancel(self):
+        """
+        Ask any queued transfer to stop once the file currently being copied
+        is complete. This is called directly from the GUI thread (rather than
+        queued to this object's thread, which is busy with the transfer).
+        """
+        self._cancel.set()
+
+    def put_files(self, local_paths):
+        """
+        Put the referenced local files onto the device as a single queued
+        transfer. Directories are copied recursively into a directory of the
+        same name on the device, or straight onto devices without directories.
+
+        All the files are copied in one raw REPL session. Emit the tuple of
+        device filenames copied when complete (or cancelled) and, once, the
+        tuple of those that could not be copied. A file that would overwrite
+        one copied earlier in the queue (such as files of the same name from
+        different directories, on a device without directories) fails.
+        """
+        queue = self._put_queue(local_paths)
+        device = {}
+
+        def setup():
+            device['dirs'] = self._has_dirs(queue)
+            device['clashes'] = self._clashing_targets(queue, device['dirs'])
+
+        def transfer(local, target):
+            if local is None:
+                if device['dirs']:
+                    self._mkdir(target)
+                return 0
+            with open(local, 'rb') as f:
+                content = f.read()
+            path = self._put_target(target, device)
+            self._execute(microfs.put_commands(content, path))
+            return len(content)
+
+        done = self._transfer(queue, transfer, self.on_put_files_fail, setup)
+        self.on_put_files.emit(done)
+
+    def sync(self, local_paths, block_size=0):
+        """
+        Copy only the referenced local files (and files in referenced
+        directories) that differ from those already on the device.
+
+        Files are compared by size and a digest computed on the device. If
+        block_size is given, files of the same size that are larger than a
+        block only have their changed blocks rewritten. Emit the tuples of
+        copied and unchanged device filenames when complete (or cancelled)
+        and, once, the tuple of those that could not be copied.
+        """
+        queue = self._put_queue(local_paths)
+        unchanged = []
+        device = {}
+
+        def setup():
+            device['dirs'] = self._has_dirs(queue)
+            device['clashes'] = self._clashing_targets(queue, device['dirs'])
+            out = self._execute(microfs.digest_commands())
+            algorithm, files = ast.literal_eval(out.decode('utf-8'))
+            device['algorithm'] = algorithm
+            device['files'] = {path: (size, digest)
+                               for path, size, digest in files}
+
+        def transfer(local, target):
+            if local is None:
+                if device['dirs'] and not any(path.startswith(target + '/')
+                                              for path in device['files']):
+                    self._mkdir(target)
+                return 0
+            with open(local, 'rb') as f:
+                content = f.read()
+            path = self._put_target(target, device)
+            algorithm = device['algorithm']
+            size, digest = device['files'].get(path, (None, None))
+            if size == len(content) and \
+                    [digest] == microfs.digest(content, algorithm):
+                unchanged.append(target)
+                return 0
+            if block_size and size == len(content) > block_size:
+                out = self._execute(microfs.digest_commands(path,
+                                                            block_size))
+                old = ast.literal_eval(out.decode('utf-8'))
+                new = microfs.digest(content, algorithm, block_size)
+                blocks = [(i * block_size,
+                           content[i * block_size:(i + 1) * block_size])
+                          for i, d in enumerate(new) if d != old[i]]
+                try:
+                    self._execute(microfs.patch_commands(blocks, path))
+                except IOError as ex:
+                    # Not every device can update files in place.
+                    logger.warning(ex)
+                else:
+                    return sum(len(block) for offset, block in blocks)
+            self._execute(microfs.put_commands(content, path))
+            return len(content)
+
+        done = self._transfer(queue, transfer, self.on_put_files_fail, setup)
+        copied = tuple(name for name in done if name not in unchanged)
+        self.on_sync_files.emit(copied, tuple(unchanged))
+
+    def _put_queue(self, local_paths):
+        """
+        Return the queue of (name, local path, device path) tuples needed to
+        put the referenced local files and directories onto the device.
+        Directories are walked recursively and appear in the queue with a
+        name and local path of None so they're created before their content.
+        """
+        queue = []
+        for path in local_paths:
+            if os.path.isdir(path):
+                parent = os.path.dirname(os.path.normpath(path))
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    target = os.path.relpath(root, parent).replace(os.sep, '/')
+                    queue.append((None, None, target))
+                    for name in sorted(files):
+                        device_name = '{}/{}'.format(target, name)
+                        queue.append((device_name, os.path.join(root, name),
+                                      device_name))
+            else:
+                name = os.path.basename(path)
+                queue.append((name, path, name))
+        return queue
+
+    def _has_dirs(self, queue):
+        """
+        Return True unless the queue has directories to create on a device
+        (already in raw mode) without them, such as the micro:bit.
+        """
+        if not any(source is None for name, source, target in queue):
+            return True
+        out = self._execute(microfs.DIRS_COMMANDS)
+        return out.strip() == b'True'
+
+    def _clashing_targets(self, queue, dirs):
+        """
+        Return the set of targets in the queue that would be put at the same
+        device path as a file earlier in the queue, given whether the device
+        has directories.
+        """
+        paths = set()
+        clashes = set()
+        for name, source, target in queue:
+            if name:
+                path = target if dirs else target.rsplit('/', 1)[-1]
+                if path in paths:
+                    clashes.add(target)
+                paths.add(path)
+        return clashes
+
+    def _put_target(self, target, device):
+        """
+        Return the device path to put the referenced target at. On devices
+        without directories, files from a directory go at the top level.
+
+        Raises an IOError rather than overwrite a file put earlier in the
+        same transfer.
+        """
+        if target in device['clashes']:
+            raise IOError("Not copying '{}': it would overwrite another file "
+                          "being copied.".format(target))
+        if device['dirs']:
+            return target
+        return target.rsplit('/', 1)[-1]
+
+    def _mkdir(self, target):
+        """
+        Create the referenced directory on a device already in raw mode.
+        Directories that already exist are fine.
+        """
+        self._execute(["import os\ntry:\n os.mkdir('{}')\n"
+                       "except OSError:\n pass\n".format(target)])
+
+    def get_files(self, filenames):
+        """
+        Get the referenced list of (device filename, local filename) pairs
+        from the device as a single queued transfer over one raw REPL
+        session. Emit the tuple of device filenames got when complete (or
+        cancelled) and, once, the tuple of those that could not be got.
+        """
+        def transfer(device_filename, local_filename):
+            out = self._execute(microfs.get_commands(device_filename))
+            with open(local_filename, 'wb') as f:
+                f.write(out)
+            return len(out)
+
+        queue = [(device, device, local) for device, local in filenames]
+        done = self._transfer(queue, transfer, self.on_get_files_fail)
+        self.on_get_files.emit(done)
+
+    def _execute(self, commands):
+        """
+        Run the commands on a device already in raw mode, returning stdout or
+        raising an IOError with the device's error message.
+        """
+        out, err = microfs.send_commands(commands, self.serial)
+        if err:
+            raise IOError(microfs.clean_error(err))
+        return out
+
+    def _transfer(self, queue, transfer, on_fail, setup=None):
+        """
+        Work through the queue of (name, source, target) tuples in one raw
+        REPL session by calling transfer(source, target) for each, which
+        returns the number of bytes moved. Progress is emitted after each
+        file and the queue stops early if cancel() is called. If given, setup
+        is called once the device is in raw mode, before the queue starts.
+
+        Entries whose name is None are housekeeping (such as creating a
+        directory) and don't count as files. Returns the tuple of names that
+        were transferred. Those that failed are emitted together with on_fail,
+        so a failed batch is only reported once.
+        """
+        self._cancel.clear()
+        names = tuple(name for name, source, target in queue if name)
+        total = len(names)
+        done = []
+        failed = []
+        count = 0
+        transferred = 0
+        start = time.monotonic()
+        try:
+            microfs.raw_on(self.serial)
+        except Exception as ex:
+            logger.error(ex)
+            on_fail.emit(names)
+            return ()
+        try:
+            if setup:
+                try:
+                    setup()
+                except Exception as ex:
+                    logger.error(ex)
+                    on_fail.emit(names)
+                    return ()
+            for name, source, target in queue:
+                if self._cancel.is_set():
+                    logger.info('Transfer cancelled.')
+                    break
+                try:
+                    transferred += transfer(source, target)
+                except Exception as ex:
+                    logger.error(ex)
+                    if name:
+                        failed.append(name)
+                else:
+                    if name:
+                        done.append(name)
+                if name:
+                    count += 1
+                    elapsed = max(time.monotonic() - start, 0.001)
+                    self.on_transfer_progress.emit(count, total, transferred,
+                                                   transferred / elapsed)
+        finally:
+            microfs.raw_off(self.serial)
+        if failed:
+            on_fail.emit(tuple(failed))
+        return tuple(done)
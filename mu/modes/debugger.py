@@ -18,8 +18,10 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 import logging
 import os.path
-from mu.modes.base import BaseMode
-from mu.logic import DEBUGGER_PORT
+import sys
+from PyQt5.QtCore import QTimer
+from mu.modes.base import BaseMode, MU_DIR
+from mu.logic import truncate
 from mu.debugger.client import Debugger
 from mu.debugger.utils import is_breakpoint_line
 
@@ -36,6 +38,10 @@ class DebugMode(BaseMode):
     description = _('Debug your Python 3 code.')
     icon = 'python'
     runner = None
+    debugger = None
+    runner_timeout = 30000  # Milliseconds to wait for a runner to start.
+    runner_timer = None  # Limits the wait for a runner, while waiting.
+    script = None  # Path of the script waiting for a runner.
     is_debugger = True
     save_timeout = 0  # No need to auto-save when in read-only debug mode.
 
@@ -106,34 +112,206 @@ class DebugMode(BaseMode):
             # If needed, save the script.
             if tab.isModified():
                 self.editor.save_tab_to_file(tab)
-            logger.debug(tab.text())
+            logger.debug(truncate(tab.text()))
             self.set_buttons(modes=False)
-            envars = self.editor.envars
-            cwd = os.path.dirname(tab.path)
-            self.runner = self.view.add_python3_runner(tab.path,
-                                                       cwd,
-                                                       debugger=True,
-                                                       envars=envars)
-            self.runner.process.waitForStarted()
-            self.runner.process.finished.connect(self.finished)
-            self.view.add_debug_inspector()
-            self.view.set_read_only(True)
-            self.debugger = Debugger('localhost', DEBUGGER_PORT,
-                                     proc=self.runner.process)
-            self.debugger.view = self
-            self.debugger.start()
+            self.start_process_pool()
+            if self.process_pool is None:
+                self.start_cold_runner(tab.path)
+            elif not self.start_runner(tab.path):
+                # Wait for a runner to be ready, without blocking Mu.
+                self.wait_for_runner(tab.path)
         else:
             logger.debug('Current script has not been saved. Aborting debug.')
             self.stop()
 
+    def start_runner(self, path):
+        """
+        Start debugging the script at the referenced path with a debug runner
+        started in advance. Returns False if no runner is ready yet.
+        """
+        process, port = self.claim_runner()
+        if process is None:
+            return False
+        self.stop_waiting()
+        self.start_session(path, process, port)
+        return True
+
+    def start_cold_runner(self, path):
+        """
+        Start debugging the script at the referenced path with a new debug
+        runner, for when no runner started in advance can be had. Like those,
+        the runner listens on a free port and reports it once it's listening.
+        """
+        logger.info('Starting a debug runner.')
+        self.stop_waiting()
+        self.start_session(path)
+
+    def start_session(self, path, process=None, port=None):
+        """
+        Show the debugger's panes and connect to the debug runner for the
+        script at the referenced path.
+
+        If process is given, it's a debug runner started in advance listening
+        on the referenced port, which is sent the script. Otherwise a new
+        debug runner is started, and connected to once it reports its port.
+        """
+        envars = self.editor.envars
+        cwd = os.path.dirname(path)
+        self.runner = self.view.add_python3_runner(path,
+                                                   cwd,
+                                                   debugger=True,
+                                                   envars=envars,
+                                                   process=process)
+        self.runner.process.finished.connect(self.finished)
+        self.view.add_debug_inspector()
+        self.view.debug_model.on_fetch.connect(self.debug_fetch_children)
+        self.view.debug_model.on_fetch_value.connect(self.debug_fetch_value)
+        self.view.set_read_only(True)
+        self.debugger = Debugger('localhost', port, proc=self.runner.process)
+        self.debugger.view = self
+        if process is None:
+            self.set_waiting_buttons()
+            self.runner.process_ready.connect(self.runner_listening)
+        else:
+            self.connect_debugger(port)
+
+    def runner_listening(self, line):
+        """
+        Called with the rest of the ready line written by a new debug runner,
+        which is the port it's listening on.
+        """
+        try:
+            port = int(line)
+        except ValueError:
+            logger.error('Unexpected output from debug runner: '
+                         '{}'.format(line))
+            self.runner.process.kill()
+            return
+        self.connect_debugger(port)
+
+    def connect_debugger(self, port):
+        """
+        Connect to the debug runner listening on the referenced port, and
+        enable the debugger's buttons.
+        """
+        self.set_buttons(**{action['name']: True
+                            for action in self.actions()})
+        self.debugger.port = port
+        self.debugger.start()
+
+    def set_waiting_buttons(self):
+        """
+        Disable all the buttons but Stop while waiting for a debug runner.
+        """
+        buttons = {action['name']: False for action in self.actions()
+                   if action['name'] != 'stop'}
+        self.set_buttons(**buttons)
+
+    def wait_for_runner(self, path):
+        """
+        Start debugging the script at the referenced path once a debug runner
+        is ready, giving up after runner_timeout milliseconds.
+        """
+        logger.info('Waiting for a debug runner.')
+        self.script = path
+        self.set_waiting_buttons()
+        self.process_pool.process_ready.connect(self.runner_ready)
+        self.process_pool.process_failed.connect(self.runner_failed)
+        self.runner_timer = QTimer()
+        self.runner_timer.timeout.connect(self.runner_timed_out)
+        self.runner_timer.setSingleShot(True)
+        self.runner_timer.start(self.runner_timeout)
+
+    def stop_waiting(self):
+        """
+        Stop waiting for a debug runner, if waiting.
+        """
+        if self.runner_timer:
+            self.runner_timer.stop()
+            self.runner_timer = None
+            self.script = None
+            if self.process_pool:
+                self.process_pool.process_ready.disconnect(self.runner_ready)
+                self.process_pool.process_failed.disconnect(
+                    self.runner_failed)
+
+    def runner_ready(self):
+        """
+        Called when a debug runner is ready, while waiting for one.
+        """
+        self.start_runner(self.script)
+
+    def runner_failed(self):
+        """
+        Called when a debug runner stops before it's ready, while waiting for
+        one. A new debug runner is started instead.
+        """
+        logger.warning('Debug runner stopped while starting up.')
+        self.start_cold_runner(self.script)
+
+    def runner_timed_out(self):
+        """
+        Called when no debug runner is ready in time. A new debug runner is
+        started instead.
+        """
+        logger.warning("Debug runner didn't start in time.")
+        self.start_cold_runner(self.script)
+
+    def process_pool_args(self):
+        """
+        Debug runners are started in advance, waiting to be sent the script
+        to debug.
+
+        Not on Windows when Mu runs with pythonw.exe, since only a new debug
+        runner has its Python paths set up (see PythonProcessPane).
+        """
+        if sys.platform == 'win32' and 'pythonw.exe' in sys.executable:
+            return None
+        return [os.path.join(MU_DIR, 'mu-debug.py'), '--warm']
+
+    def claim_runner(self):
+        """
+        Return a debug runner process started in advance, and the port it's
+        listening on. Returns (None, None) if no runner is ready.
+        """
+        claimed = self.claim_process()
+        if claimed:
+            process, line = claimed
+            try:
+                return process, int(line)
+            except ValueError:
+                logger.error('Unexpected output from debug runner: '
+                             '{}'.format(line))
+                process.kill()
+        return None, None
+
     def stop(self):
         """
         Stop the debug runner and reset the UI.
+
+        This doesn't wait for the runner to end: the Stop button shows the
+        runner is stopping until it has, then runner_stopped tidies up.
         """
         logger.debug('Stopping debugger.')
+        if self.runner and self.runner.stop_process():
+            stop_slot = self.view.button_bar.slots['stop']
+            stop_slot.setText(_('Stopping...'))
+            stop_slot.setToolTip(_('Waiting for the debug runner to stop.'))
+            self.set_buttons(**{action['name']: False
+                                for action in self.actions()})
+            self.runner.process.finished.connect(self.runner_stopped)
+        else:
+            self.runner_stopped()
+
+    def runner_stopped(self, *args):
+        """
+        Called once the debug runner has stopped, to remove the debugger's
+        panes and return to Python 3 mode.
+        """
+        self.stop_waiting()
         if self.runner:
+            # Make sure it's gone: when quitting, Mu doesn't wait for it.
             self.runner.process.kill()
-            self.runner.process.waitForFinished()
             self.runner = None
             self.debugger = None
             self.view.remove_python_runner()
@@ -210,10 +388,8 @@ class DebugMode(BaseMode):
     def debug_on_fail(self, message):
         """
         Called when, for any reason, the debug client was unable to connect to
-        the debug runner. On a Raspberry Pi this is usually because it's an
-        underpowereed machine and it takes time to start the debug runner
-        process. (However, the debug client waits for 10 seconds for the
-        runner to start.)
+        the debug runner. The runner reports its port once it's listening, so
+        this usually means it has stopped since.
         """
         # Report the problem.
         process_runner = self.view.process_runner
@@ -245,6 +421,8 @@ class DebugMode(BaseMode):
                 else:
                     tab.breakpoint_handles.remove(handle)
                     tab.markerDelete(line, -1)
+        if self.editor.debug_repr_limits:
+            self.debugger.set_repr_limits(self.editor.debug_repr_limits)
         # Start the script running.
         self.debugger.do_run()
 
@@ -282,11 +460,39 @@ class DebugMode(BaseMode):
         """
         if stack:
             locals_dict = {}
-            for frame in stack:
+            for index, frame in enumerate(stack):
                 for k, v in frame[1]['locals'].items():
-                    locals_dict[k] = v
+                    locals_dict[k] = ([index, k], v)
             self.view.update_debug_inspector(locals_dict)
 
+    def debug_fetch_children(self, request, path, start):
+        """
+        Handle when the debug inspector needs a page of the children of an
+        expanded list or dict.
+        """
+        if self.debugger:
+            self.debugger.fetch_children(request, path, start)
+
+    def debug_fetch_value(self, request, path):
+        """
+        Handle when the debug inspector needs the full repr of a value.
+        """
+        if self.debugger:
+            self.debugger.fetch_value(request, path)
+
+    def debug_on_value(self, request, value):
+        """
+        Handle when the debugger sends the full repr of a value.
+        """
+        self.view.update_debug_value(request, value)
+
+    def debug_on_children(self, request, start, total, children):
+        """
+        Handle when the debugger sends a page of the children of a list or
+        dict.
+        """
+        self.view.update_debug_children(request, start, total, children)
+
     def debug_on_postmortem(self, args, kwargs):
         """
         Handle when something catastrophic happens to the debugger.
@@ -16,6 +16,7 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+import re
 import logging
 from mu.modes.base import MicroPythonMode, FileManager
 from mu.modes.api import ESP_APIS, SHARED_APIS
@@ -44,6 +45,10 @@ class ESPMode(MicroPythonMode):
         (0x10C4, 0xEA60),  # CP210x
         (0x0403, 0x6015),   # Sparkfun ESP32 VID, PID
     ]
+    # ...so these boards could be anything. If their REPL replies, check
+    # they're running MicroPython on an ESP8266 or ESP32.
+    generic_boards = valid_boards
+    firmware = re.compile(r'^MicroPython\b.*\bESP', re.MULTILINE)
 
     def actions(self):
         """
@@ -212,6 +217,7 @@ class ESPMode(MicroPythonMode):
         self.fs = self.view.add_filesystem(self.workspace_dir(),
                                            self.file_manager,
                                            _("ESP board"))
+        self.fs.sync_block_size = self.editor.sync_block_size
         self.fs.set_message.connect(self.editor.show_status_message)
         self.fs.set_warning.connect(self.view.show_message)
         self.file_manager_thread.start()
@@ -18,17 +18,21 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 import os
+import re
 import sys
 import os.path
+import hashlib
 import logging
 import semver
+from concurrent.futures import ThreadPoolExecutor
 from tokenize import TokenError
 from mu.logic import HOME_DIRECTORY
 from mu.contrib import uflash, microfs
 from mu.modes.api import MICROBIT_APIS, SHARED_APIS
-from mu.modes.base import MicroPythonMode, FileManager
+from mu.modes.base import MicroPythonMode, FileManager, mounted_volumes
 from mu.interface.panes import CHARTS
 from PyQt5.QtCore import QThread, pyqtSignal, QTimer
+from PyQt5.QtWidgets import QMessageBox
 
 # We can run without nudatus
 can_minify = True
@@ -40,6 +44,51 @@ except ImportError:  # pragma: no cover
 logger = logging.getLogger(__name__)
 
 
+# Hash of the MicroPython runtime bundled with uflash (see runtime_hash).
+_BUNDLED_RUNTIME_HASH = None
+
+#: The maximum number of micro:bits to flash at the same time.
+FLASH_WORKERS = 16
+
+
+def runtime_hash(path_to_runtime=None):
+    """
+    Return a hash identifying the MicroPython runtime that flashing would
+    put onto the device: the custom hex file at path_to_runtime or, if that
+    is None, the runtime bundled with uflash. Returns None if the custom
+    runtime can't be read.
+    """
+    global _BUNDLED_RUNTIME_HASH
+    if path_to_runtime:
+        try:
+            with open(path_to_runtime, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError as ex:
+            logger.warning(ex)
+            return None
+    if _BUNDLED_RUNTIME_HASH is None:
+        runtime = uflash._RUNTIME.encode('utf-8')
+        _BUNDLED_RUNTIME_HASH = hashlib.sha256(runtime).hexdigest()
+    return _BUNDLED_RUNTIME_HASH
+
+
+def volume_serial_number(path_to_microbit):
+    """
+    Return the serial number of the micro:bit mounted at the referenced path,
+    as recorded in the DETAILS.TXT file provided by its interface firmware.
+    Returns None if the serial number can't be found.
+    """
+    details = os.path.join(path_to_microbit, 'DETAILS.TXT')
+    try:
+        with open(details, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if line.startswith('Unique ID:'):
+                    return line.split(':', 1)[1].strip()
+    except OSError as ex:
+        logger.warning(ex)
+    return None
+
+
 class DeviceFlasher(QThread):
     """
     Used to flash the micro:bit in a non-blocking manner.
@@ -76,6 +125,97 @@ class DeviceFlasher(QThread):
             self.on_flash_fail.emit(str(ex))
 
 
+class MultiDeviceFlasher(QThread):
+    """
+    Used to flash several micro:bits at the same time in a non-blocking
+    manner.
+    """
+    # Emitted with the name of a device and a description of its progress.
+    on_device_progress = pyqtSignal(str, str)
+    # Emitted with the name of a device and why flashing it failed.
+    on_device_fail = pyqtSignal(str, str)
+
+    def __init__(self, devices, python_script, path_to_runtime):
+        """
+        The devices should be a list of (path_to_microbit, port,
+        serial_number) tuples, one for each attached micro:bit. Those with a
+        path_to_microbit are flashed with a hex file combining the runtime and
+        the python_script. Those only reachable via their serial port have the
+        python_script copied onto them as main.py. The path_to_runtime should
+        be the path of the hex file for the MicroPython runtime to use or None
+        to use the default MicroPython runtime.
+        """
+        QThread.__init__(self)
+        self.devices = devices
+        self.python_script = python_script
+        self.path_to_runtime = path_to_runtime
+        self.hex_file = ''
+        self.flashed = []  # The devices flashed without any problems.
+
+    def run(self):
+        """
+        Build the hex file once, then flash all the devices in parallel.
+        """
+        try:
+            python_hex = ''
+            if self.python_script:
+                python_hex = uflash.hexlify(self.python_script)
+            runtime = uflash._RUNTIME
+            if self.path_to_runtime:
+                runtime = uflash.read_runtime(self.path_to_runtime)
+            self.hex_file = uflash.embed_hex(runtime, python_hex)
+        except Exception as ex:
+            logger.error(ex)
+            for device in self.devices:
+                self.on_device_fail.emit(device_name(device), str(ex))
+            return
+        workers = min(len(self.devices), FLASH_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            executor.map(self.flash_device, self.devices)
+
+    def flash_device(self, device):
+        """
+        Flash the referenced device, reporting on its progress.
+        """
+        path_to_microbit, port, serial_number = device
+        name = device_name(device)
+        self.on_device_progress.emit(name, _('Flashing...'))
+        try:
+            if path_to_microbit:
+                hex_path = os.path.join(path_to_microbit, 'micropython.hex')
+                uflash.save_hex(self.hex_file, hex_path)
+            else:
+                serial = microfs.get_serial(port)
+                try:
+                    commands = microfs.put_commands(self.python_script,
+                                                    'main.py')
+                    out, err = microfs.execute(commands, serial)
+                    if err:
+                        raise IOError(microfs.clean_error(err))
+                    # Reset the device.
+                    serial.write(b'import microbit\r\n')
+                    serial.write(b'microbit.reset()\r\n')
+                finally:
+                    serial.close()
+        except Exception as ex:
+            # Catch everything so a problem with one device doesn't stop the
+            # others from being flashed.
+            logger.error('Unable to flash {}: {}'.format(name, ex))
+            self.on_device_fail.emit(name, str(ex))
+            return
+        self.flashed.append(device)
+        self.on_device_progress.emit(name, _('Finished'))
+
+
+def device_name(device):
+    """
+    Return a name for the referenced (path_to_microbit, port, serial_number)
+    device that's meaningful to the user.
+    """
+    path_to_microbit, port, serial_number = device
+    return path_to_microbit or port
+
+
 class MicrobitMode(MicroPythonMode):
     """
     Represents the functionality required by the micro:bit mode.
@@ -86,11 +226,14 @@ class MicrobitMode(MicroPythonMode):
     fs = None  #: Reference to filesystem navigator.
     flash_thread = None
     flash_timer = None
+    flash_runtime = None  #: (serial number, runtime hash) being flashed.
+    flash_dialog = None  #: Shows progress flashing several devices.
     file_extensions = ['hex']
 
     valid_boards = [
         (0x0D28, 0x0204),  # micro:bit USB VID, PID
     ]
+    firmware = re.compile(r'^MicroPython\b.*\bmicro:bit\b', re.MULTILINE)
 
     valid_serial_numbers = [9900, 9901]  # Serial numbers of supported boards.
 
@@ -208,7 +351,15 @@ class MicrobitMode(MicroPythonMode):
         # method.
         self.python_script = python_script
         # Next step: find the microbit port and serial number.
-        path_to_microbit = uflash.find_microbit()
+        paths_to_microbits = uflash.find_microbits(mounted_volumes())
+        if len(paths_to_microbits) > 1:
+            # Several micro:bits are attached (e.g. in a classroom) so flash
+            # them all at the same time.
+            self.flash_many(paths_to_microbits, tab.label)
+            return
+        path_to_microbit = None
+        if paths_to_microbits:
+            path_to_microbit = paths_to_microbits[0]
         logger.info('Path to micro:bit: {}'.format(path_to_microbit))
         port = None
         serial_number = None
@@ -241,52 +392,27 @@ class MicrobitMode(MicroPythonMode):
                 logger.info("Python script empty. Forcing flash.")
                 force_flash = True
             logger.info("Checking target device.")
-            # Get the version of MicroPython on the device.
-            try:
-                version_info = microfs.version()
-                logger.info(version_info)
-                board_info = version_info['version'].split()
-                if (board_info[0] == 'micro:bit' and
-                        board_info[1].startswith('v')):
-                    # New style versions, so the correct information will be
-                    # in the "release" field.
-                    try:
-                        # Check the release is a correct semantic version.
-                        semver.parse(version_info['release'])
-                        board_version = version_info['release']
-                    except ValueError:
-                        # If it's an invalid semver, set to unknown version to
-                        # force flash.
-                        board_version = '0.0.1'
-                else:
-                    # 0.0.1 indicates an old unknown version. This is just a
-                    # valid arbitrary flag for semver comparison a couple of
-                    # lines below.
-                    board_version = '0.0.1'
-                logger.info('Board MicroPython: {}'.format(board_version))
-                logger.info(
-                    'Mu MicroPython: {}'.format(uflash.MICROPYTHON_VERSION))
-                # If there's an older version of MicroPython on the device,
-                # update it with the one packaged with Mu.
-                if semver.compare(board_version,
-                                  uflash.MICROPYTHON_VERSION) < 0:
-                    force_flash = True
-            except Exception:
-                # Could not get version of MicroPython. This means either the
-                # device has a really old version of MicroPython or is running
-                # something else. In any case, flash MicroPython onto the
-                # device.
-                logger.warning('Could not detect version of MicroPython.')
-                force_flash = True
             # Check use of custom runtime.
             rt_hex_path = self.editor.microbit_runtime.strip()
             message = _('Flashing "{}" onto the micro:bit.').format(tab.label)
             if (rt_hex_path and os.path.exists(rt_hex_path)):
                 message = message + _(" Runtime: {}").format(rt_hex_path)
-                force_flash = True  # Using a custom runtime, so flash it.
             else:
                 rt_hex_path = None
                 self.editor.microbit_runtime = ''
+            runtime = runtime_hash(rt_hex_path)
+            flashed = self.editor.flashed_runtimes.get(serial_number)
+            if serial_number and runtime and flashed == runtime:
+                # This exact runtime was the last one Mu flashed onto this
+                # device, so there's no need to ask the device (which may be
+                # slow or time out) for its version.
+                logger.info('Runtime unchanged since last flash.')
+            elif rt_hex_path:
+                force_flash = True  # Using a custom runtime, so flash it.
+            else:
+                force_flash = self.check_version() or force_flash
+                if not force_flash and serial_number:
+                    self.editor.flashed_runtimes[serial_number] = runtime
             # Check for use of user defined path (to save hex onto local
             # file system.
             if user_defined_microbit_path:
@@ -296,6 +422,7 @@ class MicrobitMode(MicroPythonMode):
                 logger.info('Flashing new MicroPython runtime onto device')
                 self.editor.show_status_message(message, 10)
                 self.set_buttons(flash=False)
+                self.flash_runtime = None
                 if user_defined_microbit_path or not port:
                     # The user has provided a path to a location on the
                     # filesystem. In this case save the combined hex/script
@@ -336,6 +463,8 @@ class MicrobitMode(MicroPythonMode):
                                         "https://codewith.mu/")
                         self.view.show_message(message, information)
                         return
+                    # Remember the runtime once flashing has finished.
+                    self.flash_runtime = (serial_number, runtime)
                 if sys.platform == 'win32':
                     # Windows blocks on write.
                     self.flash_thread.finished.connect(self.flash_finished)
@@ -369,6 +498,10 @@ class MicrobitMode(MicroPythonMode):
                                                       self.python_script,
                                                       rt_hex_path)
                     self.python_script = ''
+                    # Whatever runtime was cached is evidently not on the
+                    # device any more, but will be once this has finished.
+                    self.editor.flashed_runtimes.pop(serial_number, None)
+                    self.flash_runtime = (serial_number, runtime)
                     if sys.platform == 'win32':
                         # Windows blocks on write.
                         self.flash_thread.finished.connect(self.flash_finished)
@@ -396,6 +529,128 @@ class MicrobitMode(MicroPythonMode):
                             " the device remains unfound.")
             self.view.show_message(message, information)
 
+    def flash_many(self, paths_to_microbits, label):
+        """
+        Flash the script in self.python_script onto all the micro:bits
+        mounted at the referenced paths, along with any other micro:bits
+        only reachable via their serial port, at the same time. Since this
+        replaces the script on every device, the user is first asked to
+        confirm the list of devices. Progress is reported for each device in
+        a dialog.
+        """
+        ports = {}
+        try:
+            for port, serial_number in self.find_devices():
+                ports[serial_number.upper()] = (port, serial_number)
+        except Exception as ex:
+            logger.warning('Unable to find serial ports for micro:bits.')
+            logger.warning(ex)
+        devices = []
+        all_paired = True
+        for path_to_microbit in paths_to_microbits:
+            unique_id = volume_serial_number(path_to_microbit)
+            port, serial_number = None, None
+            if unique_id and unique_id.upper() in ports:
+                port, serial_number = ports.pop(unique_id.upper())
+            else:
+                all_paired = False
+            devices.append((path_to_microbit, port, serial_number))
+        if all_paired:
+            # Only when every mounted micro:bit has been matched to its port
+            # is it certain the remaining ports belong to other devices.
+            for port, serial_number in ports.values():
+                devices.append((None, port, serial_number))
+        names = [device_name(device) for device in devices]
+        message = _('Flash "{}" onto {} micro:bits?').format(label,
+                                                             len(devices))
+        information = _('This will replace the script on all of these '
+                        'devices:\n\n{}').format('\n'.join(names))
+        if self.view.show_confirmation(message, information,
+                                       icon='Question') != QMessageBox.Ok:
+            logger.info('Flashing {} devices cancelled.'.format(len(devices)))
+            return
+        rt_hex_path = self.editor.microbit_runtime.strip()
+        if not (rt_hex_path and os.path.exists(rt_hex_path)):
+            rt_hex_path = None
+        logger.info('Flashing {} devices: {}'.format(len(devices), devices))
+        message = _('Flashing "{}" onto {} micro:bits.')
+        message = message.format(label, len(devices))
+        self.editor.show_status_message(message, 10)
+        self.set_buttons(flash=False)
+        self.flash_dialog = self.view.show_flash_progress(names)
+        self.flash_thread = MultiDeviceFlasher(devices, self.python_script,
+                                               rt_hex_path)
+        # The script is flashed as part of the hex file, so there's no need
+        # to copy it as main.py.
+        self.python_script = ''
+        self.flash_thread.on_device_progress.connect(
+            self.flash_dialog.on_progress)
+        self.flash_thread.on_device_fail.connect(self.flash_dialog.on_fail)
+        self.flash_thread.finished.connect(self.flash_many_finished)
+        self.flash_thread.start()
+
+    def flash_many_finished(self):
+        """
+        Called when the thread used to flash several micro:bits has finished.
+        """
+        runtime = runtime_hash(self.flash_thread.path_to_runtime)
+        for device in self.flash_thread.devices:
+            path_to_microbit, port, serial_number = device
+            if not (path_to_microbit and serial_number):
+                # Only a full flash changes the runtime on a known device.
+                continue
+            if runtime and device in self.flash_thread.flashed:
+                self.editor.flashed_runtimes[serial_number] = runtime
+            else:
+                self.editor.flashed_runtimes.pop(serial_number, None)
+        self.flash_dialog.on_finished()
+        self.set_buttons(flash=True)
+        self.editor.show_status_message(_("Finished flashing."))
+        self.flash_thread = None
+        self.flash_dialog = None
+
+    def check_version(self):
+        """
+        Ask the connected device for the version of MicroPython it's running.
+        Returns True if the device needs flashing with the runtime bundled
+        with Mu (because its version is older or can't be determined).
+        """
+        try:
+            version_info = microfs.version()
+            logger.info(version_info)
+            board_info = version_info['version'].split()
+            if (board_info[0] == 'micro:bit' and
+                    board_info[1].startswith('v')):
+                # New style versions, so the correct information will be
+                # in the "release" field.
+                try:
+                    # Check the release is a correct semantic version.
+                    semver.parse(version_info['release'])
+                    board_version = version_info['release']
+                except ValueError:
+                    # If it's an invalid semver, set to unknown version to
+                    # force flash.
+                    board_version = '0.0.1'
+            else:
+                # 0.0.1 indicates an old unknown version. This is just a
+                # valid arbitrary flag for semver comparison a couple of
+                # lines below.
+                board_version = '0.0.1'
+            logger.info('Board MicroPython: {}'.format(board_version))
+            logger.info(
+                'Mu MicroPython: {}'.format(uflash.MICROPYTHON_VERSION))
+            # If there's an older version of MicroPython on the device,
+            # update it with the one packaged with Mu.
+            return semver.compare(board_version,
+                                  uflash.MICROPYTHON_VERSION) < 0
+        except Exception:
+            # Could not get version of MicroPython. This means either the
+            # device has a really old version of MicroPython or is running
+            # something else. In any case, flash MicroPython onto the
+            # device.
+            logger.warning('Could not detect version of MicroPython.')
+            return True
+
     def flash_finished(self):
         """
         Called when the thread used to flash the micro:bit has finished.
@@ -404,6 +659,11 @@ class MicrobitMode(MicroPythonMode):
         self.editor.show_status_message(_("Finished flashing."))
         self.flash_thread = None
         self.flash_timer = None
+        if self.flash_runtime:
+            serial_number, runtime = self.flash_runtime
+            if serial_number:
+                self.editor.flashed_runtimes[serial_number] = runtime
+            self.flash_runtime = None
         if self.python_script:
             try:
                 self.copy_main()
@@ -455,6 +715,10 @@ class MicrobitMode(MicroPythonMode):
             self.flash_timer = None
         self.set_buttons(flash=True)
         self.flash_thread = None
+        if self.flash_runtime:
+            # The device may be left with a partially written runtime.
+            self.editor.flashed_runtimes.pop(self.flash_runtime[0], None)
+            self.flash_runtime = None
 
     def toggle_repl(self, event):
         """
@@ -541,6 +805,7 @@ class MicrobitMode(MicroPythonMode):
         self.fs = self.view.add_filesystem(self.workspace_dir(),
                                            self.file_manager,
                                            _("micro:bit"))
+        self.fs.sync_block_size = self.editor.sync_block_size
         self.fs.set_message.connect(self.editor.show_status_message)
         self.fs.set_warning.connect(self.view.show_message)
         self.file_manager_thread.start()
@@ -18,7 +18,8 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 import os
 import logging
-from mu.modes.base import BaseMode
+from mu.modes.base import BaseMode, MU_DIR
+from mu.logic import truncate
 from mu.modes.api import PYTHON3_APIS, SHARED_APIS, PI_APIS, PYGAMEZERO_APIS
 from mu.resources import load_icon
 
@@ -38,6 +39,8 @@ class PyGameZeroMode(BaseMode):
     builtins = ['clock', 'music', 'Actor', 'keyboard', 'animate', 'Rect',
                 'ZRect', 'images', 'sounds', 'mouse', 'keys', 'keymods',
                 'exit', 'screen']
+    #: Modules imported in advance by Python started before pressing Play.
+    warm_modules = ['pygame', 'pgzero']
 
     def actions(self):
         """
@@ -95,11 +98,6 @@ class PyGameZeroMode(BaseMode):
         """
         if self.runner:
             self.stop_game()
-            play_slot = self.view.button_bar.slots['play']
-            play_slot.setIcon(load_icon('play'))
-            play_slot.setText(_('Play'))
-            play_slot.setToolTip(_('Play your Pygame Zero game.'))
-            self.set_buttons(modes=True)
         else:
             self.run_game()
             if self.runner:
@@ -126,27 +124,59 @@ class PyGameZeroMode(BaseMode):
             # If needed, save the script.
             if tab.isModified():
                 self.editor.save_tab_to_file(tab)
-            logger.debug(tab.text())
+            logger.debug(truncate(tab.text()))
             envars = self.editor.envars
             args = ['-m', 'pgzero']
             cwd = os.path.dirname(tab.path)
+            claimed = self.claim_process()
+            process = claimed[0] if claimed else None
             self.runner = self.view.add_python3_runner(tab.path,
                                                        cwd,
                                                        interactive=False,
                                                        envars=envars,
-                                                       python_args=args)
-            self.runner.process.waitForStarted()
+                                                       python_args=args,
+                                                       process=process)
+
+    def process_pool_args(self):
+        """
+        If the setting is on, start Python in advance of pressing Play, with
+        Pygame Zero already imported.
+        """
+        if self.editor.warm_run:
+            return [os.path.join(MU_DIR, 'mu-run.py'), '-m', 'pgzero'] + \
+                self.warm_modules
+        return None
 
     def stop_game(self):
         """
         Stop the currently running game.
+
+        This doesn't wait for the game to end: the Play button shows the game
+        is stopping until it has, then game_stopped tidies up.
         """
         logger.debug('Stopping script.')
-        if self.runner:
-            self.runner.process.kill()
-            self.runner.process.waitForFinished()
-            self.runner = None
+        if self.runner and self.runner.stop_process():
+            play_slot = self.view.button_bar.slots['play']
+            play_slot.setText(_('Stopping...'))
+            play_slot.setToolTip(_('Waiting for your Pygame Zero game to '
+                                   'stop.'))
+            self.set_buttons(play=False)
+            self.runner.process.finished.connect(self.game_stopped)
+        else:
+            self.game_stopped()
+
+    def game_stopped(self, *args):
+        """
+        Called once the game has stopped, to remove its output pane and reset
+        the buttons.
+        """
+        self.runner = None
         self.view.remove_python_runner()
+        play_slot = self.view.button_bar.slots['play']
+        play_slot.setIcon(load_icon('play'))
+        play_slot.setText(_('Play'))
+        play_slot.setToolTip(_('Play your Pygame Zero game.'))
+        self.set_buttons(play=True, modes=True)
 
     def show_images(self, event):
         """
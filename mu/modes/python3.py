@@ -20,13 +20,13 @@ import sys
 import os
 import logging
 from mu.logic import MODULE_DIR
-from mu.modes.base import BaseMode
+from mu.modes.base import BaseMode, MU_DIR
 from mu.modes.api import PYTHON3_APIS, SHARED_APIS, PI_APIS
 from mu.resources import load_icon
 from mu.interface.panes import CHARTS
 from qtconsole.manager import QtKernelManager
 from qtconsole.client import QtKernelClient
-from PyQt5.QtCore import QObject, QThread, pyqtSignal
+from PyQt5.QtCore import QObject, QThread, Qt, pyqtSignal
 
 
 logger = logging.getLogger(__name__)
@@ -39,8 +39,6 @@ class KernelRunner(QObject):
     """
     kernel_started = pyqtSignal(QtKernelManager, QtKernelClient)
     kernel_finished = pyqtSignal()
-    # Used to build context with user defined envars when running the REPL.
-    default_envars = os.environ.copy()
 
     def __init__(self, cwd, envars):
         """
@@ -50,45 +48,61 @@ class KernelRunner(QObject):
         self.cwd = cwd
         self.envars = dict(envars)
 
-    def start_kernel(self):
+    def matches(self, cwd, envars):
         """
-        Create the expected context, start the kernel, obtain a client and
-        emit a signal when both are started.
+        Return a boolean indication if the kernel runs with the referenced
+        working directory and list of environment variables.
         """
-        logger.info(sys.path)
-        os.chdir(self.cwd)  # Ensure the kernel runs with the expected CWD.
-        # Add user defined envars to os.environ so they can be picked up by
-        # the child process running the kernel.
-        logger.info('Starting iPython kernel with user defined envars: '
-                    '{}'.format(self.envars))
-        for k, v in self.envars.items():
-            os.environ[k] = v
+        return self.cwd == cwd and self.envars == dict(envars)
+
+    def kernel_environment(self):
+        """
+        Return the environment variables for the child process running the
+        kernel: Mu's own, with the user defined envars added.
+        """
+        env = os.environ.copy()
+        env.update(self.envars)
         # Ensure the expected paths are in PYTHONPATH of the subprocess so the
         # kernel and Mu-installed third party applications can be found.
-        if 'PYTHONPATH' not in os.environ:
+        if 'PYTHONPATH' not in env:
             paths = sys.path + [MODULE_DIR, ]
-            os.environ['PYTHONPATH'] = os.pathsep.join(paths)
-        if MODULE_DIR not in os.environ['PYTHONPATH']:
+            env['PYTHONPATH'] = os.pathsep.join(paths)
+        if MODULE_DIR not in env['PYTHONPATH']:
             # This is needed on Windows to ensure user installed third party
             # packages are available in the REPL.
-            new_path = os.pathsep.join([os.environ['PYTHONPATH'], MODULE_DIR])
-            os.environ['PYTHONPATH'] = new_path
-        logger.info("REPL PYTHONPATH: {}".format(os.environ['PYTHONPATH']))
+            env['PYTHONPATH'] = os.pathsep.join([env['PYTHONPATH'],
+                                                 MODULE_DIR])
+        return env
+
+    def start_kernel(self):
+        """
+        Start the kernel, obtain a client and emit a signal when both are
+        started.
+
+        The kernel's working directory and environment are passed to the
+        kernel manager (which keeps them for restarts), so Mu's own are left
+        alone and kernels can safely start at the same time.
+        """
+        logger.info(sys.path)
+        logger.info('Starting iPython kernel with user defined envars: '
+                    '{}'.format(self.envars))
+        env = self.kernel_environment()
+        logger.info("REPL PYTHONPATH: {}".format(env['PYTHONPATH']))
         self.repl_kernel_manager = QtKernelManager()
-        self.repl_kernel_manager.start_kernel()
+        self.repl_kernel_manager.start_kernel(env=env, cwd=self.cwd)
         self.repl_kernel_client = self.repl_kernel_manager.client()
         self.kernel_started.emit(self.repl_kernel_manager,
                                  self.repl_kernel_client)
 
     def stop_kernel(self):
         """
-        Clean up the context, stop the client connections to the kernel, affect
-        an immediate shutdown of the kernel and emit a "finished" signal.
+        Stop the client connections to the kernel, affect an immediate
+        shutdown of the kernel and emit a "finished" signal.
         """
-        os.environ.clear()
-        for k, v in self.default_envars.items():
-            os.environ[k] = v
-        self.repl_kernel_client.stop_channels()
+        # A kernel started in advance may never have had its REPL shown, so
+        # its channels were never started.
+        if self.repl_kernel_client.channels_running:
+            self.repl_kernel_client.stop_channels()
         self.repl_kernel_manager.shutdown_kernel(now=True)
         self.kernel_finished.emit()
 
@@ -104,7 +118,13 @@ class PythonMode(BaseMode):
     runner = None
     has_debugger = True
     kernel_runner = None
+    kernel = None  # (kernel manager, kernel client) once a kernel's started.
+    kernel_stopping = False  # Flag to show the kernel is shutting down.
+    report_kernel_stop = True  # Flag to tell the user the REPL has stopped.
+    kernel_stop_wait = 5000  # Milliseconds to wait for the kernel on quit.
     stop_kernel = pyqtSignal()
+    #: Modules imported in advance by Python started before pressing Run.
+    warm_modules = ['turtle']
 
     def actions(self):
         """
@@ -158,10 +178,6 @@ class PythonMode(BaseMode):
         run_slot = self.view.button_bar.slots['run']
         if self.runner:
             self.stop_script()
-            run_slot.setIcon(load_icon('run'))
-            run_slot.setText(_('Run'))
-            run_slot.setToolTip(_('Run your Python script.'))
-            self.set_buttons(debug=True, modes=True)
         else:
             self.run_script()
             if self.runner:
@@ -190,27 +206,58 @@ class PythonMode(BaseMode):
                 self.editor.save_tab_to_file(tab)
             envars = self.editor.envars
             cwd = os.path.dirname(tab.path)
+            claimed = self.claim_process()
+            process = claimed[0] if claimed else None
             self.runner = self.view.add_python3_runner(tab.path,
                                                        cwd,
                                                        interactive=True,
-                                                       envars=envars)
-            self.runner.process.waitForStarted()
-            if self.kernel_runner:
+                                                       envars=envars,
+                                                       process=process)
+            if self.repl:
                 self.set_buttons(plotter=False)
             elif self.plotter:
                 self.set_buttons(repl=False)
 
+    def process_pool_args(self):
+        """
+        If the setting is on, start Python in advance of pressing Run, with
+        common modules already imported.
+        """
+        if self.editor.warm_run:
+            return ['-i', os.path.join(MU_DIR, 'mu-run.py')] + \
+                self.warm_modules
+        return None
+
     def stop_script(self):
         """
         Stop the currently running script.
+
+        This doesn't wait for the script to end: the Run button shows the
+        script is stopping until it has, then script_stopped tidies up.
         """
         logger.debug('Stopping script.')
-        if self.runner:
-            self.runner.process.kill()
-            self.runner.process.waitForFinished()
-            self.runner = None
+        if self.runner and self.runner.stop_process():
+            run_slot = self.view.button_bar.slots['run']
+            run_slot.setText(_('Stopping...'))
+            run_slot.setToolTip(_('Waiting for your Python script to stop.'))
+            self.set_buttons(run=False)
+            self.runner.process.finished.connect(self.script_stopped)
+        else:
+            self.script_stopped()
+
+    def script_stopped(self, *args):
+        """
+        Called once the script has stopped, to remove its output pane and
+        reset the buttons.
+        """
+        self.runner = None
         self.view.remove_python_runner()
-        self.set_buttons(plotter=True, repl=True)
+        run_slot = self.view.button_bar.slots['run']
+        run_slot.setIcon(load_icon('run'))
+        run_slot.setText(_('Run'))
+        run_slot.setToolTip(_('Run your Python script.'))
+        self.set_buttons(run=True, debug=True, modes=True, plotter=True,
+                         repl=True)
         self.return_focus_to_current_tab()
 
     def debug(self, event):
@@ -226,43 +273,109 @@ class PythonMode(BaseMode):
         """
         Toggles the REPL on and off
         """
-        if self.kernel_runner is None:
+        if not self.repl:
             logger.info('Toggle REPL on.')
             self.editor.show_status_message(_("Starting iPython REPL."))
             self.add_repl()
         else:
             logger.info('Toggle REPL off.')
-            self.editor.show_status_message(_("Stopping iPython REPL "
-                                              "(this may take a short amount "
-                                              "of time)."))
+            if not self.editor.warm_repl:
+                self.editor.show_status_message(_("Stopping iPython REPL "
+                                                  "(this may take a short "
+                                                  "amount of time)."))
             self.remove_repl()
 
     def add_repl(self):
         """
-        Create a new Jupyter REPL session in a non-blocking way.
+        Show a Jupyter REPL session, starting its kernel in a non-blocking way
+        unless one is already running.
         """
+        self.repl = True
+        if self.kernel and not self.kernel_runner.matches(
+                self.workspace_dir(), self.editor.envars):
+            # The settings have changed since the kernel was started.
+            self.shutdown_kernel()
+        if self.kernel:
+            self.show_repl()
+            return
         self.set_buttons(repl=False)
+        if self.kernel_runner is None:
+            self.start_repl_kernel()
+        # Otherwise the REPL is shown once the kernel has started (or a new
+        # one started once the old one has stopped).
+
+    def start_repl_kernel(self):
+        """
+        Start a kernel for the REPL in a non-blocking way.
+        """
         self.kernel_thread = QThread()
         self.kernel_runner = KernelRunner(cwd=self.workspace_dir(),
                                           envars=self.editor.envars)
         self.kernel_runner.moveToThread(self.kernel_thread)
         self.kernel_runner.kernel_started.connect(self.on_kernel_start)
-        self.kernel_runner.kernel_finished.connect(self.kernel_thread.quit)
+        # Quit the thread from the thread itself, so it can finish while the
+        # GUI is blocked waiting for it when Mu quits.
+        self.kernel_runner.kernel_finished.connect(self.kernel_thread.quit,
+                                                   Qt.DirectConnection)
         self.stop_kernel.connect(self.kernel_runner.stop_kernel)
         self.kernel_thread.started.connect(self.kernel_runner.start_kernel)
         self.kernel_thread.finished.connect(self.on_kernel_stop)
         self.kernel_thread.start()
 
+    def shutdown_kernel(self, report=True):
+        """
+        Shut down the REPL's kernel in a non-blocking way.
+
+        If report is False, the user isn't told when it has stopped (because
+        it was running in the background).
+        """
+        self.kernel = None
+        if self.kernel_runner and not self.kernel_stopping:
+            self.kernel_stopping = True
+            self.report_kernel_stop = report
+            self.stop_kernel.emit()
+
     def remove_repl(self):
         """
         Remove the Jupyter REPL session.
+
+        If the setting to start the kernel in advance is on, the kernel is
+        kept running (with everything defined in it) for when the REPL is
+        shown again.
         """
         self.view.remove_repl()
-        self.set_buttons(repl=False)
-        # Don't block the GUI
-        self.stop_kernel.emit()
+        self.repl = False
+        if self.editor.warm_repl:
+            self.set_buttons(repl=True, plotter=True, run=True)
+        else:
+            self.set_buttons(repl=False)
+            # Don't block the GUI
+            self.shutdown_kernel()
         self.return_focus_to_current_tab()
 
+    def start_process_pool(self):
+        """
+        As well as starting Python in advance for the Run button, start the
+        REPL's kernel in the background if the setting is on.
+        """
+        super().start_process_pool()
+        if self.editor.warm_repl and self.kernel_runner is None:
+            logger.info('Starting iPython kernel in advance.')
+            self.start_repl_kernel()
+
+    def stop_process_pool(self, quitting=False):
+        """
+        Stop Python started in advance, and any REPL kernel kept running.
+
+        When quitting, wait (for a while) for the kernel's thread to finish,
+        so it isn't destroyed while still running.
+        """
+        super().stop_process_pool(quitting)
+        self.shutdown_kernel(report=bool(self.repl))
+        if quitting and self.kernel_runner:
+            if not self.kernel_thread.wait(self.kernel_stop_wait):
+                logger.warning('iPython kernel did not stop in time.')
+
     def toggle_plotter(self):
         """
         Toggles the plotter on and off.
@@ -301,7 +414,7 @@ class PythonMode(BaseMode):
         tell the user what to fix.
         """
         self.set_buttons(run=True, repl=True, debug=True)
-        if self.kernel_runner:
+        if self.repl:
             self.remove_repl()
         elif self.runner:
             self.run_toggle(None)
@@ -309,10 +422,20 @@ class PythonMode(BaseMode):
 
     def on_kernel_start(self, kernel_manager, kernel_client):
         """
-        Handles UI update when the kernel runner has started the iPython
-        kernel.
+        Handles the kernel runner having started the iPython kernel, showing
+        the REPL if it's wanted.
         """
-        self.view.add_jupyter_repl(kernel_manager, kernel_client)
+        if self.kernel_stopping:
+            return
+        self.kernel = (kernel_manager, kernel_client)
+        if self.repl:
+            self.show_repl()
+
+    def show_repl(self):
+        """
+        Handles UI update to show the REPL for the running iPython kernel.
+        """
+        self.view.add_jupyter_repl(*self.kernel)
         self.set_buttons(repl=True)
         if self.runner:
             self.set_buttons(plotter=False)
@@ -327,5 +450,13 @@ class PythonMode(BaseMode):
         """
         self.repl_kernel_manager = None
         self.set_buttons(repl=True, plotter=True, run=True)
-        self.editor.show_status_message(_("REPL stopped."))
+        if self.report_kernel_stop:
+            self.editor.show_status_message(_("REPL stopped."))
         self.kernel_runner = None
+        self.kernel = None
+        self.kernel_stopping = False
+        self.report_kernel_stop = True
+        if self.repl:
+            # The REPL was asked for while the old kernel was stopping.
+            self.set_buttons(repl=False)
+            self.start_repl_kernel()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Start Python in advance of running a script, so the script starts without
+waiting for the interpreter (or slow to import modules) to load.
+
+Usage: mu-run.py [-m module] [name ...]
+
+Each named module is imported and a "MU-READY" line written to stdout. A line
+of JSON containing the filename, arguments and working directory of the script
+to run is then read from stdin, and the script run as if by "python script"
+(or, with -m, "python -m module script"). The script's stderr is redirected to
+stdout, where Mu reads its output.
+
+This deliberately doesn't import Mu, so the script's process stays as close as
+possible to one started from scratch.
+"""
+
+
+def main():
+    import contextlib
+    import io
+    import json
+    import os
+    import sys
+    import traceback
+    import __main__
+
+    args = sys.argv[1:]
+    module = None
+    if args[:1] == ['-m']:
+        module = args[1]
+        args = args[2:]
+    # Hold back anything printed while importing until the script is run.
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        for name in args:
+            try:
+                __import__(name)
+            except Exception:
+                pass
+    print('MU-READY', flush=True)
+    # Read exactly one line, without buffering, so nothing meant for the
+    # script or the REPL is consumed.
+    line = b''
+    while not line.endswith(b'\n'):
+        data = os.read(sys.stdin.fileno(), 1)
+        if not data:
+            # Mu has gone away without needing this process.
+            return
+        line += data
+    script = json.loads(line.decode('utf-8'))
+    filename = script['filename']
+    os.chdir(script['cwd'])
+    sys.stderr.flush()
+    os.dup2(sys.stdout.fileno(), sys.stderr.fileno())
+    sys.stdout.write(output.getvalue())
+    try:
+        if module:
+            import runpy
+            sys.argv[1:] = [filename] + script['args']
+            sys.path[0] = script['cwd']
+            runpy.run_module(module, run_name='__main__', alter_sys=True)
+        else:
+            sys.argv[:] = [filename] + script['args']
+            sys.path[0] = os.path.dirname(filename)
+            with open(filename, 'rb') as source:
+                code = compile(source.read(), filename, 'exec')
+            # Run the script as __main__, so the REPL (with "python -i")
+            # has the script's names.
+            namespace = __main__.__dict__
+            builtins = namespace['__builtins__']
+            namespace.clear()
+            namespace.update(__name__='__main__', __file__=filename,
+                             __builtins__=builtins, __doc__=None,
+                             __package__=None, __spec__=None,
+                             __loader__=None, __cached__=None)
+            exec(code, namespace)
+    except BaseException as ex:
+        if isinstance(ex, SystemExit) and not sys.flags.interactive:
+            raise
+        # Report the error as Python would, without this launcher in the
+        # traceback. When interactive, the REPL then starts.
+        etype, value, tb = sys.exc_info()
+        sys.last_type, sys.last_value, sys.last_traceback = (etype, value,
+                                                             tb.tb_next)
+        traceback.print_exception(etype, value, tb.tb_next)
+        if not sys.flags.interactive:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
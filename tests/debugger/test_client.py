@@ -4,9 +4,9 @@ Tests for the debug client.
 """
 import socket
 import pytest
-import json
 import os.path
 import mu.debugger.client
+from mu.debugger.utils import encode_message
 from unittest import mock
 from PyQt5.QtCore import pyqtBoundSignal
 
@@ -46,8 +46,8 @@ def test_CommandBufferHandler_init():
 
 def test_CommandBufferHandler_worker_with_connection_refused_error():
     """
-    Check that the connection will try up to 10 times before emitting an
-    on_fail signal.
+    The runner reports its port once it's listening, so the connection is only
+    tried once before emitting an on_fail signal.
     """
     mock_debugger = mock.MagicMock()
     mock_debugger.host = 'localhost'
@@ -56,24 +56,18 @@ def test_CommandBufferHandler_worker_with_connection_refused_error():
     mock_socket = mock.MagicMock()
     mock_socket.connect.side_effect = ConnectionRefusedError()
     mock_socket_factory.socket.return_value = mock_socket
-    mock_time = mock.MagicMock()
-    mock_debugger = mock.MagicMock()
     cbh = mu.debugger.client.CommandBufferHandler(mock_debugger)
     cbh.on_fail = mock.MagicMock()
-    with mock.patch('mu.debugger.client.socket', mock_socket_factory), \
-            mock.patch('mu.debugger.client.time', mock_time):
+    with mock.patch('mu.debugger.client.socket', mock_socket_factory):
         cbh.worker()
-    msg = ('Connection timed out. Is your machine slow or busy? Free up some '
-           "of the machine's resources and try again.")
+    msg = 'The debug runner is no longer running.'
     cbh.on_fail.emit.assert_called_once_with(msg)
-    assert mock_socket.connect.call_count == 50
-    assert mock_time.sleep.call_count == 49
+    mock_socket.connect.assert_called_once_with(('localhost', 9999))
 
 
 def test_CommandBufferHandler_worker_with_address_error():
     """
-    Check that the connection will try up to 10 times before emitting an
-    on_fail signal.
+    Check that an address related error emits an on_fail signal.
     """
     mock_debugger = mock.MagicMock()
     mock_debugger.host = 'localhost'
@@ -107,7 +101,7 @@ def test_CommandBufferHandler_worker_break_loop():
     cbh = mu.debugger.client.CommandBufferHandler(mock_debugger)
     with mock.patch('mu.debugger.client.socket', mock_socket_factory):
         cbh.worker()
-    mock_socket.recv.assert_called_once_with(1024)
+    mock_socket.recv.assert_called_once_with(mu.debugger.client.RECV_SIZE)
 
 
 def test_CommandBufferHandler_worker_exception_breaks_loop():
@@ -125,7 +119,7 @@ def test_CommandBufferHandler_worker_exception_breaks_loop():
     cbh = mu.debugger.client.CommandBufferHandler(mock_debugger)
     with mock.patch('mu.debugger.client.socket', mock_socket_factory):
         cbh.worker()
-    mock_socket.recv.assert_called_once_with(1024)
+    mock_socket.recv.assert_called_once_with(mu.debugger.client.RECV_SIZE)
     assert cbh.stopped
 
 
@@ -135,14 +129,12 @@ def test_command_buffer_message():
     message results in the expected command, associated arguments and the
     remainder is correctly populated.
     """
-    msg = json.dumps(["bootstrap", {'arg': 'value'}]).encode('utf-8')
-    msg += mu.debugger.client.Debugger.ETX
+    msg = encode_message('bootstrap', {'arg': 'value'})
     # Splitting the message in two ensures remainder handling is exercised.
     pos = len(msg) // 2
     msg1 = msg[:pos]
     msg2 = msg[pos:]
     mock_debugger = mock.MagicMock()
-    mock_debugger.ETX = mu.debugger.client.Debugger.ETX
     mock_debugger.host = 'localhost'
     mock_debugger.port = 9999
     mock_socket_factory = mock.MagicMock()
@@ -154,9 +146,10 @@ def test_command_buffer_message():
     with mock.patch('mu.debugger.client.socket', mock_socket_factory):
         cbh.worker()
     assert mock_debugger.socket.recv.call_count == 3
-    expected = msg.replace(mu.debugger.client.Debugger.ETX,
-                           b'').decode('utf-8')
-    cbh.on_command.emit.assert_called_once_with(expected)
+    mock_socket.setsockopt.assert_called_once_with(
+        mock_socket_factory.IPPROTO_TCP, mock_socket_factory.TCP_NODELAY, 1)
+    cbh.on_command.emit.assert_called_once_with(['bootstrap',
+                                                 {'arg': 'value'}])
 
 
 def test_Debugger_init():
@@ -168,6 +161,7 @@ def test_Debugger_init():
     assert db.port == 1908
     assert db.proc is None
     assert db.view is None
+    assert db.stack == []
 
 
 def test_Debugger_start():
@@ -203,8 +197,7 @@ def test_Debugger_on_command():
     """
     db = mu.debugger.client.Debugger('localhost', 1908)
     db.on_bootstrap = mock.MagicMock()
-    msg = json.dumps(["bootstrap", {'arg': 'value'}])
-    db.on_command(msg)
+    db.on_command(['bootstrap', {'arg': 'value'}])
     db.on_bootstrap.assert_called_once_with(arg='value')
 
 
@@ -246,7 +239,8 @@ def test_Debugger_output():
     db = mu.debugger.client.Debugger('localhost', 1908)
     db.socket = mock.MagicMock()
     db.output('test', foo='bar')
-    db.socket.sendall.assert_called_once_with(b'["test", {"foo": "bar"}]\x03')
+    db.socket.sendall.assert_called_once_with(b'\x00\x00\x00\x16'
+                                              b'["test",{"foo":"bar"}]')
 
 
 def test_Debugger_output_client_error():
@@ -401,6 +395,37 @@ def test_Debugger_clear_breakpoint():
     db.output.assert_called_once_with('clear', bpnum=123)
 
 
+def test_Debugger_fetch_children():
+    """
+    Ensure the right command is sent to fetch a page of children.
+    """
+    db = mu.debugger.client.Debugger('localhost', 1908)
+    db.output = mock.MagicMock()
+    db.fetch_children(3, [0, 'foo', 1], 100)
+    db.output.assert_called_once_with('children', request=3,
+                                      path=[0, 'foo', 1], start=100)
+
+
+def test_Debugger_fetch_value():
+    """
+    Ensure the right command is sent to fetch the full repr of a value.
+    """
+    db = mu.debugger.client.Debugger('localhost', 1908)
+    db.output = mock.MagicMock()
+    db.fetch_value(3, [0, 'foo'])
+    db.output.assert_called_once_with('value', request=3, path=[0, 'foo'])
+
+
+def test_Debugger_set_repr_limits():
+    """
+    Ensure the limits on the size of reprs are sent to the runner.
+    """
+    db = mu.debugger.client.Debugger('localhost', 1908)
+    db.output = mock.MagicMock()
+    db.set_repr_limits({'maxlist': 20, 'maxlength': 500})
+    db.output.assert_called_once_with('limits', maxlist=20, maxlength=500)
+
+
 def test_Debugger_do_run():
     """
     Ensure instructing the client to run to the next breakpoint results in the
@@ -462,7 +487,9 @@ def test_Debugger_on_bootstrap():
             'name': 'breakpoint2',
         },
     ]
+    db.stack = [(1, {}), ]
     db.on_bootstrap(breakpoints)
+    assert db.stack == []
     assert db.bp_index == {}
     assert db.bp_list == [True, ]
     assert db.on_breakpoint_create.call_count == 2
@@ -602,14 +629,82 @@ def test_Debugger_on_breakpoint_clear():
 def test_Debugger_on_stack():
     """
     Handle the runner sending revised data about the current state of the debug
-    stack.
+    stack: the full stack is rebuilt from the changes and passed to the view.
+    """
+    db = mu.debugger.client.Debugger('localhost', 1908)
+    db.view = mock.MagicMock()
+    frame = {
+        'new': True,
+        'filename': 'foo.py',
+        'locals': {'changed': {'a': '1', 'b': '2'}, 'removed': []},
+        'globals': '123',
+        'current': True,
+    }
+    db.on_stack([[3, frame], ],
+                namespaces={'123': {'changed': {'x': "'y'"}, 'removed': []}},
+                builtins={'len': '<built-in function len>'})
+    expected = [(3, {
+        'filename': 'foo.py',
+        'locals': {'a': '1', 'b': '2'},
+        'globals': {'x': "'y'"},
+        'builtins': {'len': '<built-in function len>'},
+        'current': True,
+    })]
+    assert db.stack == expected
+    db.view.debug_on_stack.assert_called_once_with(expected)
+    # Only the changes are sent for the next stop.
+    frame = {
+        'locals': {'changed': {'a': '10'}, 'removed': ['b']},
+        'current': False,
+    }
+    new_frame = {
+        'new': True,
+        'filename': 'bar.py',
+        'locals': None,
+        'globals': '123',
+        'current': True,
+    }
+    db.on_stack([[4, frame], [1, new_frame]],
+                namespaces={'123': {'changed': {}, 'removed': ['x']}})
+    builtins = {'len': '<built-in function len>'}
+    assert db.stack == [
+        (4, {
+            'filename': 'foo.py',
+            'locals': {'a': '10'},
+            'globals': {},
+            'builtins': builtins,
+            'current': False,
+        }),
+        (1, {
+            'filename': 'bar.py',
+            'locals': {},
+            'globals': {},
+            'builtins': builtins,
+            'current': True,
+        }),
+    ]
+    assert db.stack[0][1]['globals'] is db.stack[1][1]['globals']
+
+
+def test_Debugger_on_children():
+    """
+    Pages of children are passed to the view.
+    """
+    db = mu.debugger.client.Debugger('localhost', 1908)
+    db.view = mock.MagicMock()
+    db.on_children(1, 0, 2, [['0', None, "'a'"], ['1', 'list', 3]])
+    db.view.debug_on_children.assert_called_once_with(
+        1, 0, 2, [['0', None, "'a'"], ['1', 'list', 3]])
+
+
+def test_Debugger_on_value():
+    """
+    Full reprs of values are passed to the view.
     """
     db = mu.debugger.client.Debugger('localhost', 1908)
     db.view = mock.MagicMock()
-    stack = mock.MagicMock()
-    db.on_stack(stack)
-    assert db.stack == stack
-    db.view.debug_on_stack.assert_called_once_with(stack)
+    db.on_value(1, "'foo'")
+    db.view.debug_on_value.assert_called_once_with(1, "'foo'")
 
 
 def test_Debugger_on_restart():
@@ -2,13 +2,91 @@
 """
 Tests for the debug runner.
 """
+import bdb
 import json
+import collections
+import socket
 import pytest
 import os.path
 import mu.debugger.runner
+from mu.debugger.utils import encode_message
 from unittest import mock
 
 
+def test_BoundedRepr():
+    """
+    Reprs are limited in size however big the value.
+    """
+    br = mu.debugger.runner.BoundedRepr()
+    assert br.repr('hello') == "'hello'"
+    assert br.repr(list(range(1000))) == '[0, 1, 2, 3, 4, 5, ...]'
+    assert len(br.repr('x' * 1000)) == br.maxstring
+    assert len(br.repr({i: 'x' * 100 for i in range(50)})) == br.maxlength
+
+
+def test_BoundedRepr_large_objects():
+    """
+    Objects with many items are summarised without making their full repr,
+    and bytes are cut short before their repr is made.
+    """
+    class Big:
+        def __len__(self):
+            return 1000
+
+        def __repr__(self):
+            raise AssertionError('Full repr made')
+
+    br = mu.debugger.runner.BoundedRepr()
+    assert br.repr(Big()) == '<Big of 1000 items>'
+    big = collections.OrderedDict((i, i) for i in range(100))
+    assert br.repr(big) == '<OrderedDict of 100 items>'
+    small = collections.OrderedDict(a=1)
+    assert br.repr(small) == "OrderedDict([('a', 1)])"
+    assert len(br.repr(b'x' * 10000)) == br.maxstring
+    assert len(br.repr(bytearray(10000))) == br.maxstring
+
+
+def test_BoundedRepr_repr_fails():
+    """
+    If a repr can't be made, the type of the value is given instead.
+    """
+    br = mu.debugger.runner.BoundedRepr()
+    with mock.patch('reprlib.Repr.repr', side_effect=ValueError('Boom')):
+        assert br.repr(123) == '<int object>'
+
+
+def test_BoundedRepr_configure():
+    """
+    Known limits are set, unknown ones are ignored.
+    """
+    br = mu.debugger.runner.BoundedRepr()
+    br.configure(maxlist=2, maxlength='12', foo=1, __class__=1)
+    assert br.maxlist == 2
+    assert br.maxlength == 12
+    assert not hasattr(br, 'foo')
+    assert br.repr([1, 2, 3]) == '[1, 2, ...]'
+    assert br.repr('x' * 20) == "'xxxxxxxx..."
+
+
+def test_inspect_value():
+    """
+    Lists and dicts are summarised by their length, everything else by its
+    repr.
+    """
+    assert mu.debugger.runner.inspect_value([1, 2]) == ['list', 2]
+    assert mu.debugger.runner.inspect_value({'a': 1}) == ['dict', 1]
+    assert mu.debugger.runner.inspect_value((1, 2)) == [None, '(1, 2)']
+
+
+def test_child_items():
+    """
+    Children of lists are labelled by index, and children of dicts by key.
+    """
+    child_items = mu.debugger.runner.child_items
+    assert child_items(['a', 'b', 'c'], 1, 5) == [('1', 'b'), ('2', 'c')]
+    assert child_items({1: 'a', 2: 'b'}, 0, 1) == [('1', 'a')]
+
+
 def test_command_buffer_break_loop():
     """
     Ensure if the command_buffer receives None from the socket then break out
@@ -17,7 +95,8 @@ def test_command_buffer_break_loop():
     mock_debugger = mock.MagicMock()
     mock_debugger.client.recv.return_value = None
     mu.debugger.runner.command_buffer(mock_debugger)
-    mock_debugger.client.recv.assert_called_once_with(1024)
+    mock_debugger.client.recv.assert_called_once_with(
+        mu.debugger.runner.RECV_SIZE)
     mock_debugger.commands.put.assert_called_once_with(('close', {}))
 
 
@@ -28,14 +107,12 @@ def test_command_buffer_message():
     remainder is correctly populated.
     """
     raw = ["enable", {'bpnum': '1'}]
-    msg = json.dumps(raw).encode('utf-8')
-    msg += mu.debugger.runner.Debugger.ETX
+    msg = encode_message(*raw)
     # Splitting the message in two ensures remainder handling is exercised.
     pos = len(msg) // 2
     msg1 = msg[:pos]
     msg2 = msg[pos:]
     mock_debugger = mock.MagicMock()
-    mock_debugger.ETX = mu.debugger.runner.Debugger.ETX
     mock_debugger.client.recv.side_effect = [msg1, msg2, None]
     mu.debugger.runner.command_buffer(mock_debugger)
     assert mock_debugger.client.recv.call_count == 3
@@ -61,6 +138,9 @@ def test_Debugger_init():
     assert db.quitting is None
     assert db.botframe is None
     assert db.stopframe is None
+    assert db.snapshot == []
+    assert db.namespaces == {}
+    assert db.builtins_sent is False
 
 
 def test_Debugger_output():
@@ -72,7 +152,8 @@ def test_Debugger_output():
     db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
     db.client = mock.MagicMock()
     db.output('test', foo='bar')
-    db.client.sendall.assert_called_once_with(b'["test", {"foo": "bar"}]\x03')
+    db.client.sendall.assert_called_once_with(b'\x00\x00\x00\x16'
+                                              b'["test",{"foo":"bar"}]')
 
 
 def test_Debugger_output_client_error():
@@ -135,13 +216,15 @@ def test_Debugger_output_stack_normal():
     ]
     db.curframe = None
     db.output_stack()
+    key = str(id(frame2.f_globals))
     expected_stack = [(
         3,
         {
+            'new': True,
             'filename': 'filename.py',
-            'locals': {'locals': "'foo'"},
-            'globals': {'globals': "'bar'"},
-            'builtins': {'builtins': "'baz'"},
+            'locals': {'changed': {'locals': [None, "'foo'"]},
+                       'removed': []},
+            'globals': key,
             'restricted': 'f_restricted',
             'lasti': "'f_lasti'",
             'exc_type': "'f_exc_type'",
@@ -150,7 +233,10 @@ def test_Debugger_output_stack_normal():
             'current': False,
         }
     )]
-    db.output.assert_called_once_with('stack', stack=expected_stack)
+    db.output.assert_called_once_with(
+        'stack', stack=expected_stack,
+        namespaces={key: {'changed': {'globals': "'bar'"}, 'removed': []}},
+        builtins={'builtins': "'baz'"})
 
 
 def test_Debugger_output_stack_exception():
@@ -185,13 +271,15 @@ def test_Debugger_output_stack_exception():
     ]
     db.curframe = None
     db.output_stack()
+    key = str(id(frame4.f_globals))
     expected_stack = [(
         5,
         {
+            'new': True,
             'filename': 'filename.py',
-            'locals': {'locals': "'foo'"},
-            'globals': {'globals': "'bar'"},
-            'builtins': {'builtins': "'baz'"},
+            'locals': {'changed': {'locals': [None, "'foo'"]},
+                       'removed': []},
+            'globals': key,
             'restricted': 'f_restricted',
             'lasti': "'f_lasti'",
             'exc_type': "'f_exc_type'",
@@ -200,7 +288,99 @@ def test_Debugger_output_stack_exception():
             'current': False,
         }
     )]
-    db.output.assert_called_once_with('stack', stack=expected_stack)
+    db.output.assert_called_once_with(
+        'stack', stack=expected_stack,
+        namespaces={key: {'changed': {'globals': "'bar'"}, 'removed': []}},
+        builtins={'builtins': "'baz'"})
+
+
+def test_Debugger_output_stack_delta():
+    """
+    Once the stack has been sent, only the frames, variables and namespaces
+    that changed are sent, and builtins are not sent again.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.output = mock.MagicMock()
+    frame1 = mock.MagicMock()
+    frame1.f_code.co_filename = '<string>'
+    shared_globals = {'data': [1, 2, 3]}
+    frame2 = mock.MagicMock()
+    frame2.f_code.co_filename = 'filename.py'
+    frame2.f_locals = {'a': 1, 'b': 2}
+    frame2.f_globals = shared_globals
+    frame2.f_builtins = {'builtins': 'baz'}
+    frame2.f_lasti = 1
+    frame3 = mock.MagicMock()
+    frame3.f_code.co_filename = 'filename.py'
+    frame3.f_locals = {'x': 'y'}
+    frame3.f_globals = shared_globals
+    frame3.f_lasti = 1
+    db.stack = [(None, 1), (frame1, 2), (frame2, 3), (frame3, 4)]
+    db.curframe = frame3
+    db.output_stack()
+    key = str(id(shared_globals))
+    data = db.output.call_args[1]
+    assert data['namespaces'] == {
+        key: {'changed': {'data': '[1, 2, 3]'}, 'removed': []},
+    }
+    assert data['stack'][0][1]['globals'] == key
+    assert data['stack'][1][1]['globals'] == key
+    assert 'builtins' in data
+    # Step: frame2 has a changed local, frame3 has returned and a new frame
+    # has been called in its place.
+    frame2.f_locals = {'a': 10}
+    frame2.f_lasti = 2
+    frame4 = mock.MagicMock()
+    frame4.f_code.co_filename = 'other.py'
+    frame4.f_locals = {}
+    frame4.f_globals = shared_globals
+    frame4.f_lasti = 1
+    db.stack = [(None, 1), (frame1, 2), (frame2, 5), (frame4, 1)]
+    db.curframe = frame4
+    db.output.reset_mock()
+    db.output_stack()
+    db.output.assert_called_once_with('stack', stack=[
+        (5, {
+            'locals': {'changed': {'a': [None, '10']}, 'removed': ['b']},
+            'lasti': '2',
+        }),
+        (1, {
+            'new': True,
+            'filename': 'other.py',
+            'locals': None,
+            'globals': key,
+            'restricted': frame4.f_restricted,
+            'lasti': '1',
+            'exc_type': repr(frame4.f_exc_type),
+            'exc_value': repr(frame4.f_exc_value),
+            'exc_traceback': repr(frame4.f_exc_traceback),
+            'current': True,
+        }),
+    ], namespaces={})
+    # Nothing changed at all.
+    db.output.reset_mock()
+    db.output_stack()
+    db.output.assert_called_once_with('stack', stack=[
+        (5, {}),
+        (1, {}),
+    ], namespaces={})
+
+
+def test_Debugger_reset_snapshot():
+    """
+    Resetting the snapshot means the whole stack, and builtins, are sent
+    again.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.snapshot = [(None, {})]
+    db.namespaces = {'1': ({}, {})}
+    db.builtins_sent = True
+    db.reset_snapshot()
+    assert db.snapshot == []
+    assert db.namespaces == {}
+    assert db.builtins_sent is False
 
 
 def test_Debugger_reset():
@@ -257,6 +437,27 @@ def test_Debugger_interact_good_case():
     db.do_quit.assert_called_once_with(foo='bar')
 
 
+def test_Debugger_interact_fast_continuing():
+    """
+    When stopping at a breakpoint after continuing, the fast continue is ended
+    and the whole stack traced again, ready for stepping.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.setup = mock.MagicMock()
+    db.output_stack = mock.MagicMock()
+    db.commands = mock.MagicMock()
+    db.commands.get.return_value = ('quit', {})
+    db.do_quit = mock.MagicMock(return_value=True)
+    db.end_fast_continue = mock.MagicMock()
+    db.trace_stack = mock.MagicMock()
+    db.fast_continuing = True
+    mock_frame = mock.MagicMock()
+    db.interact(mock_frame, None)
+    db.end_fast_continue.assert_called_once_with()
+    db.trace_stack.assert_called_once_with(mock_frame)
+
+
 def test_Debugger_interact_unknown_command():
     """
     If the runner receives an unknown command it should respond with an error.
@@ -288,8 +489,9 @@ def test_Debugger_interact_client_close():
     db.commands = mock.MagicMock()
     db.commands.get.side_effect = mu.debugger.runner.ClientClose()
     db.do_quit = mock.MagicMock(return_value=True)
+    db.reset_snapshot = mock.MagicMock()
     db.socket = mock.MagicMock()
-    mock_client = mock.MagicMock
+    mock_client = mock.MagicMock()
     db.socket.accept.return_value = (mock_client, '127.0.0.1')
     mock_thread_instance = mock.MagicMock()
     mock_thread = mock.MagicMock(return_value=mock_thread_instance)
@@ -302,6 +504,9 @@ def test_Debugger_interact_client_close():
         db.interact(None, None)
     db.output.assert_called_once_with('bootstrap', breakpoints=[])
     assert db.output_stack.call_count == 2
+    mock_client.setsockopt.assert_called_once_with(socket.IPPROTO_TCP,
+                                                   socket.TCP_NODELAY, 1)
+    db.reset_snapshot.assert_called_once_with()
 
 
 def test_Debugger_interact_restart():
@@ -720,6 +925,59 @@ def test_Debugger_do_clear():
                                       bpnum=1)
 
 
+def test_Debugger_do_children():
+    """
+    A page of the children of a list or dict is found by following the path
+    from a local variable in the stack.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.output = mock.MagicMock()
+    frame = mock.MagicMock()
+    frame.f_locals = {
+        'foo': {'a': 1, 'b': [1, 2, list(range(150))]},
+    }
+    db.snapshot = [(None, {}), (frame, {})]
+    db.do_children(1, [1, 'foo'], 0)
+    db.output.assert_called_once_with('children', request=1, start=0,
+                                      total=2, children=[
+                                          ["'a'", None, '1'],
+                                          ["'b'", 'list', 3],
+                                      ])
+    db.output.reset_mock()
+    db.do_children(2, [1, 'foo', 1, 2], 100)
+    children = [[str(i), None, str(i)] for i in range(100, 150)]
+    db.output.assert_called_once_with('children', request=2, start=100,
+                                      total=150, children=children)
+
+
+def test_Debugger_do_value():
+    """
+    The full repr of a value is found by following the path from a local
+    variable in the stack.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.output = mock.MagicMock()
+    frame = mock.MagicMock()
+    frame.f_locals = {'foo': ['x' * 1000]}
+    db.snapshot = [(frame, {})]
+    db.do_value(1, [0, 'foo', 0])
+    db.output.assert_called_once_with('value', request=1,
+                                      value=repr('x' * 1000))
+
+
+def test_Debugger_do_limits():
+    """
+    The limits on the size of reprs are passed on to the bounded repr.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    with mock.patch('mu.debugger.runner.short_repr') as mock_repr:
+        db.do_limits(maxlist=3)
+    mock_repr.configure.assert_called_once_with(maxlist=3)
+
+
 def test_Debugger_do_step():
     """
     Calls set_step and returns True.
@@ -803,6 +1061,256 @@ def test_Debugger_do_continue_no_breakpoints_continue_flag_set():
     db.set_continue.assert_called_once_with()
 
 
+def make_frames(db, *codes):
+    """
+    Return a mock frame for each code object, each called from the next, with
+    the debugger's bottom frame at the end of the chain.
+    """
+    db.botframe = mock.MagicMock()
+    frames = []
+    caller = db.botframe
+    for code in reversed(codes):
+        caller = mock.MagicMock(f_code=code, f_back=caller)
+        frames.insert(0, caller)
+    return frames
+
+
+def test_Debugger_set_continue_no_breakpoints():
+    """
+    With no breakpoints, bdb stops tracing altogether.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    with mock.patch('bdb.Bdb.set_continue') as mock_continue, \
+            mock.patch('mu.debugger.runner.sys') as mock_sys:
+        db.set_continue()
+    mock_continue.assert_called_once_with()
+    assert db.fast_continuing is False
+    assert mock_sys.settrace.call_count == 0
+
+
+def test_Debugger_set_continue_trace():
+    """
+    Without sys.monitoring, a light global trace function is used and frames
+    on the stack without breakpoints are no longer traced.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.breaks = {db.canonic('x.py'): [1]}
+    with_break = compile('x = 1\n', 'x.py', 'exec')
+    without_break = compile('x = 1\n', 'y.py', 'exec')
+    frames = make_frames(db, with_break, without_break)
+    mock_sys = mock.MagicMock()
+    del mock_sys.monitoring
+    mock_sys._getframe.return_value = mock.MagicMock(f_back=frames[0])
+    with mock.patch('bdb.Bdb.set_continue'), \
+            mock.patch('mu.debugger.runner.sys', mock_sys):
+        db.set_continue()
+    assert db.fast_continuing is True
+    assert db.break_lines == {db.canonic('x.py'): {1}}
+    mock_sys.settrace.assert_called_once_with(db.trace_continue)
+    assert frames[0].f_trace is not None
+    assert frames[1].f_trace is None
+
+
+def test_Debugger_set_continue_monitoring():
+    """
+    With sys.monitoring, tracing is turned off and only the start of each
+    code object is monitored, with lines monitored for the code containing
+    breakpoints that's already running.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.breaks = {db.canonic('x.py'): [1]}
+    db.monitor_start = mock.MagicMock()
+    frames = make_frames(db, 'code1', 'code2')
+    mock_sys = mock.MagicMock()
+    mock_sys._getframe.return_value = mock.MagicMock(f_back=frames[0])
+    monitoring = mock_sys.monitoring
+    monitoring.get_tool.return_value = None
+    with mock.patch('bdb.Bdb.set_continue'), \
+            mock.patch('mu.debugger.runner.sys', mock_sys):
+        db.set_continue()
+    assert db.fast_continuing is True
+    tool = monitoring.DEBUGGER_ID
+    monitoring.use_tool_id.assert_called_once_with(tool, 'mu-debugger')
+    assert monitoring.register_callback.call_args_list == [
+        mock.call(tool, monitoring.events.PY_START, db.monitor_start),
+        mock.call(tool, monitoring.events.LINE, db.monitor_line),
+    ]
+    mock_sys.settrace.assert_called_once_with(None)
+    monitoring.restart_events.assert_called_once_with()
+    monitoring.set_events.assert_called_once_with(tool,
+                                                  monitoring.events.PY_START)
+    assert frames[0].f_trace is None
+    assert frames[1].f_trace is None
+    assert db.monitor_start.call_args_list == [mock.call('code1', 0),
+                                               mock.call('code2', 0)]
+
+
+def test_Debugger_set_continue_monitoring_tool_in_use():
+    """
+    The debugger's monitoring tool ID is only claimed once.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.breaks = {db.canonic('x.py'): [1]}
+    make_frames(db)
+    mock_sys = mock.MagicMock()
+    mock_sys._getframe.return_value = mock.MagicMock(f_back=db.botframe)
+    mock_sys.monitoring.get_tool.return_value = 'mu-debugger'
+    with mock.patch('bdb.Bdb.set_continue'), \
+            mock.patch('mu.debugger.runner.sys', mock_sys):
+        db.set_continue()
+    assert mock_sys.monitoring.use_tool_id.call_count == 0
+
+
+def test_Debugger_end_fast_continue():
+    """
+    All the events monitored while continuing are turned off.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.fast_continuing = True
+    db.break_code = {('x.py', 'code1'): True, ('x.py', 'code2'): False}
+    mock_sys = mock.MagicMock()
+    monitoring = mock_sys.monitoring
+    with mock.patch('mu.debugger.runner.sys', mock_sys):
+        db.end_fast_continue()
+    assert db.fast_continuing is False
+    tool = monitoring.DEBUGGER_ID
+    monitoring.set_events.assert_called_once_with(tool, 0)
+    monitoring.set_local_events.assert_called_once_with(tool, 'code1', 0)
+
+
+def test_Debugger_end_fast_continue_not_monitoring():
+    """
+    Nothing needs turning off if sys.monitoring isn't available or the tool
+    was never used.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.fast_continuing = True
+    mock_sys = mock.MagicMock()
+    del mock_sys.monitoring
+    with mock.patch('mu.debugger.runner.sys', mock_sys):
+        db.end_fast_continue()
+    assert db.fast_continuing is False
+    mock_sys = mock.MagicMock()
+    mock_sys.monitoring.get_tool.return_value = None
+    with mock.patch('mu.debugger.runner.sys', mock_sys):
+        db.end_fast_continue()
+    assert mock_sys.monitoring.set_events.call_count == 0
+
+
+def test_Debugger_trace_stack():
+    """
+    Every frame down to the bottom frame, and all new calls, are traced.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    frames = make_frames(db, 'code1', 'code2')
+    frames[1].f_trace = None
+    with mock.patch('mu.debugger.runner.sys') as mock_sys:
+        db.trace_stack(frames[0])
+    mock_sys.settrace.assert_called_once_with(db.trace_dispatch)
+    assert frames[0].f_trace == db.trace_dispatch
+    assert frames[1].f_trace == db.trace_dispatch
+    assert db.botframe.f_trace != db.trace_dispatch
+
+
+def test_Debugger_has_breakpoint():
+    """
+    Code objects are checked for lines with breakpoints, and the result is
+    cached.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.break_lines = {db.canonic('x.py'): {3}}
+    code = compile('x = 1\ny = 2\nz = 3\n', 'x.py', 'exec')
+    assert db.has_breakpoint(code) is True
+    assert db.break_code == {('x.py', code): True}
+    other_lines = compile('x = 1\ny = 2\n', 'x.py', 'exec')
+    assert db.has_breakpoint(other_lines) is False
+    other_file = compile('x = 1\ny = 2\nz = 3\n', 'y.py', 'exec')
+    assert db.has_breakpoint(other_file) is False
+    db.break_lines = {}
+    assert db.has_breakpoint(code) is True
+
+
+def test_Debugger_trace_continue():
+    """
+    Only frames running code with breakpoints are handed to bdb.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.trace_dispatch = mock.MagicMock(return_value='trace')
+    code1 = mock.MagicMock(co_filename='x.py')
+    code2 = mock.MagicMock(co_filename='x.py')
+    db.break_code = {('x.py', code1): True, ('x.py', code2): False}
+    frame = mock.MagicMock(f_code=code1)
+    assert db.trace_continue(frame, 'call', None) == 'trace'
+    db.trace_dispatch.assert_called_once_with(frame, 'call', None)
+    frame = mock.MagicMock(f_code=code2)
+    assert db.trace_continue(frame, 'call', None) is None
+    assert db.trace_dispatch.call_count == 1
+
+
+def test_Debugger_monitor_start():
+    """
+    Line events are only turned on for code containing breakpoints, and the
+    start of the code object is never monitored again.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    code1 = mock.MagicMock(co_filename='x.py')
+    code2 = mock.MagicMock(co_filename='x.py')
+    db.break_code = {('x.py', code1): True, ('x.py', code2): False}
+    with mock.patch('mu.debugger.runner.sys') as mock_sys:
+        monitoring = mock_sys.monitoring
+        assert db.monitor_start(code1, 0) == monitoring.DISABLE
+        assert db.monitor_start(code2, 0) == monitoring.DISABLE
+    monitoring.set_local_events.assert_called_once_with(
+        monitoring.DEBUGGER_ID, code1, monitoring.events.LINE)
+
+
+def test_Debugger_monitor_line_no_breakpoint():
+    """
+    Lines without breakpoints are no longer monitored.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.break_lines = {db.canonic('x.py'): {3}}
+    db.user_line = mock.MagicMock()
+    code = mock.MagicMock(co_filename='x.py')
+    with mock.patch('mu.debugger.runner.sys') as mock_sys:
+        assert db.monitor_line(code, 2) == mock_sys.monitoring.DISABLE
+    assert db.user_line.call_count == 0
+
+
+def test_Debugger_monitor_line_breakpoint():
+    """
+    Stop if bdb agrees the breakpoint on the line is effective.
+    """
+    mock_socket = mock.MagicMock()
+    db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
+    db.break_lines = {db.canonic('x.py'): {3}}
+    db.break_here = mock.MagicMock(return_value=False)
+    db.user_line = mock.MagicMock()
+    code = mock.MagicMock(co_filename='x.py')
+    with mock.patch('mu.debugger.runner.sys') as mock_sys:
+        assert db.monitor_line(code, 3) is None
+        assert db.user_line.call_count == 0
+        db.break_here.return_value = True
+        assert db.monitor_line(code, 3) is None
+        frame = mock_sys._getframe.return_value
+        db.user_line.assert_called_once_with(frame)
+        mock_sys._getframe.assert_called_with(1)
+        db.quitting = True
+        with pytest.raises(bdb.BdbQuit):
+            db.monitor_line(code, 3)
+
+
 def test_Debugger_do_quit():
     """
     Sets _user_requested_quit to True, calles set_quit and returns True.
@@ -837,6 +1345,7 @@ def test_Debugger_runscript():
     mock_socket = mock.MagicMock()
     db = mu.debugger.runner.Debugger(mock_socket, 'localhost', 9999)
     db.run = mock.MagicMock()
+    db.end_fast_continue = mock.MagicMock()
     db._runscript('x.py')
     assert db._run_state == mu.debugger.runner.DebugState.STARTING
     assert db.mainpyfile == db.canonic('x.py')
@@ -846,6 +1355,7 @@ def test_Debugger_runscript():
                                    '.read(), r"x.py", "exec");'
                                    'exec(__debug_code__);'
                                    '__debug_script__.close();')
+    db.end_fast_continue.assert_called_once_with()
 
 
 def test_run_with_user_requested_quit():
@@ -873,6 +1383,115 @@ def test_run_with_user_requested_quit():
     assert mock_sys.path[0] == os.path.dirname('foo.py')
 
 
+def test_run_with_listener():
+    """
+    If given a socket that's already listening, the debugger uses it rather
+    than creating a new one.
+    """
+    mock_debugger = mock.MagicMock()
+    mock_debugger._user_requested_quit = True
+    mock_debugger_class = mock.MagicMock(return_value=mock_debugger)
+    mock_sys = mock.MagicMock()
+    mock_sys.argv = [None, None]
+    mock_sys.path = [None]
+    mock_listener = mock.MagicMock()
+    with mock.patch('mu.debugger.runner.Debugger', mock_debugger_class), \
+            mock.patch('mu.debugger.runner.sys', mock_sys), \
+            mock.patch('mu.debugger.runner.listen') as mock_listen:
+        mu.debugger.runner.run('localhost', 1908, 'foo.py', 'bar',
+                               listener=mock_listener)
+    assert mock_listen.call_count == 0
+    mock_debugger_class.assert_called_once_with(mock_listener, 'localhost',
+                                                1908)
+    assert mock_sys.argv[1:] == ['bar', ]
+
+
+def test_run_reports_port():
+    """
+    A new debug runner listens on the referenced port (0 for a free one) and
+    reports the port it's listening on, as one started in advance does.
+    """
+    mock_debugger = mock.MagicMock()
+    mock_debugger._user_requested_quit = True
+    mock_debugger_class = mock.MagicMock(return_value=mock_debugger)
+    mock_sys = mock.MagicMock()
+    mock_sys.argv = [None, None]
+    mock_sys.path = [None]
+    mock_listener = mock.MagicMock()
+    mock_listener.getsockname.return_value = ('127.0.0.1', 4321)
+    with mock.patch('mu.debugger.runner.Debugger', mock_debugger_class), \
+            mock.patch('mu.debugger.runner.sys', mock_sys), \
+            mock.patch('mu.debugger.runner.listen',
+                       return_value=mock_listener) as mock_listen, \
+            mock.patch('builtins.print') as mock_print:
+        mu.debugger.runner.run('localhost', 0, 'foo.py')
+    mock_listen.assert_called_once_with('localhost', 0)
+    mock_print.assert_called_once_with('MU-READY', 4321, flush=True)
+    mock_debugger_class.assert_called_once_with(mock_listener, 'localhost',
+                                                4321)
+
+
+def test_listen():
+    """
+    The socket the client debugger connects to is bound and listening.
+    """
+    with mock.patch('mu.debugger.runner.socket') as mock_socket:
+        result = mu.debugger.runner.listen('localhost', 1908)
+    s = mock_socket.socket.return_value
+    assert result == s
+    mock_socket.socket.assert_called_once_with(mock_socket.AF_INET,
+                                               mock_socket.SOCK_STREAM)
+    s.bind.assert_called_once_with(('localhost', 1908))
+    s.listen.assert_called_once_with(1)
+
+
+def test_serve():
+    """
+    A runner started in advance listens on a free port, which it reports in
+    its ready line, then debugs the script it's sent in the referenced working
+    directory.
+    """
+    mock_listener = mock.MagicMock()
+    mock_listener.getsockname.return_value = ('127.0.0.1', 4321)
+    mock_sys = mock.MagicMock()
+    script = {'filename': '/foo/bar.py', 'args': ['baz', ], 'cwd': '/foo'}
+    mock_sys.stdin.readline.return_value = json.dumps(script) + '\n'
+    with mock.patch('mu.debugger.runner.listen',
+                    return_value=mock_listener) as mock_listen, \
+            mock.patch('mu.debugger.runner.sys', mock_sys), \
+            mock.patch('mu.debugger.runner.os.chdir') as mock_chdir, \
+            mock.patch('mu.debugger.runner.os.dup2') as mock_dup2, \
+            mock.patch('mu.debugger.runner.run') as mock_run, \
+            mock.patch('builtins.print') as mock_print:
+        mu.debugger.runner.serve('localhost')
+    mock_listen.assert_called_once_with('localhost', 0)
+    mock_print.assert_called_once_with('MU-READY', 4321, flush=True)
+    mock_chdir.assert_called_once_with('/foo')
+    # The script's stderr goes to stdout, where Mu reads its output.
+    mock_dup2.assert_called_once_with(mock_sys.stdout.fileno(),
+                                      mock_sys.stderr.fileno())
+    mock_run.assert_called_once_with('localhost', 4321, '/foo/bar.py', 'baz',
+                                     listener=mock_listener)
+
+
+def test_serve_not_needed():
+    """
+    If Mu goes away before sending a script to debug, the runner just ends.
+    """
+    mock_listener = mock.MagicMock()
+    mock_listener.getsockname.return_value = ('127.0.0.1', 4321)
+    mock_sys = mock.MagicMock()
+    mock_sys.stdin.readline.return_value = ''
+    with mock.patch('mu.debugger.runner.listen',
+                    return_value=mock_listener), \
+            mock.patch('mu.debugger.runner.sys', mock_sys), \
+            mock.patch('mu.debugger.runner.run') as mock_run, \
+            mock.patch('builtins.print'):
+        mu.debugger.runner.serve('localhost')
+    mock_listener.close.assert_called_once_with()
+    assert mock_run.call_count == 0
+
+
 def test_run_with_restart_exception():
     """
     Ensure the logger is called.
@@ -2,7 +2,10 @@
 """
 Tests for the debug utils.
 """
-from mu.debugger.utils import is_breakpoint_line
+import json
+from unittest import mock
+from mu.debugger.utils import (is_breakpoint_line, encode_message,
+                               decode_messages, diff_namespace, apply_delta)
 
 
 def test_is_breakpoint_line_valid_code():
@@ -71,3 +74,73 @@ def test_is_breakpoint_line_closing_collection():
     assert is_breakpoint_line(']') is False
     assert is_breakpoint_line('}') is False
     assert is_breakpoint_line(')') is False
+
+
+def test_encode_message():
+    """
+    Messages are compact JSON prefixed by their length in bytes.
+    """
+    result = encode_message('line', {'filename': 'foo.py', 'line': 1})
+    payload = b'["line",{"filename":"foo.py","line":1}]'
+    assert result == len(payload).to_bytes(4, 'big') + payload
+
+
+def test_decode_messages():
+    """
+    Complete messages are removed from the buffer and decoded, leaving any
+    incomplete message behind until the rest of it arrives.
+    """
+    last = encode_message('stack', {'stack': ['\u2603']})
+    buffer = bytearray(encode_message('line', {'line': 1}) +
+                       encode_message('restart', {}) + last[:6])
+    assert decode_messages(buffer) == [['line', {'line': 1}],
+                                       ['restart', {}]]
+    assert buffer == last[:6]
+    buffer += last[6:]
+    assert decode_messages(buffer) == [['stack', {'stack': ['\u2603']}]]
+    assert buffer == b''
+
+
+def test_decode_messages_json_str():
+    """
+    Messages in a bytearray are decoded to str before being parsed as JSON,
+    since Python 3.5's json.loads doesn't accept bytes or bytearray.
+    """
+    buffer = bytearray(encode_message('line', {'line': '\u2603'}))
+    real_loads = json.loads
+
+    def loads(payload):
+        assert isinstance(payload, str)
+        return real_loads(payload)
+
+    with mock.patch('mu.debugger.utils.json.loads', loads):
+        assert decode_messages(buffer) == [['line', {'line': '\u2603'}]]
+
+
+def test_decode_messages_incomplete_header():
+    """
+    A buffer too short to hold a length prefix is left untouched.
+    """
+    buffer = bytearray(b'\x00\x00')
+    assert decode_messages(buffer) == []
+    assert buffer == b'\x00\x00'
+
+
+def test_diff_namespace():
+    """
+    Changed, added and removed names are all captured by the delta, which
+    turns the old namespace into the new one.
+    """
+    old = {'a': '1', 'b': '2', 'c': '3'}
+    new = {'a': '1', 'b': '20', 'd': '4'}
+    delta = diff_namespace(old, new)
+    assert delta == {'changed': {'b': '20', 'd': '4'}, 'removed': ['c']}
+    apply_delta(old, delta)
+    assert old == new
+
+
+def test_diff_namespace_unchanged():
+    """
+    If nothing changed, there's no delta.
+    """
+    assert diff_namespace({'a': '1'}, {'a': '1'}) is None
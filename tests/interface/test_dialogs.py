@@ -211,6 +211,7 @@ def test_PackageDialog_setup():
     pd.run_pip.assert_called_once_with()
     assert pd.button_box.button(QDialogButtonBox.Ok).isEnabled() is False
     assert pd.pkg_dirs == {}
+    assert pd.index is None
 
 
 def test_PackageDialog_remove_packages():
@@ -221,125 +222,144 @@ def test_PackageDialog_remove_packages():
     pd = mu.interface.dialogs.PackageDialog()
     pd.to_remove = {'foo', 'bar-baz', 'Quux'}
     pd.module_dir = 'wibble'
+    pd.index = None
     dirs = ['foo-1.0.0.dist-info', 'foo', 'bar_baz-1.0.0.dist-info', 'bar_baz',
-            'quux-1.0.0.dist-info', 'quux', ]
-    with mock.patch('mu.interface.dialogs.os.listdir', return_value=dirs), \
+            'quux-1.0.0.dist-info', 'quux', 'foobar-2.0.egg-info', ]
+    with mock.patch('mu.interface.dialogs.os.listdir',
+                    return_value=dirs) as mock_listdir, \
             mock.patch('mu.interface.dialogs.QTimer') as mock_qtimer:
         pd.remove_packages()
+        mock_listdir.assert_called_once_with('wibble')
         assert pd.pkg_dirs == {
             'foo': os.path.join('wibble', 'foo-1.0.0.dist-info'),
             'bar-baz': os.path.join('wibble', 'bar_baz-1.0.0.dist-info'),
             'Quux': os.path.join('wibble', 'quux-1.0.0.dist-info'),
         }
+        assert pd.pkg_files == {}
         mock_qtimer.singleShot.assert_called_once_with(2, pd.remove_package)
 
 
-def test_PackageDialog_remove_package_dist_info():
+def test_PackageDialog_remove_packages_index():
     """
-    Ensures that if there are packages remaining to be deleted, then the next
-    one is deleted as expected.
+    If there's an index of installed packages, the packages to remove and
+    their files are found in it without looking in the module directory.
     """
     pd = mu.interface.dialogs.PackageDialog()
-    pd.append_data = mock.MagicMock()
-    pd.pkg_dirs = {'foo': os.path.join('bar', 'foo-1.0.0.dist-info')}
-    pd.module_dir = 'baz'
-    files = [
-        ['filename1', '', ],
-        ['filename2', '', ],
-        ['filename3', '', ],
-    ]
-    mock_remove = mock.MagicMock()
-    mock_shutil = mock.MagicMock()
-    mock_qtimer = mock.MagicMock()
-    with mock.patch('builtins.open'), \
-            mock.patch('mu.interface.dialogs.csv.reader',
-                       return_value=files), \
-            mock.patch('mu.interface.dialogs.os.remove', mock_remove), \
-            mock.patch('mu.interface.dialogs.shutil', mock_shutil), \
-            mock.patch('mu.interface.dialogs.QTimer', mock_qtimer):
-        pd.remove_package()
-        assert pd.pkg_dirs == {}
-        assert mock_remove.call_count == 3
-        assert mock_shutil.rmtree.call_count == 3
-        pd.append_data.assert_called_once_with('Removed foo\n')
+    pd.to_remove = {'Foo', 'bar'}
+    pd.module_dir = 'wibble'
+    pd.index = {
+        'foo': {'name': 'Foo', 'version': '1.0', 'info': 'Foo-1.0.dist-info',
+                'files': ['foo.py']},
+        'bar': {'name': 'bar', 'version': '2.0', 'info': 'bar-2.0.egg-info',
+                'files': None},
+    }
+    with mock.patch('mu.interface.dialogs.os.listdir') as mock_listdir, \
+            mock.patch('mu.interface.dialogs.QTimer') as mock_qtimer:
+        pd.remove_packages()
+        assert mock_listdir.call_count == 0
+        assert pd.pkg_dirs == {
+            'Foo': os.path.join('wibble', 'Foo-1.0.dist-info'),
+            'bar': os.path.join('wibble', 'bar-2.0.egg-info'),
+        }
+        assert pd.pkg_files == {'Foo': ['foo.py']}
         mock_qtimer.singleShot.assert_called_once_with(2, pd.remove_package)
 
 
-def test_PackageDialog_remove_package_dist_info_cannot_delete():
+def test_PackageDialog_remove_packages_not_installed():
+    """
+    Packages without metadata in the module directory aren't scheduled for
+    removal.
+    """
+    pd = mu.interface.dialogs.PackageDialog()
+    pd.to_remove = {'foo'}
+    pd.module_dir = 'wibble'
+    pd.index = None
+    dirs = ['foo_bar-1.0.0.dist-info', 'foo_bar', ]
+    with mock.patch('mu.interface.dialogs.os.listdir', return_value=dirs), \
+            mock.patch('mu.interface.dialogs.QTimer') as mock_qtimer:
+        pd.remove_packages()
+        assert pd.pkg_dirs == {}
+        assert mock_qtimer.singleShot.call_count == 0
+
+
+def test_PackageDialog_remove_package():
     """
     Ensures that if there are packages remaining to be deleted, then the next
-    one is deleted and any failures are logged.
+    one is deleted as expected, using the files recorded for it.
     """
     pd = mu.interface.dialogs.PackageDialog()
     pd.append_data = mock.MagicMock()
-    pd.pkg_dirs = {'foo': os.path.join('bar', 'foo-1.0.0.dist-info')}
+    pd.pkg_dirs = {'foo': os.path.join('baz', 'foo-1.0.0.dist-info')}
     pd.module_dir = 'baz'
-    files = [
-        ['filename1', '', ],
-        ['filename2', '', ],
-        ['filename3', '', ],
-    ]
-    mock_remove = mock.MagicMock(side_effect=Exception('Bang'))
+    pd.pkg_files = {}
+    pd.emptied_dirs = set()
+    files = ['filename1', os.path.join('foo', 'filename2'), 'filename3', ]
+    mock_files = mock.MagicMock(return_value=files)
+    mock_remove = mock.MagicMock()
     mock_shutil = mock.MagicMock()
     mock_qtimer = mock.MagicMock()
-    mock_log = mock.MagicMock()
-    with mock.patch('builtins.open'), \
-            mock.patch('mu.interface.dialogs.csv.reader',
-                       return_value=files), \
+    with mock.patch('mu.interface.dialogs.package_files', mock_files), \
             mock.patch('mu.interface.dialogs.os.remove', mock_remove), \
-            mock.patch('mu.interface.dialogs.logger.error', mock_log), \
             mock.patch('mu.interface.dialogs.shutil', mock_shutil), \
             mock.patch('mu.interface.dialogs.QTimer', mock_qtimer):
         pd.remove_package()
         assert pd.pkg_dirs == {}
+        mock_files.assert_called_once_with('baz', 'foo-1.0.0.dist-info')
         assert mock_remove.call_count == 3
-        assert mock_log.call_count == 6
+        assert pd.emptied_dirs == {'baz', os.path.join('baz', 'foo')}
         assert mock_shutil.rmtree.call_count == 3
         pd.append_data.assert_called_once_with('Removed foo\n')
         mock_qtimer.singleShot.assert_called_once_with(2, pd.remove_package)
 
 
-def test_PackageDialog_remove_package_egg_info():
+def test_PackageDialog_remove_package_indexed_files():
     """
-    Ensures that if there are packages remaining to be deleted, then the next
-    one is deleted as expected.
+    If the package's files are known from the index, they're deleted without
+    reading the package's record.
     """
     pd = mu.interface.dialogs.PackageDialog()
     pd.append_data = mock.MagicMock()
-    pd.pkg_dirs = {'foo': os.path.join('bar', 'foo-1.0.0.egg-info')}
+    pd.pkg_dirs = {'foo': os.path.join('baz', 'foo-1.0.0.egg-info')}
     pd.module_dir = 'baz'
-    files = ''.join(["filename1\n", "filename2\n", "filename3\n", ])
+    pd.pkg_files = {'foo': ['filename1', 'filename2']}
+    pd.emptied_dirs = set()
+    mock_files = mock.MagicMock()
     mock_remove = mock.MagicMock()
     mock_shutil = mock.MagicMock()
     mock_qtimer = mock.MagicMock()
-    with mock.patch('builtins.open', mock.mock_open(read_data=files)), \
+    with mock.patch('mu.interface.dialogs.package_files', mock_files), \
             mock.patch('mu.interface.dialogs.os.remove', mock_remove), \
             mock.patch('mu.interface.dialogs.shutil', mock_shutil), \
             mock.patch('mu.interface.dialogs.QTimer', mock_qtimer):
         pd.remove_package()
         assert pd.pkg_dirs == {}
-        assert mock_remove.call_count == 3
+        assert pd.pkg_files == {}
+        assert mock_files.call_count == 0
+        assert mock_remove.call_args_list == [
+            mock.call(os.path.join('baz', 'filename1')),
+            mock.call(os.path.join('baz', 'filename2')),
+        ]
         assert mock_shutil.rmtree.call_count == 3
         pd.append_data.assert_called_once_with('Removed foo\n')
         mock_qtimer.singleShot.assert_called_once_with(2, pd.remove_package)
 
 
-def test_PackageDialog_remove_package_egg_info_cannot_delete():
+def test_PackageDialog_remove_package_cannot_delete():
     """
     Ensures that if there are packages remaining to be deleted, then the next
     one is deleted and any failures are logged.
     """
     pd = mu.interface.dialogs.PackageDialog()
     pd.append_data = mock.MagicMock()
-    pd.pkg_dirs = {'foo': os.path.join('bar', 'foo-1.0.0.egg-info')}
+    pd.pkg_dirs = {'foo': os.path.join('baz', 'foo-1.0.0.dist-info')}
     pd.module_dir = 'baz'
-    files = ''.join(["filename1\n", "filename2\n", "filename3\n", ])
+    pd.pkg_files = {'foo': ['filename1', 'filename2', 'filename3']}
+    pd.emptied_dirs = set()
     mock_remove = mock.MagicMock(side_effect=Exception('Bang'))
     mock_shutil = mock.MagicMock()
     mock_qtimer = mock.MagicMock()
     mock_log = mock.MagicMock()
-    with mock.patch('builtins.open', mock.mock_open(read_data=files)), \
-            mock.patch('mu.interface.dialogs.os.remove', mock_remove), \
+    with mock.patch('mu.interface.dialogs.os.remove', mock_remove), \
             mock.patch('mu.interface.dialogs.logger.error', mock_log), \
             mock.patch('mu.interface.dialogs.shutil', mock_shutil), \
             mock.patch('mu.interface.dialogs.QTimer', mock_qtimer):
@@ -352,18 +372,19 @@ def test_PackageDialog_remove_package_egg_info_cannot_delete():
         mock_qtimer.singleShot.assert_called_once_with(2, pd.remove_package)
 
 
-def test_PackageDialog_remove_package_egg_info_cannot_open_record():
+def test_PackageDialog_remove_package_cannot_read_record():
     """
-    If the installed-files.txt file is not available (sometimes the case), then
-    simply raise an exception and communicate this to the user.
+    If the package's record of installed files is not available (sometimes the
+    case for eggs), then communicate this to the user.
     """
     pd = mu.interface.dialogs.PackageDialog()
     pd.append_data = mock.MagicMock()
-    pd.pkg_dirs = {'foo': os.path.join('bar', 'foo-1.0.0.egg-info')}
+    pd.pkg_dirs = {'foo': os.path.join('baz', 'foo-1.0.0.egg-info')}
     pd.module_dir = 'baz'
+    pd.pkg_files = {}
     mock_qtimer = mock.MagicMock()
     mock_log = mock.MagicMock()
-    with mock.patch('builtins.open',
+    with mock.patch('mu.interface.dialogs.package_files',
                     mock.MagicMock(side_effect=Exception("boom"))), \
             mock.patch('mu.interface.dialogs.logger.error', mock_log), \
             mock.patch('mu.interface.dialogs.QTimer', mock_qtimer):
@@ -379,29 +400,52 @@ def test_PackageDialog_remove_package_egg_info_cannot_open_record():
 def test_PackageDialog_remove_package_end_state():
     """
     If there are no more packages to remove and there's nothing to be done for
-    adding packages, then ensure all directories that do not contain files are
-    deleted and the expected end-state is called.
+    adding packages, then ensure directories left empty are deleted and the
+    expected end-state is called.
     """
     pd = mu.interface.dialogs.PackageDialog()
     pd.module_dir = 'foo'
     pd.pkg_dirs = {}
     pd.to_add = {}
     pd.process = None
+    pd.remove_empty_dirs = mock.MagicMock()
     pd.end_state = mock.MagicMock()
-    with mock.patch('mu.interface.dialogs.os.listdir',
-                    return_value=['bar', 'baz']), \
-            mock.patch('mu.interface.dialogs.os.walk',
-                       side_effect=[[('bar', [], [])],
-                                    [('baz', [], ['x'])]]), \
-            mock.patch('mu.interface.dialogs.shutil') as mock_shutil:
+    with mock.patch('mu.interface.dialogs.shutil') as mock_shutil:
         pd.remove_package()
-        assert mock_shutil.rmtree.call_count == 2
-        call_args = mock_shutil.rmtree.call_args_list
-        assert call_args[0][0][0] == os.path.join('foo', 'bar')
-        assert call_args[1][0][0] == os.path.join('foo', 'bin')
+        pd.remove_empty_dirs.assert_called_once_with()
+        mock_shutil.rmtree.assert_called_once_with(os.path.join('foo', 'bin'),
+                                                   ignore_errors=True)
     pd.end_state.assert_called_once_with()
 
 
+def test_PackageDialog_remove_empty_dirs(tmp_path):
+    """
+    Directories files were removed from are deleted, along with their parents,
+    when empty. Directories that still contain something, and any outside the
+    module directory, are left alone.
+    """
+    module_dir = tmp_path / 'site-packages'
+    (module_dir / 'foo' / 'bar').mkdir(parents=True)
+    (module_dir / 'baz').mkdir()
+    (module_dir / 'baz' / 'keep.py').write_text('')
+    (module_dir / 'qux').mkdir()
+    (module_dir / 'untouched').mkdir()
+    pd = mu.interface.dialogs.PackageDialog()
+    pd.module_dir = str(module_dir)
+    pd.emptied_dirs = {
+        str(module_dir / 'foo' / 'bar'),
+        str(module_dir / 'baz'),
+        str(module_dir / 'qux'),
+        str(module_dir / 'missing'),
+        str(module_dir),
+        str(tmp_path),
+    }
+    pd.remove_empty_dirs()
+    assert sorted(os.listdir(str(module_dir))) == ['baz', 'untouched']
+    assert os.path.isdir(str(tmp_path))
+    assert pd.emptied_dirs == set()
+
+
 def test_PackageDialog_end_state():
     """
     Ensure the expected end-state is correctly cofigured (for when all tasks
@@ -417,13 +461,14 @@ def test_PackageDialog_end_state():
 
 def test_PackageDialog_run_pip():
     """
-    Ensure the expected package to be installed is done so via the expected
+    Ensure the expected packages to be installed are done so via the expected
     correct call to "pip" in a new process (as per the recommended way to
     us "pip").
     """
     pd = mu.interface.dialogs.PackageDialog()
-    pd.to_add = {'foo'}
+    pd.to_add = {'foo', 'baz'}
     pd.module_dir = 'bar'
+    pd.wheel_dir = None
     mock_process = mock.MagicMock()
     with mock.patch('mu.interface.dialogs.QProcess', mock_process):
         pd.run_pip()
@@ -434,40 +479,185 @@ def test_PackageDialog_run_pip():
             '-m',  # run the module
             'pip',  # called pip
             'install',  # to install
-            'foo',  # a package called "foo"
+            'baz',  # a package called "baz"
+            'foo',  # and a package called "foo"
             '--target',  # and the target directory for package assets is...
             'bar',  # ...this directory
         ]
         pd.process.start.assert_called_once_with(sys.executable, args)
 
 
-def test_PackageDialog_finished_with_more_to_remove():
+def test_PackageDialog_run_pip_package():
     """
-    When the pip process is finished, check if there are more packages to
-    install and run again.
+    A package to be retried on its own is installed by itself, leaving any
+    other packages to be added alone.
     """
     pd = mu.interface.dialogs.PackageDialog()
     pd.to_add = {'foo'}
-    pd.run_pip = mock.MagicMock()
+    pd.module_dir = 'bar'
+    pd.wheel_dir = None
+    mock_process = mock.MagicMock()
+    with mock.patch('mu.interface.dialogs.QProcess', mock_process):
+        pd.run_pip(['baz'])
+        assert pd.to_add == {'foo'}
+        assert pd.pip_packages == ['baz']
+        args = ['-m', 'pip', 'install', 'baz', '--target', 'bar']
+        pd.process.start.assert_called_once_with(sys.executable, args)
+
+
+def test_PackageDialog_run_pip_wheel_dir():
+    """
+    If the wheel directory exists, pip is told to only look for packages
+    there, so it doesn't try to reach PyPI.
+    """
+    pd = mu.interface.dialogs.PackageDialog()
+    pd.to_add = {'foo'}
+    pd.module_dir = 'bar'
+    pd.wheel_dir = 'wheels'
+    mock_process = mock.MagicMock()
+    with mock.patch('mu.interface.dialogs.QProcess', mock_process), \
+            mock.patch('mu.interface.dialogs.os.path.isdir',
+                       return_value=True):
+        pd.run_pip()
+        args = ['-m', 'pip', 'install', 'foo', '--target', 'bar',
+                '--no-index', '--find-links', 'wheels']
+        pd.process.start.assert_called_once_with(sys.executable, args)
+
+
+def test_PackageDialog_run_pip_no_wheel_dir():
+    """
+    If the wheel directory doesn't exist, pip only looks on PyPI.
+    """
+    pd = mu.interface.dialogs.PackageDialog()
+    pd.to_add = {'foo'}
+    pd.module_dir = 'bar'
+    pd.wheel_dir = 'wheels'
+    mock_process = mock.MagicMock()
+    with mock.patch('mu.interface.dialogs.QProcess', mock_process), \
+            mock.patch('mu.interface.dialogs.os.path.isdir',
+                       return_value=False):
+        pd.run_pip()
+        args = ['-m', 'pip', 'install', 'foo', '--target', 'bar']
+        pd.process.start.assert_called_once_with(sys.executable, args)
+
+
+def test_PackageDialog_finished_with_more_to_remove():
+    """
+    When the pip process is finished, if packages are still being removed, wait
+    for them before moving to the end state.
+    """
+    pd = mu.interface.dialogs.PackageDialog()
+    pd.to_add = set()
+    pd.pkg_dirs = {'foo': 'foo-1.0.0.dist-info'}
+    pd.pip_packages = ['bar']
+    pd.pip_queue = []
+    pd.pip_results = []
     pd.process = mock.MagicMock()
+    pd.process.readAll.return_value = b''
+    pd.append_data = mock.MagicMock()
+    pd.end_state = mock.MagicMock()
     pd.finished()
     assert pd.process is None
-    pd.run_pip.assert_called_once_with()
+    assert pd.end_state.call_count == 0
 
 
 def test_PackageDialog_finished_to_end_state():
     """
-    When the pip process is finished, if there are no more packages to install
-    and there's no more activity for removing packages, move to the end state.
+    When the pip process is finished, if there's no more activity for removing
+    packages, move to the end state.
     """
     pd = mu.interface.dialogs.PackageDialog()
     pd.to_add = set()
     pd.pkg_dirs = {}
+    pd.pip_packages = ['bar']
+    pd.pip_queue = []
+    pd.pip_results = []
+    pd.process = mock.MagicMock()
+    pd.process.readAll.return_value = b''
+    pd.append_data = mock.MagicMock()
     pd.end_state = mock.MagicMock()
     pd.finished()
+    assert pd.process is None
+    pd.append_data.assert_called_with('Installed bar\n')
     pd.end_state.assert_called_once_with()
 
 
+def test_PackageDialog_finished_pip_failed():
+    """
+    If pip fails to install a package on its own, the rest of its output is
+    shown followed by a message saying the package wasn't installed.
+    """
+    pd = mu.interface.dialogs.PackageDialog()
+    pd.pkg_dirs = {}
+    pd.pip_packages = ['foo']
+    pd.pip_queue = []
+    pd.pip_results = []
+    pd.process = mock.MagicMock()
+    pd.process.readAll.return_value.data.return_value = b'No matching dist'
+    pd.append_data = mock.MagicMock()
+    pd.end_state = mock.MagicMock()
+    pd.finished(1, mu.interface.dialogs.QProcess.NormalExit)
+    assert pd.append_data.call_args_list[0] == mock.call('No matching dist')
+    msg = pd.append_data.call_args_list[-1][0][0]
+    assert 'UNABLE TO INSTALL PACKAGE: foo' in msg
+    assert pd.pip_results == []
+    pd.end_state.assert_called_once_with()
+
+
+def test_PackageDialog_finished_batch_failed():
+    """
+    If pip fails to install several packages together, none of them were
+    installed, so they're retried one at a time.
+    """
+    pd = mu.interface.dialogs.PackageDialog()
+    pd.pkg_dirs = {}
+    pd.pip_packages = ['bar', 'foo']
+    pd.pip_queue = []
+    pd.pip_results = []
+    pd.process = mock.MagicMock()
+    pd.process.readAll.return_value = b''
+    pd.append_data = mock.MagicMock()
+    pd.end_state = mock.MagicMock()
+    pd.run_pip = mock.MagicMock()
+    pd.finished(1, mu.interface.dialogs.QProcess.NormalExit)
+    pd.run_pip.assert_called_once_with(['bar'])
+    assert pd.pip_queue == ['foo']
+    assert pd.pip_results == []
+    assert pd.end_state.call_count == 0
+
+
+def test_PackageDialog_finished_retries_reported():
+    """
+    Once every package has been retried on its own, the result for each one
+    is reported.
+    """
+    pd = mu.interface.dialogs.PackageDialog()
+    pd.pkg_dirs = {}
+    pd.pip_packages = ['foo']
+    pd.pip_queue = []
+    pd.pip_results = [('bar', False)]
+    pd.process = mock.MagicMock()
+    pd.process.readAll.return_value = b''
+    pd.append_data = mock.MagicMock()
+    pd.end_state = mock.MagicMock()
+    pd.finished(0, mu.interface.dialogs.QProcess.NormalExit)
+    messages = [call[0][0] for call in pd.append_data.call_args_list]
+    assert 'UNABLE TO INSTALL PACKAGE: bar' in messages[-2]
+    assert messages[-1] == 'Installed foo\n'
+    pd.end_state.assert_called_once_with()
+
+
+def test_PackageDialog_read_process_finished():
+    """
+    Once the pip process has finished, there's nothing left to read.
+    """
+    pd = mu.interface.dialogs.PackageDialog()
+    pd.process = None
+    pd.append_data = mock.MagicMock()
+    pd.read_process()
+    assert pd.append_data.call_count == 0
+
+
 def test_PackageDialog_read_process():
     """
     Ensure any data from the subprocess running "pip" is read and appended to
@@ -495,3 +685,40 @@ def test_PackageDialog_append_data():
     assert c.movePosition.call_count == 2
     c.insertText.assert_called_once_with('hello')
     pd.text_area.setTextCursor.assert_called_once_with(c)
+
+
+def test_FlashDevicesDialog_setup():
+    """
+    Ensure the dialog lists each of the devices, waiting to be flashed.
+    """
+    fd = mu.interface.dialogs.FlashDevicesDialog()
+    fd.setup(['/media/MICROBIT', 'COM1'])
+    assert fd.device_list.count() == 2
+    assert fd.items['/media/MICROBIT'].text() == '/media/MICROBIT: Waiting'
+    assert fd.items['COM1'].text() == 'COM1: Waiting'
+    assert fd.button_box.button(QDialogButtonBox.Ok).isEnabled() is False
+
+
+def test_FlashDevicesDialog_on_progress_and_fail():
+    """
+    Ensure the status of each device is updated and failures remembered.
+    """
+    fd = mu.interface.dialogs.FlashDevicesDialog()
+    fd.setup(['foo', 'bar'])
+    fd.on_progress('foo', 'Finished')
+    fd.on_fail('bar', 'Boom')
+    assert fd.items['foo'].text() == 'foo: Finished'
+    assert fd.items['bar'].text() == 'bar: Failed (Boom)'
+    assert fd.failed == {'bar'}
+
+
+def test_FlashDevicesDialog_on_finished():
+    """
+    Ensure the outcome is summarised and the dialog can be dismissed.
+    """
+    fd = mu.interface.dialogs.FlashDevicesDialog()
+    fd.setup(['foo', 'bar', 'baz'])
+    fd.on_fail('bar', 'Boom')
+    fd.on_finished()
+    assert fd.summary.text() == 'Flashed 2 of 3 devices.'
+    assert fd.button_box.button(QDialogButtonBox.Ok).isEnabled() is True
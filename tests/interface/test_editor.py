@@ -49,6 +49,25 @@ def test_EditorPane_init():
         assert editor.newline == '\r\n'
 
 
+def test_EditorPane_count_changes():
+    """
+    The characters inserted and deleted since the tab was last journaled are
+    counted, but not the text the tab started with.
+    """
+    editor = mu.interface.editor.EditorPane('/foo/bar.py', 'baz')
+    assert editor.unjournaled == 0
+    assert editor.journal_id is None
+    editor.insertAt('hello', 0, 0)
+    assert editor.unjournaled == 5
+    editor.setSelection(0, 0, 0, 2)
+    editor.removeSelectedText()
+    assert editor.unjournaled == 7
+    # Other modifications (e.g. markers) aren't counted.
+    editor.count_changes(0, editor.SC_MOD_CHANGEMARKER, None, 0, 0, 0, 0, 0,
+                         0, 0)
+    assert editor.unjournaled == 7
+
+
 def test_EditorPane_configure():
     """
     Check the expected configuration takes place. NOTE - this is checking the
@@ -201,6 +201,7 @@ def test_FileTabs_removeTab_ok():
         rt.assert_called_once_with(tab_id)
         qtw.widget.assert_called_once_with(tab_id)
         assert mock_tab.isModified.call_count == 1
+        mock_window.dirty_tabs.discard.assert_called_once_with(mock_tab)
 
 
 def test_FileTabs_change_tab():
@@ -484,8 +485,11 @@ def test_Window_add_tab():
     ep.setFocus.assert_called_once_with()
     ep.setReadOnly.assert_called_once_with(w.read_only_tabs)
     on_modified = ep.modificationChanged.connect.call_args[0][0]
-    on_modified()
+    on_modified(True)
     w.tabs.setTabText.assert_called_once_with(new_tab_index, ep.label)
+    assert w.dirty_tabs == {ep}
+    on_modified(False)
+    assert w.dirty_tabs == set()
 
 
 def test_Window_focus_tab():
@@ -529,20 +533,12 @@ def test_Window_widgets():
 
 def test_Window_modified():
     """
-    Ensure the window's modified attribute is derived from the modified state
-    of its tabs.
+    Ensure the window's modified attribute is derived from the tabs with
+    unsaved changes.
     """
     w = mu.interface.main.Window()
-    w.tabs = mock.MagicMock()
-    w.tabs.count = mock.MagicMock(return_value=2)
-    widget1 = mock.MagicMock()
-    widget1.isModified = mock.MagicMock(return_value=False)
-    widget2 = mock.MagicMock()
-    widget2.isModified = mock.MagicMock(return_value=False)
-    w.tabs.widget = mock.MagicMock(side_effect=[widget1, widget2])
     assert w.modified is False
-    widget2.isModified = mock.MagicMock(return_value=True)
-    w.tabs.widget = mock.MagicMock(side_effect=[widget1, widget2])
+    w.dirty_tabs.add(mock.MagicMock())
     assert w.modified
 
 
@@ -664,13 +660,20 @@ def test_Window_add_filesystem():
     mock_file_manager.on_list_files.connect.\
         assert_called_once_with(mock_fs.on_ls)
     mock_fs.list_files.connect.assert_called_once_with(mock_file_manager.ls)
+    mock_fs.sync_files.connect.assert_called_once_with(mock_file_manager.sync)
     mock_fs.microbit_fs.put.connect.\
         assert_called_once_with(mock_file_manager.put)
+    mock_fs.microbit_fs.put_files.connect.\
+        assert_called_once_with(mock_file_manager.put_files)
     mock_fs.microbit_fs.delete.connect.\
         assert_called_once_with(mock_file_manager.delete)
     mock_fs.microbit_fs.list_files.connect.\
         assert_called_once_with(mock_file_manager.ls)
     mock_fs.local_fs.get.connect.assert_called_once_with(mock_file_manager.get)
+    mock_fs.local_fs.get_files.connect.\
+        assert_called_once_with(mock_file_manager.get_files)
+    mock_fs.cancel_transfer.connect.\
+        assert_called_once_with(mock_file_manager.cancel, Qt.DirectConnection)
     mock_fs.local_fs.list_files.connect.\
         assert_called_once_with(mock_file_manager.ls)
     mock_file_manager.on_put_file.connect.\
@@ -679,6 +682,14 @@ def test_Window_add_filesystem():
         assert_called_once_with(mock_fs.microbit_fs.on_delete)
     mock_file_manager.on_get_file.connect.\
         assert_called_once_with(mock_fs.local_fs.on_get)
+    mock_file_manager.on_put_files.connect.\
+        assert_called_once_with(mock_fs.microbit_fs.on_put_files)
+    mock_file_manager.on_get_files.connect.\
+        assert_called_once_with(mock_fs.local_fs.on_get_files)
+    mock_file_manager.on_sync_files.connect.\
+        assert_called_once_with(mock_fs.microbit_fs.on_sync_files)
+    mock_file_manager.on_transfer_progress.connect.\
+        assert_called_once_with(mock_fs.on_transfer_progress)
     mock_file_manager.on_list_fail.connect.\
         assert_called_once_with(mock_fs.on_ls_fail)
     mock_file_manager.on_put_fail.connect.\
@@ -687,6 +698,10 @@ def test_Window_add_filesystem():
         assert_called_once_with(mock_fs.on_delete_fail)
     mock_file_manager.on_get_fail.connect.\
         assert_called_once_with(mock_fs.on_get_fail)
+    mock_file_manager.on_put_files_fail.connect.\
+        assert_called_once_with(mock_fs.on_put_files_fail)
+    mock_file_manager.on_get_files_fail.connect.\
+        assert_called_once_with(mock_fs.on_get_files_fail)
     w.connect_zoom.assert_called_once_with(mock_fs)
 
 
@@ -820,6 +835,23 @@ def test_Window_add_jupyter_repl():
     w.add_repl.assert_called_once_with(mock_pane, 'Python3 (Jupyter)')
 
 
+def test_Window_add_jupyter_repl_channels():
+    """
+    The kernel client's channels are only started if they aren't already
+    running, from when the REPL was last shown.
+    """
+    w = mu.interface.main.Window()
+    w.add_repl = mock.MagicMock()
+    mock_kernel_client = mock.MagicMock()
+    mock_kernel_client.channels_running = False
+    with mock.patch('mu.interface.main.JupyterREPLPane'):
+        w.add_jupyter_repl(mock.MagicMock(), mock_kernel_client)
+        mock_kernel_client.start_channels.assert_called_once_with()
+        mock_kernel_client.channels_running = True
+        w.add_jupyter_repl(mock.MagicMock(), mock_kernel_client)
+    assert mock_kernel_client.start_channels.call_count == 1
+
+
 def test_Window_add_repl():
     """
     Ensure the expected settings are updated.
@@ -901,13 +933,17 @@ def test_Window_add_debug_inspector():
     mock_dock_class = mock.MagicMock(return_value=mock_dock)
     with mock.patch('mu.interface.main.DebugInspector',
                     mock_debug_inspector_class), \
-            mock.patch('mu.interface.main.QStandardItemModel',
+            mock.patch('mu.interface.main.DebugInspectorModel',
                        mock_model_class), \
             mock.patch('mu.interface.main.QDockWidget', mock_dock_class):
         w.add_debug_inspector()
     assert w.debug_inspector == mock_debug_inspector
     assert w.debug_model == mock_model
     mock_debug_inspector.setModel.assert_called_once_with(mock_model)
+    mock_debug_inspector.clicked.connect.assert_called_once_with(
+        mock_model.load_more)
+    mock_debug_inspector.doubleClicked.connect.assert_called_once_with(
+        mock_model.fetch_value)
     mock_dock.setWidget.assert_called_once_with(mock_debug_inspector)
     w.addDockWidget.assert_called_once_with(Qt.RightDockWidgetArea, mock_dock)
 
@@ -919,45 +955,50 @@ def test_Window_update_debug_inspector():
     to show the different types of value.
     """
     locals_dict = {
-        '__builtins__': ['some', 'builtin', 'methods', ],
-        '__debug_code__': '<debug code details>',
-        '__debug_script__': '<debug script details',
-        '__file__': "'/path/to/script.py'",
-        '__name__': "'__main__'",
-        'foo': "'hello'",
-        'bar': "['this', 'is', 'a', 'list']",
-        'baz': "{'this': 'is', 'a': 'dict'}",
+        '__builtins__': ([0, '__builtins__'], [None, "<module 'builtins'>"]),
+        '__debug_code__': ([0, '__debug_code__'], [None, '<code>']),
+        '__debug_script__': ([0, '__debug_script__'], [None, '<file>']),
+        '__name__': ([0, '__name__'], [None, "'__main__'"]),
+        'foo': ([1, 'foo'], [None, "'hello'"]),
+        'bar': ([1, 'bar'], ['list', 4]),
     }
     w = mu.interface.main.Window()
     w.debug_model = mock.MagicMock()
-    mock_standard_item = mock.MagicMock()
-    with mock.patch('mu.interface.main.DebugInspectorItem',
-                    mock_standard_item):
-        w.update_debug_inspector(locals_dict)
+    w.update_debug_inspector(locals_dict)
     w.debug_model.clear.assert_called_once_with()
     w.debug_model.setHorizontalHeaderLabels(['Name', 'Value', ])
-    # You just have to believe this is correct. I checked! :-)
-    assert mock_standard_item.call_count == 22
+    root = w.debug_model.invisibleRootItem()
+    assert w.debug_model.append_variable.call_args_list == [
+        mock.call(root, '__name__', [0, '__name__'], None, "'__main__'"),
+        mock.call(root, 'bar', [1, 'bar'], 'list', 4),
+        mock.call(root, 'foo', [1, 'foo'], None, "'hello'"),
+    ]
 
 
-def test_Window_update_debug_inspector_with_exception():
+def test_Window_update_debug_children():
     """
-    If an exception is encountered when working out the type of the value,
-    make sure it just reverts to the repr of the object.
+    Pages of children are added to the debug inspector's model, if it's
+    still there.
     """
-    locals_dict = {
-        'bar': "['this', 'is', 'a', 'list']",
-    }
     w = mu.interface.main.Window()
+    w.debug_model = None
+    w.update_debug_children(1, 0, 1, [['0', None, '1']])
     w.debug_model = mock.MagicMock()
-    mock_standard_item = mock.MagicMock()
-    mock_eval = mock.MagicMock(side_effect=Exception('BOOM!'))
-    with mock.patch(
-        'mu.interface.main.DebugInspectorItem', mock_standard_item), \
-            mock.patch('builtins.eval', mock_eval):
-        w.update_debug_inspector(locals_dict)
-    # You just have to believe this is correct. I checked! :-)
-    assert mock_standard_item.call_count == 2
+    w.update_debug_children(1, 0, 1, [['0', None, '1']])
+    w.debug_model.add_children.assert_called_once_with(1, 0, 1,
+                                                       [['0', None, '1']])
+
+
+def test_Window_update_debug_value():
+    """
+    Full reprs are shown in the debug inspector's model, if it's still there.
+    """
+    w = mu.interface.main.Window()
+    w.debug_model = None
+    w.update_debug_value(1, "'foo'")
+    w.debug_model = mock.MagicMock()
+    w.update_debug_value(1, "'foo'")
+    w.debug_model.set_value.assert_called_once_with(1, "'foo'")
 
 
 def test_Window_remove_filesystem():
@@ -1194,12 +1235,31 @@ def test_Window_sync_packages():
         to_remove = {'foo'}
         to_add = {'bar'}
         module_dir = 'baz'
-        w.sync_packages(to_remove, to_add, module_dir)
+        wheel_dir = 'qux'
+        index = {}
+        w.sync_packages(to_remove, to_add, module_dir, wheel_dir, index)
         dialog = mock_package_dialog()
-        dialog.setup.assert_called_once_with(to_remove, to_add, module_dir)
+        dialog.setup.assert_called_once_with(to_remove, to_add, module_dir,
+                                             wheel_dir, index)
         dialog.exec.assert_called_once_with()
 
 
+def test_Window_show_flash_progress():
+    """
+    Ensure the non-modal dialog showing the progress of flashing several
+    devices is displayed and returned.
+    """
+    mock_flash_dialog = mock.MagicMock()
+    with mock.patch('mu.interface.main.FlashDevicesDialog',
+                    mock_flash_dialog):
+        w = mu.interface.main.Window()
+        result = w.show_flash_progress(['foo', 'bar'])
+        dialog = mock_flash_dialog()
+        assert result == dialog
+        dialog.setup.assert_called_once_with(['foo', 'bar'])
+        dialog.show.assert_called_once_with()
+
+
 def test_Window_show_message():
     """
     Ensure the show_message method configures a QMessageBox in the expected
@@ -1446,11 +1506,69 @@ def test_Window_set_usb_checker():
     mock_timer = mock.MagicMock()
     mock_timer_class = mock.MagicMock(return_value=mock_timer)
     mock_callback = mock.MagicMock()
-    with mock.patch('mu.interface.main.QTimer', mock_timer_class):
+    with mock.patch('mu.interface.main.QTimer', mock_timer_class), \
+            mock.patch('mu.interface.main.sys.platform', 'win32'):
         w.set_usb_checker(1, mock_callback)
         assert w.usb_checker == mock_timer
         w.usb_checker.timeout.connect.assert_called_once_with(mock_callback)
         w.usb_checker.start.assert_called_once_with(1000)
+    assert w.usb_watcher is None
+
+
+def test_Window_set_usb_checker_linux():
+    """
+    On Linux, /dev is watched for changes rather than polled.
+    """
+    w = mu.interface.main.Window()
+    mock_timer = mock.MagicMock()
+    mock_timer_class = mock.MagicMock(return_value=mock_timer)
+    mock_watcher = mock.MagicMock()
+    mock_watcher.directories.return_value = ['/dev']
+    mock_watcher_class = mock.MagicMock(return_value=mock_watcher)
+    mock_callback = mock.MagicMock()
+    with mock.patch('mu.interface.main.QTimer', mock_timer_class), \
+            mock.patch('mu.interface.main.QFileSystemWatcher',
+                       mock_watcher_class), \
+            mock.patch('mu.interface.main.sys.platform', 'linux'):
+        w.set_usb_checker(1, mock_callback)
+    mock_watcher_class.assert_called_once_with(['/dev'])
+    assert w.usb_watcher == mock_watcher
+    mock_timer.timeout.connect.assert_called_once_with(mock_callback)
+    mock_timer.setSingleShot.assert_called_once_with(True)
+    mock_watcher.directoryChanged.connect.assert_called_once_with(
+        w.usb_changed)
+    mock_timer.start.assert_called_once_with(1000)
+
+
+def test_Window_set_usb_checker_linux_no_dev():
+    """
+    If /dev can't be watched, fall back to polling.
+    """
+    w = mu.interface.main.Window()
+    mock_timer = mock.MagicMock()
+    mock_timer_class = mock.MagicMock(return_value=mock_timer)
+    mock_watcher = mock.MagicMock()
+    mock_watcher.directories.return_value = []
+    mock_watcher_class = mock.MagicMock(return_value=mock_watcher)
+    with mock.patch('mu.interface.main.QTimer', mock_timer_class), \
+            mock.patch('mu.interface.main.QFileSystemWatcher',
+                       mock_watcher_class), \
+            mock.patch('mu.interface.main.sys.platform', 'linux'):
+        w.set_usb_checker(1, mock.MagicMock())
+    assert w.usb_watcher is None
+    assert mock_timer.setSingleShot.call_count == 0
+    mock_timer.start.assert_called_once_with(1000)
+
+
+def test_Window_usb_changed():
+    """
+    A change to /dev schedules a check once things have settled.
+    """
+    w = mu.interface.main.Window()
+    w.usb_checker = mock.MagicMock()
+    w.usb_changed('/dev')
+    w.usb_checker.start.assert_called_once_with(
+        mu.interface.main.USB_SETTLE_TIME)
 
 
 def test_Window_set_timer():
@@ -1468,6 +1586,21 @@ def test_Window_set_timer():
         w.timer.start.assert_called_once_with(5 * 1000)
 
 
+def test_Window_set_journal_timer():
+    """
+    Ensure a repeating timer to journal unsaved tabs is created.
+    """
+    w = mu.interface.main.Window()
+    mock_timer = mock.MagicMock()
+    mock_timer_class = mock.MagicMock(return_value=mock_timer)
+    mock_callback = mock.MagicMock()
+    with mock.patch('mu.interface.main.QTimer', mock_timer_class):
+        w.set_journal_timer(1, mock_callback)
+        assert w.journal_timer == mock_timer
+        w.journal_timer.timeout.connect.assert_called_once_with(mock_callback)
+        w.journal_timer.start.assert_called_once_with(1000)
+
+
 def test_Window_stop_timer():
     """
     Ensure the timer is stopped and destroyed.
@@ -2,13 +2,15 @@
 """
 Tests for the user interface elements of Mu.
 """
-from PyQt5.QtWidgets import QApplication, QMessageBox, QLabel
+from PyQt5.QtWidgets import (QApplication, QMessageBox, QLabel,
+                             QListWidgetItem)
 from PyQt5.QtChart import QChart, QLineSeries, QValueAxis
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QUrl, QModelIndex, QProcess
 from PyQt5.QtGui import QTextCursor
 from unittest import mock
 import sys
 import os
+import json
 import signal
 import mu
 import platform
@@ -530,17 +532,76 @@ def test_MicroPythonDeviceFileList_dropEvent():
     source = mu.interface.panes.LocalFileList('homepath')
     mock_item = mock.MagicMock()
     mock_item.text.return_value = 'foo.py'
-    source.currentItem = mock.MagicMock(return_value=mock_item)
+    source.selectedItems = mock.MagicMock(return_value=[mock_item, ])
     mock_event.source.return_value = source
     mfs = mu.interface.panes.MicroPythonDeviceFileList('homepath')
     mfs.disable = mock.MagicMock()
     mfs.set_message = mock.MagicMock()
-    mfs.put = mock.MagicMock()
+    mfs.put_files = mock.MagicMock()
     # Test
     mfs.dropEvent(mock_event)
     fn = os.path.join('homepath', 'foo.py')
     assert mfs.set_message.emit.call_count == 1
-    mfs.put.emit.assert_called_once_with(fn)
+    mfs.put_files.emit.assert_called_once_with([fn, ])
+
+
+def test_MicroPythonDeviceFileList_dropEvent_many():
+    """
+    Dropping several selected files queues them as a single transfer and
+    only asks once about overwriting existing files.
+    """
+    mock_event = mock.MagicMock()
+    source = mu.interface.panes.LocalFileList('homepath')
+    items = [QListWidgetItem('foo.py'), QListWidgetItem('bar.py')]
+    source.selectedItems = mock.MagicMock(return_value=items)
+    mock_event.source.return_value = source
+    mfs = mu.interface.panes.MicroPythonDeviceFileList('homepath')
+    mfs.addItem('foo.py')
+    mfs.addItem('bar.py')
+    mfs.show_confirm_overwrite_dialog = mock.MagicMock(return_value=True)
+    mfs.set_message = mock.MagicMock()
+    mfs.put_files = mock.MagicMock()
+    mfs.dropEvent(mock_event)
+    mfs.show_confirm_overwrite_dialog.assert_called_once_with()
+    mfs.set_message.emit.\
+        assert_called_once_with('Copying 2 items to micro:bit.')
+    mfs.put_files.emit.assert_called_once_with([
+        os.path.join('homepath', 'foo.py'),
+        os.path.join('homepath', 'bar.py'),
+    ])
+
+
+def test_MicroPythonDeviceFileList_dropEvent_urls():
+    """
+    Files and directories dragged in from outside Mu are queued by their
+    local paths.
+    """
+    mock_event = mock.MagicMock()
+    mock_event.source.return_value = None
+    mock_event.mimeData().hasUrls.return_value = True
+    mock_event.mimeData().urls.return_value = [
+        QUrl.fromLocalFile('/home/user/project/lib'),
+        QUrl('https://codewith.mu/'),
+    ]
+    mfs = mu.interface.panes.MicroPythonDeviceFileList('homepath')
+    mfs.set_message = mock.MagicMock()
+    mfs.put_files = mock.MagicMock()
+    mfs.dropEvent(mock_event)
+    mfs.put_files.emit.assert_called_once_with(['/home/user/project/lib', ])
+
+
+def test_MicroPythonDeviceFileList_dragEnterEvent_urls():
+    """
+    Drags from outside Mu carrying URLs are accepted.
+    """
+    mock_event = mock.MagicMock()
+    mock_event.mimeData().hasUrls.return_value = True
+    mfs = mu.interface.panes.MicroPythonDeviceFileList('homepath')
+    mfs.dragEnterEvent(mock_event)
+    mock_event.acceptProposedAction.assert_called_once_with()
+    mock_event.reset_mock()
+    mfs.dragMoveEvent(mock_event)
+    mock_event.acceptProposedAction.assert_called_once_with()
 
 
 def test_MicroPythonDeviceFileList_dropEvent_wrong_source():
@@ -551,6 +612,7 @@ def test_MicroPythonDeviceFileList_dropEvent_wrong_source():
     mock_event = mock.MagicMock()
     source = mock.MagicMock()
     mock_event.source.return_value = source
+    mock_event.mimeData().hasUrls.return_value = False
     mfs = mu.interface.panes.MicroPythonDeviceFileList('homepath')
     mfs.findItems = mock.MagicMock()
     mfs.dropEvent(mock_event)
@@ -570,6 +632,20 @@ def test_MicroPythonDeviceFileList_on_put():
     mfs.list_files.emit.assert_called_once_with()
 
 
+def test_MicroPythonDeviceFileList_on_put_files():
+    """
+    A single message and list_files signal should be emitted for the whole
+    queued transfer.
+    """
+    mfs = mu.interface.panes.MicroPythonDeviceFileList('homepath')
+    mfs.set_message = mock.MagicMock()
+    mfs.list_files = mock.MagicMock()
+    mfs.on_put_files(('lib/a.py', 'lib/b.py', 'code.py'))
+    msg = "3 file(s) successfully copied to micro:bit."
+    mfs.set_message.emit.assert_called_once_with(msg)
+    mfs.list_files.emit.assert_called_once_with()
+
+
 def test_MicroPythonDeviceFileList_contextMenuEvent():
     """
     Ensure that the menu displayed when a file on the micro:bit is
@@ -595,6 +671,42 @@ def test_MicroPythonDeviceFileList_contextMenuEvent():
     mfs.delete.emit.assert_called_once_with('foo.py')
 
 
+def test_MicroPythonDeviceFileList_contextMenuEvent_sync():
+    """
+    Ensure the sync entry in the device file list's menu asks for the local
+    files to be synced.
+    """
+    mock_menu = mock.MagicMock()
+    mock_sync = mock.MagicMock()
+    mock_menu.addAction.side_effect = [mock.MagicMock(), mock_sync]
+    mock_menu.exec_.return_value = mock_sync
+    mfs = mu.interface.panes.MicroPythonDeviceFileList('homepath')
+    mfs.currentItem = mock.MagicMock()
+    mfs.disable = mock.MagicMock()
+    mfs.set_message = mock.MagicMock()
+    mfs.delete = mock.MagicMock()
+    mfs.sync = mock.MagicMock()
+    mfs.mapToGlobal = mock.MagicMock()
+    with mock.patch('mu.interface.panes.QMenu', return_value=mock_menu):
+        mfs.contextMenuEvent(mock.MagicMock())
+    mfs.disable.emit.assert_called_once_with()
+    assert mfs.delete.emit.call_count == 0
+    mfs.sync.emit.assert_called_once_with()
+
+
+def test_MicroPythonDeviceFileList_on_sync_files():
+    """
+    A message summarising the sync and list_files signal should be emitted.
+    """
+    mfs = mu.interface.panes.MicroPythonDeviceFileList('homepath')
+    mfs.set_message = mock.MagicMock()
+    mfs.list_files = mock.MagicMock()
+    mfs.on_sync_files(('a.py', ), ('b.py', 'c.py'))
+    msg = "1 changed file(s) copied to micro:bit, 2 already up to date."
+    mfs.set_message.emit.assert_called_once_with(msg)
+    mfs.list_files.emit.assert_called_once_with()
+
+
 def test_MicroPythonFileList_on_delete():
     """
     On delete should emit a message and list_files signal.
@@ -625,18 +737,39 @@ def test_LocalFileList_dropEvent():
     source = mu.interface.panes.MicroPythonDeviceFileList('homepath')
     mock_item = mock.MagicMock()
     mock_item.text.return_value = 'foo.py'
-    source.currentItem = mock.MagicMock(return_value=mock_item)
+    source.selectedItems = mock.MagicMock(return_value=[mock_item, ])
     mock_event.source.return_value = source
     lfs = mu.interface.panes.LocalFileList('homepath')
     lfs.disable = mock.MagicMock()
     lfs.set_message = mock.MagicMock()
-    lfs.get = mock.MagicMock()
+    lfs.get_files = mock.MagicMock()
     # Test
     lfs.dropEvent(mock_event)
     fn = os.path.join('homepath', 'foo.py')
     lfs.disable.emit.assert_called_once_with()
     assert lfs.set_message.emit.call_count == 1
-    lfs.get.emit.assert_called_once_with('foo.py', fn)
+    lfs.get_files.emit.assert_called_once_with([['foo.py', fn], ])
+
+
+def test_LocalFileList_dropEvent_many():
+    """
+    Dropping several selected device files queues them as a single transfer.
+    """
+    mock_event = mock.MagicMock()
+    source = mu.interface.panes.MicroPythonDeviceFileList('homepath')
+    items = [QListWidgetItem('foo.py'), QListWidgetItem('bar.py')]
+    source.selectedItems = mock.MagicMock(return_value=items)
+    mock_event.source.return_value = source
+    lfs = mu.interface.panes.LocalFileList('homepath')
+    lfs.set_message = mock.MagicMock()
+    lfs.get_files = mock.MagicMock()
+    lfs.dropEvent(mock_event)
+    msg = "Getting 2 files from micro:bit. Copying to 'homepath'."
+    lfs.set_message.emit.assert_called_once_with(msg)
+    lfs.get_files.emit.assert_called_once_with([
+        ['foo.py', os.path.join('homepath', 'foo.py')],
+        ['bar.py', os.path.join('homepath', 'bar.py')],
+    ])
 
 
 def test_LocalFileList_dropEvent_wrong_source():
@@ -667,6 +800,20 @@ def test_LocalFileList_on_get():
     lfs.list_files.emit.assert_called_once_with()
 
 
+def test_LocalFileList_on_get_files():
+    """
+    On get_files should emit a single message and list_files.
+    """
+    lfs = mu.interface.panes.LocalFileList('homepath')
+    lfs.set_message = mock.MagicMock()
+    lfs.list_files = mock.MagicMock()
+    lfs.on_get_files(('a.py', 'b.py'))
+    msg = ("Successfully copied 2 file(s) from the micro:bit "
+           "to your computer.")
+    lfs.set_message.emit.assert_called_once_with(msg)
+    lfs.list_files.emit.assert_called_once_with()
+
+
 def test_LocalFileList_contextMenuEvent():
     """
     Ensure that the menu displayed when a local file is
@@ -828,6 +975,57 @@ def test_FileSystemPane_on_ls():
     fsp.enable.assert_called_once_with()
 
 
+def test_FileSystemPane_on_transfer_progress():
+    """
+    Progress of a queued transfer is shown with the option to cancel until
+    the final file has been copied.
+    """
+    fsp = mu.interface.panes.FileSystemPane('homepath')
+    fsp.progress = mock.MagicMock()
+    fsp.cancel_button = mock.MagicMock()
+    fsp.show_message = mock.MagicMock()
+    fsp.on_transfer_progress(2, 5, 4096, 2048.0)
+    fsp.progress.setMaximum.assert_called_once_with(5)
+    fsp.progress.setValue.assert_called_once_with(2)
+    fsp.progress.show.assert_called_once_with()
+    fsp.cancel_button.show.assert_called_once_with()
+    fsp.show_message.assert_called_once_with(
+        'Copied 2 of 5 files (2.0 KB/s).')
+    fsp.on_transfer_progress(5, 5, 8192, 2048.0)
+    fsp.cancel_button.hide.assert_called_once_with()
+
+
+def test_FileSystemPane_on_sync():
+    """
+    Syncing emits the paths of all the files listed on the computer and the
+    size of the blocks to patch.
+    """
+    fsp = mu.interface.panes.FileSystemPane('homepath')
+    fsp.local_fs.addItem('a.py')
+    fsp.local_fs.addItem('b.py')
+    fsp.sync_block_size = 512
+    fsp.sync_files = mock.MagicMock()
+    fsp.on_sync()
+    fsp.sync_files.emit.assert_called_once_with([
+        os.path.join('homepath', 'a.py'),
+        os.path.join('homepath', 'b.py'),
+    ], 512)
+
+
+def test_FileSystemPane_on_cancel():
+    """
+    Cancelling a transfer hides the button and emits cancel_transfer.
+    """
+    fsp = mu.interface.panes.FileSystemPane('homepath')
+    fsp.cancel_button = mock.MagicMock()
+    fsp.show_message = mock.MagicMock()
+    fsp.cancel_transfer = mock.MagicMock()
+    fsp.on_cancel()
+    fsp.cancel_button.hide.assert_called_once_with()
+    assert fsp.show_message.call_count == 1
+    fsp.cancel_transfer.emit.assert_called_once_with()
+
+
 def test_FileSystemPane_on_ls_fail():
     """
     A warning is emitted and the widget disabled if listing files fails.
@@ -850,6 +1048,21 @@ def test_FileSystem_Pane_on_put_fail():
     assert fsp.show_warning.call_count == 1
 
 
+def test_FileSystem_Pane_on_put_files_fail():
+    """
+    A queued transfer with several files that failed is warned about once.
+    """
+    fsp = mu.interface.panes.FileSystemPane('homepath')
+    fsp.show_warning = mock.MagicMock()
+    fsp.on_put_files_fail(('a.py', 'b.py', 'c.py'))
+    assert fsp.show_warning.call_count == 1
+    assert '3 files' in fsp.show_warning.call_args[0][0]
+    assert "'a.py'" in fsp.show_warning.call_args[0][0]
+    fsp.on_put_fail = mock.MagicMock()
+    fsp.on_put_files_fail(('a.py', ))
+    fsp.on_put_fail.assert_called_once_with('a.py')
+
+
 def test_FileSystem_Pane_on_delete_fail():
     """
     A warning is emitted if deleting files on the micro:bit fails.
@@ -870,6 +1083,20 @@ def test_FileSystem_Pane_on_get_fail():
     assert fsp.show_warning.call_count == 1
 
 
+def test_FileSystem_Pane_on_get_files_fail():
+    """
+    A queued transfer with several files that failed is warned about once.
+    """
+    fsp = mu.interface.panes.FileSystemPane('homepath')
+    fsp.show_warning = mock.MagicMock()
+    fsp.on_get_files_fail(('a.py', 'b.py'))
+    assert fsp.show_warning.call_count == 1
+    assert '2 files' in fsp.show_warning.call_args[0][0]
+    fsp.on_get_fail = mock.MagicMock()
+    fsp.on_get_files_fail(('a.py', ))
+    fsp.on_get_fail.assert_called_once_with('a.py')
+
+
 def test_FileSystemPane_set_font_size():
     """
     Ensure the right size is set as the point size and the text based UI child
@@ -980,6 +1207,220 @@ def test_JupyterREPLPane_setFocus():
     jw._control.setFocus.assert_called_once_with()
 
 
+def test_JupyterREPLPane_request_restart_kernel():
+    """
+    When asked to, the kernel is restarted without waiting for it to shut
+    down cleanly.
+    """
+    jw = mu.interface.panes.JupyterREPLPane()
+    jw.restart_kernel = mock.MagicMock()
+    jw.request_restart_kernel()
+    jw.restart_kernel.assert_called_once_with(mock.ANY, now=True)
+
+
+def test_process_environment():
+    """
+    The child process has unbuffered UTF-8 output, the given environment
+    variables and Mu's Python path.
+    """
+    mock_environment = mock.MagicMock()
+    mock_environment_class = mock.MagicMock()
+    mock_environment_class.systemEnvironment.return_value = mock_environment
+    with mock.patch('mu.interface.panes.QProcessEnvironment',
+                    mock_environment_class):
+        envars = [['name', 'value'], ]
+        result = mu.interface.panes.process_environment(envars)
+    assert result == mock_environment
+    assert envars == [['name', 'value'], ]
+    assert mock_environment.insert.call_args_list == [
+        mock.call('PYTHONUNBUFFERED', '1'),
+        mock.call('PYTHONIOENCODING', 'utf-8'),
+        mock.call('name', 'value'),
+        mock.call('PYTHONPATH', os.pathsep.join(sys.path)),
+    ]
+
+
+def test_ProcessPool_init():
+    """
+    Ensure the pool is set up with no processes.
+    """
+    pp = mu.interface.panes.ProcessPool(['runner.py', ], [['name', 'value']],
+                                        size=2)
+    assert pp.args == ['runner.py', ]
+    assert pp.envars == [('name', 'value')]
+    assert pp.size == 2
+    assert pp.starting == []
+    assert pp.ready == []
+
+
+def test_ProcessPool_fill():
+    """
+    Enough processes are started to fill the pool.
+    """
+    pp = mu.interface.panes.ProcessPool(['runner.py', ], size=2)
+    pp.ready = [(mock.MagicMock(), '1234')]
+    mock_process_class = mock.MagicMock()
+    mock_environment = mock.MagicMock()
+    with mock.patch('mu.interface.panes.QProcess', mock_process_class), \
+            mock.patch('mu.interface.panes.process_environment',
+                       return_value=mock_environment) as mock_env:
+        pp.fill()
+    mock_process_class.assert_called_once_with(pp)
+    process = mock_process_class.return_value
+    assert pp.starting == [process]
+    process.setProcessChannelMode.assert_called_once_with(
+        mock_process_class.SeparateChannels)
+    mock_env.assert_called_once_with([])
+    process.setProcessEnvironment.assert_called_once_with(mock_environment)
+    assert process.readyRead.connect.call_count == 1
+    assert process.readyReadStandardError.connect.call_count == 1
+    assert process.finished.connect.call_count == 1
+    process.start.assert_called_once_with(sys.executable, ['runner.py', ])
+
+
+def test_ProcessPool_on_ready_read():
+    """
+    Once a starting process has written its ready line, it's ready to be
+    claimed with the rest of that line.
+    """
+    pp = mu.interface.panes.ProcessPool(['runner.py', ])
+    mock_process = mock.MagicMock()
+    mock_process.canReadLine.return_value = False
+    pp.starting = [mock_process]
+    pp.on_ready_read(mock_process)
+    assert pp.starting == [mock_process]
+    mock_process.canReadLine.return_value = True
+    mock_process.readLine.return_value = b'MU-READY 1234\n'
+    pp.process_ready = mock.MagicMock()
+    pp.on_ready_read(mock_process)
+    assert pp.starting == []
+    assert pp.ready == [(mock_process, '1234')]
+    pp.process_ready.emit.assert_called_once_with()
+    pp.on_ready_read(mock_process)
+    assert mock_process.readLine.call_count == 1
+
+
+def test_ProcessPool_on_ready_read_skips_other_output():
+    """
+    Anything a starting process writes before its ready line is logged and
+    otherwise ignored.
+    """
+    pp = mu.interface.panes.ProcessPool(['runner.py', ])
+    mock_process = mock.MagicMock()
+    mock_process.canReadLine.side_effect = [True, True, True]
+    mock_process.readLine.side_effect = [b'Hello from sitecustomize\n',
+                                         b'1234\n', b'MU-READY\n']
+    pp.starting = [mock_process]
+    pp.process_ready = mock.MagicMock()
+    with mock.patch('mu.interface.panes.logger') as mock_logger:
+        pp.on_ready_read(mock_process)
+    assert pp.ready == [(mock_process, '')]
+    pp.process_ready.emit.assert_called_once_with()
+    mock_logger.info.assert_any_call(
+        'Pooled process: Hello from sitecustomize')
+    mock_logger.info.assert_any_call('Pooled process: 1234')
+
+
+def test_ProcessPool_on_ready_read_stderr():
+    """
+    Anything a process writes to stderr while in the pool is logged.
+    """
+    pp = mu.interface.panes.ProcessPool(['runner.py', ])
+    mock_process = mock.MagicMock()
+    mock_process.readAllStandardError.return_value = b'DeprecationWarning\n'
+    with mock.patch('mu.interface.panes.logger') as mock_logger:
+        pp.on_ready_read_stderr(mock_process)
+        mock_process.readAllStandardError.return_value = b''
+        pp.on_ready_read_stderr(mock_process)
+    mock_logger.info.assert_called_once_with(
+        'Pooled process stderr: DeprecationWarning')
+
+
+def test_ProcessPool_on_finished():
+    """
+    Processes that end before being claimed are removed from the pool.
+    """
+    pp = mu.interface.panes.ProcessPool(['runner.py', ])
+    starting = mock.MagicMock()
+    starting.readAllStandardError.return_value = b'Boom'
+    ready = mock.MagicMock()
+    ready.readAllStandardError.return_value = b''
+    pp.starting = [starting]
+    pp.ready = [(ready, '1234')]
+    pp.process_failed = mock.MagicMock()
+    pp.on_finished(starting, 1, 0)
+    pp.process_failed.emit.assert_called_once_with()
+    pp.on_finished(ready, 1, 0)
+    assert pp.starting == []
+    assert pp.ready == []
+    assert pp.process_failed.emit.call_count == 1
+
+
+def test_ProcessPool_matches():
+    """
+    Environment variables from the settings are lists, not tuples.
+    """
+    pp = mu.interface.panes.ProcessPool(['runner.py', ], [('name', 'value')])
+    assert pp.matches([['name', 'value'], ])
+    assert not pp.matches([])
+    assert mu.interface.panes.ProcessPool(['runner.py', ]).matches(None)
+
+
+def test_ProcessPool_claim():
+    """
+    A ready process is handed over, no longer watched by the pool, and a
+    replacement started.
+    """
+    pp = mu.interface.panes.ProcessPool(['runner.py', ])
+    pp.fill = mock.MagicMock()
+    mock_process = mock.MagicMock()
+    mock_process.readAllStandardError.return_value = b''
+    pp.ready = [(mock_process, '1234')]
+    assert pp.claim([]) == (mock_process, '1234')
+    assert pp.ready == []
+    mock_process.readyRead.disconnect.assert_called_once_with()
+    mock_process.readyReadStandardError.disconnect.assert_called_once_with()
+    mock_process.finished.disconnect.assert_called_once_with()
+    pp.fill.assert_called_once_with()
+
+
+def test_ProcessPool_claim_unavailable():
+    """
+    Nothing is claimed if no process is ready, or if the processes were
+    started with different environment variables.
+    """
+    pp = mu.interface.panes.ProcessPool(['runner.py', ])
+    pp.fill = mock.MagicMock()
+    assert pp.claim([['name', 'value'], ]) is None
+    assert pp.fill.call_count == 0
+    pp.ready = [(mock.MagicMock(), '1234')]
+    assert pp.claim([['name', 'value'], ]) is None
+    assert len(pp.ready) == 1
+    assert pp.fill.call_count == 0
+    pp.ready = []
+    assert pp.claim() is None
+    # Make sure a process is on its way, if one ended before it was ready.
+    pp.fill.assert_called_once_with()
+
+
+def test_ProcessPool_stop():
+    """
+    All the processes in the pool are killed.
+    """
+    pp = mu.interface.panes.ProcessPool(['runner.py', ])
+    starting = mock.MagicMock()
+    ready = mock.MagicMock()
+    pp.starting = [starting]
+    pp.ready = [(ready, '1234')]
+    pp.stop()
+    assert pp.starting == []
+    assert pp.ready == []
+    for process in (starting, ready):
+        process.finished.disconnect.assert_called_once_with()
+        process.kill.assert_called_once_with()
+        process.waitForFinished.assert_called_once_with()
+
+
 def test_PythonProcessPane_init():
     """
     Check the font, input_buffer and other initial state is set as expected.
@@ -991,8 +1432,9 @@ def test_PythonProcessPane_init():
     assert ppp.start_of_current_line == 0
     assert ppp.history_position == 0
     assert ppp.running is False
-    assert ppp.stdout_buffer == b''
+    assert ppp.stdout_decoder.decode(b'') == ''
     assert ppp.reading_stdout is False
+    assert ppp.kill_timer.isSingleShot()
 
 
 def test_PythonProcessPane_start_process():
@@ -1060,6 +1502,50 @@ def test_PythonProcessPane_start_process_debugger():
     expected_script = os.path.abspath(os.path.normcase('script.py'))
     expected_args = [runner, expected_script, 'foo', 'bar', ]
     ppp.process.start.assert_called_once_with(python_exec, expected_args)
+    assert ppp.awaiting_ready is True
+
+
+def test_PythonProcessPane_start_process_warm_debugger():
+    """
+    Ensure a debug runner that's already running is adopted and sent the
+    script to debug, rather than starting a new process.
+    """
+    mock_process = mock.MagicMock()
+    mock_process_class = mock.MagicMock()
+    with mock.patch('mu.interface.panes.QProcess', mock_process_class):
+        ppp = mu.interface.panes.PythonProcessPane()
+        ppp.start_process('script.py', 'workspace', debugger=True,
+                          command_args=['foo', ], process=mock_process)
+    assert mock_process_class.call_count == 0
+    assert ppp.process == mock_process
+    mock_process.setParent.assert_called_once_with(ppp)
+    mock_process.readyRead.connect.assert_called_once_with(
+        ppp.try_read_from_stdout)
+    mock_process.finished.connect.assert_called_once_with(ppp.finished)
+    expected_script = os.path.abspath(os.path.normcase('script.py'))
+    sent = mock_process.write.call_args[0][0]
+    assert sent.endswith(b'\n')
+    assert json.loads(sent.decode('utf-8')) == {
+        'filename': expected_script,
+        'args': ['foo', ],
+        'cwd': 'workspace',
+    }
+    assert mock_process.start.call_count == 0
+    assert ppp.running is False
+
+
+def test_PythonProcessPane_start_process_warm_script():
+    """
+    Ensure a process started in advance to run a script is marked as running,
+    so input is sent to it.
+    """
+    mock_process = mock.MagicMock()
+    with mock.patch('mu.interface.panes.QProcess'):
+        ppp = mu.interface.panes.PythonProcessPane()
+        ppp.start_process('script.py', 'workspace', process=mock_process)
+    assert ppp.process == mock_process
+    assert ppp.running is True
+    assert mock_process.write.call_count == 1
 
 
 def test_PythonProcessPane_start_process_not_interactive():
@@ -1271,6 +1757,66 @@ def test_PythonProcessPane_finished():
     assert 'status: 1' in mock_cursor.insertText.call_args[0][0]
     ppp.setReadOnly.assert_called_once_with(True)
     ppp.setTextCursor.assert_called_once_with(ppp.textCursor())
+    assert not ppp.kill_timer.isActive()
+
+
+def test_PythonProcessPane_stop_process():
+    """
+    The process is asked to terminate, and killed if it hasn't after a while,
+    without waiting for it.
+    """
+    ppp = mu.interface.panes.PythonProcessPane()
+    ppp.process = mock.MagicMock()
+    ppp.process.state.return_value = QProcess.Running
+    with mock.patch('sys.platform', 'linux'):
+        assert ppp.stop_process() is True
+    ppp.process.terminate.assert_called_once_with()
+    assert ppp.process.kill.call_count == 0
+    assert ppp.process.waitForFinished.call_count == 0
+    assert ppp.kill_timer.isActive()
+    assert ppp.kill_timer.interval() == ppp.kill_timeout
+    ppp.kill_timer.stop()
+
+
+def test_PythonProcessPane_stop_process_windows():
+    """
+    On Windows, the process is killed straight away.
+    """
+    ppp = mu.interface.panes.PythonProcessPane()
+    ppp.process = mock.MagicMock()
+    ppp.process.state.return_value = QProcess.Running
+    with mock.patch('sys.platform', 'win32'):
+        assert ppp.stop_process() is True
+    ppp.process.kill.assert_called_once_with()
+    assert ppp.process.terminate.call_count == 0
+    assert not ppp.kill_timer.isActive()
+
+
+def test_PythonProcessPane_stop_process_not_running():
+    """
+    There's nothing to stop if there's no process, or it has already ended.
+    """
+    ppp = mu.interface.panes.PythonProcessPane()
+    assert ppp.stop_process() is False
+    ppp.process = mock.MagicMock()
+    ppp.process.state.return_value = QProcess.NotRunning
+    assert ppp.stop_process() is False
+    assert ppp.process.terminate.call_count == 0
+    assert ppp.process.kill.call_count == 0
+
+
+def test_PythonProcessPane_kill_process():
+    """
+    A process still running once the time to stop is up is killed.
+    """
+    ppp = mu.interface.panes.PythonProcessPane()
+    ppp.process = mock.MagicMock()
+    ppp.process.state.return_value = QProcess.NotRunning
+    ppp.kill_process()
+    assert ppp.process.kill.call_count == 0
+    ppp.process.state.return_value = QProcess.Running
+    ppp.kill_process()
+    ppp.process.kill.assert_called_once_with()
 
 
 def test_PythonProcessPane_context_menu():
@@ -1500,6 +2046,7 @@ def test_PythonProcessPane_parse_input_ctrl_c():
     ppp.process = mock.MagicMock()
     ppp.process.processId.return_value = 123
     ppp.running = True
+    ppp.stdout_decoder = mock.MagicMock()
     key = Qt.Key_C
     text = ''
     modifiers = Qt.ControlModifier
@@ -1512,6 +2059,7 @@ def test_PythonProcessPane_parse_input_ctrl_c():
         ppp.parse_input(key, text, modifiers)
     mock_kill.assert_called_once_with(123, signal.SIGINT)
     ppp.process.readAll.assert_called_once_with()
+    ppp.stdout_decoder.reset.assert_called_once_with()
     mock_timer.singleShot.assert_called_once_with(1, ppp.on_process_halt)
 
 
@@ -1893,74 +2441,146 @@ def test_PythonProcessPane_try_read_from_stdout_has_started():
     assert ppp.read_from_stdout.call_count == 0
 
 
+def test_PythonProcessPane_try_read_from_stdout_awaiting_ready():
+    """
+    A new debug runner's output isn't read as usual until its ready line has
+    been read.
+    """
+    ppp = mu.interface.panes.PythonProcessPane()
+    ppp.read_from_stdout = mock.MagicMock()
+    ppp.read_ready_line = mock.MagicMock(return_value=False)
+    ppp.awaiting_ready = True
+    ppp.try_read_from_stdout()
+    assert ppp.read_from_stdout.call_count == 0
+    ppp.read_ready_line.return_value = True
+    ppp.try_read_from_stdout()
+    ppp.read_from_stdout.assert_called_once_with()
+
+
+def test_PythonProcessPane_read_ready_line():
+    """
+    Lines before a new debug runner's ready line are shown as usual. The rest
+    of the ready line is emitted with process_ready, and isn't shown.
+    """
+    ppp = mu.interface.panes.PythonProcessPane()
+    ppp.append_text = mock.MagicMock()
+    ppp.on_append_text = mock.MagicMock()
+    ppp.process_ready = mock.MagicMock()
+    ppp.process = mock.MagicMock()
+    lines = [b'Warning!\n', b'MU-READY 4321\n']
+    ppp.process.canReadLine.side_effect = [True, True, True]
+    ppp.process.readLine.side_effect = lines
+    ppp.awaiting_ready = True
+    assert ppp.read_ready_line() is True
+    ppp.append_text.assert_called_once_with('Warning!\n')
+    ppp.on_append_text.emit.assert_called_once_with(b'Warning!\n')
+    ppp.process_ready.emit.assert_called_once_with('4321')
+    assert ppp.awaiting_ready is False
+    # Nothing more to read.
+    ppp.process.canReadLine.side_effect = None
+    ppp.process.canReadLine.return_value = False
+    assert ppp.read_ready_line() is False
+
+
 def test_PythonProcessPane_read_from_stdout():
     """
-    Ensure incoming bytes from sub-process's stout are processed correctly.
+    Ensure all the incoming bytes from sub-process's stdout are processed
+    correctly, and another read scheduled for the next frame.
     """
     ppp = mu.interface.panes.PythonProcessPane()
-    ppp.append = mock.MagicMock()
+    ppp.append_text = mock.MagicMock()
     ppp.process = mock.MagicMock()
-    ppp.process.read.return_value = b'hello world'
+    ppp.process.readAll.return_value.data.return_value = b'hello world'
     ppp.on_append_text = mock.MagicMock()
     ppp.set_start_of_current_line = mock.MagicMock()
     mock_timer = mock.MagicMock()
     with mock.patch('mu.interface.panes.QTimer', mock_timer):
         ppp.read_from_stdout()
-    assert ppp.append.call_count == 1
-    ppp.process.read.assert_called_once_with(256)
+    ppp.append_text.assert_called_once_with('hello world')
     ppp.on_append_text.emit.assert_called_once_with(b'hello world')
     ppp.set_start_of_current_line.assert_called_once_with()
-    mock_timer.singleShot.assert_called_once_with(2, ppp.read_from_stdout)
+    mock_timer.singleShot.assert_called_once_with(ppp.stdout_interval,
+                                                  ppp.read_from_stdout)
+
+
+def test_PythonProcessPane_read_from_stdout_plotter_not_flooded():
+    """
+    Lots of output read in one go is emitted in slices small enough that a
+    connected plotter doesn't take it as a flood of data.
+    """
+    ppp = mu.interface.panes.PythonProcessPane()
+    plotter = mu.interface.panes.PlotterPane()
+    plotter.data_flood = mock.MagicMock()
+    ppp.on_append_text.connect(plotter.process_bytes)
+    data = b'(1, 22)\n' * 1000
+    ppp.process = mock.MagicMock()
+    ppp.process.readAll.return_value.data.return_value = data
+    ppp.append_text = mock.MagicMock()
+    ppp.set_start_of_current_line = mock.MagicMock()
+    with mock.patch('mu.interface.panes.QTimer'):
+        ppp.read_from_stdout()
+    assert plotter.flooded is False
+    assert plotter.data_flood.emit.call_count == 0
+    assert len(plotter.raw_data) == 1000
 
 
-def test_PythonProcessPane_read_from_stdout_with_stdout_buffer():
+def test_PythonProcessPane_read_from_stdout_split_character():
     """
     Ensure incoming bytes from sub-process's stdout are processed correctly if
     there was a split between reads in a multi-byte character (such as "𠜎").
 
-    The buffer is pre-pended to the current read, thus resulting in bytes that
-    can be successfully represented in a UTF based string.
+    The start of the character is held back until the rest of it arrives,
+    while the raw bytes are emitted as they're read.
     """
     msg = "Hello 𠜎 world".encode('utf-8')
     ppp = mu.interface.panes.PythonProcessPane()
-    ppp.stdout_buffer = msg[:7]  # Start of msg but split in multi-byte char.
+    ppp.append_text = mock.MagicMock()
     ppp.process = mock.MagicMock()
-    ppp.process.read.return_value = msg[7:]  # Remainder of msg.
+    ppp.process.readAll.return_value.data.side_effect = [msg[:7], msg[7:]]
     ppp.on_append_text = mock.MagicMock()
     ppp.set_start_of_current_line = mock.MagicMock()
-    mock_timer = mock.MagicMock()
-    with mock.patch('mu.interface.panes.QTimer', mock_timer):
+    with mock.patch('mu.interface.panes.QTimer'):
         ppp.read_from_stdout()
-    ppp.process.read.assert_called_once_with(256)
-    ppp.on_append_text.emit.assert_called_once_with(msg)
-    ppp.set_start_of_current_line.assert_called_once_with()
-    mock_timer.singleShot.assert_called_once_with(2, ppp.read_from_stdout)
-    assert ppp.stdout_buffer == b''
+        ppp.read_from_stdout()
+    assert ppp.append_text.call_args_list == [mock.call('Hello '),
+                                              mock.call('𠜎 world')]
+    assert ppp.on_append_text.emit.call_args_list == [mock.call(msg[:7]),
+                                                      mock.call(msg[7:])]
 
 
-def test_PythonProcessPane_read_from_stdout_with_unicode_error():
+def test_PythonProcessPane_read_from_stdout_only_partial_character():
     """
-    Ensure incoming bytes from sub-process's stdout are processed correctly if
-    there was a split between reads in a multi-byte character (such as "𠜎").
+    If the only bytes read are the start of a multi-byte character, there's
+    no text to add yet.
+    """
+    msg = "𠜎".encode('utf-8')
+    ppp = mu.interface.panes.PythonProcessPane()
+    ppp.append_text = mock.MagicMock()
+    ppp.process = mock.MagicMock()
+    ppp.process.readAll.return_value.data.return_value = msg[:2]
+    ppp.on_append_text = mock.MagicMock()
+    ppp.set_start_of_current_line = mock.MagicMock()
+    with mock.patch('mu.interface.panes.QTimer') as mock_timer:
+        ppp.read_from_stdout()
+    assert ppp.append_text.call_count == 0
+    ppp.on_append_text.emit.assert_called_once_with(msg[:2])
+    assert mock_timer.singleShot.call_count == 1
 
-    If the read bytes end with a split of a multi-byte character, ensure they
-    are put into the self.stdout_buffer so they can be pre-pended to the next
-    bytes read from the child process.
+
+def test_PythonProcessPane_read_from_stdout_invalid_bytes():
+    """
+    Bytes that are not valid UTF-8 are replaced rather than holding up the
+    rest of the output.
     """
-    msg = "Hello 𠜎 world".encode('utf-8')
     ppp = mu.interface.panes.PythonProcessPane()
+    ppp.append_text = mock.MagicMock()
     ppp.process = mock.MagicMock()
-    ppp.process.read.return_value = msg[:7]  # Split the multi-byte character.
+    ppp.process.readAll.return_value.data.return_value = b'a\xffb'
     ppp.on_append_text = mock.MagicMock()
     ppp.set_start_of_current_line = mock.MagicMock()
-    mock_timer = mock.MagicMock()
-    with mock.patch('mu.interface.panes.QTimer', mock_timer):
+    with mock.patch('mu.interface.panes.QTimer'):
         ppp.read_from_stdout()
-    ppp.process.read.assert_called_once_with(256)
-    assert ppp.on_append_text.emit.call_count == 0
-    assert ppp.set_start_of_current_line.call_count == 0
-    mock_timer.singleShot.assert_called_once_with(2, ppp.read_from_stdout)
-    assert ppp.stdout_buffer == msg[:7]
+    ppp.append_text.assert_called_once_with('a\ufffdb')
 
 
 def test_PythonProcessPane_read_from_stdout_no_data():
@@ -1970,7 +2590,7 @@ def test_PythonProcessPane_read_from_stdout_no_data():
     ppp = mu.interface.panes.PythonProcessPane()
     ppp.reading_stdout = True
     ppp.process = mock.MagicMock()
-    ppp.process.read.return_value = b''
+    ppp.process.readAll.return_value.data.return_value = b''
     ppp.read_from_stdout()
     assert ppp.reading_stdout is False
 
@@ -1999,6 +2619,21 @@ def test_PythonProcessPane_append():
     assert mock_cursor.movePosition.call_count == 2
 
 
+def test_PythonProcessPane_append_text():
+    """
+    Ensure the referenced text is added to the end of the textual content of
+    the QTextEdit.
+    """
+    ppp = mu.interface.panes.PythonProcessPane()
+    mock_cursor = mock.MagicMock()
+    ppp.setTextCursor = mock.MagicMock()
+    ppp.textCursor = mock.MagicMock(return_value=mock_cursor)
+    ppp.append_text('hello')
+    mock_cursor.movePosition.assert_called_with(QTextCursor.End)
+    mock_cursor.insertText.assert_called_once_with('hello')
+    ppp.setTextCursor.assert_called_once_with(mock_cursor)
+
+
 def test_PythonProcessPane_insert_within_input_line():
     """
     Ensure text is inserted at the end of the document if the current cursor
@@ -2161,6 +2796,118 @@ def test_DebugInspectorItem():
     assert not item.isEditable()
 
 
+def test_DebugInspectorModel_append_variable():
+    """
+    Lists and dicts can be expanded to fetch their children, other values
+    just show their repr.
+    """
+    model = mu.interface.panes.DebugInspectorModel()
+    root = model.invisibleRootItem()
+    model.append_variable(root, 'a', [0, 'a'], 'list', 3)
+    model.append_variable(root, 'b', [0, 'b'], 'dict', 2)
+    model.append_variable(root, 'c', [0, 'c'], 'list', 0)
+    model.append_variable(root, 'd', [0, 'd'], None, "'hello'")
+    assert model.item(0, 1).text() == '(A list of 3 items.)'
+    assert model.item(1, 1).text() == '(A dict of 2 items.)'
+    assert model.item(3, 1).text() == "'hello'"
+    assert model.hasChildren(model.index(0, 0))
+    assert model.hasChildren(model.index(1, 0))
+    assert not model.hasChildren(model.index(2, 0))
+    assert not model.hasChildren(model.index(3, 0))
+    assert model.item(0).path == [0, 'a']
+    assert model.item(0).total == 3
+    assert model.item(3).path == [0, 'd']
+    assert model.item(3).total is None
+
+
+def test_DebugInspectorModel_fetch():
+    """
+    Children are only requested once, when the item is expanded.
+    """
+    model = mu.interface.panes.DebugInspectorModel()
+    model.on_fetch = mock.MagicMock()
+    root = model.invisibleRootItem()
+    model.append_variable(root, 'a', [0, 'a'], 'list', 3)
+    model.append_variable(root, 'd', [0, 'd'], None, "'hello'")
+    assert not model.canFetchMore(QModelIndex())
+    assert not model.canFetchMore(model.index(1, 0))
+    index = model.index(0, 0)
+    assert model.canFetchMore(index)
+    model.fetchMore(index)
+    model.on_fetch.emit.assert_called_once_with(1, [0, 'a'], 0)
+    assert model.pending == {1: model.item(0)}
+    assert not model.canFetchMore(index)
+
+
+def test_DebugInspectorModel_add_children():
+    """
+    Pages of children are added to the item that asked for them, with a row
+    to click to fetch the rest.
+    """
+    model = mu.interface.panes.DebugInspectorModel()
+    model.on_fetch = mock.MagicMock()
+    root = model.invisibleRootItem()
+    model.append_variable(root, 'a', [0, 'a'], 'list', 3)
+    item = model.item(0)
+    model.fetchMore(model.index(0, 0))
+    model.add_children(1, 0, 3, [['0', None, "'x'"], ['1', 'dict', 1]])
+    assert item.rowCount() == 3
+    assert item.child(0, 1).text() == "'x'"
+    assert item.child(1).path == [0, 'a', 1]
+    more = item.child(2)
+    assert more.more
+    assert more.text() == '(Click to show 1 more items.)'
+    # Clicking the "more" row fetches the next page.
+    model.load_more(model.indexFromItem(item.child(2, 1)))
+    model.on_fetch.emit.assert_called_with(2, [0, 'a'], 2)
+    assert more.text() == '(Loading...)'
+    model.load_more(model.indexFromItem(more))
+    assert model.on_fetch.emit.call_count == 2
+    model.add_children(2, 2, 3, [['2', None, '3']])
+    assert item.rowCount() == 3
+    assert item.child(2, 1).text() == '3'
+    assert not item.child(2).more
+    # Clicking other rows does nothing.
+    model.load_more(model.indexFromItem(item.child(0)))
+    assert model.on_fetch.emit.call_count == 2
+
+
+def test_DebugInspectorModel_fetch_value():
+    """
+    Double clicking a value that isn't a list or dict fetches its full repr,
+    which replaces the bounded repr.
+    """
+    model = mu.interface.panes.DebugInspectorModel()
+    model.on_fetch_value = mock.MagicMock()
+    root = model.invisibleRootItem()
+    model.append_variable(root, 'a', [0, 'a'], 'list', 0)
+    model.append_variable(root, 'd', [0, 'd'], None, "'hel...")
+    model.fetch_value(model.index(0, 1))
+    assert model.on_fetch_value.emit.call_count == 0
+    model.fetch_value(model.index(1, 1))
+    model.on_fetch_value.emit.assert_called_once_with(1, [0, 'd'])
+    model.set_value(1, "'hello'")
+    assert model.item(1, 1).text() == "'hello'"
+    # Unknown requests are ignored.
+    model.set_value(2, "'world'")
+    assert model.item(1, 1).text() == "'hello'"
+
+
+def test_DebugInspectorModel_add_children_stale_request():
+    """
+    Pages for requests made before the stack changed are ignored.
+    """
+    model = mu.interface.panes.DebugInspectorModel()
+    model.on_fetch = mock.MagicMock()
+    root = model.invisibleRootItem()
+    model.append_variable(root, 'a', [0, 'a'], 'list', 3)
+    model.fetchMore(model.index(0, 0))
+    model.clear()
+    assert model.pending == {}
+    model.add_children(1, 0, 3, [['0', None, "'x'"]])
+    assert model.rowCount() == 0
+
+
 def test_DebugInspector_set_font_size():
     """
     Check the correct stylesheet values are being set.
@@ -3,12 +3,106 @@
 Tests for the BaseMode class.
 """
 import os
+import hashlib
+import zlib
 import mu
 import pytest
-from mu.modes.base import BaseMode, MicroPythonMode, FileManager
+from mu.modes.base import (BaseMode, MicroPythonMode, FileManager,
+                           mounted_volumes, parse_mountinfo,
+                           read_mount_command)
 from unittest import mock
 
 
+MOUNTINFO = (b'22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw\n'
+             b'98 22 8:17 / /media/ntoll/CIRCUITPY rw,nosuid shared:50 - '
+             b'vfat /dev/sdb rw\n')
+
+
+def test_mounted_volumes_not_posix():
+    """
+    There's no mount table on Windows, so return None.
+    """
+    with mock.patch('mu.modes.base.os.name', 'nt'):
+        assert mounted_volumes() is None
+
+
+def test_mounted_volumes_mountinfo(tmpdir):
+    """
+    On Linux, the mount table is read and cached until the kernel signals it
+    has changed.
+    """
+    mountinfo = tmpdir.join('mountinfo')
+    mountinfo.write_binary(MOUNTINFO)
+    mock_poller = mock.MagicMock()
+    mock_poller.poll.return_value = []
+    with mock.patch.dict('mu.modes.base._MOUNTS', clear=True), \
+            mock.patch('mu.modes.base.MOUNTINFO', str(mountinfo)), \
+            mock.patch('mu.modes.base.select.poll',
+                       return_value=mock_poller):
+        volumes = mounted_volumes()
+        assert volumes == ['/', '/media/ntoll/CIRCUITPY']
+        assert mock_poller.register.call_count == 1
+        # Unchanged, so the cached volumes are returned.
+        assert mounted_volumes() is volumes
+        mock_poller.poll.assert_called_once_with(0)
+        # Something was unmounted.
+        mountinfo.write_binary(MOUNTINFO.splitlines(True)[0])
+        mock_poller.poll.return_value = [(3, 10)]
+        assert mounted_volumes() == ['/', ]
+        assert mock_poller.register.call_count == 1
+        mu.modes.base._MOUNTS['mountinfo'].close()
+
+
+def test_mounted_volumes_no_mountinfo():
+    """
+    If there's no Linux mount table (e.g. on OSX), use the mount command.
+    """
+    with mock.patch.dict('mu.modes.base._MOUNTS', clear=True), \
+            mock.patch('mu.modes.base.os.name', 'posix'), \
+            mock.patch('mu.modes.base.MOUNTINFO', '/does/not/exist'), \
+            mock.patch('mu.modes.base.read_mount_command',
+                       return_value=['/']):
+        assert mounted_volumes() == ['/']
+        assert mu.modes.base._MOUNTS == {}
+
+
+def test_parse_mountinfo():
+    """
+    Ensure mount points, including those with escaped spaces, are found.
+    """
+    mountinfo = MOUNTINFO + (b'99 22 8:33 / /Volumes/MICROBIT\\0401 rw - '
+                             b'vfat /dev/sdc rw\n\n')
+    assert parse_mountinfo(mountinfo) == ['/', '/media/ntoll/CIRCUITPY',
+                                          '/Volumes/MICROBIT 1']
+
+
+def test_read_mount_command():
+    """
+    Ensure the mount points are extracted from the output of "mount".
+    """
+    with open('tests/modes/mount_exists.txt', 'rb') as fixture_file:
+        fixture = fixture_file.read()
+    with mock.patch('mu.modes.base.check_output', return_value=fixture):
+        volumes = read_mount_command()
+    assert '/media/ntoll/CIRCUITPY' in volumes
+    assert '/sys' in volumes
+
+
+def test_read_mount_command_no_mount_command():
+    """
+    When the user doesn't have administrative privileges on OSX then the mount
+    command isn't on their path. In which case, check Mu uses the more
+    explicit /sbin/mount instead.
+    """
+    fixture = b'/dev/disk2 on /Volumes/CIRCUITPY (msdos, local)\n'
+    mock_check = mock.MagicMock(side_effect=[FileNotFoundError, fixture])
+    with mock.patch('mu.modes.base.check_output', mock_check):
+        assert read_mount_command() == ['/Volumes/CIRCUITPY']
+    assert mock_check.call_count == 2
+    assert mock_check.call_args_list[0][0][0] == 'mount'
+    assert mock_check.call_args_list[1][0][0] == '/sbin/mount'
+
+
 def test_base_mode():
     """
     Sanity check for the parent class of all modes.
@@ -189,6 +283,92 @@ def test_base_mode_open_file():
     assert bm.open_file('unused/path') is None
 
 
+def test_base_mode_process_pool_args():
+    """
+    By default, modes don't start Python processes in advance.
+    """
+    bm = BaseMode(mock.MagicMock(), mock.MagicMock())
+    assert bm.process_pool_args() is None
+    bm.start_process_pool()
+    assert bm.process_pool is None
+    assert bm.claim_process() is None
+
+
+def test_base_mode_start_process_pool():
+    """
+    Ensure processes are started in advance with the mode's arguments, and
+    the same pool is kept while they still match.
+    """
+    editor = mock.MagicMock()
+    editor.envars = [['name', 'value']]
+    bm = BaseMode(editor, mock.MagicMock())
+    bm.process_pool_args = mock.MagicMock(return_value=['runner.py', ])
+    mock_pool = mock.MagicMock()
+    mock_pool.args = ['runner.py', ]
+    mock_pool.matches.return_value = True
+    mock_pool_class = mock.MagicMock(return_value=mock_pool)
+    with mock.patch('mu.modes.base.ProcessPool', mock_pool_class):
+        bm.start_process_pool()
+        bm.start_process_pool()
+    mock_pool_class.assert_called_once_with(['runner.py', ], editor.envars,
+                                            bm.process_pool_size)
+    assert bm.process_pool == mock_pool
+    assert mock_pool.fill.call_count == 2
+    assert mock_pool.stop.call_count == 0
+
+
+def test_base_mode_start_process_pool_changed():
+    """
+    If the arguments or environment variables have changed, the processes
+    started in advance are replaced.
+    """
+    editor = mock.MagicMock()
+    bm = BaseMode(editor, mock.MagicMock())
+    bm.process_pool_args = mock.MagicMock(return_value=['runner.py', ])
+    old_pool = mock.MagicMock()
+    old_pool.args = ['runner.py', ]
+    old_pool.matches.return_value = False
+    bm.process_pool = old_pool
+    new_pool = mock.MagicMock()
+    with mock.patch('mu.modes.base.ProcessPool', return_value=new_pool):
+        bm.start_process_pool()
+    old_pool.stop.assert_called_once_with()
+    assert bm.process_pool == new_pool
+    new_pool.fill.assert_called_once_with()
+    # Turning the pool off stops it.
+    bm.process_pool_args.return_value = None
+    bm.start_process_pool()
+    new_pool.stop.assert_called_once_with()
+    assert bm.process_pool is None
+
+
+def test_base_mode_stop_process_pool():
+    """
+    Ensure the processes started in advance are stopped.
+    """
+    bm = BaseMode(mock.MagicMock(), mock.MagicMock())
+    mock_pool = mock.MagicMock()
+    bm.process_pool = mock_pool
+    bm.stop_process_pool()
+    mock_pool.stop.assert_called_once_with()
+    assert bm.process_pool is None
+    bm.stop_process_pool()  # Nothing to stop.
+
+
+def test_base_mode_claim_process():
+    """
+    Ensure a process is claimed from the pool with the current environment
+    variables.
+    """
+    editor = mock.MagicMock()
+    editor.envars = [['name', 'value']]
+    bm = BaseMode(editor, mock.MagicMock())
+    bm.process_pool = mock.MagicMock()
+    bm.process_pool.claim.return_value = ('process', 'ready')
+    assert bm.claim_process() == ('process', 'ready')
+    bm.process_pool.claim.assert_called_once_with(editor.envars)
+
+
 def test_micropython_mode_find_device():
     """
     Ensure it's possible to detect a device and return the expected port.
@@ -241,6 +421,31 @@ def test_micropython_mode_find_device_but_no_device():
         assert mm.find_device() == (None, None)
 
 
+def test_micropython_mode_find_devices():
+    """
+    Ensure all the connected valid devices are returned, ignoring others.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    mm = MicroPythonMode(editor, view)
+    mm.valid_boards = [(0x0D28, 0x0204)]
+    ports = []
+    for name, vid, pid in (('COM0', 0x0D28, 0x0204), ('COM1', 999, 666),
+                           ('COM2', 0x0D28, 0x0204)):
+        mock_port = mock.MagicMock()
+        mock_port.productIdentifier = mock.MagicMock(return_value=pid)
+        mock_port.vendorIdentifier = mock.MagicMock(return_value=vid)
+        mock_port.portName = mock.MagicMock(return_value=name)
+        mock_port.serialNumber = mock.MagicMock(return_value=name + '123')
+        ports.append(mock_port)
+    mock_os = mock.MagicMock()
+    mock_os.name = 'nt'
+    with mock.patch('mu.modes.base.QSerialPortInfo.availablePorts',
+                    return_value=ports), \
+            mock.patch('mu.modes.base.os', mock_os):
+        assert mm.find_devices() == [('COM0', 'COM0123'), ('COM2', 'COM2123')]
+
+
 def test_micropython_mode_port_path_posix():
     """
     Ensure the correct path for a port_name is returned if the platform is
@@ -647,3 +852,280 @@ def test_FileManager_delete_fail():
                     side_effect=Exception('boom')):
         fm.delete('foo.py')
     fm.on_delete_fail.emit.assert_called_once_with('foo.py')
+
+
+def test_FileManager_put_files(tmpdir):
+    """
+    Files and directories are queued and copied over a single raw REPL
+    session, with progress emitted after each file and the device filenames
+    emitted once everything is done.
+    """
+    project = tmpdir.mkdir('project')
+    project.join('code.py').write('print(1)')
+    lib = project.mkdir('lib')
+    lib.join('a.py').write('a = 1')
+    fm = FileManager("/dev/ttyUSB0")
+    fm.serial = mock.MagicMock()
+    fm.on_put_files = mock.MagicMock()
+    fm.on_transfer_progress = mock.MagicMock()
+    mock_send = mock.MagicMock(side_effect=[(b'True\r\n', b'')] +
+                               [(b'', b'')] * 3)
+    with mock.patch('mu.modes.base.microfs.raw_on') as mock_raw_on, \
+            mock.patch('mu.modes.base.microfs.raw_off') as mock_raw_off, \
+            mock.patch('mu.modes.base.microfs.send_commands', mock_send):
+        fm.put_files([str(project.join('code.py')), str(lib)])
+    mock_raw_on.assert_called_once_with(fm.serial)
+    mock_raw_off.assert_called_once_with(fm.serial)
+    # The check for directories, one file, one mkdir and one file in the
+    # directory.
+    assert mock_send.call_count == 4
+    assert mock_send.call_args_list[0][0][0] == mu.modes.base.microfs.\
+        DIRS_COMMANDS
+    assert "os.mkdir('lib')" in mock_send.call_args_list[2][0][0][0]
+    assert "open('lib/a.py', 'wb')" in mock_send.call_args_list[3][0][0][0]
+    fm.on_put_files.emit.assert_called_once_with(('code.py', 'lib/a.py'))
+    assert fm.on_transfer_progress.emit.call_count == 2
+    done, total, transferred, rate = \
+        fm.on_transfer_progress.emit.call_args[0]
+    assert (done, total, transferred) == (2, 2, 13)
+
+
+def test_FileManager_put_files_no_dirs(tmpdir):
+    """
+    On a device without directories (such as the micro:bit) no directory is
+    created and the files in a directory are put at the top level.
+    """
+    lib = tmpdir.mkdir('lib')
+    lib.join('a.py').write('a = 1')
+    fm = FileManager("/dev/ttyUSB0")
+    fm.serial = mock.MagicMock()
+    fm.on_put_files = mock.MagicMock()
+    fm.on_put_files_fail = mock.MagicMock()
+    mock_send = mock.MagicMock(side_effect=[(b'False\r\n', b''),
+                                            (b'', b'')])
+    with mock.patch('mu.modes.base.microfs.raw_on'), \
+            mock.patch('mu.modes.base.microfs.raw_off'), \
+            mock.patch('mu.modes.base.microfs.send_commands', mock_send):
+        fm.put_files([str(lib)])
+    assert mock_send.call_count == 2
+    assert "open('a.py', 'wb')" in mock_send.call_args_list[1][0][0][0]
+    fm.on_put_files.emit.assert_called_once_with(('lib/a.py', ))
+    assert fm.on_put_files_fail.emit.call_count == 0
+
+
+def test_FileManager_put_files_no_dirs_clash(tmpdir):
+    """
+    On a device without directories, files of the same name from different
+    directories fail rather than overwrite each other.
+    """
+    lib = tmpdir.mkdir('lib')
+    lib.mkdir('a').join('x.py').write('a')
+    lib.mkdir('b').join('x.py').write('b')
+    fm = FileManager("/dev/ttyUSB0")
+    fm.serial = mock.MagicMock()
+    fm.on_put_files = mock.MagicMock()
+    fm.on_put_files_fail = mock.MagicMock()
+    mock_send = mock.MagicMock(side_effect=[(b'False\r\n', b''),
+                                            (b'', b'')])
+    with mock.patch('mu.modes.base.microfs.raw_on'), \
+            mock.patch('mu.modes.base.microfs.raw_off'), \
+            mock.patch('mu.modes.base.microfs.send_commands', mock_send):
+        fm.put_files([str(lib)])
+    # Only the directory check and the first x.py.
+    assert mock_send.call_count == 2
+    assert "open('x.py', 'wb')" in mock_send.call_args_list[1][0][0][0]
+    fm.on_put_files.emit.assert_called_once_with(('lib/a/x.py', ))
+    fm.on_put_files_fail.emit.assert_called_once_with(('lib/b/x.py', ))
+
+
+def test_FileManager_put_files_fail(tmpdir):
+    """
+    Files that fail to copy are reported once, together, and the rest of the
+    queue is still transferred.
+    """
+    tmpdir.join('a.py').write('a')
+    tmpdir.join('b.py').write('b')
+    tmpdir.join('c.py').write('c')
+    fm = FileManager("/dev/ttyUSB0")
+    fm.serial = mock.MagicMock()
+    fm.on_put_files = mock.MagicMock()
+    fm.on_put_files_fail = mock.MagicMock()
+    mock_send = mock.MagicMock(side_effect=[(b'', b'Error\r\nOSError\r\n'),
+                                            (b'', b''),
+                                            (b'', b'Error\r\nOSError\r\n')])
+    with mock.patch('mu.modes.base.microfs.raw_on'), \
+            mock.patch('mu.modes.base.microfs.raw_off'), \
+            mock.patch('mu.modes.base.microfs.send_commands', mock_send):
+        fm.put_files([str(tmpdir.join(name))
+                      for name in ('a.py', 'b.py', 'c.py')])
+    fm.on_put_files_fail.emit.assert_called_once_with(('a.py', 'c.py'))
+    fm.on_put_files.emit.assert_called_once_with(('b.py', ))
+
+
+def test_FileManager_put_files_raw_on_fail(tmpdir):
+    """
+    If the device can't enter raw mode every file in the queue fails, and is
+    reported once.
+    """
+    tmpdir.join('a.py').write('a')
+    tmpdir.join('b.py').write('b')
+    fm = FileManager("/dev/ttyUSB0")
+    fm.serial = mock.MagicMock()
+    fm.on_put_files = mock.MagicMock()
+    fm.on_put_files_fail = mock.MagicMock()
+    with mock.patch('mu.modes.base.microfs.raw_on',
+                    side_effect=IOError('boom')):
+        fm.put_files([str(tmpdir.join('a.py')), str(tmpdir.join('b.py'))])
+    fm.on_put_files_fail.emit.assert_called_once_with(('a.py', 'b.py'))
+    fm.on_put_files.emit.assert_called_once_with(())
+
+
+def test_FileManager_get_files(tmpdir):
+    """
+    Several device files are got over a single raw REPL session and written
+    to their local filenames.
+    """
+    fm = FileManager("/dev/ttyUSB0")
+    fm.serial = mock.MagicMock()
+    fm.on_get_files = mock.MagicMock()
+    fm.on_transfer_progress = mock.MagicMock()
+    mock_send = mock.MagicMock(side_effect=[(b'foo', b''), (b'barbaz', b'')])
+    local_foo = str(tmpdir.join('foo.py'))
+    local_bar = str(tmpdir.join('bar.py'))
+    with mock.patch('mu.modes.base.microfs.raw_on') as mock_raw_on, \
+            mock.patch('mu.modes.base.microfs.raw_off'), \
+            mock.patch('mu.modes.base.microfs.send_commands', mock_send):
+        fm.get_files([['foo.py', local_foo], ['bar.py', local_bar]])
+    mock_raw_on.assert_called_once_with(fm.serial)
+    assert tmpdir.join('foo.py').read() == 'foo'
+    assert tmpdir.join('bar.py').read() == 'barbaz'
+    fm.on_get_files.emit.assert_called_once_with(('foo.py', 'bar.py'))
+    assert fm.on_transfer_progress.emit.call_args[0][:3] == (2, 2, 9)
+
+
+def test_FileManager_cancel(tmpdir):
+    """
+    Cancelling stops the queue after the file currently being copied.
+    """
+    tmpdir.join('a.py').write('a')
+    tmpdir.join('b.py').write('b')
+    fm = FileManager("/dev/ttyUSB0")
+    fm.serial = mock.MagicMock()
+    fm.on_put_files = mock.MagicMock()
+
+    def send(commands, serial):
+        fm.cancel()
+        return (b'', b'')
+
+    with mock.patch('mu.modes.base.microfs.raw_on'), \
+            mock.patch('mu.modes.base.microfs.raw_off') as mock_raw_off, \
+            mock.patch('mu.modes.base.microfs.send_commands', send):
+        fm.put_files([str(tmpdir.join('a.py')), str(tmpdir.join('b.py'))])
+    fm.on_put_files.emit.assert_called_once_with(('a.py', ))
+    mock_raw_off.assert_called_once_with(fm.serial)
+
+
+def test_FileManager_sync(tmpdir):
+    """
+    Only files whose size or device computed digest differ from the local
+    copy are put onto the device.
+    """
+    tmpdir.join('same.py').write('same')
+    tmpdir.join('changed.py').write('changed')
+    tmpdir.join('new.py').write('new')
+    fm = FileManager("/dev/ttyUSB0")
+    fm.serial = mock.MagicMock()
+    fm.on_sync_files = mock.MagicMock()
+    listing = repr(('sha256', [
+        ('same.py', 4, hashlib.sha256(b'same').digest()),
+        ('changed.py', 7, hashlib.sha256(b'CHANGED').digest()),
+    ])).encode('utf-8')
+    mock_send = mock.MagicMock(side_effect=[(listing, b''), (b'', b''),
+                                            (b'', b'')])
+    paths = [str(tmpdir.join(name))
+             for name in ('same.py', 'changed.py', 'new.py')]
+    with mock.patch('mu.modes.base.microfs.raw_on'), \
+            mock.patch('mu.modes.base.microfs.raw_off'), \
+            mock.patch('mu.modes.base.microfs.send_commands', mock_send):
+        fm.sync(paths)
+    assert mock_send.call_count == 3
+    assert "open('changed.py', 'wb')" in mock_send.call_args_list[1][0][0][0]
+    assert "open('new.py', 'wb')" in mock_send.call_args_list[2][0][0][0]
+    fm.on_sync_files.emit.assert_called_once_with(('changed.py', 'new.py'),
+                                                  ('same.py', ))
+
+
+def test_FileManager_sync_blocks(tmpdir):
+    """
+    With a block size, a changed file of the same size only has its changed
+    blocks rewritten in place.
+    """
+    old = b'a' * 64 + b'b' * 64
+    new = b'a' * 64 + b'c' * 64
+    tmpdir.join('big.bin').write_binary(new)
+    fm = FileManager("/dev/ttyUSB0")
+    fm.serial = mock.MagicMock()
+    fm.on_sync_files = mock.MagicMock()
+    fm.on_transfer_progress = mock.MagicMock()
+    listing = repr(('adler32', [
+        ('big.bin', 128, zlib.adler32(old)),
+    ])).encode('utf-8')
+    blocks = repr([zlib.adler32(old[:64]),
+                   zlib.adler32(old[64:])]).encode('utf-8')
+    mock_send = mock.MagicMock(side_effect=[(listing, b''), (blocks, b''),
+                                            (b'', b'')])
+    with mock.patch('mu.modes.base.microfs.raw_on'), \
+            mock.patch('mu.modes.base.microfs.raw_off'), \
+            mock.patch('mu.modes.base.microfs.send_commands', mock_send):
+        fm.sync([str(tmpdir.join('big.bin'))], block_size=64)
+    patch = mock_send.call_args_list[2][0][0]
+    assert patch[0] == "fd = open('big.bin', 'r+b')"
+    assert patch[2] == 'fd.seek(64)'
+    assert len(patch) == 5
+    fm.on_sync_files.emit.assert_called_once_with(('big.bin', ), ())
+    assert fm.on_transfer_progress.emit.call_args[0][2] == 64
+
+
+def test_FileManager_sync_no_dirs(tmpdir):
+    """
+    On a device without directories the files in a directory are compared
+    with, and put at, the top level.
+    """
+    lib = tmpdir.mkdir('lib')
+    lib.join('same.py').write('same')
+    lib.join('new.py').write('new')
+    fm = FileManager("/dev/ttyUSB0")
+    fm.serial = mock.MagicMock()
+    fm.on_sync_files = mock.MagicMock()
+    listing = repr(('adler32', [
+        ('same.py', 4, zlib.adler32(b'same')),
+    ])).encode('utf-8')
+    mock_send = mock.MagicMock(side_effect=[(b'False\r\n', b''),
+                                            (listing, b''), (b'', b'')])
+    with mock.patch('mu.modes.base.microfs.raw_on'), \
+            mock.patch('mu.modes.base.microfs.raw_off'), \
+            mock.patch('mu.modes.base.microfs.send_commands', mock_send):
+        fm.sync([str(lib)])
+    assert mock_send.call_count == 3
+    assert "open('new.py', 'wb')" in mock_send.call_args_list[2][0][0][0]
+    fm.on_sync_files.emit.assert_called_once_with(('lib/new.py', ),
+                                                  ('lib/same.py', ))
+
+
+def test_FileManager_sync_listing_fail(tmpdir):
+    """
+    If the device can't list its files every file in the sync fails.
+    """
+    tmpdir.join('a.py').write('a')
+    fm = FileManager("/dev/ttyUSB0")
+    fm.serial = mock.MagicMock()
+    fm.on_sync_files = mock.MagicMock()
+    fm.on_put_files_fail = mock.MagicMock()
+    mock_send = mock.MagicMock(return_value=(b'', b'Error\r\nOSError\r\n'))
+    with mock.patch('mu.modes.base.microfs.raw_on'), \
+            mock.patch('mu.modes.base.microfs.raw_off') as mock_raw_off, \
+            mock.patch('mu.modes.base.microfs.send_commands', mock_send):
+        fm.sync([str(tmpdir.join('a.py'))])
+    fm.on_put_files_fail.emit.assert_called_once_with(('a.py', ))
+    fm.on_sync_files.emit.assert_called_once_with((), ())
+    mock_raw_off.assert_called_once_with(fm.serial)
@@ -2,7 +2,8 @@
 """
 Tests for the debug mode.
 """
-from mu.logic import DEBUGGER_PORT
+import os
+import mu
 from mu.modes.debugger import DebugMode
 from unittest import mock
 
@@ -40,7 +41,9 @@ def test_debug_mode():
 
 def test_debug_start():
     """
-    Ensure the handling of starting the debugger works as expected.
+    Ensure the handling of starting the debugger works as expected: a debug
+    runner is claimed from the pool and the debugger connects to the port
+    it's listening on.
     """
     editor = mock.MagicMock()
     editor.envars = [['name', 'value'], ]
@@ -51,18 +54,29 @@ def test_debug_start():
     view.add_python3_runner.return_value = mock_runner
     mock_debugger = mock.MagicMock()
     mock_debugger_class = mock.MagicMock(return_value=mock_debugger)
+    mock_process = mock.MagicMock()
     dm = DebugMode(editor, view)
+    dm.start_process_pool = mock.MagicMock()
+    dm.process_pool = mock.MagicMock()
+    dm.claim_runner = mock.MagicMock(return_value=(mock_process, 1234))
     with mock.patch('mu.modes.debugger.Debugger', mock_debugger_class):
         dm.start()
     editor.save_tab_to_file.called_once_with(view.current_tab)
+    dm.start_process_pool.assert_called_once_with()
+    dm.claim_runner.assert_called_once_with()
     view.add_python3_runner.assert_called_once_with('/foo/bar', '/foo',
                                                     debugger=True,
-                                                    envars=[['name', 'value']])
-    mock_runner.process.waitForStarted.assert_called_once_with()
+                                                    envars=[['name', 'value']],
+                                                    process=mock_process)
+    assert mock_runner.process.waitForStarted.call_count == 0
     mock_runner.process.finished.connect.assert_called_once_with(dm.finished)
     view.add_debug_inspector.assert_called_once_with()
+    view.debug_model.on_fetch.connect.assert_called_once_with(
+        dm.debug_fetch_children)
+    view.debug_model.on_fetch_value.connect.assert_called_once_with(
+        dm.debug_fetch_value)
     view.set_read_only.assert_called_once_with(True)
-    mock_debugger_class.assert_called_once_with('localhost', DEBUGGER_PORT,
+    mock_debugger_class.assert_called_once_with('localhost', 1234,
                                                 proc=mock_runner.process)
     assert dm.runner == mock_runner
     assert dm.debugger == mock_debugger
@@ -70,6 +84,187 @@ def test_debug_start():
     mock_debugger.start.assert_called_once_with()
 
 
+def test_debug_start_without_pool():
+    """
+    If debug runners can't be started in advance, a new debug runner is
+    started the way Mu always has. The debugger connects once the runner
+    reports the port it's listening on, and not before.
+    """
+    editor = mock.MagicMock()
+    editor.envars = []
+    view = mock.MagicMock()
+    view.current_tab.path = '/foo/bar'
+    view.current_tab.isModified.return_value = False
+    mock_runner = mock.MagicMock()
+    view.add_python3_runner.return_value = mock_runner
+    mock_debugger_class = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.start_process_pool = mock.MagicMock()
+    dm.claim_runner = mock.MagicMock()
+    with mock.patch('mu.modes.debugger.Debugger', mock_debugger_class):
+        dm.start()
+    assert dm.claim_runner.call_count == 0
+    view.add_python3_runner.assert_called_once_with('/foo/bar', '/foo',
+                                                    debugger=True,
+                                                    envars=[],
+                                                    process=None)
+    mock_debugger_class.assert_called_once_with(
+        'localhost', None, proc=mock_runner.process)
+    mock_debugger = mock_debugger_class.return_value
+    assert mock_debugger.start.call_count == 0
+    assert dm.runner == mock_runner
+    mock_runner.process_ready.connect.assert_called_once_with(
+        dm.runner_listening)
+    dm.runner_listening('4321')
+    assert mock_debugger.port == 4321
+    mock_debugger.start.assert_called_once_with()
+
+
+def test_debug_runner_listening_unexpected():
+    """
+    A new debug runner that reports something other than its port is killed,
+    without connecting to it.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.runner = mock.MagicMock()
+    dm.debugger = mock.MagicMock()
+    dm.runner_listening('nonsense')
+    dm.runner.process.kill.assert_called_once_with()
+    assert dm.debugger.start.call_count == 0
+
+
+def test_debug_start_wait_for_runner():
+    """
+    If no debug runner is ready yet, wait for one without blocking.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    view.current_tab.path = '/foo/bar'
+    view.current_tab.isModified.return_value = False
+    dm = DebugMode(editor, view)
+    dm.start_process_pool = mock.MagicMock()
+    dm.process_pool = mock.MagicMock()
+    dm.start_runner = mock.MagicMock(return_value=False)
+    dm.wait_for_runner = mock.MagicMock()
+    dm.start()
+    dm.start_runner.assert_called_once_with('/foo/bar')
+    dm.wait_for_runner.assert_called_once_with('/foo/bar')
+
+
+def test_debug_start_runner_not_ready():
+    """
+    Nothing is started if no debug runner is ready.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.claim_runner = mock.MagicMock(return_value=(None, None))
+    assert dm.start_runner('/foo/bar') is False
+    assert view.add_python3_runner.call_count == 0
+    assert dm.runner is None
+
+
+def test_debug_wait_for_runner():
+    """
+    Wait for a debug runner to be ready, or to fail, for a limited time, with
+    only the Stop button enabled.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    view.button_bar.slots = {
+        'stop': mock.MagicMock(),
+        'run': mock.MagicMock(),
+    }
+    dm = DebugMode(editor, view)
+    dm.process_pool = mock.MagicMock()
+    mock_timer = mock.MagicMock()
+    with mock.patch('mu.modes.debugger.QTimer', return_value=mock_timer):
+        dm.wait_for_runner('/foo/bar')
+    assert dm.script == '/foo/bar'
+    dm.process_pool.process_ready.connect.assert_called_once_with(
+        dm.runner_ready)
+    dm.process_pool.process_failed.connect.assert_called_once_with(
+        dm.runner_failed)
+    mock_timer.timeout.connect.assert_called_once_with(dm.runner_timed_out)
+    mock_timer.start.assert_called_once_with(dm.runner_timeout)
+    assert view.button_bar.slots['stop'].setEnabled.call_count == 0
+    view.button_bar.slots['run'].setEnabled.assert_called_once_with(False)
+    # Once a runner is ready, it's used to debug the script.
+    dm.start_runner = mock.MagicMock()
+    dm.runner_ready()
+    dm.start_runner.assert_called_once_with('/foo/bar')
+
+
+def test_debug_stop_waiting():
+    """
+    Stop listening to the pool and cancel the time limit when no longer
+    waiting for a debug runner.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.stop_waiting()  # Not waiting, so nothing to do.
+    mock_pool = mock.MagicMock()
+    mock_timer = mock.MagicMock()
+    dm.process_pool = mock_pool
+    dm.runner_timer = mock_timer
+    dm.script = '/foo/bar'
+    dm.stop_waiting()
+    mock_timer.stop.assert_called_once_with()
+    assert dm.runner_timer is None
+    assert dm.script is None
+    mock_pool.process_ready.disconnect.assert_called_once_with(
+        dm.runner_ready)
+    mock_pool.process_failed.disconnect.assert_called_once_with(
+        dm.runner_failed)
+
+
+def test_debug_runner_failed():
+    """
+    If the debug runner stops while starting up, a new debug runner is
+    started for the script instead.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.script = '/foo/bar'
+    dm.start_cold_runner = mock.MagicMock()
+    dm.runner_failed()
+    dm.start_cold_runner.assert_called_once_with('/foo/bar')
+    assert view.show_message.call_count == 0
+
+
+def test_debug_runner_timed_out():
+    """
+    If no debug runner is ready in time, a new debug runner is started for
+    the script instead.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.script = '/foo/bar'
+    dm.start_cold_runner = mock.MagicMock()
+    dm.runner_timed_out()
+    dm.start_cold_runner.assert_called_once_with('/foo/bar')
+    assert view.show_message.call_count == 0
+
+
+def test_debug_start_cold_runner():
+    """
+    Starting a new debug runner stops waiting for one from the pool.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.stop_waiting = mock.MagicMock()
+    dm.start_session = mock.MagicMock()
+    dm.start_cold_runner('/foo/bar')
+    dm.stop_waiting.assert_called_once_with()
+    dm.start_session.assert_called_once_with('/foo/bar')
+
+
 def test_debug_start_no_tab():
     """
     If there's no active tab, there can be no runner either.
@@ -98,20 +293,132 @@ def test_debug_start_prompt_for_unsaved_file():
     dm.stop.assert_called_once_with()
 
 
+def test_debug_process_pool_args():
+    """
+    Debug runners are started in advance, waiting for the script to debug.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    mu_dir = os.path.dirname(os.path.abspath(mu.__file__))
+    runner = os.path.join(mu_dir, 'mu-debug.py')
+    with mock.patch('mu.modes.debugger.sys.platform', 'linux'):
+        assert dm.process_pool_args() == [runner, '--warm']
+
+
+def test_debug_process_pool_args_pythonw():
+    """
+    On Windows, with Mu run by pythonw.exe, debug runners aren't started in
+    advance, since only a new runner has its Python paths set up.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    with mock.patch('mu.modes.debugger.sys.platform', 'win32'), \
+            mock.patch('mu.modes.debugger.sys.executable',
+                       'C:\\Mu\\pythonw.exe'):
+        assert dm.process_pool_args() is None
+
+
+def test_debug_claim_runner():
+    """
+    A ready debug runner is claimed from the pool along with the port it
+    reported.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    mock_process = mock.MagicMock()
+    dm.claim_process = mock.MagicMock(return_value=(mock_process, '1234'))
+    assert dm.claim_runner() == (mock_process, 1234)
+    dm.claim_process.assert_called_once_with()
+
+
+def test_debug_claim_runner_none_ready():
+    """
+    If no runner is ready, there's nothing to claim.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.claim_process = mock.MagicMock(return_value=None)
+    assert dm.claim_runner() == (None, None)
+
+
+def test_debug_claim_runner_bad_output():
+    """
+    If the runner didn't report a port, it's killed.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    mock_process = mock.MagicMock()
+    dm.claim_process = mock.MagicMock(return_value=(mock_process,
+                                                    'Traceback'))
+    assert dm.claim_runner() == (None, None)
+    mock_process.kill.assert_called_once_with()
+
+
 def test_debug_stop():
     """
-    Ensure the script runner is cleaned up properly.
+    Ensure the debug runner is asked to stop, without waiting for it, and
+    the buttons show it's stopping.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    view.button_bar.slots = {
+        'stop': mock.MagicMock(),
+        'run': mock.MagicMock(),
+    }
+    dm = DebugMode(editor, view)
+    dm.runner_stopped = mock.MagicMock()
+    mock_runner = mock.MagicMock()
+    mock_runner.stop_process.return_value = True
+    dm.runner = mock_runner
+    dm.stop()
+    mock_runner.stop_process.assert_called_once_with()
+    assert mock_runner.process.waitForFinished.call_count == 0
+    stop_slot = view.button_bar.slots['stop']
+    stop_slot.setText.assert_called_once_with('Stopping...')
+    stop_slot.setEnabled.assert_called_once_with(False)
+    view.button_bar.slots['run'].setEnabled.assert_called_once_with(False)
+    mock_runner.process.finished.connect.assert_called_once_with(
+        dm.runner_stopped)
+    assert dm.runner_stopped.call_count == 0
+
+
+def test_debug_stop_not_running():
+    """
+    If there's no debug runner still running, tidy up straight away.
     """
     editor = mock.MagicMock()
     view = mock.MagicMock()
     dm = DebugMode(editor, view)
+    dm.runner_stopped = mock.MagicMock()
+    dm.stop()
+    dm.runner_stopped.assert_called_once_with()
     mock_runner = mock.MagicMock()
+    mock_runner.stop_process.return_value = False
     dm.runner = mock_runner
     dm.stop()
+    assert dm.runner_stopped.call_count == 2
+
+
+def test_debug_runner_stopped():
+    """
+    Ensure the script runner is cleaned up properly.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.stop_waiting = mock.MagicMock()
+    mock_runner = mock.MagicMock()
+    dm.runner = mock_runner
+    dm.runner_stopped(0, 0)
+    dm.stop_waiting.assert_called_once_with()
     assert dm.runner is None
     assert dm.debugger is None
     mock_runner.process.kill.assert_called_once_with()
-    mock_runner.process.waitForFinished.assert_called_once_with()
     view.remove_python_runner.assert_called_once_with()
     view.remove_debug_inspector.assert_called_once_with()
     editor.change_mode.assert_called_once_with('python')
@@ -349,8 +656,26 @@ def test_debug_on_bootstrap():
     mock_tab.breakpoint_handles = set([0, ])
     mock_tab.markerLine.return_value = 0
     view.widgets = [mock_tab, ]
+    editor.debug_repr_limits = {}
     dm.debug_on_bootstrap()
     dm.debugger.create_breakpoint.assert_called_once_with(mock_tab.path, 1)
+    assert dm.debugger.set_repr_limits.call_count == 0
+    dm.debugger.do_run.assert_called_once_with()
+
+
+def test_debug_on_bootstrap_repr_limits():
+    """
+    Any limits on the size of reprs set by the user are sent to the debugger
+    before the script is run.
+    """
+    editor = mock.MagicMock()
+    editor.debug_repr_limits = {'maxlist': 20}
+    view = mock.MagicMock()
+    view.widgets = []
+    dm = DebugMode(editor, view)
+    dm.debugger = mock.MagicMock()
+    dm.debug_on_bootstrap()
+    dm.debugger.set_repr_limits.assert_called_once_with({'maxlist': 20})
     dm.debugger.do_run.assert_called_once_with()
 
 
@@ -562,12 +887,63 @@ def test_debug_on_stack():
     ]
     dm.debug_on_stack(stack)
     view.update_debug_inspector.assert_called_once_with({
-        'a': 'frame1',
-        'b': 'frame2',
-        'c': 'frame2',
+        'a': ([0, 'a'], 'frame1'),
+        'b': ([1, 'b'], 'frame2'),
+        'c': ([1, 'c'], 'frame2'),
     })
 
 
+def test_debug_fetch_children():
+    """
+    Requests for the children of a list or dict in the inspector are passed
+    to the debugger.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.debug_fetch_children(1, [0, 'foo'], 0)
+    dm.debugger = mock.MagicMock()
+    dm.debug_fetch_children(1, [0, 'foo'], 0)
+    dm.debugger.fetch_children.assert_called_once_with(1, [0, 'foo'], 0)
+
+
+def test_debug_fetch_value():
+    """
+    Requests for the full repr of a value in the inspector are passed to the
+    debugger.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.debug_fetch_value(1, [0, 'foo'])
+    dm.debugger = mock.MagicMock()
+    dm.debug_fetch_value(1, [0, 'foo'])
+    dm.debugger.fetch_value.assert_called_once_with(1, [0, 'foo'])
+
+
+def test_debug_on_value():
+    """
+    Full reprs sent by the debugger are passed to the view.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.debug_on_value(1, "'foo'")
+    view.update_debug_value.assert_called_once_with(1, "'foo'")
+
+
+def test_debug_on_children():
+    """
+    Pages of children sent by the debugger are passed to the view.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    dm = DebugMode(editor, view)
+    dm.debug_on_children(1, 0, 1, [['0', None, "'a'"]])
+    view.update_debug_children.assert_called_once_with(
+        1, 0, 1, [['0', None, "'a'"]])
+
+
 def test_debug_on_postmortem():
     """
     Ensure that the args and kwargs passed as a context for postmortem and
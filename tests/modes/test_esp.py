@@ -25,6 +25,21 @@ def test_ESPMode_init():
     assert esp_mode.icon == 'esp'
 
 
+def test_ESPMode_firmware(esp_mode):
+    """
+    ESP boards use generic USB/serial chips, so ensure only MicroPython on
+    an ESP8266 or ESP32 is recognised.
+    """
+    assert esp_mode.generic_boards == esp_mode.valid_boards
+    esp32 = ("MicroPython v1.10 on 2019-01-25; ESP32 module with ESP32\r\n"
+             "Type \"help()\" for more information.\r\n>>> ")
+    esp8266 = "MicroPython v1.11 on 2019-05-29; ESP module with ESP8266"
+    assert esp_mode.firmware.search(esp32)
+    assert esp_mode.firmware.search(esp8266)
+    assert not esp_mode.firmware.search("Adafruit CircuitPython 4.0.0")
+    assert not esp_mode.firmware.search("")
+
+
 def test_ESPMode_actions(esp_mode):
     """
     Sanity check for mode actions.
@@ -62,6 +77,7 @@ def test_add_fs(fm, qthread, esp_mode):
                                                          esp_mode.file_manager,
                                                          "ESP board")
     assert esp_mode.fs
+    assert esp_mode.fs.sync_block_size == esp_mode.editor.sync_block_size
 
 
 def test_add_fs_no_device(esp_mode):
@@ -6,11 +6,13 @@ import os
 import os.path
 import pytest
 from mu.logic import HOME_DIRECTORY
-from mu.modes.microbit import MicrobitMode, DeviceFlasher
+from mu.modes.microbit import (MicrobitMode, DeviceFlasher, runtime_hash,
+                               MultiDeviceFlasher, volume_serial_number)
 from mu.modes.api import MICROBIT_APIS, SHARED_APIS
-from mu.contrib import uflash
+from mu.contrib import uflash, microfs
 from unittest import mock
 from tokenize import TokenError
+from PyQt5.QtWidgets import QMessageBox
 
 
 TEST_ROOT = os.path.split(os.path.dirname(__file__))[0]
@@ -52,6 +54,117 @@ def test_DeviceFlasher_run_fail():
     df.on_flash_fail.emit.assert_called_once_with(str(Exception('Boom')))
 
 
+def test_volume_serial_number():
+    """
+    Ensure the serial number is read from the DETAILS.TXT file on the
+    micro:bit's volume.
+    """
+    unique_id = '9900000031864e45002c10140000006e0000000097969901'
+    details = ('# DAPLink Firmware - see https://mbed.com/daplink\n'
+               'Unique ID: {}\n'
+               'HIC ID: 97969901\n').format(unique_id)
+    mock_open = mock.mock_open(read_data=details)
+    with mock.patch('builtins.open', mock_open):
+        result = volume_serial_number('MICROBIT')
+    assert result == unique_id
+    assert mock_open.call_args[0][0] == os.path.join('MICROBIT',
+                                                     'DETAILS.TXT')
+
+
+def test_volume_serial_number_missing():
+    """
+    If there's no serial number to be found, return None.
+    """
+    mock_open = mock.mock_open(read_data='HIC ID: 97969901\n')
+    with mock.patch('builtins.open', mock_open):
+        assert volume_serial_number('MICROBIT') is None
+    with mock.patch('builtins.open', side_effect=OSError('Boom')):
+        assert volume_serial_number('MICROBIT') is None
+
+
+def test_MultiDeviceFlasher_run():
+    """
+    Ensure the hex file is built once and saved onto each mounted device,
+    while devices only reachable via their serial port have the script
+    copied onto them as main.py.
+    """
+    devices = [('/media/MICROBIT', 'COM0', '9900'),
+               ('/media/MICROBIT1', None, None),
+               (None, 'COM2', '9901')]
+    mdf = MultiDeviceFlasher(devices, b'script', None)
+    mdf.on_device_progress = mock.MagicMock()
+    mdf.on_device_fail = mock.MagicMock()
+    mock_serial = mock.MagicMock()
+    with mock.patch('mu.modes.microbit.uflash.hexlify',
+                    return_value='hex') as hexlify, \
+            mock.patch('mu.modes.microbit.uflash.embed_hex',
+                       return_value='combined') as embed_hex, \
+            mock.patch('mu.modes.microbit.uflash.save_hex') as save_hex, \
+            mock.patch('mu.modes.microbit.microfs.get_serial',
+                       return_value=mock_serial) as get_serial, \
+            mock.patch('mu.modes.microbit.microfs.execute',
+                       return_value=(b'', b'')) as execute:
+        mdf.run()
+    hexlify.assert_called_once_with(b'script')
+    embed_hex.assert_called_once_with(uflash._RUNTIME, 'hex')
+    assert save_hex.call_count == 2
+    for path in ('/media/MICROBIT', '/media/MICROBIT1'):
+        hex_path = os.path.join(path, 'micropython.hex')
+        save_hex.assert_any_call('combined', hex_path)
+    get_serial.assert_called_once_with('COM2')
+    commands = microfs.put_commands(b'script', 'main.py')
+    execute.assert_called_once_with(commands, mock_serial)
+    mock_serial.close.assert_called_once_with()
+    assert sorted(mdf.flashed, key=str) == sorted(devices, key=str)
+    assert mdf.on_device_progress.emit.call_count == 6
+    mdf.on_device_progress.emit.assert_any_call('COM2', 'Finished')
+    assert mdf.on_device_fail.emit.call_count == 0
+
+
+def test_MultiDeviceFlasher_run_device_fail():
+    """
+    A problem flashing one device is reported without stopping the others
+    from being flashed.
+    """
+    devices = [('/media/MICROBIT', None, None),
+               (None, 'COM2', '9901')]
+    mdf = MultiDeviceFlasher(devices, b'', '/foo/bar.hex')
+    mdf.on_device_progress = mock.MagicMock()
+    mdf.on_device_fail = mock.MagicMock()
+    mock_serial = mock.MagicMock()
+    with mock.patch('mu.modes.microbit.uflash.read_runtime',
+                    return_value='runtime') as read_runtime, \
+            mock.patch('mu.modes.microbit.uflash.save_hex',
+                       side_effect=IOError('Boom')), \
+            mock.patch('mu.modes.microbit.microfs.get_serial',
+                       return_value=mock_serial), \
+            mock.patch('mu.modes.microbit.microfs.execute',
+                       return_value=(b'', b'Traceback\r\nOSError: 28\r\n')):
+        mdf.run()
+    read_runtime.assert_called_once_with('/foo/bar.hex')
+    assert mdf.hex_file == 'runtime'
+    assert mdf.flashed == []
+    mdf.on_device_fail.emit.assert_any_call('/media/MICROBIT', 'Boom')
+    mdf.on_device_fail.emit.assert_any_call('COM2', 'OSError: 28')
+    mock_serial.close.assert_called_once_with()
+
+
+def test_MultiDeviceFlasher_run_hex_fail():
+    """
+    If the hex file can't be built, all the devices are reported as failed.
+    """
+    devices = [('/media/MICROBIT', None, None), (None, 'COM2', '9901')]
+    mdf = MultiDeviceFlasher(devices, b'script', None)
+    mdf.on_device_fail = mock.MagicMock()
+    with mock.patch('mu.modes.microbit.uflash.hexlify',
+                    side_effect=ValueError('Boom')), \
+            mock.patch('mu.modes.microbit.uflash.save_hex') as save_hex:
+        mdf.run()
+    assert save_hex.call_count == 0
+    mdf.on_device_fail.emit.assert_any_call('/media/MICROBIT', 'Boom')
+    mdf.on_device_fail.emit.assert_any_call('COM2', 'Boom')
+
+
 def test_microbit_mode():
     """
     Sanity check for setting up the mode.
@@ -121,8 +234,8 @@ def test_flash_with_attached_device_has_latest_firmware():
     }
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.modes.microbit.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.modes.microbit.microfs.version',
                        return_value=version_info),\
             mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
@@ -144,6 +257,109 @@ def test_flash_with_attached_device_has_latest_firmware():
         mm.copy_main.assert_called_once_with()
 
 
+def test_flash_with_attached_device_has_latest_firmware_caches_runtime():
+    """
+    If the device has the bundled runtime the hash of the runtime is cached
+    against the device's serial number.
+    """
+    version_info = {
+        'sysname': 'microbit',
+        'nodename': 'microbit',
+        'release': uflash.MICROPYTHON_VERSION,
+        'version': ("micro:bit v0.1.0-b'e10a5ff' on 2018-6-8; MicroPython "
+                    "v1.9.2-34-gd64154c73 on 2017-09-01"),
+        'machine': 'micro:bit with nRF51822',
+    }
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
+            mock.patch('mu.modes.microbit.microfs.version',
+                       return_value=version_info),\
+            mock.patch('mu.modes.microbit.os.path.exists', return_value=True):
+        view = mock.MagicMock()
+        view.current_tab.text = mock.MagicMock(return_value='foo')
+        editor = mock.MagicMock()
+        editor.minify = False
+        editor.microbit_runtime = ''
+        editor.flashed_runtimes = {}
+        mm = MicrobitMode(editor, view)
+        mm.find_device = mock.MagicMock(return_value=('bar', '990012345'))
+        mm.copy_main = mock.MagicMock()
+        mm.flash()
+    assert editor.flashed_runtimes == {'990012345': runtime_hash()}
+    mm.copy_main.assert_called_once_with()
+
+
+def test_flash_with_cached_runtime_skips_version_check():
+    """
+    If the runtime to flash is the one last flashed onto the device, the
+    (possibly slow) version check is skipped and only the script is copied.
+    """
+    mock_flasher_class = mock.MagicMock()
+    mock_version = mock.MagicMock()
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
+            mock.patch('mu.modes.microbit.microfs.version', mock_version),\
+            mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
+            mock.patch('mu.modes.microbit.DeviceFlasher',
+                       mock_flasher_class):
+        view = mock.MagicMock()
+        view.current_tab.text = mock.MagicMock(return_value='foo')
+        editor = mock.MagicMock()
+        editor.minify = False
+        editor.microbit_runtime = ''
+        editor.flashed_runtimes = {'990012345': runtime_hash()}
+        mm = MicrobitMode(editor, view)
+        mm.find_device = mock.MagicMock(return_value=('bar', '990012345'))
+        mm.copy_main = mock.MagicMock()
+        mm.flash()
+    assert mock_version.call_count == 0
+    assert mock_flasher_class.call_count == 0
+    mm.copy_main.assert_called_once_with()
+
+
+def test_flash_with_cached_runtime_serial_problem_forgets_runtime():
+    """
+    If copy_main fails for a device with a cached runtime, the cache entry is
+    dropped and the runtime recorded again once the fallback flash finishes.
+    """
+    mock_flasher = mock.MagicMock()
+    mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
+            mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
+            mock.patch('mu.modes.microbit.DeviceFlasher',
+                       mock_flasher_class), \
+            mock.patch('mu.modes.microbit.sys.platform', 'win32'):
+        view = mock.MagicMock()
+        view.current_tab.text = mock.MagicMock(return_value='foo')
+        editor = mock.MagicMock()
+        editor.minify = False
+        editor.microbit_runtime = ''
+        editor.flashed_runtimes = {'990012345': runtime_hash()}
+        mm = MicrobitMode(editor, view)
+        mm.find_device = mock.MagicMock(return_value=('bar', '990012345'))
+        mm.copy_main = mock.MagicMock(side_effect=IOError('boom'))
+        mm.set_buttons = mock.MagicMock()
+        mm.flash()
+    assert editor.flashed_runtimes == {}
+    assert mm.flash_runtime == ('990012345', runtime_hash())
+    mm.python_script = ''
+    mm.flash_finished()
+    assert editor.flashed_runtimes == {'990012345': runtime_hash()}
+    assert mm.flash_runtime is None
+
+
+def test_runtime_hash():
+    """
+    The bundled runtime's hash is computed once, custom runtimes are hashed
+    from their file and unreadable runtimes have no hash.
+    """
+    assert runtime_hash() == runtime_hash()
+    custom = os.path.join(TEST_ROOT, 'customhextest.hex')
+    assert runtime_hash(custom) not in (None, runtime_hash())
+    assert runtime_hash(os.path.join(TEST_ROOT, 'missing.hex')) is None
+
+
 def test_flash_device_has_latest_firmware_encounters_serial_problem_windows():
     """
     If copy_main encounters an IOError on Windows, revert to old-school
@@ -159,8 +375,8 @@ def test_flash_device_has_latest_firmware_encounters_serial_problem_windows():
     }
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.modes.microbit.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.modes.microbit.microfs.version',
                        return_value=version_info),\
             mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
@@ -206,8 +422,8 @@ def test_flash_device_has_latest_firmware_encounters_serial_problem_unix():
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
     mock_timer = mock.MagicMock()
     mock_timer_class = mock.MagicMock(return_value=mock_timer)
-    with mock.patch('mu.modes.microbit.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.modes.microbit.microfs.version',
                        return_value=version_info),\
             mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
@@ -253,8 +469,8 @@ def test_flash_with_attached_device_has_latest_firmware_encounters_problem():
     }
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.modes.microbit.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.modes.microbit.microfs.version',
                        return_value=version_info),\
             mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
@@ -292,8 +508,8 @@ def test_flash_with_attached_device_has_old_firmware():
     }
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.modes.microbit.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.modes.microbit.microfs.version',
                        return_value=version_info),\
             mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
@@ -329,8 +545,8 @@ def test_flash_force_with_no_micropython():
     """
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.modes.microbit.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.modes.microbit.microfs.version',
                        side_effect=ValueError('bang')),\
             mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
@@ -367,8 +583,8 @@ def test_flash_force_with_unsupported_microbit():
     """
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.modes.microbit.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.modes.microbit.microfs.version',
                        side_effect=ValueError('bang')),\
             mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
@@ -404,8 +620,8 @@ def test_flash_force_with_attached_device_as_windows():
     }
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.modes.microbit.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.modes.microbit.microfs.version',
                        return_value=version_info),\
             mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
@@ -451,8 +667,8 @@ def test_flash_forced_with_attached_device_as_not_windows():
     mock_timer_class = mock.MagicMock(return_value=mock_timer)
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.modes.microbit.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.modes.microbit.microfs.version',
                        return_value=version_info),\
             mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
@@ -527,8 +743,8 @@ def test_flash_with_attached_known_device_and_forced():
     mock_timer_class = mock.MagicMock(return_value=mock_timer)
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.modes.microbit.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.modes.microbit.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.modes.microbit.microfs.version',
                        return_value=version_info),\
             mock.patch('mu.modes.microbit.os.path.exists', return_value=True),\
@@ -557,8 +773,8 @@ def test_force_flash_no_serial_connection():
     """
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.contrib.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.contrib.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.contrib.microfs.get_serial'),\
             mock.patch('mu.contrib.microfs.version',
                        side_effect=IOError('bang')),\
@@ -596,8 +812,8 @@ def test_force_flash_empty_script():
     }
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.contrib.uflash.find_microbit',
-                    return_value='bar'),\
+    with mock.patch('mu.contrib.uflash.find_microbits',
+                    return_value=['bar']),\
             mock.patch('mu.contrib.microfs.get_serial'),\
             mock.patch('mu.contrib.microfs.version',
                        return_value=version_info),\
@@ -635,8 +851,8 @@ def test_force_flash_user_specified_device_path():
     }
     mock_flasher = mock.MagicMock()
     mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
-    with mock.patch('mu.contrib.uflash.find_microbit',
-                    return_value=None),\
+    with mock.patch('mu.contrib.uflash.find_microbits',
+                    return_value=[]),\
             mock.patch('mu.contrib.microfs.get_serial'),\
             mock.patch('mu.contrib.microfs.version',
                        return_value=version_info),\
@@ -669,7 +885,7 @@ def test_flash_path_specified_does_not_exist():
     """
     with mock.patch('mu.contrib.uflash.hexlify', return_value=''), \
             mock.patch('mu.contrib.uflash.embed_hex', return_value='foo'), \
-            mock.patch('mu.contrib.uflash.find_microbit', return_value=None),\
+            mock.patch('mu.contrib.uflash.find_microbits', return_value=[]),\
             mock.patch('mu.logic.os.path.exists', return_value=False),\
             mock.patch('mu.logic.os.makedirs', return_value=None), \
             mock.patch('mu.contrib.uflash.save_hex', return_value=None) as s:
@@ -699,7 +915,7 @@ def test_flash_without_device():
     """
     with mock.patch('mu.contrib.uflash.hexlify', return_value=''), \
             mock.patch('mu.contrib.uflash.embed_hex', return_value='foo'), \
-            mock.patch('mu.contrib.uflash.find_microbit', return_value=None),\
+            mock.patch('mu.contrib.uflash.find_microbits', return_value=[]),\
             mock.patch('mu.contrib.uflash.save_hex', return_value=None) as s:
         view = mock.MagicMock()
         view.get_microbit_path = mock.MagicMock(return_value=None)
@@ -779,6 +995,22 @@ def test_flash_finished_copy_main():
     mm.copy_main.assert_called_once_with()
 
 
+def test_flash_finished_records_runtime():
+    """
+    Once a runtime has been flashed onto a device, its hash is cached against
+    the device's serial number.
+    """
+    view = mock.MagicMock()
+    editor = mock.MagicMock()
+    editor.flashed_runtimes = {}
+    mm = MicrobitMode(editor, view)
+    mm.set_buttons = mock.MagicMock()
+    mm.flash_runtime = ('990012345', 'abc')
+    mm.flash_finished()
+    assert editor.flashed_runtimes == {'990012345': 'abc'}
+    assert mm.flash_runtime is None
+
+
 def test_flash_finished_copy_main_encounters_error():
     """
     If copy_main encounters an error, flash_failed is called.
@@ -955,6 +1187,7 @@ def test_add_fs():
         view.add_filesystem.assert_called_once_with(workspace, mock_fm(),
                                                     'micro:bit')
         assert mm.fs
+        assert mm.fs.sync_block_size == editor.sync_block_size
 
 
 def test_add_fs_no_device():
@@ -1263,3 +1496,155 @@ def test_open_hex_with_exception():
     assert text is None
     assert mock_extract.call_count == 1
     assert mock_open.call_count == 1
+
+
+def test_flash_failed_forgets_runtime():
+    """
+    If flashing a runtime fails, any runtime cached for the device is
+    forgotten since the device may now be in an unknown state.
+    """
+    view = mock.MagicMock()
+    editor = mock.MagicMock()
+    editor.flashed_runtimes = {'990012345': 'abc'}
+    mm = MicrobitMode(editor, view)
+    mm.set_buttons = mock.MagicMock()
+    mm.flash_runtime = ('990012345', 'def')
+    mm.flash_failed('Boom')
+    assert editor.flashed_runtimes == {}
+    assert mm.flash_runtime is None
+
+
+def test_flash_many_devices():
+    """
+    If several micro:bits are attached, they're all flashed at once.
+    """
+    view = mock.MagicMock()
+    view.current_tab.text = mock.MagicMock(return_value='foo')
+    view.current_tab.label = 'foo.py'
+    editor = mock.MagicMock()
+    editor.minify = False
+    mm = MicrobitMode(editor, view)
+    mm.flash_many = mock.MagicMock()
+    with mock.patch('mu.modes.microbit.mounted_volumes',
+                    return_value=['/', 'bar', 'baz']), \
+            mock.patch('mu.modes.microbit.uflash.find_microbits',
+                       return_value=['bar', 'baz']) as find_microbits:
+        mm.flash()
+    find_microbits.assert_called_once_with(['/', 'bar', 'baz'])
+    mm.flash_many.assert_called_once_with(['bar', 'baz'], 'foo.py')
+    assert mm.python_script == b'foo'
+
+
+def test_flash_many():
+    """
+    Ensure mounted devices are paired with their serial ports and, since all
+    the mounted devices are accounted for, remaining ports are flashed too.
+    """
+    view = mock.MagicMock()
+    editor = mock.MagicMock()
+    editor.microbit_runtime = ''
+    mm = MicrobitMode(editor, view)
+    mm.set_buttons = mock.MagicMock()
+    mm.python_script = b'foo'
+    mm.find_devices = mock.MagicMock(return_value=[('COM0', '9900AB'),
+                                                   ('COM1', '9901CD')])
+    view.show_confirmation.return_value = QMessageBox.Ok
+    mock_flasher = mock.MagicMock()
+    mock_flasher_class = mock.MagicMock(return_value=mock_flasher)
+    with mock.patch('mu.modes.microbit.volume_serial_number',
+                    return_value='9900ab'), \
+            mock.patch('mu.modes.microbit.MultiDeviceFlasher',
+                       mock_flasher_class):
+        mm.flash_many(['bar'], 'foo.py')
+    devices = [('bar', 'COM0', '9900AB'), (None, 'COM1', '9901CD')]
+    assert 'bar\nCOM1' in view.show_confirmation.call_args[0][1]
+    mock_flasher_class.assert_called_once_with(devices, b'foo', None)
+    view.show_flash_progress.assert_called_once_with(['bar', 'COM1'])
+    dialog = view.show_flash_progress()
+    assert mm.flash_dialog == dialog
+    mock_flasher.on_device_progress.connect.assert_called_once_with(
+        dialog.on_progress)
+    mock_flasher.on_device_fail.connect.assert_called_once_with(
+        dialog.on_fail)
+    mock_flasher.finished.connect.assert_called_once_with(
+        mm.flash_many_finished)
+    mock_flasher.start.assert_called_once_with()
+    mm.set_buttons.assert_called_once_with(flash=False)
+    assert mm.python_script == ''
+
+
+def test_flash_many_unpaired():
+    """
+    If a mounted device can't be paired with its serial port, the other ports
+    may belong to it, so only the mounted devices are flashed.
+    """
+    view = mock.MagicMock()
+    editor = mock.MagicMock()
+    editor.microbit_runtime = 'custom.hex'
+    mm = MicrobitMode(editor, view)
+    mm.set_buttons = mock.MagicMock()
+    mm.python_script = b'foo'
+    mm.find_devices = mock.MagicMock(side_effect=Exception('Boom'))
+    view.show_confirmation.return_value = QMessageBox.Ok
+    mock_flasher_class = mock.MagicMock()
+    with mock.patch('mu.modes.microbit.volume_serial_number',
+                    return_value=None), \
+            mock.patch('mu.modes.microbit.os.path.exists',
+                       return_value=True), \
+            mock.patch('mu.modes.microbit.MultiDeviceFlasher',
+                       mock_flasher_class):
+        mm.flash_many(['bar', 'baz'], 'foo.py')
+    devices = [('bar', None, None), ('baz', None, None)]
+    mock_flasher_class.assert_called_once_with(devices, b'foo', 'custom.hex')
+
+
+def test_flash_many_cancelled():
+    """
+    If the user doesn't confirm flashing several micro:bits, none of them are
+    flashed.
+    """
+    view = mock.MagicMock()
+    view.show_confirmation.return_value = QMessageBox.Cancel
+    editor = mock.MagicMock()
+    mm = MicrobitMode(editor, view)
+    mm.set_buttons = mock.MagicMock()
+    mm.python_script = b'foo'
+    mm.find_devices = mock.MagicMock(return_value=[])
+    mock_flasher_class = mock.MagicMock()
+    with mock.patch('mu.modes.microbit.volume_serial_number',
+                    return_value=None), \
+            mock.patch('mu.modes.microbit.MultiDeviceFlasher',
+                       mock_flasher_class):
+        mm.flash_many(['bar', 'baz'], 'foo.py')
+    assert view.show_confirmation.call_count == 1
+    assert mock_flasher_class.call_count == 0
+    assert mm.set_buttons.call_count == 0
+    assert view.show_flash_progress.call_count == 0
+
+
+def test_flash_many_finished():
+    """
+    Ensure the runtime is remembered for successfully flashed devices and
+    forgotten for those that failed.
+    """
+    view = mock.MagicMock()
+    editor = mock.MagicMock()
+    editor.flashed_runtimes = {'9901': 'abc', '9902': 'abc'}
+    mm = MicrobitMode(editor, view)
+    mm.set_buttons = mock.MagicMock()
+    dialog = mock.MagicMock()
+    mm.flash_dialog = dialog
+    ok = ('bar', 'COM0', '9900')
+    failed = ('baz', 'COM1', '9901')
+    copied = (None, 'COM2', '9902')
+    mm.flash_thread = mock.MagicMock()
+    mm.flash_thread.path_to_runtime = None
+    mm.flash_thread.devices = [ok, failed, copied]
+    mm.flash_thread.flashed = [ok, copied]
+    mm.flash_many_finished()
+    assert editor.flashed_runtimes == {'9900': runtime_hash(),
+                                       '9902': 'abc'}
+    dialog.on_finished.assert_called_once_with()
+    mm.set_buttons.assert_called_once_with(flash=True)
+    assert mm.flash_thread is None
+    assert mm.flash_dialog is None
@@ -90,22 +90,15 @@ def test_pgzero_play_toggle_on_cancelled():
 
 def test_pgzero_play_toggle_off():
     """
-    Check the handler for clicking play stops the process and reverts the UI
-    state.
+    Check the handler for clicking play stops the process.
     """
     editor = mock.MagicMock()
     view = mock.MagicMock()
     pm = PyGameZeroMode(editor, view)
     pm.runner = True
     pm.stop_game = mock.MagicMock()
-    pm.set_buttons = mock.MagicMock()
     pm.play_toggle(None)
     pm.stop_game.assert_called_once_with()
-    slot = pm.view.button_bar.slots['play']
-    assert slot.setIcon.call_count == 1
-    slot.setText.assert_called_once_with('Play')
-    slot.setToolTip.assert_called_once_with('Play your Pygame Zero game.')
-    pm.set_buttons.assert_called_once_with(modes=True)
 
 
 def test_pgzero_run_game():
@@ -126,8 +119,39 @@ def test_pgzero_run_game():
     view.add_python3_runner.assert_called_once_with('/foo/bar', '/foo',
                                                     interactive=False,
                                                     envars=editor.envars,
-                                                    python_args=py_args)
-    mock_runner.process.waitForStarted.assert_called_once_with()
+                                                    python_args=py_args,
+                                                    process=None)
+    assert mock_runner.process.waitForStarted.call_count == 0
+
+
+def test_pgzero_run_game_warm():
+    """
+    If Python was started in advance, it's used to run the game.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    view.current_tab.path = '/foo/bar'
+    view.current_tab.isModified.return_value = False
+    pm = PyGameZeroMode(editor, view)
+    mock_process = mock.MagicMock()
+    pm.claim_process = mock.MagicMock(return_value=(mock_process, 'ready'))
+    pm.run_game()
+    assert view.add_python3_runner.call_args[1]['process'] == mock_process
+
+
+def test_pgzero_process_pool_args():
+    """
+    Python is only started in advance of pressing Play if the setting is on.
+    """
+    editor = mock.MagicMock()
+    editor.warm_run = False
+    pm = PyGameZeroMode(editor, mock.MagicMock())
+    assert pm.process_pool_args() is None
+    editor.warm_run = True
+    args = pm.process_pool_args()
+    assert args[0].endswith('mu-run.py')
+    assert args[1:3] == ['-m', 'pgzero']
+    assert args[3:] == pm.warm_modules
 
 
 def test_pgzero_run_game_no_editor():
@@ -160,19 +184,62 @@ def test_pgzero_run_game_needs_saving():
 
 def test_pgzero_stop_game():
     """
-    Check that the child process is killed, the runner cleaned up and UI
-    is reset.
+    Check that the child process is asked to stop, without waiting for it,
+    and the Play button shows it's stopping.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    view.button_bar.slots = {
+        'play': mock.MagicMock(),
+    }
+    pm = PyGameZeroMode(editor, view)
+    pm.game_stopped = mock.MagicMock()
+    mock_runner = mock.MagicMock()
+    mock_runner.stop_process.return_value = True
+    pm.runner = mock_runner
+    pm.stop_game()
+    mock_runner.stop_process.assert_called_once_with()
+    assert mock_runner.process.waitForFinished.call_count == 0
+    slot = view.button_bar.slots['play']
+    slot.setText.assert_called_once_with('Stopping...')
+    slot.setEnabled.assert_called_once_with(False)
+    mock_runner.process.finished.connect.assert_called_once_with(
+        pm.game_stopped)
+    assert pm.game_stopped.call_count == 0
+
+
+def test_pgzero_stop_game_finished():
+    """
+    If the game has already finished, tidy up straight away.
     """
     editor = mock.MagicMock()
     view = mock.MagicMock()
     pm = PyGameZeroMode(editor, view)
+    pm.game_stopped = mock.MagicMock()
     mock_runner = mock.MagicMock()
+    mock_runner.stop_process.return_value = False
     pm.runner = mock_runner
     pm.stop_game()
-    mock_runner.process.kill.assert_called_once_with()
-    mock_runner.process.waitForFinished.assert_called_once_with()
+    pm.game_stopped.assert_called_once_with()
+
+
+def test_pgzero_game_stopped():
+    """
+    Once the game has stopped, the runner is cleaned up and the UI reset.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    pm = PyGameZeroMode(editor, view)
+    pm.runner = mock.MagicMock()
+    pm.set_buttons = mock.MagicMock()
+    pm.game_stopped(0, 0)
     assert pm.runner is None
     view.remove_python_runner.assert_called_once_with()
+    slot = view.button_bar.slots['play']
+    assert slot.setIcon.call_count == 1
+    slot.setText.assert_called_once_with('Play')
+    slot.setToolTip.assert_called_once_with('Play your Pygame Zero game.')
+    pm.set_buttons.assert_called_once_with(play=True, modes=True)
 
 
 def test_pgzero_stop_game_no_runner():
@@ -8,13 +8,14 @@ from mu.modes.python3 import PythonMode, KernelRunner
 from mu.modes.api import PYTHON3_APIS, SHARED_APIS, PI_APIS
 from mu.logic import MODULE_DIR
 from unittest import mock
+from PyQt5.QtCore import Qt
 
 
 def test_kernel_runner_start_kernel():
     """
     Ensure the start_kernel method eventually emits the kernel_started signal
     with the associated kernel manager and kernel client objects for
-    subsequent use.
+    subsequent use, having passed the kernel's context to the kernel manager.
     """
     mock_kernel_manager = mock.MagicMock()
     mock_client = mock.MagicMock()
@@ -22,62 +23,62 @@ def test_kernel_runner_start_kernel():
     envars = [['name', 'value'], ]
     kr = KernelRunner(cwd='/a/path/to/mu_code', envars=envars)
     kr.kernel_started = mock.MagicMock()
-    mock_os = mock.MagicMock()
-    mock_os.environ = {}
-    mock_os.pathsep = os.pathsep
-    mock_os.path.dirname.return_value = ('/Applications/mu-editor.app'
-                                         '/Contents/Resources/app/mu')
+    kr.kernel_environment = mock.MagicMock(return_value={
+        'name': 'value',
+        'PYTHONPATH': 'foo',
+    })
     mock_kernel_manager_class = mock.MagicMock()
     mock_kernel_manager_class.return_value = mock_kernel_manager
-    with mock.patch('mu.modes.python3.os', mock_os), \
-            mock.patch('mu.modes.python3.QtKernelManager',
-                       mock_kernel_manager_class), \
-            mock.patch('sys.platform', 'darwin'):
+    environ = dict(os.environ)
+    with mock.patch('mu.modes.python3.QtKernelManager',
+                    mock_kernel_manager_class), \
+            mock.patch('mu.modes.python3.os.chdir') as mock_chdir:
         kr.start_kernel()
-    mock_os.chdir.assert_called_once_with('/a/path/to/mu_code')
-    assert mock_os.environ['name'] == 'value'
-    expected_paths = sys.path + [MODULE_DIR, ]
-    assert mock_os.environ['PYTHONPATH'] == os.pathsep.join(expected_paths)
+    assert mock_chdir.call_count == 0
+    assert dict(os.environ) == environ
     assert kr.repl_kernel_manager == mock_kernel_manager
     mock_kernel_manager_class.assert_called_once_with()
-    mock_kernel_manager.start_kernel.assert_called_once_with()
+    mock_kernel_manager.start_kernel.assert_called_once_with(
+        env=kr.kernel_environment(), cwd='/a/path/to/mu_code')
     assert kr.repl_kernel_client == mock_client
     kr.kernel_started.emit.assert_called_once_with(mock_kernel_manager,
                                                    mock_client)
 
 
-def test_kernel_runner_start_kernel_pythonpath_exists():
+def test_kernel_runner_kernel_environment():
     """
-    Ensure  that MODULE_DIR is added to the existing PYTHONPATH
+    The kernel's environment is Mu's, with the user defined envars and the
+    expected PYTHONPATH, without changing Mu's own.
     """
-    mock_kernel_manager = mock.MagicMock()
-    mock_client = mock.MagicMock()
-    mock_kernel_manager.client.return_value = mock_client
     envars = [['name', 'value'], ]
     kr = KernelRunner(cwd='/a/path/to/mu_code', envars=envars)
-    kr.kernel_started = mock.MagicMock()
-    mock_os = mock.MagicMock()
-    mock_os.environ = {'PYTHONPATH': 'foo'}
-    mock_os.pathsep = os.pathsep
-    mock_os.path.dirname.return_value = ('/Applications/mu-editor.app'
-                                         '/Contents/Resources/app/mu')
-    mock_kernel_manager_class = mock.MagicMock()
-    mock_kernel_manager_class.return_value = mock_kernel_manager
-    with mock.patch('mu.modes.python3.os', mock_os), \
-            mock.patch('mu.modes.python3.QtKernelManager',
-                       mock_kernel_manager_class), \
-            mock.patch('sys.platform', 'darwin'):
-        kr.start_kernel()
-    mock_os.chdir.assert_called_once_with('/a/path/to/mu_code')
-    assert mock_os.environ['name'] == 'value'
+    with mock.patch.dict('mu.modes.python3.os.environ', {'MU_TEST': 'mu'},
+                         clear=True):
+        env = kr.kernel_environment()
+        assert dict(os.environ) == {'MU_TEST': 'mu'}
+    assert env['MU_TEST'] == 'mu'
+    assert env['name'] == 'value'
+    expected_paths = sys.path + [MODULE_DIR, ]
+    assert env['PYTHONPATH'] == os.pathsep.join(expected_paths)
+
+
+def test_kernel_runner_kernel_environment_pythonpath_exists():
+    """
+    Ensure that MODULE_DIR is added to the existing PYTHONPATH
+    """
+    kr = KernelRunner(cwd='/a/path/to/mu_code', envars=[])
+    with mock.patch.dict('mu.modes.python3.os.environ',
+                         {'PYTHONPATH': 'foo'}, clear=True):
+        env = kr.kernel_environment()
     expected_paths = ['foo', ] + [MODULE_DIR, ]
-    assert mock_os.environ['PYTHONPATH'] == os.pathsep.join(expected_paths)
-    assert kr.repl_kernel_manager == mock_kernel_manager
-    mock_kernel_manager_class.assert_called_once_with()
-    mock_kernel_manager.start_kernel.assert_called_once_with()
-    assert kr.repl_kernel_client == mock_client
-    kr.kernel_started.emit.assert_called_once_with(mock_kernel_manager,
-                                                   mock_client)
+    assert env['PYTHONPATH'] == os.pathsep.join(expected_paths)
+    # A user defined PYTHONPATH takes the place of Mu's.
+    kr = KernelRunner(cwd='/a/path/to/mu_code',
+                      envars=[['PYTHONPATH', 'bar']])
+    with mock.patch.dict('mu.modes.python3.os.environ',
+                         {'PYTHONPATH': 'foo'}, clear=True):
+        env = kr.kernel_environment()
+    assert env['PYTHONPATH'] == os.pathsep.join(['bar', MODULE_DIR])
 
 
 def test_kernel_runner_stop_kernel():
@@ -90,19 +91,28 @@ def test_kernel_runner_stop_kernel():
     kr.repl_kernel_client = mock.MagicMock()
     kr.repl_kernel_manager = mock.MagicMock()
     kr.kernel_finished = mock.MagicMock()
-    mock_os = mock.MagicMock()
-    mock_os.environ = {
-        'old_mu_context': 'to_be_deleted',
-    }
-    with mock.patch('mu.modes.python3.os', mock_os):
-        kr.stop_kernel()
-    assert 'old_mu_context' not in mock_os.environ
-    assert len(mock_os.environ) == len(kr.default_envars)
+    kr.stop_kernel()
     kr.repl_kernel_client.stop_channels.assert_called_once_with()
     kr.repl_kernel_manager.shutdown_kernel.assert_called_once_with(now=True)
     kr.kernel_finished.emit.assert_called_once_with()
 
 
+def test_kernel_runner_stop_kernel_channels_not_running():
+    """
+    A kernel started in advance, whose REPL was never shown, is shut down
+    without stopping the channels that were never started.
+    """
+    kr = KernelRunner(cwd='/a/path/to/mu_code', envars=[['name', 'value'], ])
+    kr.repl_kernel_client = mock.MagicMock()
+    kr.repl_kernel_client.channels_running = False
+    kr.repl_kernel_manager = mock.MagicMock()
+    kr.kernel_finished = mock.MagicMock()
+    kr.stop_kernel()
+    assert kr.repl_kernel_client.stop_channels.call_count == 0
+    kr.repl_kernel_manager.shutdown_kernel.assert_called_once_with(now=True)
+    kr.kernel_finished.emit.assert_called_once_with()
+
+
 def test_python_mode():
     """
     Sanity check for setting up of the mode.
@@ -187,27 +197,15 @@ def test_python_run_toggle_on_cancelled():
 
 def test_python_run_toggle_off():
     """
-    Check the handler for clicking run stops the process and reverts the UI
-    state.
+    Check the handler for clicking run stops the process.
     """
     editor = mock.MagicMock()
     view = mock.MagicMock()
-    view.button_bar.slots = {
-        'debug': mock.MagicMock(),
-        'modes': mock.MagicMock(),
-        'run': mock.MagicMock(),
-    }
     pm = PythonMode(editor, view)
     pm.runner = True
     pm.stop_script = mock.MagicMock()
     pm.run_toggle(None)
     pm.stop_script.assert_called_once_with()
-    slot = pm.view.button_bar.slots['run']
-    assert slot.setIcon.call_count == 1
-    slot.setText.assert_called_once_with('Run')
-    slot.setToolTip.assert_called_once_with('Run your Python script.')
-    pm.view.button_bar.slots['debug'].setEnabled.assert_called_once_with(True)
-    pm.view.button_bar.slots['modes'].setEnabled.assert_called_once_with(True)
 
 
 def test_python_run_script():
@@ -227,21 +225,56 @@ def test_python_run_script():
     editor.save_tab_to_file.assert_called_once_with(view.current_tab)
     view.add_python3_runner.assert_called_once_with('/foo/bar', '/foo',
                                                     interactive=True,
-                                                    envars=editor.envars)
-    mock_runner.process.waitForStarted.assert_called_once_with()
+                                                    envars=editor.envars,
+                                                    process=None)
+    assert mock_runner.process.waitForStarted.call_count == 0
     # Check the buttons are set to the correct state when other aspects of the
     # mode are also in play.
     pm.set_buttons = mock.MagicMock()
-    pm.kernel_runner = True
+    pm.repl = True
     pm.run_script()
     pm.set_buttons.assert_called_once_with(plotter=False)
     pm.set_buttons.reset_mock()
-    pm.kernel_runner = False
+    pm.repl = False
     pm.plotter = True
     pm.run_script()
     pm.set_buttons.assert_called_once_with(repl=False)
 
 
+def test_python_run_script_warm():
+    """
+    If Python was started in advance, it's used to run the script.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    view.current_tab.path = '/foo/bar'
+    view.current_tab.isModified.return_value = False
+    pm = PythonMode(editor, view)
+    mock_process = mock.MagicMock()
+    pm.claim_process = mock.MagicMock(return_value=(mock_process, 'ready'))
+    pm.run_script()
+    view.add_python3_runner.assert_called_once_with('/foo/bar', '/foo',
+                                                    interactive=True,
+                                                    envars=editor.envars,
+                                                    process=mock_process)
+
+
+def test_python_process_pool_args():
+    """
+    Python is only started in advance of pressing Run if the setting is on.
+    """
+    editor = mock.MagicMock()
+    editor.warm_run = False
+    pm = PythonMode(editor, mock.MagicMock())
+    assert pm.process_pool_args() is None
+    editor.warm_run = True
+    args = pm.process_pool_args()
+    assert args[0] == '-i'
+    assert args[1].endswith('mu-run.py')
+    assert os.path.isfile(args[1])
+    assert args[2:] == pm.warm_modules
+
+
 def test_python_run_script_no_editor():
     """
     If there's no active tab, there can be no runner either.
@@ -287,31 +320,81 @@ def test_python_run_script_uses_editor_save():
 
 def test_python_stop_script():
     """
-    Check that the child process is killed, the runner cleaned up and UI
-    is reset.
+    Check that the child process is asked to stop, without waiting for it,
+    and the Run button shows it's stopping.
     """
     editor = mock.MagicMock()
     view = mock.MagicMock()
+    view.button_bar.slots = {
+        'run': mock.MagicMock(),
+    }
     pm = PythonMode(editor, view)
+    pm.script_stopped = mock.MagicMock()
     mock_runner = mock.MagicMock()
+    mock_runner.stop_process.return_value = True
     pm.runner = mock_runner
     pm.stop_script()
-    mock_runner.process.kill.assert_called_once_with()
-    mock_runner.process.waitForFinished.assert_called_once_with()
-    assert pm.runner is None
+    mock_runner.stop_process.assert_called_once_with()
+    assert mock_runner.process.waitForFinished.call_count == 0
+    slot = view.button_bar.slots['run']
+    slot.setText.assert_called_once_with('Stopping...')
+    slot.setEnabled.assert_called_once_with(False)
+    mock_runner.process.finished.connect.assert_called_once_with(
+        pm.script_stopped)
+    assert pm.script_stopped.call_count == 0
+    assert pm.runner == mock_runner
 
 
-def test_python_stop_resets_focus():
+def test_python_stop_script_finished():
     """
-    Check that, when a child process is killed, the current
-    tab regains focus.
+    If the script has already finished, tidy up straight away.
     """
     editor = mock.MagicMock()
     view = mock.MagicMock()
     pm = PythonMode(editor, view)
+    pm.script_stopped = mock.MagicMock()
     mock_runner = mock.MagicMock()
+    mock_runner.stop_process.return_value = False
     pm.runner = mock_runner
     pm.stop_script()
+    pm.script_stopped.assert_called_once_with()
+
+
+def test_python_script_stopped():
+    """
+    Once the script has stopped, the runner is cleaned up and the UI reset.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    view.button_bar.slots = {
+        'debug': mock.MagicMock(),
+        'modes': mock.MagicMock(),
+        'run': mock.MagicMock(),
+    }
+    pm = PythonMode(editor, view)
+    pm.runner = mock.MagicMock()
+    pm.script_stopped(0, 0)
+    assert pm.runner is None
+    view.remove_python_runner.assert_called_once_with()
+    slot = view.button_bar.slots['run']
+    assert slot.setIcon.call_count == 1
+    slot.setText.assert_called_once_with('Run')
+    slot.setToolTip.assert_called_once_with('Run your Python script.')
+    slot.setEnabled.assert_called_once_with(True)
+    view.button_bar.slots['debug'].setEnabled.assert_called_once_with(True)
+    view.button_bar.slots['modes'].setEnabled.assert_called_once_with(True)
+
+
+def test_python_stop_resets_focus():
+    """
+    Check that, when a child process has stopped, the current tab regains
+    focus.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    pm.runner = mock.MagicMock()
+    pm.script_stopped()
     view.current_tab.setFocus.assert_called_once_with()
 
 
@@ -352,7 +435,7 @@ def test_python_toggle_repl():
     pm.remove_repl = mock.MagicMock()
     pm.toggle_repl(None)
     pm.add_repl.assert_called_once_with()
-    pm.kernel_runner = True
+    pm.repl = True
     pm.toggle_repl(None)
     pm.remove_repl.assert_called_once_with()
 
@@ -383,7 +466,7 @@ def test_python_add_repl():
     pm.kernel_runner.kernel_started.connect.\
         assert_called_once_with(pm.on_kernel_start)
     pm.kernel_runner.kernel_finished.connect.\
-        assert_called_once_with(pm.kernel_thread.quit)
+        assert_called_once_with(pm.kernel_thread.quit, Qt.DirectConnection)
     pm.stop_kernel.connect.\
         assert_called_once_with(pm.kernel_runner.stop_kernel)
     pm.kernel_thread.started.connect.\
@@ -398,11 +481,16 @@ def test_python_remove_repl():
     Make sure the REPL is removed properly.
     """
     editor = mock.MagicMock()
+    editor.warm_repl = False
     view = mock.MagicMock()
     pm = PythonMode(editor, view)
     pm.set_buttons = mock.MagicMock()
     pm.stop_kernel = mock.MagicMock()
+    pm.kernel_runner = mock.MagicMock()
+    pm.repl = True
     pm.remove_repl()
+    view.remove_repl.assert_called_once_with()
+    assert pm.repl is False
     pm.stop_kernel.emit.assert_called_once_with()
     pm.set_buttons.assert_called_once_with(repl=False)
 
@@ -412,16 +500,60 @@ def test_python_remove_repl_reset_focus():
     Make sure the REPL is removed properly.
     """
     editor = mock.MagicMock()
+    editor.warm_repl = False
     view = mock.MagicMock()
     pm = PythonMode(editor, view)
     pm.set_buttons = mock.MagicMock()
     pm.stop_kernel = mock.MagicMock()
+    pm.kernel_runner = mock.MagicMock()
     pm.remove_repl()
     pm.stop_kernel.emit.assert_called_once_with()
     pm.set_buttons.assert_called_once_with(repl=False)
     view.current_tab.setFocus.assert_called_once_with()
 
 
+def test_python_remove_repl_keep_kernel():
+    """
+    If the setting to start the kernel in advance is on, removing the REPL
+    keeps its kernel running.
+    """
+    editor = mock.MagicMock()
+    editor.warm_repl = True
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    pm.set_buttons = mock.MagicMock()
+    pm.stop_kernel = mock.MagicMock()
+    pm.kernel_runner = mock.MagicMock()
+    pm.kernel = ('manager', 'client')
+    pm.repl = True
+    pm.remove_repl()
+    view.remove_repl.assert_called_once_with()
+    assert pm.repl is False
+    assert pm.stop_kernel.emit.call_count == 0
+    assert pm.kernel == ('manager', 'client')
+    pm.set_buttons.assert_called_once_with(repl=True, plotter=True, run=True)
+
+
+def test_python_shutdown_kernel():
+    """
+    The kernel is only asked to stop once, and not at all if there isn't one.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    pm.stop_kernel = mock.MagicMock()
+    pm.shutdown_kernel()
+    assert pm.stop_kernel.emit.call_count == 0
+    pm.kernel_runner = mock.MagicMock()
+    pm.kernel = ('manager', 'client')
+    pm.shutdown_kernel()
+    pm.shutdown_kernel(report=False)
+    pm.stop_kernel.emit.assert_called_once_with()
+    assert pm.kernel is None
+    assert pm.kernel_stopping is True
+    assert pm.report_kernel_stop is True
+
+
 def test_python_toggle_plotter():
     """
     Ensure toggling the plotter causes it to be added/removed.
@@ -517,7 +649,7 @@ def test_python_on_data_flood():
         mock_super().on_data_flood.assert_called_once_with()
     pm.set_buttons.reset_mock()
     pm.runner = False
-    pm.kernel_runner = True
+    pm.repl = True
     with mock.patch('builtins.super') as mock_super:
         pm.on_data_flood()
         pm.set_buttons.assert_called_once_with(run=True, repl=True, debug=True)
@@ -535,9 +667,11 @@ def test_python_on_kernel_start():
     view = mock.MagicMock()
     pm = PythonMode(editor, view)
     pm.set_buttons = mock.MagicMock()
+    pm.repl = True
     mock_kernel_manager = mock.MagicMock()
     mock_client = mock.MagicMock()
     pm.on_kernel_start(mock_kernel_manager, mock_client)
+    assert pm.kernel == (mock_kernel_manager, mock_client)
     view.add_jupyter_repl.assert_called_once_with(mock_kernel_manager,
                                                   mock_client)
     pm.set_buttons.assert_called_once_with(repl=True)
@@ -577,3 +711,177 @@ def test_python_on_kernel_stop():
     view.button_bar.slots['repl'].setEnabled.assert_called_once_with(True)
     editor.show_status_message.assert_called_once_with('REPL stopped.')
     assert pm.kernel_runner is None
+    assert pm.kernel is None
+    assert pm.kernel_stopping is False
+
+
+def test_python_on_kernel_stop_repl_wanted():
+    """
+    If the REPL was asked for while the old kernel was stopping, a new kernel
+    is started for it.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    pm.start_repl_kernel = mock.MagicMock()
+    pm.repl = True
+    pm.on_kernel_stop()
+    pm.start_repl_kernel.assert_called_once_with()
+
+
+def test_python_on_kernel_stop_not_reported():
+    """
+    The user isn't told a kernel kept running in the background, without
+    the REPL shown, has stopped.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    pm.report_kernel_stop = False
+    pm.on_kernel_stop()
+    assert editor.show_status_message.call_count == 0
+    assert pm.report_kernel_stop is True
+
+
+def test_python_on_kernel_start_hidden():
+    """
+    A kernel started in advance is kept, without showing the REPL, and a
+    kernel that's being shut down is ignored.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    pm.on_kernel_start('manager', 'client')
+    assert pm.kernel == ('manager', 'client')
+    assert view.add_jupyter_repl.call_count == 0
+    pm.kernel = None
+    pm.kernel_stopping = True
+    pm.repl = True
+    pm.on_kernel_start('manager', 'client')
+    assert pm.kernel is None
+    assert view.add_jupyter_repl.call_count == 0
+
+
+def test_python_add_repl_kernel_running():
+    """
+    If the kernel is already running, the REPL is shown straight away.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    pm.start_repl_kernel = mock.MagicMock()
+    pm.kernel_runner = mock.MagicMock()
+    pm.kernel_runner.matches.return_value = True
+    pm.kernel = ('manager', 'client')
+    pm.add_repl()
+    assert pm.repl is True
+    pm.kernel_runner.matches.assert_called_once_with(pm.workspace_dir(),
+                                                     editor.envars)
+    view.add_jupyter_repl.assert_called_once_with('manager', 'client')
+    assert pm.start_repl_kernel.call_count == 0
+
+
+def test_python_add_repl_kernel_changed():
+    """
+    If the kernel was started with other settings, it's replaced once it has
+    stopped.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    pm.start_repl_kernel = mock.MagicMock()
+    pm.stop_kernel = mock.MagicMock()
+    pm.set_buttons = mock.MagicMock()
+    pm.kernel_runner = mock.MagicMock()
+    pm.kernel_runner.matches.return_value = False
+    pm.kernel = ('manager', 'client')
+    pm.add_repl()
+    pm.stop_kernel.emit.assert_called_once_with()
+    assert view.add_jupyter_repl.call_count == 0
+    assert pm.start_repl_kernel.call_count == 0
+    pm.set_buttons.assert_called_once_with(repl=False)
+
+
+def test_python_toggle_repl_keep_kernel():
+    """
+    There's no waiting for the kernel to stop if it's kept running.
+    """
+    editor = mock.MagicMock()
+    editor.warm_repl = True
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    pm.remove_repl = mock.MagicMock()
+    pm.repl = True
+    pm.toggle_repl(None)
+    pm.remove_repl.assert_called_once_with()
+    assert editor.show_status_message.call_count == 0
+
+
+def test_python_start_process_pool_kernel():
+    """
+    If the setting is on, the REPL's kernel is started in advance.
+    """
+    editor = mock.MagicMock()
+    editor.warm_run = False
+    editor.warm_repl = False
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    pm.start_repl_kernel = mock.MagicMock()
+    pm.start_process_pool()
+    assert pm.start_repl_kernel.call_count == 0
+    editor.warm_repl = True
+    pm.start_process_pool()
+    pm.start_repl_kernel.assert_called_once_with()
+    pm.kernel_runner = mock.MagicMock()
+    pm.start_process_pool()
+    assert pm.start_repl_kernel.call_count == 1
+
+
+def test_python_stop_process_pool_kernel():
+    """
+    Any kernel kept running is shut down along with Python started in
+    advance.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    mock_pool = mock.MagicMock()
+    pm.process_pool = mock_pool
+    pm.shutdown_kernel = mock.MagicMock()
+    pm.stop_process_pool()
+    mock_pool.stop.assert_called_once_with()
+    pm.shutdown_kernel.assert_called_once_with(report=False)
+
+
+def test_python_stop_process_pool_quitting():
+    """
+    When quitting, the kernel's thread is waited for (but not forever), so
+    it isn't destroyed while still running.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    pm = PythonMode(editor, view)
+    pm.stop_kernel = mock.MagicMock()
+    pm.kernel_runner = mock.MagicMock()
+    pm.kernel_thread = mock.MagicMock()
+    pm.kernel_thread.wait.return_value = False
+    with mock.patch('mu.modes.python3.logger') as mock_logger:
+        pm.stop_process_pool(quitting=True)
+    pm.stop_kernel.emit.assert_called_once_with()
+    pm.kernel_thread.wait.assert_called_once_with(pm.kernel_stop_wait)
+    assert mock_logger.warning.call_count == 1
+    # Not waited for when changing mode.
+    pm.kernel_stopping = False
+    pm.stop_process_pool()
+    assert pm.kernel_thread.wait.call_count == 1
+
+
+def test_kernel_runner_matches():
+    """
+    A kernel only matches the working directory and environment variables it
+    was started with.
+    """
+    kr = KernelRunner(cwd='/a/path', envars=[['name', 'value'], ])
+    assert kr.matches('/a/path', [['name', 'value'], ])
+    assert not kr.matches('/another/path', [['name', 'value'], ])
+    assert not kr.matches('/a/path', [])
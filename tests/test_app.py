@@ -6,7 +6,7 @@ import sys
 import os.path
 from unittest import mock
 from mu.app import excepthook, run, setup_logging, debug, setup_modes
-from mu.logic import LOG_FILE, LOG_DIR, DEBUGGER_PORT, ENCODING
+from mu.logic import LOG_FILE, LOG_DIR, ENCODING
 from mu.interface.themes import NIGHT_STYLE, DAY_STYLE, CONTRAST_STYLE
 
 
@@ -139,11 +139,26 @@ def test_debug():
             mock.patch('mu.app.run_debugger', mock_runner):
         debug()
     expected_filename = os.path.normcase(os.path.abspath('foo.py'))
-    mock_runner.assert_called_once_with('localhost', DEBUGGER_PORT,
+    mock_runner.assert_called_once_with('localhost', 0,
                                         expected_filename,
                                         ['foo', 'bar', 'baz', ])
 
 
+def test_debug_warm():
+    """
+    With the "--warm" flag, a debug runner is started in advance of knowing
+    the script to debug.
+    """
+    mock_sys = mock.MagicMock()
+    mock_sys.argv = [None, '--warm']
+    with mock.patch('mu.app.sys', mock_sys), \
+            mock.patch('mu.app.serve_debugger') as mock_serve, \
+            mock.patch('mu.app.run_debugger') as mock_run:
+        debug()
+    mock_serve.assert_called_once_with('localhost')
+    assert mock_run.call_count == 0
+
+
 def test_debug_no_args():
     """
     If the debugger is accidentally started with no filename and/or associated
@@ -108,7 +108,8 @@ def generate_session(theme="day", mode="python", file_contents=None,
     invalid file contents)
 
     The mu.logic.get_session_path function is mocked to return the
-    temporary filepath from this session.
+    temporary filepath from this session, and the journal directory is one
+    (that doesn't exist) in the temporary directory.
 
     The session is yielded to the contextmanager so the typical usage is:
 
@@ -142,7 +143,9 @@ def generate_session(theme="day", mode="python", file_contents=None,
             f.write(json.dumps(session_data))
     session = dict(session_data)
     session['session_filepath'] = filepath
-    with mock.patch("mu.logic.get_session_path", return_value=filepath):
+    with mock.patch("mu.logic.get_session_path", return_value=filepath), \
+            mock.patch("mu.logic.JOURNAL_DIR",
+                       os.path.join(dirpath, 'journal')):
         yield session
     shutil.rmtree(dirpath)
 
@@ -191,71 +194,170 @@ def test_CONSTANTS():
     assert mu.logic.WORKSPACE_NAME
 
 
-def test_installed_packages_dist_info():
+def _make_package(module_dir, info, metadata, record=None):
     """
-    Ensure module meta-data is processed properly to give a return value of a
-    list containing all the installed modules currently in the MODULE_DIR.
+    Create the metadata directory of an installed package.
     """
-    mock_listdir = mock.MagicMock(return_value=['foo-1.0.0.dist-info',
-                                                'bar-2.0.0.dist-info', 'baz'])
-    mock_open = mock.MagicMock()
-    mock_file = mock.MagicMock()
-    mock_open().__enter__ = mock.MagicMock(return_value=mock_file)
-    foo_metadata = [b"Metadata-Version: 2.1", b"Name: foo",
-                    b"test: \xe6\x88\x91"]
-    bar_metadata = [b"Metadata-Version: 2.1", b"Name: bar",
-                    b"test: \xe6\x88\x91"]
-    mock_file.readlines = mock.MagicMock(side_effect=[foo_metadata,
-                                                      bar_metadata])
-    with mock.patch('builtins.open', mock_open), \
-            mock.patch('mu.logic.os.listdir', mock_listdir):
-        mock_open.reset_mock()
-        result = mu.logic.installed_packages()
-        assert mock_open.call_args_list[0][0][0].endswith('METADATA')
-        assert mock_open.call_args_list[1][0][0].endswith('METADATA')
-        assert result == ['bar', 'foo', ]  # ordered result.
+    pkg_dir = os.path.join(module_dir, info)
+    os.makedirs(pkg_dir)
+    name = 'METADATA' if info.endswith('dist-info') else 'PKG-INFO'
+    with open(os.path.join(pkg_dir, name), 'wb') as f:
+        f.write(metadata)
+    if record is not None:
+        name = 'RECORD' if info.endswith('dist-info') else \
+            'installed-files.txt'
+        with open(os.path.join(pkg_dir, name), 'w') as f:
+            f.write(record)
+    return pkg_dir
 
 
-def test_installed_packages_egg_info():
+def test_read_package_metadata_dist_info():
     """
-    Ensure module meta-data is processed properly to give a return value of a
-    list containing all the installed modules currently in the MODULE_DIR.
+    The name and version of a package are read from the headers of its
+    METADATA, whatever their order, and the description isn't read.
     """
-    mock_listdir = mock.MagicMock(return_value=['foo-1.0.0.egg-info',
-                                                'bar-2.0.0.egg-info', 'baz'])
-    mock_open = mock.MagicMock()
-    mock_file = mock.MagicMock()
-    mock_open().__enter__ = mock.MagicMock(return_value=mock_file)
-    foo_metadata = [b"Metadata-Version: 2.1", b"Name: foo",
-                    b"test: \xe6\x88\x91"]
-    bar_metadata = [b"Metadata-Version: 2.1", b"Name: bar",
-                    b"test: \xe6\x88\x91"]
-    mock_file.readlines = mock.MagicMock(side_effect=[foo_metadata,
-                                                      bar_metadata])
-    with mock.patch('builtins.open', mock_open), \
-            mock.patch('mu.logic.os.listdir', mock_listdir):
-        mock_open.reset_mock()
-        result = mu.logic.installed_packages()
-        assert mock_open.call_args_list[0][0][0].endswith('PKG-INFO')
-        assert mock_open.call_args_list[1][0][0].endswith('PKG-INFO')
-        assert result == ['bar', 'foo', ]  # ordered result.
+    with tempfile.TemporaryDirectory() as module_dir:
+        pkg_dir = _make_package(module_dir, 'foo-1.0.0.dist-info',
+                                b"Metadata-Version: 2.1\nVersion: 1.0.0\n"
+                                b"Name: foo\ntest: \xe6\x88\x91\n\n"
+                                b"Name: not-foo\n")
+        result = mu.logic.read_package_metadata(pkg_dir)
+    assert result == ('foo', '1.0.0')
 
 
-def test_installed_packages_errors():
+def test_read_package_metadata_egg_info():
     """
-    If there's an error opening the expected metadata file, then just ignore
-    and log.
+    The name and version of an egg are read from its PKG-INFO.
     """
-    mock_listdir = mock.MagicMock(return_value=['foo-1.0.0.egg-info',
-                                                'bar-2.0.0.egg-info', 'baz'])
-    mock_open = mock.MagicMock(side_effect=Exception("Boom"))
-    with mock.patch('builtins.open', mock_open), \
-            mock.patch('mu.logic.os.listdir', mock_listdir), \
-            mock.patch('mu.logic.logger.error') as mock_log:
-        mock_open.reset_mock()
-        result = mu.logic.installed_packages()
-        assert result == []
-        assert mock_log.call_count == 4
+    with tempfile.TemporaryDirectory() as module_dir:
+        pkg_dir = _make_package(module_dir, 'foo-1.0.0.egg-info',
+                                b"Metadata-Version: 1.0\nName: foo\n")
+        result = mu.logic.read_package_metadata(pkg_dir)
+    assert result == ('foo', None)
+
+
+def test_read_package_metadata_no_name():
+    """
+    Metadata without a package name is an error.
+    """
+    with tempfile.TemporaryDirectory() as module_dir:
+        pkg_dir = _make_package(module_dir, 'foo-1.0.0.dist-info',
+                                b"Metadata-Version: 2.1\n\nName: foo\n")
+        with pytest.raises(ValueError):
+            mu.logic.read_package_metadata(pkg_dir)
+
+
+def test_package_files_dist_info():
+    """
+    The files installed by a package are read from its RECORD.
+    """
+    with tempfile.TemporaryDirectory() as module_dir:
+        _make_package(module_dir, 'foo-1.0.0.dist-info', b"Name: foo\n",
+                      'foo/__init__.py,sha256=x,1\n\n'
+                      'foo-1.0.0.dist-info/RECORD,,\n')
+        result = mu.logic.package_files(module_dir, 'foo-1.0.0.dist-info')
+    assert result == ['foo/__init__.py', 'foo-1.0.0.dist-info/RECORD']
+
+
+def test_package_files_egg_info():
+    """
+    The files installed by an egg are read from its installed-files.txt and
+    made relative to the module directory.
+    """
+    with tempfile.TemporaryDirectory() as module_dir:
+        _make_package(module_dir, 'foo-1.0.0.egg-info', b"Name: foo\n",
+                      '../foo/__init__.py\nPKG-INFO\n')
+        result = mu.logic.package_files(module_dir, 'foo-1.0.0.egg-info')
+    assert result == [os.path.join('foo', '__init__.py'),
+                      os.path.join('foo-1.0.0.egg-info', 'PKG-INFO')]
+
+
+def test_package_index():
+    """
+    The index of installed packages is built from their metadata, written to
+    disk and, while the module directory is unchanged, used from there.
+    """
+    with tempfile.TemporaryDirectory() as data_dir:
+        module_dir = os.path.join(data_dir, 'site-packages')
+        index_path = os.path.join(data_dir, 'packages.json')
+        os.makedirs(os.path.join(module_dir, 'foo'))
+        _make_package(module_dir, 'Foo_Bar-1.0.dist-info',
+                      b"Name: Foo-Bar\nVersion: 1.0\n",
+                      'foo/__init__.py,,\n')
+        _make_package(module_dir, 'baz-2.0-py3.6.egg-info',
+                      b"Name: baz\nVersion: 2.0\n")
+        expected = {
+            'foo_bar': {'name': 'Foo-Bar', 'version': '1.0',
+                        'info': 'Foo_Bar-1.0.dist-info',
+                        'files': ['foo/__init__.py']},
+            'baz': {'name': 'baz', 'version': '2.0',
+                    'info': 'baz-2.0-py3.6.egg-info', 'files': None},
+        }
+        with mock.patch('mu.logic.MODULE_DIR', module_dir), \
+                mock.patch('mu.logic.PACKAGE_INDEX', index_path):
+            assert mu.logic.package_index() == expected
+            with open(index_path) as f:
+                assert json.load(f)['packages'] == expected
+            with mock.patch('mu.logic.os.listdir') as mock_listdir:
+                assert mu.logic.package_index() == expected
+                assert mock_listdir.call_count == 0
+            assert mu.logic.installed_packages() == ['Foo-Bar', 'baz']
+
+
+def test_package_index_changed():
+    """
+    If a package is installed or removed, the module directory's modification
+    time changes and the index is rebuilt.
+    """
+    with tempfile.TemporaryDirectory() as data_dir:
+        module_dir = os.path.join(data_dir, 'site-packages')
+        index_path = os.path.join(data_dir, 'packages.json')
+        _make_package(module_dir, 'foo-1.0.dist-info', b"Name: foo\n", '')
+        with mock.patch('mu.logic.MODULE_DIR', module_dir), \
+                mock.patch('mu.logic.PACKAGE_INDEX', index_path):
+            assert list(mu.logic.package_index()) == ['foo']
+            shutil.rmtree(os.path.join(module_dir, 'foo-1.0.dist-info'))
+            # Ensure the modification time differs, whatever the resolution
+            # of the filesystem's timestamps.
+            os.utime(module_dir, ns=(0, 0))
+            assert mu.logic.package_index() == {}
+
+
+def test_package_index_damaged():
+    """
+    If the index on disk can't be read, it's rebuilt.
+    """
+    with tempfile.TemporaryDirectory() as data_dir:
+        module_dir = os.path.join(data_dir, 'site-packages')
+        index_path = os.path.join(data_dir, 'packages.json')
+        _make_package(module_dir, 'foo-1.0.dist-info', b"Name: foo\n", '')
+        with open(index_path, 'w') as f:
+            f.write('{"module_dir"')
+        with mock.patch('mu.logic.MODULE_DIR', module_dir), \
+                mock.patch('mu.logic.PACKAGE_INDEX', index_path):
+            assert list(mu.logic.package_index()) == ['foo']
+        with open(index_path) as f:
+            assert json.load(f)['module_dir'] == module_dir
+
+
+def test_package_index_errors():
+    """
+    If a package's metadata can't be read it's left out of the index, and if
+    its installed files can't be read they're unknown. Either way, the error is
+    logged, as is failing to write the index.
+    """
+    with tempfile.TemporaryDirectory() as data_dir:
+        module_dir = os.path.join(data_dir, 'site-packages')
+        index_path = os.path.join(data_dir, 'missing', 'packages.json')
+        _make_package(module_dir, 'foo-1.0.dist-info', b"Version: 1.0\n")
+        _make_package(module_dir, 'bar-1.0.dist-info', b"Name: bar\n")
+        with mock.patch('mu.logic.MODULE_DIR', module_dir), \
+                mock.patch('mu.logic.PACKAGE_INDEX', index_path), \
+                mock.patch('mu.logic.logger.error') as mock_log:
+            result = mu.logic.package_index()
+    assert result == {'bar': {'name': 'bar', 'version': None,
+                              'info': 'bar-1.0.dist-info', 'files': None}}
+    assert mock_log.call_count == 6
 
 
 def test_write_and_flush():
@@ -272,6 +374,48 @@ def test_write_and_flush():
     mock_fd.flush.assert_called_once_with()
 
 
+def test_write_chunks():
+    """
+    Each chunk is written in turn, with the last written and flushed by
+    write_and_flush.
+    """
+    mock_fd = mock.MagicMock()
+    with mock.patch('mu.logic.write_and_flush') as mock_wandf:
+        mu.logic.write_chunks(mock_fd, iter(['foo', 'bar', 'baz']))
+    assert mock_fd.write.call_args_list == [mock.call(''), mock.call('foo'),
+                                            mock.call('bar')]
+    mock_wandf.assert_called_once_with(mock_fd, 'baz')
+
+
+def test_normalised_chunks():
+    """
+    The text is split into chunks of whole lines, each with trailing spaces
+    removed and ended with the newline.
+    """
+    text = 'foo  \nbar\r\n\nbaz '
+    chunks = list(mu.logic.normalised_chunks(text, '\r\n', 4))
+    assert chunks == ['foo\r\n', 'bar\r\n', '\r\nbaz\r\n']
+    assert list(mu.logic.normalised_chunks(text, '\n')) == [
+        'foo\nbar\n\nbaz\n']
+
+
+def test_normalised_chunks_empty():
+    """
+    Empty text is saved as a single newline.
+    """
+    assert list(mu.logic.normalised_chunks('', '\n')) == ['\n']
+
+
+def test_truncate():
+    """
+    Text longer than the limit is cut short with a note of how much was left
+    out, otherwise it's unchanged.
+    """
+    assert mu.logic.truncate('hello', 5) == 'hello'
+    truncated = mu.logic.truncate('hello world', 5)
+    assert truncated == 'hello... (6 more characters)'
+
+
 def test_save_and_encode():
     """
     When saving, ensure that encoding cookies are honoured, otherwise fall back
@@ -313,6 +457,75 @@ def test_save_and_encode():
     assert mock_wandf.call_count == 1
 
 
+def test_save_and_encode_atomic():
+    """
+    An atomic save replaces the file with a temporary file holding the text,
+    keeping the file's permissions and leaving no temporary file behind.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'foo.py')
+        with open(path, 'w') as f:
+            f.write('old')
+        os.chmod(path, 0o640)
+        mu.logic.save_and_encode('print("Hello")  \n', path, '\n',
+                                 atomic=True)
+        with open(path) as f:
+            assert f.read() == 'print("Hello")\n'
+        assert os.stat(path).st_mode & 0o777 == 0o640
+        assert os.listdir(tmp) == ['foo.py']
+
+
+def test_save_and_encode_atomic_link():
+    """
+    An atomic save through a symbolic link replaces the file the link points
+    to, rather than the link.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'foo.py')
+        link = os.path.join(tmp, 'bar.py')
+        with open(path, 'w') as f:
+            f.write('old')
+        try:
+            os.symlink(path, link)
+        except (OSError, NotImplementedError):
+            pytest.skip('Unable to create a symbolic link.')
+        mu.logic.save_and_encode('new', link, '\n', atomic=True)
+        assert os.path.islink(link)
+        with open(path) as f:
+            assert f.read() == 'new\n'
+
+
+def test_save_and_encode_atomic_fails():
+    """
+    If an atomic save fails, the file is left as it was and the temporary file
+    is removed.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'foo.py')
+        with open(path, 'w') as f:
+            f.write('old')
+        text = '# -*- coding: latin-1 -*-\nprint("\u6211")'
+        with pytest.raises(UnicodeEncodeError):
+            mu.logic.save_and_encode(text, path, '\n', atomic=True)
+        with open(path) as f:
+            assert f.read() == 'old'
+        assert os.listdir(tmp) == ['foo.py']
+
+
+def test_write_and_read_journal():
+    """
+    The text and newline convention of a tab written to a journal are read
+    back from it, and the journal is compressed.
+    """
+    text = 'print("Hello")\r\n' * 100
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'foo.json.gz')
+        mu.logic.write_journal(text, path, '\r\n')
+        assert os.listdir(tmp) == ['foo.json.gz']
+        assert os.path.getsize(path) < len(text)
+        assert mu.logic.read_journal(path) == (text, '\r\n')
+
+
 def test_sniff_encoding_from_BOM():
     """
     Ensure an expected BOM detected at the start of the referenced file is
@@ -683,6 +896,103 @@ def test_REPL_unsupported():
             mu.logic.REPL('tty0')
 
 
+def test_FileWriter_coalesces_saves():
+    """
+    Saving a file again before it's written replaces the pending save, so only
+    the latest text is written, and the results of the saves can be taken.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'foo.py')
+        writer = mu.logic.FileWriter()
+        writer.write(path, 'first', '\n')
+        writer.write(path, 'second', '\n')
+        with mock.patch('mu.logic.save_and_encode',
+                        wraps=mu.logic.save_and_encode) as mock_save:
+            writer.start()
+            writer.stop()
+        mock_save.assert_called_once_with('second', path, '\n', atomic=True)
+        with open(path) as f:
+            assert f.read() == 'second\n'
+    assert writer.take_results() == [(path, 'second', None)]
+    assert writer.take_results() == []
+
+
+def test_FileWriter_error():
+    """
+    A problem saving a file is logged and returned in the results.
+    """
+    writer = mu.logic.FileWriter()
+    error = OSError('Bang')
+    writer.write('foo.py', 'text', '\n')
+    with mock.patch('mu.logic.save_and_encode', side_effect=error), \
+            mock.patch('mu.logic.logger.error') as mock_log:
+        writer.start()
+        writer.flush()
+        assert writer.take_results() == [('foo.py', 'text', error)]
+        writer.stop()
+    assert mock_log.call_count == 1
+
+
+def test_FileWriter_written():
+    """
+    The written signal is emitted once each save is written.
+    """
+    writer = mu.logic.FileWriter()
+    writer.written = mock.MagicMock()
+    writer.write('foo.py', 'text', '\n')
+    writer.write('bar.py', 'text', '\n')
+    with mock.patch('mu.logic.save_and_encode'):
+        writer.start()
+        writer.stop()
+    assert writer.written.emit.call_count == 2
+
+
+def test_FileWriter_cancel():
+    """
+    Cancelling a pending save means it isn't written, and cancelling a save
+    that's being written waits for it to finish.
+    """
+    writer = mu.logic.FileWriter()
+    writer.write('foo.py', 'text', '\n')
+    writer.cancel('foo.py')
+    assert writer.pending == {}
+    writer.writing = 'foo.py'
+
+    def finish():
+        with writer.condition:
+            writer.writing = None
+            writer.condition.notify_all()
+
+    writer.condition.wait = mock.MagicMock(side_effect=finish)
+    writer.cancel('foo.py')
+    writer.condition.wait.assert_called_once_with()
+
+
+def test_FileWriter_save():
+    """
+    If given a save function, the writer uses it to write files.
+    """
+    save = mock.MagicMock()
+    writer = mu.logic.FileWriter(save=save)
+    writer.write('foo.json.gz', 'text', '\n')
+    with mock.patch('mu.logic.save_and_encode') as mock_save:
+        writer.start()
+        writer.stop()
+    save.assert_called_once_with('text', 'foo.json.gz', '\n')
+    assert mock_save.call_count == 0
+
+
+def test_FileWriter_flush_not_running():
+    """
+    Flushing a writer whose thread isn't running doesn't wait for saves that
+    will never be written.
+    """
+    writer = mu.logic.FileWriter()
+    writer.write('foo.py', 'text', '\n')
+    writer.flush()
+    assert 'foo.py' in writer.pending
+
+
 def test_editor_init():
     """
     Ensure a new instance is set-up correctly and creates the required folders
@@ -731,6 +1041,7 @@ def test_editor_setup():
         assert mock_shutil.call_count == 3
     assert e.modes == mock_modes
     view.set_usb_checker.assert_called_once_with(1, e.check_usb)
+    view.set_journal_timer.assert_called_once_with(1, e.journal_tabs)
 
 
 def test_editor_restore_session_existing_runtime():
@@ -754,6 +1065,63 @@ def test_editor_restore_session_existing_runtime():
     assert ed._view.zoom_position == 5
 
 
+def test_editor_restore_session_flashed_runtimes():
+    """
+    The runtimes flashed onto micro:bits are restored from the session.
+    """
+    ed = mocked_editor()
+    with generate_session(flashed_runtimes={'990012345': 'abc'}):
+        ed.restore_session()
+    assert ed.flashed_runtimes == {'990012345': 'abc'}
+
+
+def test_editor_restore_session_debug_repr_limits():
+    """
+    The limits on the size of reprs sent by the debugger are restored from
+    the session.
+    """
+    ed = mocked_editor()
+    with generate_session(debug_repr_limits={'maxlist': 20}):
+        ed.restore_session()
+    assert ed.debug_repr_limits == {'maxlist': 20}
+
+
+def test_editor_restore_session_warm_run():
+    """
+    The setting to start Python in advance for the Run button is restored
+    from the session.
+    """
+    ed = mocked_editor()
+    assert ed.warm_run is False
+    with generate_session(warm_run=True):
+        ed.restore_session()
+    assert ed.warm_run is True
+
+
+def test_editor_restore_session_warm_repl():
+    """
+    The setting to start the REPL's kernel in advance is restored from the
+    session.
+    """
+    ed = mocked_editor()
+    assert ed.warm_repl is False
+    with generate_session(warm_repl=True):
+        ed.restore_session()
+    assert ed.warm_repl is True
+
+
+def test_editor_restore_session_sync_block_size():
+    """
+    The size of the blocks patched when syncing files is restored from the
+    session.
+    """
+    ed = mocked_editor()
+    assert ed.sync_block_size == 0
+    with generate_session(sync_block_size=512):
+        ed.restore_session()
+    assert ed.sync_block_size == 512
+
+
 def test_editor_restore_session_missing_runtime():
     """
     If the referenced microbit_runtime file doesn't exist, reset to '' so Mu
@@ -929,6 +1297,265 @@ def test_editor_session_and_open_focus_passed_file():
         'path/foo.py')
 
 
+def test_restore_session_restores_journals():
+    """
+    Unsaved tabs are restored from their journals before deciding whether to
+    start with a blank tab.
+    """
+    ed = mocked_editor()
+    ed._view.tab_count = 1
+    ed.restore_journals = mock.MagicMock()
+    with generate_session():
+        ed.restore_session()
+    ed.restore_journals.assert_called_once_with()
+    assert ed._view.add_tab.call_count == 0
+
+
+def test_restore_journals():
+    """
+    Journaled tabs are restored, oldest first, as modified tabs (whose text
+    can't be undone) that carry on using their journals, which are locked.
+    Unreadable journals are logged and left alone, and unfinished snapshots
+    are removed.
+    """
+    view = mock.MagicMock()
+    tabs = [mock.MagicMock(), mock.MagicMock()]
+    view.add_tab.side_effect = tabs
+    ed = mu.logic.Editor(view)
+    mock_mode = mock.MagicMock()
+    mock_mode.api.return_value = ['api']
+    ed.modes = {'python': mock_mode}
+    with tempfile.TemporaryDirectory() as journal_dir:
+        newer = os.path.join(journal_dir, 'newer.json.gz')
+        older = os.path.join(journal_dir, 'older.json.gz')
+        mu.logic.write_journal('newer text', newer, '\n')
+        mu.logic.write_journal('older text', older, '\r\n')
+        os.utime(older, (0, 0))
+        with open(os.path.join(journal_dir, 'bad.json.gz'), 'wb') as f:
+            f.write(b'not a journal')
+        with open(os.path.join(journal_dir, 'newer.json.gz.tmp'), 'wb') as f:
+            f.write(b'unfinished')
+        with open(os.path.join(journal_dir, 'never.json.gz.tmp'), 'wb') as f:
+            f.write(b'unfinished')
+        with mock.patch('mu.logic.JOURNAL_DIR', journal_dir), \
+                mock.patch('mu.logic.logger.error') as mock_log:
+            ed.restore_journals()
+        assert sorted(os.listdir(journal_dir)) == [
+            'bad.json.gz', 'newer.json.gz', 'newer.lock', 'older.json.gz',
+            'older.lock']
+        assert sorted(ed.journal_locks) == ['newer', 'older']
+        assert all(lock.isLocked() for lock in ed.journal_locks.values())
+        for lock in ed.journal_locks.values():
+            lock.unlock()
+    assert view.add_tab.call_args_list == [
+        mock.call(None, '', ['api'], '\r\n'),
+        mock.call(None, '', ['api'], '\n'),
+    ]
+    tabs[0].setText.assert_called_once_with('older text')
+    tabs[1].setText.assert_called_once_with('newer text')
+    for tab in tabs:
+        tab.SendScintilla.assert_called_once_with(tab.SCI_EMPTYUNDOBUFFER)
+        assert tab.unjournaled == 0
+    assert tabs[0].journal_id == 'older'
+    assert tabs[1].journal_id == 'newer'
+    assert ed.journals == {'older': tabs[0], 'newer': tabs[1]}
+    assert mock_log.call_count == 2
+
+
+def test_restore_journals_owned_by_another_mu():
+    """
+    The journals of another copy of Mu that's still running (so holds their
+    locks) aren't restored, and nothing of them is removed.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    ed.modes = {'python': mock.MagicMock()}
+    with tempfile.TemporaryDirectory() as journal_dir:
+        mu.logic.write_journal('text', os.path.join(journal_dir,
+                                                    'other.json.gz'), '\n')
+        with open(os.path.join(journal_dir, 'other.json.gz.tmp'), 'wb') as f:
+            f.write(b'being written')
+        with mock.patch('mu.logic.JOURNAL_DIR', journal_dir):
+            other = mu.logic.journal_lock('other')
+            assert other.tryLock(0)
+            try:
+                ed.restore_journals()
+            finally:
+                other.unlock()
+        assert sorted(os.listdir(journal_dir)) == [
+            'other.json.gz', 'other.json.gz.tmp']
+    assert view.add_tab.call_count == 0
+    assert ed.journals == {}
+    assert ed.journal_locks == {}
+
+
+def test_restore_journals_no_journals():
+    """
+    If there's no journal directory, there's nothing to restore.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    with mock.patch('mu.logic.JOURNAL_DIR', os.path.join('no', 'such')):
+        ed.restore_journals()
+    assert view.add_tab.call_count == 0
+
+
+def _journal_tab(path=None, unjournaled=0, journaled_at=0.0,
+                 journal_id=None):
+    """
+    Return a mock tab with the attributes used for journaling.
+    """
+    tab = mock.MagicMock()
+    tab.path = path
+    tab.text = mock.MagicMock(return_value='text')
+    tab.newline = '\n'
+    tab.unjournaled = unjournaled
+    tab.journaled_at = journaled_at
+    tab.journal_id = journal_id
+    return tab
+
+
+def test_journal_tabs():
+    """
+    Unsaved tabs are journaled once enough of their text has changed or, if
+    less has changed, once enough time has passed. Tabs with a path, and tabs
+    that haven't changed, aren't journaled. The journal writer is started the
+    first time it's needed.
+    """
+    now = 1000.0
+    big_change = _journal_tab(unjournaled=mu.logic.JOURNAL_BYTES,
+                              journaled_at=now)
+    small_change = _journal_tab(unjournaled=1, journaled_at=now)
+    old_change = _journal_tab(
+        unjournaled=1, journaled_at=now - mu.logic.JOURNAL_TIMEOUT,
+        journal_id='old')
+    no_change = _journal_tab()
+    saved = _journal_tab(path='foo.py', unjournaled=mu.logic.JOURNAL_BYTES)
+    view = mock.MagicMock()
+    view.widgets = [big_change, small_change, old_change, no_change, saved]
+    view.dirty_tabs = view.widgets
+    ed = mu.logic.Editor(view)
+    ed.journals = {'old': old_change}
+    mock_writer = mock.MagicMock()
+    with mock.patch('mu.logic.JOURNAL_DIR', 'journal'), \
+            mock.patch('mu.logic.os.makedirs') as mock_makedirs, \
+            mock.patch('mu.logic.FileWriter',
+                       return_value=mock_writer) as mock_file_writer, \
+            mock.patch('mu.logic.uuid.uuid4') as mock_uuid, \
+            mock.patch('mu.logic.QLockFile') as mock_lock_file, \
+            mock.patch('mu.logic.time.monotonic', return_value=now):
+        mock_uuid.return_value.hex = 'new'
+        ed.journal_tabs()
+    mock_makedirs.assert_called_once_with('journal', exist_ok=True)
+    mock_lock_file.assert_called_once_with(os.path.join('journal',
+                                                        'new.lock'))
+    mock_lock_file.return_value.tryLock.assert_called_once_with(0)
+    assert ed.journal_locks == {'new': mock_lock_file.return_value}
+    mock_file_writer.assert_called_once_with(save=mu.logic.write_journal)
+    mock_writer.written.connect.assert_called_once_with(
+        mock_writer.take_results)
+    mock_writer.start.assert_called_once_with()
+    assert mock_writer.write.call_args_list == [
+        mock.call(os.path.join('journal', 'new.json.gz'), 'text', '\n'),
+        mock.call(os.path.join('journal', 'old.json.gz'), 'text', '\n'),
+    ]
+    assert big_change.journal_id == 'new'
+    assert ed.journals == {'new': big_change, 'old': old_change}
+    for tab in (big_change, old_change):
+        assert tab.unjournaled == 0
+        assert tab.journaled_at == now
+    assert small_change.unjournaled == 1
+    assert small_change.journal_id is None
+    assert saved.journal_id is None
+
+
+def test_journal_tabs_lock_fails():
+    """
+    A tab isn't journaled if its new journal can't be locked.
+    """
+    tab = _journal_tab(unjournaled=mu.logic.JOURNAL_BYTES)
+    view = mock.MagicMock()
+    view.widgets = [tab]
+    view.dirty_tabs = [tab]
+    ed = mu.logic.Editor(view)
+    ed.journaler = mock.MagicMock()
+    with mock.patch('mu.logic.QLockFile') as mock_lock_file, \
+            mock.patch('mu.logic.logger.error') as mock_log:
+        mock_lock_file.return_value.tryLock.return_value = False
+        ed.journal_tabs()
+    assert ed.journaler.write.call_count == 0
+    assert tab.journal_id is None
+    assert ed.journals == {}
+    assert mock_log.call_count == 1
+
+
+def test_journal_tabs_removes_journals():
+    """
+    The journals of tabs that have been closed, saved to a file or are no
+    longer modified are removed.
+    """
+    closed = _journal_tab(journal_id='closed')
+    saved = _journal_tab(path='foo.py', journal_id='saved')
+    unmodified = _journal_tab(journal_id='unmodified')
+    unmodified.isModified.return_value = False
+    modified = _journal_tab(journal_id='modified')
+    modified.isModified.return_value = True
+    view = mock.MagicMock()
+    view.widgets = [saved, unmodified, modified]
+    view.dirty_tabs = set()
+    ed = mu.logic.Editor(view)
+    ed.journals = {'closed': closed, 'saved': saved,
+                   'unmodified': unmodified, 'modified': modified}
+    ed.remove_journal = mock.MagicMock()
+    ed.journal_tabs()
+    assert ed.remove_journal.call_args_list == [
+        mock.call('closed'), mock.call('saved'), mock.call('unmodified'),
+    ]
+
+
+def test_remove_journal():
+    """
+    Removing a journal forgets it, cancels any pending snapshot, deletes its
+    file and gives up its lock.
+    """
+    tab = _journal_tab(journal_id='foo')
+    ed = mu.logic.Editor(mock.MagicMock())
+    ed.journals = {'foo': tab}
+    ed.journaler = mock.MagicMock()
+    with tempfile.TemporaryDirectory() as journal_dir:
+        path = os.path.join(journal_dir, 'foo.json.gz')
+        mu.logic.write_journal('text', path, '\n')
+        with mock.patch('mu.logic.JOURNAL_DIR', journal_dir):
+            lock = mu.logic.journal_lock('foo')
+            assert lock.tryLock(0)
+            ed.journal_locks = {'foo': lock}
+            ed.remove_journal('foo')
+        assert os.listdir(journal_dir) == []
+    ed.journaler.cancel.assert_called_once_with(path)
+    assert ed.journals == {}
+    assert ed.journal_locks == {}
+    assert not lock.isLocked()
+    assert tab.journal_id is None
+
+
+def test_remove_journal_not_written():
+    """
+    Removing a journal that was never written is fine, and any problem
+    deleting a journal is logged.
+    """
+    ed = mu.logic.Editor(mock.MagicMock())
+    ed.journals = {'foo': _journal_tab(journal_id='foo'),
+                   'bar': _journal_tab(journal_id='bar')}
+    with mock.patch('mu.logic.JOURNAL_DIR', os.path.join('no', 'such')), \
+            mock.patch('mu.logic.logger.error') as mock_log:
+        ed.remove_journal('foo')
+        assert mock_log.call_count == 0
+        with mock.patch('mu.logic.os.remove', side_effect=OSError('Bang')):
+            ed.remove_journal('bar')
+        assert mock_log.call_count == 2
+    assert ed.journals == {}
+
+
 def test_toggle_theme_to_night():
     """
     The current theme is 'day' so toggle to night. Expect the state to be
@@ -1568,6 +2195,47 @@ def test_save_file_with_encoding_error():
     assert ed._view.current_tab.setModified.call_count == 0
 
 
+def test_save_cancels_autosave():
+    """
+    Saving a tab stops an earlier autosave of the file overwriting it.
+    """
+    text, path, newline = "foo", "foo.py", "\n"
+    ed = mocked_editor(text=text, path=path, newline=newline)
+    ed.writer = mock.MagicMock()
+    with mock.patch("mu.logic.save_and_encode") as mock_save:
+        ed.save()
+    ed.writer.cancel.assert_called_once_with(path)
+    mock_save.assert_called_once_with(text, path, newline)
+    ed._view.current_tab.setModified.assert_called_once_with(False)
+
+
+def test_show_save_error_disk():
+    """
+    A problem with the disk is reported as such.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    with mock.patch('mu.logic.logger.error') as mock_log:
+        ed.show_save_error(OSError('Bang'))
+    assert mock_log.call_count == 1
+    message = view.show_message.call_args[0][0]
+    assert message == 'Could not save file (disk problem)'
+
+
+def test_show_save_error_encoding():
+    """
+    A problem encoding the text is reported as such.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    ex = UnicodeEncodeError(mu.logic.ENCODING, "", 0, 0, "Unable to encode")
+    with mock.patch('mu.logic.logger.error') as mock_log:
+        ed.show_save_error(ex)
+    assert mock_log.call_count == 2
+    message = view.show_message.call_args[0][0]
+    assert message == 'Could not save file (encoding problem)'
+
+
 def test_save_python_file():
     """
     If the path is a Python file (ending in *.py) then save it and reset the
@@ -1590,6 +2258,24 @@ def test_save_python_file():
     view.current_tab.setModified.assert_called_once_with(False)
 
 
+def test_save_tab_to_file_logs_truncated_text():
+    """
+    Saving fetches the tab's text once, and only logs the start of it.
+    """
+    contents = 'x' * (mu.logic.LOG_TEXT_LIMIT + 10)
+    view = mock.MagicMock()
+    tab = mock.MagicMock()
+    tab.path = 'foo.py'
+    tab.text = mock.MagicMock(return_value=contents)
+    ed = mu.logic.Editor(view)
+    with mock.patch('mu.logic.save_and_encode') as mock_save, \
+            mock.patch('mu.logic.logger.debug') as mock_debug:
+        ed.save_tab_to_file(tab)
+    mock_save.assert_called_once_with(contents, 'foo.py', tab.newline)
+    assert tab.text.call_count == 1
+    mock_debug.assert_called_once_with(mu.logic.truncate(contents))
+
+
 def test_save_with_no_file_extension():
     """
     If the path doesn't end in *.py then append it to the filename.
@@ -1849,7 +2535,7 @@ def test_quit_modified_ok():
     with mock.patch('sys.exit', return_value=None), \
             mock.patch('builtins.open', mock_open):
         ed.quit(mock_event)
-    mock_debug_mode.stop.assert_called_once_with()
+    mock_debug_mode.runner_stopped.assert_called_once_with()
     assert view.show_confirmation.call_count == 1
     assert mock_event.ignore.call_count == 0
     assert mock_open.call_count == 1
@@ -1978,6 +2664,138 @@ def test_quit_save_envars():
     assert session['envars'] == [['name1', 'value1'], ['name2', 'value2'], ]
 
 
+def test_quit_save_flashed_runtimes():
+    """
+    When saving the session, ensure the runtimes flashed onto micro:bits are
+    logged in the session file.
+    """
+    view = mock.MagicMock()
+    view.modified = False
+    view.zoom_position = 2
+    view.widgets = []
+    ed = mu.logic.Editor(view)
+    mock_mode = mock.MagicMock()
+    ed.modes = {
+        'python': mock_mode,
+    }
+    ed.flashed_runtimes = {'990012345': 'abc'}
+    mock_open = mock.MagicMock()
+    mock_open.return_value.__enter__ = lambda s: s
+    mock_open.return_value.__exit__ = mock.Mock()
+    mock_open.return_value.write = mock.MagicMock()
+    with mock.patch('sys.exit', return_value=None), \
+            mock.patch('builtins.open', mock_open):
+        ed.quit()
+    recovered = ''.join([i[0][0] for i
+                        in mock_open.return_value.write.call_args_list])
+    session = json.loads(recovered)
+    assert session['flashed_runtimes'] == {'990012345': 'abc'}
+
+
+def test_quit_save_debug_repr_limits():
+    """
+    When saving the session, ensure the limits on the size of reprs sent by
+    the debugger are logged in the session file.
+    """
+    view = mock.MagicMock()
+    view.modified = False
+    view.zoom_position = 2
+    view.widgets = []
+    ed = mu.logic.Editor(view)
+    mock_mode = mock.MagicMock()
+    ed.modes = {
+        'python': mock_mode,
+    }
+    ed.debug_repr_limits = {'maxlist': 20}
+    mock_open = mock.MagicMock()
+    mock_open.return_value.__enter__ = lambda s: s
+    mock_open.return_value.__exit__ = mock.Mock()
+    mock_open.return_value.write = mock.MagicMock()
+    with mock.patch('sys.exit', return_value=None), \
+            mock.patch('builtins.open', mock_open):
+        ed.quit()
+    recovered = ''.join([i[0][0] for i
+                        in mock_open.return_value.write.call_args_list])
+    session = json.loads(recovered)
+    assert session['debug_repr_limits'] == {'maxlist': 20}
+    assert session['warm_run'] is False
+    assert session['warm_repl'] is False
+    assert session['sync_block_size'] == 0
+
+
+def test_quit_stops_process_pools():
+    """
+    Processes started in advance are stopped when quitting.
+    """
+    view = mock.MagicMock()
+    view.modified = False
+    view.widgets = []
+    ed = mu.logic.Editor(view)
+    python_mode = mock.MagicMock()
+    python_mode.is_debugger = False
+    debug_mode = mock.MagicMock()
+    ed.modes = {
+        'python': python_mode,
+        'debugger': debug_mode,
+    }
+    mock_open = mock.MagicMock()
+    mock_open.return_value.__enter__ = lambda s: s
+    mock_open.return_value.__exit__ = mock.Mock()
+    with mock.patch('sys.exit', return_value=None), \
+            mock.patch('builtins.open', mock_open):
+        ed.quit()
+    python_mode.stop_process_pool.assert_called_once_with(quitting=True)
+    debug_mode.stop_process_pool.assert_called_once_with(quitting=True)
+
+
+def test_quit_finishes_autosaves():
+    """
+    Autosaves are finished before checking for un-saved work, and the writer
+    is stopped when quitting.
+    """
+    view = mock.MagicMock()
+    view.modified = False
+    view.widgets = []
+    ed = mu.logic.Editor(view)
+    ed.modes = {'python': mock.MagicMock(is_debugger=False)}
+    ed.writer = mock.MagicMock()
+    ed.on_written = mock.MagicMock()
+    mock_open = mock.MagicMock()
+    mock_open.return_value.__enter__ = lambda s: s
+    mock_open.return_value.__exit__ = mock.Mock()
+    with mock.patch('sys.exit', return_value=None), \
+            mock.patch('builtins.open', mock_open):
+        ed.quit()
+    ed.writer.flush.assert_called_once_with()
+    ed.on_written.assert_called_once_with()
+    ed.writer.stop.assert_called_once_with()
+
+
+def test_quit_removes_journals():
+    """
+    Quitting discards unsaved work, so the journal writer is stopped and the
+    journals are removed.
+    """
+    view = mock.MagicMock()
+    view.modified = False
+    view.widgets = []
+    ed = mu.logic.Editor(view)
+    ed.modes = {'python': mock.MagicMock(is_debugger=False)}
+    journaler = mock.MagicMock()
+    ed.journaler = journaler
+    ed.journals = {'foo': mock.MagicMock(), 'bar': mock.MagicMock()}
+    ed.remove_journal = mock.MagicMock()
+    mock_open = mock.MagicMock()
+    mock_open.return_value.__enter__ = lambda s: s
+    mock_open.return_value.__exit__ = mock.Mock()
+    with mock.patch('sys.exit', return_value=None), \
+            mock.patch('builtins.open', mock_open):
+        ed.quit()
+    journaler.stop.assert_called_once_with()
+    assert ed.remove_journal.call_args_list == [mock.call('foo'),
+                                                mock.call('bar')]
+
+
 def test_quit_save_zoom_level():
     """
     When saving the session, ensure the zoom level is logged in the session
@@ -2254,9 +3072,16 @@ def test_sync_package_state():
     ed = mu.logic.Editor(view)
     old_packages = ['foo', 'bar', ]
     new_packages = ['bar', 'baz', ]
-    ed.sync_package_state(old_packages, new_packages)
+    index = {'foo': {'name': 'foo', 'version': '1.0',
+                     'info': 'foo-1.0.dist-info', 'files': []}}
+    mock_index = mock.MagicMock(return_value=index)
+    with mock.patch('mu.logic.package_index', mock_index):
+        ed.sync_package_state(old_packages, new_packages)
     view.sync_packages.assert_called_once_with({'foo'}, {'baz'},
-                                               mu.logic.MODULE_DIR)
+                                               mu.logic.MODULE_DIR,
+                                               mu.logic.WHEEL_DIR, index)
+    # The index is brought up to date once the packages have changed.
+    assert mock_index.call_count == 2
 
 
 def test_select_mode():
@@ -2329,6 +3154,7 @@ def test_change_mode():
         'python': mode,
     }
     ed.mode = 'microbit'
+    ed.usb_ports = []
     ed.change_mode('python')
     # Check the old mode is closed properly.
     old_mode.remove_repl.assert_called_once_with()
@@ -2336,6 +3162,8 @@ def test_change_mode():
     old_mode.remove_plotter.assert_called_once_with()
     # Check the new mode is set up correctly.
     assert ed.mode == 'python'
+    # Connected devices are checked afresh for the new mode.
+    assert ed.usb_ports is None
     view.change_mode.assert_called_once_with(mode)
     if sys.version_info < (3, 6):
         assert mock_button_bar.connect.call_count == 11
@@ -2403,21 +3231,162 @@ def test_change_mode_reset_breakpoints():
     mock_tab.reset_annotations.assert_called_once_with()
 
 
+def test_change_mode_process_pools():
+    """
+    Processes started in advance are only kept for the current mode, and for
+    the debugger in modes with a debugger.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    python_mode = mock.MagicMock()
+    python_mode.has_debugger = True
+    python_mode.is_debugger = False
+    python_mode.save_timeout = 0
+    microbit_mode = mock.MagicMock()
+    microbit_mode.has_debugger = False
+    microbit_mode.is_debugger = False
+    microbit_mode.save_timeout = 0
+    debug_mode = mock.MagicMock()
+    ed.modes = {
+        'python': python_mode,
+        'microbit': microbit_mode,
+        'debugger': debug_mode,
+    }
+    ed.mode = 'microbit'
+    ed.change_mode('python')
+    python_mode.start_process_pool.assert_called_once_with()
+    debug_mode.start_process_pool.assert_called_once_with()
+    microbit_mode.stop_process_pool.assert_called_once_with()
+    assert debug_mode.stop_process_pool.call_count == 0
+    ed.change_mode('microbit')
+    microbit_mode.start_process_pool.assert_called_once_with()
+    python_mode.stop_process_pool.assert_called_once_with()
+    debug_mode.stop_process_pool.assert_called_once_with()
+
+
 def test_autosave():
     """
-    Ensure the autosave callback does the expected things to the tabs.
+    Ensure the autosave callback schedules the modified tabs with paths to be
+    saved in the background, starting the writer the first time.
     """
     view = mock.MagicMock()
-    view.modified = True
     mock_tab = mock.MagicMock()
     mock_tab.path = 'foo'
-    mock_tab.isModified.return_value = True
-    view.widgets = [mock_tab, ]
+    mock_tab.text.return_value = 'bar'
+    mock_tab.newline = '\n'
+    new_tab = mock.MagicMock()
+    new_tab.path = None
+    view.dirty_tabs = {mock_tab, new_tab}
     ed = mu.logic.Editor(view)
-    with mock.patch('mu.logic.save_and_encode') as mock_save:
+    mock_writer = mock.MagicMock()
+    with mock.patch('mu.logic.FileWriter', return_value=mock_writer):
+        ed.autosave()
+        ed.autosave()
+    assert ed.writer is mock_writer
+    mock_writer.written.connect.assert_called_once_with(ed.on_written)
+    mock_writer.start.assert_called_once_with()
+    assert mock_writer.write.call_args_list == [
+        mock.call('foo', 'bar', '\n'),
+        mock.call('foo', 'bar', '\n'),
+    ]
+    assert mock_tab.setModified.call_count == 0
+
+
+def test_autosave_nothing_modified():
+    """
+    If nothing's modified, the writer isn't started.
+    """
+    view = mock.MagicMock()
+    view.dirty_tabs = set()
+    ed = mu.logic.Editor(view)
+    with mock.patch('mu.logic.FileWriter') as mock_writer:
         ed.autosave()
-    assert mock_save.call_count == 1
-    mock_tab.setModified.assert_called_once_with(False)
+    assert mock_writer.call_count == 0
+    assert ed.writer is None
+
+
+def test_on_written():
+    """
+    Once autosaved, tabs whose text hasn't changed since are no longer
+    modified.
+    """
+    view = mock.MagicMock()
+    saved_tab = mock.MagicMock()
+    saved_tab.path = 'foo'
+    saved_tab.text = mock.MagicMock(return_value='saved')
+    changed_tab = mock.MagicMock()
+    changed_tab.path = 'bar'
+    changed_tab.text = mock.MagicMock(return_value='changed since')
+    view.widgets = [saved_tab, changed_tab]
+    ed = mu.logic.Editor(view)
+    ed.show_status_message = mock.MagicMock()
+    ed.writer = mock.MagicMock()
+    ed.writer.take_results.return_value = [('foo', 'saved', None),
+                                           ('bar', 'changed', None)]
+    ed.on_written()
+    saved_tab.setModified.assert_called_once_with(False)
+    assert changed_tab.setModified.call_count == 0
+    ed.show_status_message.assert_called_once_with('Saved file: foo')
+
+
+def test_on_written_error():
+    """
+    Problems autosaving are reported and the tab is left modified.
+    """
+    view = mock.MagicMock()
+    tab = mock.MagicMock()
+    tab.path = 'foo'
+    tab.text = mock.MagicMock(return_value='text')
+    view.widgets = [tab]
+    ed = mu.logic.Editor(view)
+    ed.show_save_error = mock.MagicMock()
+    ed.writer = mock.MagicMock()
+    error = OSError('Bang')
+    ed.writer.take_results.return_value = [('foo', 'text', error)]
+    ed.on_written()
+    ed.show_save_error.assert_called_once_with(error)
+    assert tab.setModified.call_count == 0
+
+
+def test_on_written_no_writer():
+    """
+    If there's no writer, there's nothing to do.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    ed.on_written()
+    assert view.widgets.__iter__.call_count == 0
+
+
+def mock_port(name, vid, pid, serial_number='12345'):
+    """
+    Return a mock QSerialPortInfo for the referenced port and USB IDs.
+    """
+    port = mock.MagicMock()
+    port.portName.return_value = name
+    port.vendorIdentifier.return_value = vid
+    port.productIdentifier.return_value = pid
+    port.serialNumber.return_value = serial_number
+    return port
+
+
+def mock_device_mode(name, valid_boards, generic_boards=None, firmware=None):
+    """
+    Return a mock mode that works with the referenced boards.
+    """
+    mode = mock.MagicMock()
+    mode.name = name
+    mode.runner = None
+    mode.valid_boards = valid_boards
+    mode.generic_boards = generic_boards or []
+    mode.firmware = re.compile(firmware) if firmware else None
+    mode.port_path = lambda port_name: '/dev/' + port_name
+    return mode
+
+
+MICROBIT = (0x0D28, 0x0204)
+CIRCUITPLAYGROUND = (0x239A, 0x8019)
+CP210X = (0x10C4, 0xEA60)
 
 
 def test_check_usb():
@@ -2431,20 +3400,22 @@ def test_check_usb():
     mode_py = mock.MagicMock()
     mode_py.name = "Python3"
     mode_py.runner = None
-    mode_py.find_device.return_value = (None, None)
-    mode_mb = mock.MagicMock()
-    mode_mb.name = 'BBC micro:bit'
-    mode_mb.find_device.return_value = ('/dev/ttyUSB0', '12345')
+    del mode_py.valid_boards
+    mode_mb = mock_device_mode('BBC micro:bit', [MICROBIT])
     ed.modes = {
         'microbit': mode_mb,
         'python': mode_py,
     }
     ed.show_status_message = mock.MagicMock()
-    ed.check_usb()
+    ports = [mock_port('ttyUSB0', *MICROBIT)]
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=ports):
+        ed.check_usb()
     expected = 'Detected new BBC micro:bit device.'
     ed.show_status_message.assert_called_with(expected)
     assert view.show_confirmation.called
     ed.change_mode.assert_called_once_with('microbit')
+    assert ed.connected_devices == {('microbit', '/dev/ttyUSB0')}
 
 
 def test_check_usb_change_mode_cancel():
@@ -2458,16 +3429,16 @@ def test_check_usb_change_mode_cancel():
     mode_py = mock.MagicMock()
     mode_py.name = "Python3"
     mode_py.runner = None
-    mode_py.find_device.return_value = (None, None)
-    mode_cp = mock.MagicMock()
-    mode_cp.name = 'CircuitPlayground'
-    mode_cp.find_device.return_value = ('/dev/ttyUSB1', '12345')
+    mode_cp = mock_device_mode('CircuitPlayground', [CIRCUITPLAYGROUND])
     ed.modes = {
         'circuitplayground': mode_cp,
         'python': mode_py,
     }
     ed.show_status_message = mock.MagicMock()
-    ed.check_usb()
+    ports = [mock_port('ttyUSB1', *CIRCUITPLAYGROUND)]
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=ports):
+        ed.check_usb()
     expected = 'Detected new CircuitPlayground device.'
     ed.show_status_message.assert_called_with(expected)
     assert view.show_confirmation.called
@@ -2482,18 +3453,18 @@ def test_check_usb_already_in_mode():
     view.show_confirmation = mock.MagicMock(return_value=QMessageBox.Ok)
     ed = mu.logic.Editor(view)
     ed.change_mode = mock.MagicMock()
-    mode_mb = mock.MagicMock()
-    mode_mb.name = 'BBC micro:bit'
-    mode_mb.find_device.return_value = ('/dev/ttyUSB0', '12345')
-    mode_cp = mock.MagicMock()
-    mode_cp.find_device.return_value = (None, None)
+    mode_mb = mock_device_mode('BBC micro:bit', [MICROBIT])
+    mode_cp = mock_device_mode('CircuitPlayground', [CIRCUITPLAYGROUND])
     ed.modes = {
         'microbit': mode_mb,
-        'circuitplayground': mode_cp
+        'circuitplayground': mode_cp,
     }
     ed.mode = 'microbit'
     ed.show_status_message = mock.MagicMock()
-    ed.check_usb()
+    ports = [mock_port('ttyUSB0', *MICROBIT)]
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=ports):
+        ed.check_usb()
     view.show_confirmation.assert_not_called()
     ed.change_mode.assert_not_called()
 
@@ -2510,16 +3481,16 @@ def test_check_usb_currently_running_code():
     mode_py = mock.MagicMock()
     mode_py.name = "Python3"
     mode_py.runner = True
-    mode_py.find_device.return_value = (None, None)
-    mode_mb = mock.MagicMock()
-    mode_mb.name = 'BBC micro:bit'
-    mode_mb.find_device.return_value = ('/dev/ttyUSB0', '12345')
+    mode_mb = mock_device_mode('BBC micro:bit', [MICROBIT])
     ed.modes = {
         'microbit': mode_mb,
         'python': mode_py,
     }
     ed.show_status_message = mock.MagicMock()
-    ed.check_usb()
+    ports = [mock_port('ttyUSB0', *MICROBIT)]
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=ports):
+        ed.check_usb()
     view.show_confirmation.assert_not_called()
     ed.change_mode.assert_not_called()
 
@@ -2535,20 +3506,19 @@ def test_check_usb_multiple_devices():
     mode_py = mock.MagicMock()
     mode_py.name = "Python3"
     mode_py.runner = None
-    mode_py.find_device.return_value = (None, None)
-    mode_mb = mock.MagicMock()
-    mode_mb.name = 'BBC micro:bit'
-    mode_mb.find_device.return_value = ('/dev/ttyUSB0', '12345')
-    mode_cp = mock.MagicMock()
-    mode_cp.name = 'CircuitPlayground'
-    mode_cp.find_device.return_value = ('/dev/ttyUSB1', '54321')
+    mode_mb = mock_device_mode('BBC micro:bit', [MICROBIT])
+    mode_cp = mock_device_mode('CircuitPlayground', [CIRCUITPLAYGROUND])
     ed.modes = {
         'microbit': mode_mb,
         'circuitplayground': mode_cp,
         'python': mode_py,
     }
     ed.show_status_message = mock.MagicMock()
-    ed.check_usb()
+    ports = [mock_port('ttyUSB0', *MICROBIT),
+             mock_port('ttyUSB1', *CIRCUITPLAYGROUND, '54321')]
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=ports):
+        ed.check_usb()
     expected_mb = mock.call('Detected new BBC micro:bit device.')
     expected_cp = mock.call('Detected new CircuitPlayground device.')
     ed.show_status_message.assert_has_calls((expected_mb, expected_cp),
@@ -2569,23 +3539,159 @@ def test_check_usb_when_selecting_mode_is_silent():
     mode_py = mock.MagicMock()
     mode_py.name = "Python3"
     mode_py.runner = None
-    mode_py.find_device.return_value = (None, None)
-    mode_cp = mock.MagicMock()
-    mode_cp.name = 'CircuitPlayground'
-    mode_cp.find_device.return_value = ('/dev/ttyUSB1', '12345')
+    mode_cp = mock_device_mode('CircuitPlayground', [CIRCUITPLAYGROUND])
     ed.modes = {
         'circuitplayground': mode_cp,
         'python': mode_py,
     }
     ed.show_status_message = mock.MagicMock()
     ed.selecting_mode = True
-    ed.check_usb()
+    ports = [mock_port('ttyUSB1', *CIRCUITPLAYGROUND)]
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=ports):
+        ed.check_usb()
     expected = 'Detected new CircuitPlayground device.'
     ed.show_status_message.assert_called_with(expected)
     assert view.show_confirmation.call_count == 0
     ed.change_mode.assert_not_called()
 
 
+def test_check_usb_unchanged_ports():
+    """
+    Ensure the ports are enumerated on each check but the connected devices
+    aren't worked out again if the ports haven't changed.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    ed.show_status_message = mock.MagicMock()
+    ed.modes = {
+        'microbit': mock_device_mode('BBC micro:bit', [MICROBIT]),
+    }
+    ed.board_index = mock.MagicMock(return_value=[])
+    ports = [mock_port('ttyACM0', *MICROBIT)]
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=ports) as available_ports:
+        ed.check_usb()
+        ed.check_usb()
+    assert available_ports.call_count == 2
+    ed.board_index.assert_called_once_with(ports)
+    assert ed.usb_ports == [('ttyACM0', 0x0D28, 0x0204, '12345')]
+
+
+def test_check_usb_probes_ambiguous_devices():
+    """
+    In a mode they may work with, devices with generic USB/serial chips
+    aren't reported until the firmware on them has been probed in the
+    background.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    ed.show_status_message = mock.MagicMock()
+    ed.modes = {
+        'esp': mock_device_mode('ESP MicroPython', [CP210X],
+                                generic_boards=[CP210X]),
+    }
+    ed.mode = 'esp'
+    ports = [mock_port('ttyUSB0', *CP210X)]
+    mock_prober = mock.MagicMock()
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=ports), \
+            mock.patch('mu.logic.DeviceProber',
+                       return_value=mock_prober) as prober_class:
+        ed.check_usb()
+    prober_class.assert_called_once_with(['/dev/ttyUSB0'])
+    mock_prober.on_probed.connect.assert_called_once_with(ed.on_probed)
+    mock_prober.finished.connect.assert_called_once_with(ed.probe_finished)
+    mock_prober.start.assert_called_once_with()
+    assert ed.prober == mock_prober
+    assert ed.connected_devices == set()
+    assert ed.show_status_message.call_count == 0
+
+
+def test_check_usb_probed_devices():
+    """
+    Once probed, ambiguous devices are reported for the modes whose firmware
+    was found on them. Devices with generic chips whose REPL replied with
+    other firmware are ignored, while those whose REPL didn't reply are
+    reported by their USB IDs. Probe results for removed devices are
+    forgotten.
+    """
+    view = mock.MagicMock()
+    view.show_confirmation = mock.MagicMock(return_value=QMessageBox.Cancel)
+    ed = mu.logic.Editor(view)
+    ed.show_status_message = mock.MagicMock()
+    ed.modes = {
+        'esp': mock_device_mode('ESP MicroPython', [CP210X],
+                                generic_boards=[CP210X],
+                                firmware=r'^MicroPython.*ESP'),
+    }
+    ed.mode = 'esp'
+    ed.probed = {
+        '/dev/ttyUSB0': 'MicroPython v1.10 on 2019-01-25; ESP32 module',
+        '/dev/ttyUSB1': 'MicroPython v1.10 on 2019-01-25; micro:bit\n>>> ',
+        '/dev/ttyUSB2': '',
+        '/dev/ttyUSB3': 'Removed',
+    }
+    ports = [mock_port('ttyUSB0', *CP210X), mock_port('ttyUSB1', *CP210X),
+             mock_port('ttyUSB2', *CP210X)]
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=ports), \
+            mock.patch('mu.logic.DeviceProber') as prober_class:
+        ed.check_usb()
+    assert prober_class.call_count == 0
+    assert ed.connected_devices == {('esp', '/dev/ttyUSB0'),
+                                    ('esp', '/dev/ttyUSB2')}
+    assert '/dev/ttyUSB3' not in ed.probed
+    assert ed.show_status_message.call_count == 2
+    ed.show_status_message.assert_called_with(
+        'Detected new ESP MicroPython device.')
+
+
+def test_check_usb_ambiguous_devices_not_probed_in_other_modes():
+    """
+    Opening a port may reset the board, so devices with generic USB/serial
+    chips aren't probed unless Mu is in a mode they may work with. Until
+    then they're reported by their USB IDs.
+    """
+    view = mock.MagicMock()
+    view.show_confirmation = mock.MagicMock(return_value=QMessageBox.Cancel)
+    ed = mu.logic.Editor(view)
+    ed.show_status_message = mock.MagicMock()
+    ed.modes = {
+        'python': mock.MagicMock(),
+        'esp': mock_device_mode('ESP MicroPython', [CP210X],
+                                generic_boards=[CP210X]),
+    }
+    ed.mode = 'python'
+    ports = [mock_port('ttyUSB0', *CP210X)]
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=ports), \
+            mock.patch('mu.logic.DeviceProber') as prober_class:
+        ed.check_usb()
+    assert prober_class.call_count == 0
+    assert ed.connected_devices == {('esp', '/dev/ttyUSB0')}
+
+
+def test_check_usb_unclaimed_devices_not_probed():
+    """
+    Devices whose USB IDs aren't claimed by any mode are never probed.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    ed.show_status_message = mock.MagicMock()
+    ed.modes = {
+        'esp': mock_device_mode('ESP MicroPython', [CP210X],
+                                generic_boards=[CP210X]),
+    }
+    ports = [mock_port('ttyUSB0', 0x1234, 0x5678)]
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=ports), \
+            mock.patch('mu.logic.DeviceProber') as prober_class:
+        ed.check_usb()
+    assert prober_class.call_count == 0
+    assert ed.connected_devices == set()
+
+
 def test_check_usb_remove_disconnected_devices():
     """
     Ensure that if a device is no longer connected, it is removed from
@@ -2600,6 +3706,143 @@ def test_check_usb_remove_disconnected_devices():
     assert len(ed.connected_devices) == 0
 
 
+def test_board_index():
+    """
+    Ensure each port connected to a board is mapped to the modes that work
+    with it, including those accepting any board from a vendor.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    mode_py = mock.MagicMock()
+    del mode_py.valid_boards
+    ed.modes = {
+        'python': mode_py,
+        'microbit': mock_device_mode('BBC micro:bit', [MICROBIT]),
+        'adafruit': mock_device_mode('Adafruit', [CIRCUITPLAYGROUND,
+                                                  (0x239A, None)]),
+        'other': mock_device_mode('Other', [CIRCUITPLAYGROUND]),
+        'esp': mock_device_mode('ESP', [CP210X], generic_boards=[CP210X]),
+    }
+    ports = [mock_port('ttyACM0', *MICROBIT),
+             mock_port('ttyACM1', *CIRCUITPLAYGROUND),
+             mock_port('ttyACM2', 0x239A, 0x1234),
+             mock_port('ttyUSB0', *CP210X),
+             mock_port('ttyS0', 0, 0)]
+    assert ed.board_index(ports) == [
+        ('/dev/ttyACM0', ['microbit'], False),
+        ('/dev/ttyACM1', ['adafruit', 'other'], False),
+        ('/dev/ttyACM2', ['adafruit'], False),
+        ('/dev/ttyUSB0', ['esp'], True),
+    ]
+
+
+def test_identify_firmware():
+    """
+    Ensure the modes are told apart by the banner of the firmware.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    ed.modes = {
+        'microbit': mock_device_mode('BBC micro:bit', [MICROBIT],
+                                     firmware=r'micro:bit'),
+        'esp': mock_device_mode('ESP', [CP210X], firmware=r'ESP'),
+        'other': mock_device_mode('Other', [CP210X]),
+    }
+    names = ['microbit', 'esp', 'other']
+    banner = 'MicroPython v1.10 on 2019-01-25; ESP32 module with ESP32'
+    assert ed.identify_firmware(names, True, banner) == ['esp']
+    other = 'CircuitPython 4.0.0 on 2019-05-20; Some Board\r\n>>> '
+    assert ed.identify_firmware(names, True, other) == []
+    # Without a generic chip, an unknown banner can't rule out any modes.
+    assert ed.identify_firmware(names, False, other) == names
+    # If the REPL didn't reply, the board is taken to be what its USB IDs
+    # say it is.
+    assert ed.identify_firmware(names, True, '') == names
+    assert ed.identify_firmware(names, True, 'Hello from a program') == names
+
+
+def test_on_probed_and_probe_finished():
+    """
+    Ensure the result of probing is remembered and, once probing has
+    finished, the USB devices are checked again.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    ed.check_usb = mock.MagicMock()
+    ed.prober = mock.MagicMock()
+    ed.usb_ports = []
+    ed.on_probed('/dev/ttyUSB0', 'MicroPython')
+    assert ed.probed == {'/dev/ttyUSB0': 'MicroPython'}
+    ed.probe_finished()
+    assert ed.prober is None
+    assert ed.usb_ports is None
+    ed.check_usb.assert_called_once_with()
+
+
+def test_probe_firmware():
+    """
+    Ensure the banner is requested without resetting the device.
+    """
+    mock_serial = mock.MagicMock()
+    mock_serial.read_until.return_value = b'MicroPython v1.10\r\n>>> '
+    with mock.patch('mu.logic.Serial', return_value=mock_serial):
+        assert mu.logic.probe_firmware('/dev/ttyUSB0') == \
+            'MicroPython v1.10\r\n>>> '
+    assert mock_serial.port == '/dev/ttyUSB0'
+    assert mock_serial.dtr is False
+    assert mock_serial.rts is False
+    mock_serial.open.assert_called_once_with()
+    mock_serial.write.assert_called_once_with(b'\r\x02')
+    mock_serial.close.assert_called_once_with()
+
+
+def test_DeviceProber_run():
+    """
+    Ensure each port is probed and the result emitted, even if probing fails.
+    """
+    dp = mu.logic.DeviceProber(['/dev/ttyUSB0', '/dev/ttyUSB1'])
+    dp.on_probed = mock.MagicMock()
+
+    def probe(port):
+        if port == '/dev/ttyUSB1':
+            raise OSError('Boom')
+        return 'MicroPython\r\n>>> '
+
+    with mock.patch('mu.logic.probe_firmware', probe), \
+            mock.patch('mu.logic.time.sleep'):
+        dp.run()
+    assert dp.on_probed.emit.call_count == 2
+    dp.on_probed.emit.assert_any_call('/dev/ttyUSB0', 'MicroPython\r\n>>> ')
+    dp.on_probed.emit.assert_any_call('/dev/ttyUSB1', '')
+
+
+def test_DeviceProber_probe_retries():
+    """
+    If the device's REPL doesn't reply, it's probed again a few times, after
+    a delay, before giving up.
+    """
+    dp = mu.logic.DeviceProber(['/dev/ttyUSB0'])
+    dp.on_probed = mock.MagicMock()
+    replies = ['', 'Hello from a program', 'MicroPython\r\n>>> ']
+    with mock.patch('mu.logic.probe_firmware',
+                    side_effect=replies) as mock_probe, \
+            mock.patch('mu.logic.time.sleep') as mock_sleep:
+        dp.probe('/dev/ttyUSB0')
+    assert mock_probe.call_count == 3
+    assert mock_sleep.call_args_list == [
+        mock.call(mu.logic.PROBE_RETRY_DELAY)] * 2
+    dp.on_probed.emit.assert_called_once_with('/dev/ttyUSB0',
+                                              'MicroPython\r\n>>> ')
+    # Give up after the last retry.
+    dp.on_probed.reset_mock()
+    with mock.patch('mu.logic.probe_firmware',
+                    return_value='') as mock_probe, \
+            mock.patch('mu.logic.time.sleep'):
+        dp.probe('/dev/ttyUSB0')
+    assert mock_probe.call_count == mu.logic.PROBE_RETRIES + 1
+    dp.on_probed.emit.assert_called_once_with('/dev/ttyUSB0', '')
+
+
 def test_show_status_message():
     """
     Ensure the method calls the status_bar in the view layer.
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Times how long the visual debugger takes to step through a line of code when
+the script being debugged is stopped at the bottom of a deep stack.
+
+A debug runner is started in a child process and driven over its socket, in
+the same way as Mu's debug client, to a breakpoint at the bottom of a chain of
+recursive calls. The latency of each "next" command (from sending it to
+receiving the updated stack) is then measured for each stack depth.
+
+Finally, the time taken to continue through a CPU-heavy script to a breakpoint
+at its end is compared to the time taken to run the script natively.
+
+Usage: python utils/bench_debugger.py [steps] [depth ...]
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+from mu.debugger.utils import (encode_message, decode_messages,  # noqa: E402
+                               RECV_SIZE)
+
+
+SCRIPT = """\
+DATA = {{str(i): list(range(20)) for i in range(200)}}
+
+
+def recurse(depth):
+    if depth:
+        return recurse(depth - 1)
+    total = 0
+    for i in range({steps}):
+        total += i
+    return total
+
+
+recurse({depth})
+"""
+BREAK_LINE = 8  # The "for" loop at the bottom of the stack.
+
+BUSY_SCRIPT = """\
+import json
+
+
+def work(n):
+    return sum(i * i for i in range(n))
+
+
+results = [work(100) for i in range(20000)]
+encoded = json.dumps(results)
+done = True
+"""
+BUSY_BREAK_LINE = 10  # The last line, after all the work is done.
+
+RUNNER = """\
+import sys
+sys.path.insert(0, {root!r})
+from mu.debugger.runner import run
+run('localhost', {port}, {filename!r})
+"""
+
+
+class Client:
+    """
+    A minimal, blocking version of Mu's debug client.
+    """
+
+    def __init__(self, port):
+        for attempt in range(100):
+            try:
+                self.socket = socket.create_connection(('localhost', port))
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.05)
+        else:
+            raise RuntimeError('Could not connect to the debug runner.')
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = bytearray()
+        self.messages = []
+        self.received = 0
+
+    def send(self, event, **data):
+        self.socket.sendall(encode_message(event, data))
+
+    def wait_for(self, event):
+        """
+        Block until the named event arrives, and return its data.
+        """
+        while True:
+            while self.messages:
+                name, data = self.messages.pop(0)
+                if name == event:
+                    return data
+            new_buffer = self.socket.recv(RECV_SIZE)
+            if not new_buffer:
+                raise RuntimeError('The debug runner closed the connection.')
+            self.received += len(new_buffer)
+            self.buffer += new_buffer
+            self.messages.extend(decode_messages(self.buffer))
+
+
+def start_runner(filename):
+    """
+    Start a debug runner for the script in a child process, and return the
+    process and a client connected to it.
+    """
+    with socket.socket() as s:
+        s.bind(('localhost', 0))
+        port = s.getsockname()[1]
+    runner = RUNNER.format(root=ROOT, port=port, filename=filename)
+    proc = subprocess.Popen([sys.executable, '-c', runner])
+    client = Client(port)
+    client.wait_for('bootstrap')
+    client.wait_for('stack')
+    return proc, client
+
+
+def stop_runner(proc, client):
+    client.send('quit')
+    client.wait_for('finished')
+    client.socket.close()
+    proc.wait(timeout=10)
+
+
+def bench(depth, steps, tmp):
+    """
+    Return the average step latency, in seconds, and the average number of
+    bytes received per step, with the given number of frames on the stack.
+    """
+    filename = os.path.join(tmp, 'deep_{}.py'.format(depth))
+    with open(filename, 'w') as script_file:
+        script_file.write(SCRIPT.format(depth=depth, steps=steps))
+    proc, client = start_runner(filename)
+    client.send('break', filename=filename, line=BREAK_LINE)
+    client.wait_for('breakpoint_create')
+    client.send('continue')
+    client.wait_for('stack')
+    client.received = 0
+    start = time.perf_counter()
+    for i in range(steps):
+        client.send('next')
+        client.wait_for('stack')
+    elapsed = time.perf_counter() - start
+    received = client.received
+    stop_runner(proc, client)
+    return elapsed / steps, received / steps
+
+
+def bench_continue(tmp):
+    """
+    Return the time, in seconds, taken to continue to a breakpoint at the end
+    of a CPU-heavy script, and the time taken to run it natively.
+    """
+    filename = os.path.join(tmp, 'busy.py')
+    with open(filename, 'w') as script_file:
+        script_file.write(BUSY_SCRIPT)
+    start = time.perf_counter()
+    subprocess.check_call([sys.executable, filename])
+    native = time.perf_counter() - start
+    proc, client = start_runner(filename)
+    client.send('break', filename=filename, line=BUSY_BREAK_LINE)
+    client.wait_for('breakpoint_create')
+    start = time.perf_counter()
+    client.send('continue')
+    client.wait_for('stack')
+    debugged = time.perf_counter() - start
+    stop_runner(proc, client)
+    return debugged, native
+
+
+if __name__ == '__main__':
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    depths = [int(d) for d in sys.argv[2:]] or [1, 50, 200]
+    print('{} steps per stack depth'.format(steps))
+    with tempfile.TemporaryDirectory() as tmp:
+        for depth in depths:
+            latency, received = bench(depth, steps, tmp)
+            print('depth {:<5} {:8.3f} ms/step {:10.0f} bytes/step'.format(
+                depth, latency * 1000, received))
+        debugged, native = bench_continue(tmp)
+        print('continue to breakpoint {:8.3f} ms (native run {:.3f} ms)'
+              .format(debugged * 1000, native * 1000))
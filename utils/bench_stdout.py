@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Times how quickly the pane showing a running script's output keeps up with a
+script printing in a loop.
+
+A script printing lines of text is run in a PythonProcessPane (with Qt's
+offscreen platform, so no display is needed) and the time taken until all of
+its output is shown in the pane is measured, giving the throughput in MB/s.
+
+Usage: python utils/bench_stdout.py [megabytes] [line length]
+"""
+import os
+import sys
+import tempfile
+import time
+
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+app = QApplication([])
+from mu.interface.panes import PythonProcessPane  # noqa: E402
+
+
+SCRIPT = """\
+import sys
+line = 'x' * {length}
+for i in range({lines}):
+    print(line)
+sys.stdout.flush()
+"""
+
+
+def bench(megabytes, length, tmp):
+    """
+    Return the time, in seconds, taken to show the script's output, and the
+    number of characters shown.
+    """
+    lines = megabytes * 1024 * 1024 // (length + 1)
+    filename = os.path.join(tmp, 'loud.py')
+    with open(filename, 'w') as script_file:
+        script_file.write(SCRIPT.format(length=length, lines=lines))
+    pane = PythonProcessPane()
+    start = time.perf_counter()
+    pane.start_process(filename, tmp, interactive=False)
+    expected = lines * (length + 1)
+    while True:
+        app.processEvents()
+        finished = pane.process.state() == pane.process.NotRunning
+        if finished and not pane.reading_stdout and \
+                not pane.process.bytesAvailable():
+            break
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    shown = len(pane.toPlainText())
+    if shown < expected:
+        print('Only {} of {} characters were shown.'.format(shown, expected))
+    return elapsed, shown
+
+
+if __name__ == '__main__':
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 79
+    with tempfile.TemporaryDirectory() as tmp:
+        elapsed, shown = bench(megabytes, length, tmp)
+    print('{} characters in {:.3f} s: {:.2f} MB/s'.format(
+        shown, elapsed, shown / elapsed / 1024 / 1024))
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Times how long it takes to turn a Python script into a .hex file ready to
+flash onto a BBC micro:bit: hexlify the script, embed it in the MicroPython
+runtime and save the result to disk.
+
+Usage: python utils/bench_uflash.py [path/to/script.py] [iterations]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from mu.contrib import uflash  # noqa: E402
+
+
+def report(name, total, iterations):
+    """
+    Prints the average time, in milliseconds, of a step of the benchmark.
+    """
+    print('{:<12} {:8.3f} ms'.format(name, total * 1000 / iterations))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], 'rb') as script_file:
+            script = script_file.read()
+    else:
+        script = b'from microbit import *\n' + (
+            b'display.scroll("Hello, World!")\n' * 200)
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    python_hex = uflash.hexlify(script)
+    micropython_hex = uflash.embed_hex(uflash._RUNTIME, python_hex)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'micropython.hex')
+
+        def end_to_end():
+            hex_file = uflash.embed_hex(uflash._RUNTIME,
+                                        uflash.hexlify(script))
+            uflash.save_hex(hex_file, path)
+
+        steps = [
+            ('hexlify', lambda: uflash.hexlify(script)),
+            ('embed_hex', lambda: uflash.embed_hex(uflash._RUNTIME,
+                                                   python_hex)),
+            ('save_hex', lambda: uflash.save_hex(micropython_hex, path)),
+            ('end to end', end_to_end),
+        ]
+        print('Script: {} bytes, {} iterations'.format(len(script),
+                                                       iterations))
+        for name, step in steps:
+            report(name, timeit.timeit(step, number=iterations), iterations)